@@ -1,57 +1,33 @@
-import io
-import math
-import base64
-import re
-from pathlib import Path
+import time
+import uuid
 
 import streamlit as st
 import streamlit.components.v1 as components
-import os
 import pandas as pd
 import altair as alt
 
-from logic.monthly_distribution import (
-    calculate_monthly_distribution_ratios,
-    get_season_factors,
+from logic.daily_gp import (
+    calculate_daily_gp,
+    compute_distribution_plan,
+    monthly_gp_averages,
 )
-
-# ── Google Analytics（gtag）: <head> 直後に相当する位置への埋め込み ──
-# Streamlit にはカスタム head がないため、起動時に static/index.html を1回だけ修正する。
-# 書き込み不可の環境では iframe 経由で親 document.head へ注入するフォールバックを使う。
-_GA_MEASUREMENT_ID = "G-KQ7S0XT9JP"
-_GOOGLE_TAG_SNIPPET = f"""<!-- Google tag (gtag.js) -->
-<script async src="https://www.googletagmanager.com/gtag/js?id={_GA_MEASUREMENT_ID}"></script>
-<script>
-  window.dataLayer = window.dataLayer || [];
-  function gtag(){{dataLayer.push(arguments);}}
-  gtag('js', new Date());
-
-  gtag('config', '{_GA_MEASUREMENT_ID}');
-</script>"""
-
-
-def _inject_google_tag_into_streamlit_index_html() -> bool:
-    """Streamlit パッケージ内 index.html の <head> 直後に gtag を埋め込む（重複挿入しない）。"""
-    try:
-        index_path = Path(st.__file__).resolve().parent / "static" / "index.html"
-        text = index_path.read_text(encoding="utf-8")
-    except OSError:
-        return False
-    if _GA_MEASUREMENT_ID in text:
-        return True
-    m = re.search(r"<head[^>]*>", text, flags=re.IGNORECASE)
-    if not m:
-        return False
-    insert_at = m.end()
-    new_text = text[:insert_at] + "\n" + _GOOGLE_TAG_SNIPPET + "\n" + text[insert_at:]
-    try:
-        index_path.write_text(new_text, encoding="utf-8")
-    except OSError:
-        return False
-    return True
-
-
-_GA_INDEX_PATCH_OK = _inject_google_tag_into_streamlit_index_html()
+from logic.explain import DistributionTrace
+from logic.plan_state import PlanState
+from export import get_scheduler, payload_job
+from export.tabular import XLSX_MIME, plan_table
+from runtime import bootstrap
+from runtime.bootstrap import GA_MEASUREMENT_ID
+from runtime.metrics import cache_lookup, mark_cache_miss, observe_rerun
+from runtime.tracing import LOG_SPANS, start_recording, stop_recording
+from storage.history import record_designs
+from storage.memo_cache import design_key
+
+_RERUN_START = time.perf_counter()
+
+# ── プロセス単位の起動処理（GAの index.html 埋め込み・静的アセットの登録）は1回だけ ──
+_RUNTIME = bootstrap()
+_GA_INDEX_PATCH_OK = _RUNTIME["ga_index_patch_ok"]
+_ASSETS = _RUNTIME["assets"]
 
 # ページ設定（最初のStreamlitコマンドでなければならない）
 st.set_page_config(
@@ -60,6 +36,9 @@ st.set_page_config(
     layout="wide",
 )
 
+# セッション（ユーザー）ごとの識別子（エクスポートジョブの同時実行数の制御に使う）
+_USER = st.session_state.setdefault("_session_user", uuid.uuid4().hex)
+
 if not _GA_INDEX_PATCH_OK:
     # index.html が書き換えられない環境向け
     if "_ga_parent_head_injection" not in st.session_state:
@@ -76,11 +55,11 @@ try {{
     var ext = d.createElement("script");
     ext.id = "st-ga-gtag-ext";
     ext.async = true;
-    ext.src = "https://www.googletagmanager.com/gtag/js?id={_GA_MEASUREMENT_ID}";
+    ext.src = "https://www.googletagmanager.com/gtag/js?id={GA_MEASUREMENT_ID}";
     d.head.appendChild(ext);
     var inl = d.createElement("script");
     inl.id = "st-ga-gtag";
-    inl.text = "\\n  window.dataLayer = window.dataLayer || [];\\n  function gtag(){{dataLayer.push(arguments);}}\\n  gtag('js', new Date());\\n  gtag('config', '{_GA_MEASUREMENT_ID}');\\n";
+    inl.text = "\\n  window.dataLayer = window.dataLayer || [];\\n  function gtag(){{dataLayer.push(arguments);}}\\n  gtag('js', new Date());\\n  gtag('config', '{GA_MEASUREMENT_ID}');\\n";
     d.head.appendChild(inl);
   }}
 }} catch (e) {{}}
@@ -89,10 +68,12 @@ try {{
             height=0,
         )
 
-# CSS読み込み（1回だけ）
-css_path = os.path.join(os.path.dirname(__file__), "style.css")
-with open(css_path, encoding="utf-8") as f:
-    st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+# ── 処理段階ごとの所要時間の計測（?debug=1 で画面下部に表示、FERT_TRACE_LOG=1 でログ出力） ──
+_DEBUG = st.query_params.get("debug") == "1"
+_TRACE = start_recording() if (_DEBUG or LOG_SPANS) else None
+
+# CSS読み込み（インラインの <style>。ファイルの読み込みは起動時の1回だけ）
+st.markdown(_ASSETS.stylesheet_markup("style.css"), unsafe_allow_html=True)
 
 
 ELEMENTS = {
@@ -131,8 +112,6 @@ FERTILIZERS = {
     },
 }
 
-fert_results = {}
-
 # ── 月順ラベル（暦年 1月〜12月 固定） ──
 MONTHS_LABEL = ["1月", "2月", "3月", "4月", "5月", "6月",
                 "7月", "8月", "9月", "10月", "11月", "12月"]
@@ -170,8 +149,8 @@ def comment_template(status, name):
         return f"土壌中の{name}は、目安とする範囲を上回っています。"
 
 
-def render_soil_eval(name, value, mlsn, slan):
-    """要素ごとの土壌評価を表示する"""
+def render_soil_eval(name, value, mlsn, slan, plan_state):
+    """要素ごとの土壌評価を表示する（補正量は plan_state に登録する）"""
 
     # ── 1. 判定 ──
     status = judge_status(value, mlsn, slan)
@@ -208,8 +187,7 @@ def render_soil_eval(name, value, mlsn, slan):
         deficit_text = f"不足量（目安）：{deficit:.1f} mg/100g<br>"
 
         if fert_kg is not None and name in ["N", "P", "K"]:
-            fert_results[name] = fert_kg
-            monthly_plan = split_by_month(fert_kg, name)
+            monthly_plan = plan_state.set_fertilizer(name, fert_kg)
             fert_text = (
                 f"肥料換算（{FERTILIZERS[name]['name']}）："
                 f"{fert_kg:.2f} kg / 10a<br>"
@@ -280,13 +258,6 @@ def calc_fertilizer_amount(deficit_kg, elem):
     rate = fert["rate"]
     return deficit_kg / rate
 
-def split_by_month(total_kg_10a, _elem=None):
-    """年間施肥量をGP配分比率で12ヶ月に配分する。
-    monthly_dist_ratios はGP計算後に設定されるグローバル変数。
-    """
-    return {str(m + 1): total_kg_10a * monthly_dist_ratios[m] for m in range(12)}
-
-
 def render_ca_mg_ratio(ca, mg):
     if mg <= 0:
         st.markdown("""
@@ -316,100 +287,6 @@ def render_ca_mg_ratio(ca, mg):
 """)
 
 
-# ============================================================
-# Growth Potential（GP）算出関数
-# ============================================================
-
-def estimate_temperature(day, latitude):
-    """
-    緯度から仮想的な年間気温カーブを生成する。
-    T(d) = T_mean + A * sin(2π * (d - φ) / 365)
-
-    ・T_mean : 年平均気温（緯度から簡易推定）
-    ・A       : 年較差の半分（緯度から簡易推定）
-    ・φ       : 位相（日本国内では定数: 最高気温が8月上旬に来るよう設定）
-    ※ 実測値ではなく「地点の気候的傾向」を表すためのモデル
-    """
-    t_mean    = 36.0 - 0.6 * latitude
-    amplitude = 0.35 * latitude - 2.5
-    phase     = 121  # sin ピークが day≒212（8月上旬）になる位相
-
-    return t_mean + amplitude * math.sin(2 * math.pi * (day - phase) / 365)
-
-
-def gp_cool(temp):
-    """寒地型芝の GP（気温応答関数）"""
-    if temp <= 0:
-        return 0.0
-    elif temp <= 20:
-        return temp / 20.0
-    elif temp < 35:
-        return (35.0 - temp) / 15.0
-    else:
-        return 0.0
-
-
-def gp_warm(temp):
-    """暖地型芝の GP（気温応答関数）"""
-    if temp <= 10:
-        return 0.0
-    elif temp <= 30:
-        return (temp - 10.0) / 20.0
-    elif temp < 45:
-        return (45.0 - temp) / 15.0
-    else:
-        return 0.0
-
-
-def weight_cool(temp):
-    """WOS 時の寒地型寄与率 w(T)"""
-    if temp <= 12:
-        return 1.0
-    elif temp < 22:
-        return (22.0 - temp) / 10.0
-    else:
-        return 0.0
-
-
-def calculate_daily_gp(latitude, turf_type):
-    """
-    365 日分の GP を算出する。
-    戻り値: list[float]（長さ 365）
-    """
-    daily_gp = []
-    for day in range(1, 366):
-        temp = estimate_temperature(day, latitude)
-
-        if turf_type == "寒地型芝":
-            gp = gp_cool(temp)
-        elif turf_type in ("暖地型芝", "日本芝"):
-            gp = gp_warm(temp)
-        elif turf_type == "ウィンターオーバーシード（WOS）":
-            w = weight_cool(temp)
-            gp = w * gp_cool(temp) + (1 - w) * gp_warm(temp)
-        else:
-            gp = 0.0
-
-        daily_gp.append(gp)
-
-    return daily_gp
-
-
-def monthly_gp_averages(daily_gp):
-    """
-    365 日分の GP を月別平均に集約する。
-    戻り値: dict（キー "1"〜"12"、値: 月平均 GP）
-    """
-    month_days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-    monthly = {}
-    start = 0
-    for m, days in enumerate(month_days, 1):
-        end = start + days
-        monthly[str(m)] = sum(daily_gp[start:end]) / days
-        start = end
-    return monthly
-
-
 # ============================================================
 # URL クエリパラメータからの復元（ページ再読み込み時）
 # ============================================================
@@ -455,60 +332,66 @@ st.markdown(
 
 # ── バナー表示（新規タブでサービスページへ） ──
 _BANNER_PR_URL = "https://www.turf-tools.jp/services-4"
-banner_pr = os.path.join(os.path.dirname(__file__), "banner_pr_size1.png")
-
-
-def _img_to_base64(path: str) -> str:
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
 
 
 def _linked_png_banner_markup(
-    path: str, url: str, alt: str, width_px: int, height_px: int
+    name: str, url: str, alt: str, width_px: int, height_px: int
 ) -> str:
-    """リンク付きバナー1枚分の HTML 断片（存在しないパスは空文字）。"""
-    if not os.path.exists(path):
+    """リンク付きバナー1枚分の HTML 断片（未登録のファイルは空文字）。"""
+    src = _ASSETS.image_src(name)
+    if src is None:
         return ""
-    b64 = _img_to_base64(path)
     return (
         f'<a href="{url}" target="_blank" rel="noopener noreferrer" style="flex-shrink:0;line-height:0;">'
-        f'<img src="data:image/png;base64,{b64}" alt="{alt}" '
+        f'<img src="{src}" alt="{alt}" '
         f'width="{width_px}" height="{height_px}" '
         f'style="width:{width_px}px;height:{height_px}px;object-fit:contain;display:block;" />'
         f"</a>"
     )
 
 
-if os.path.exists(banner_pr):
-    b64 = _img_to_base64(banner_pr)
-    st.markdown(
+def _build_banner_pr_markup() -> str:
+    src = _ASSETS.image_src("banner_pr_size1.png")
+    if src is None:
+        return ""
+    return (
         f'<a href="{_BANNER_PR_URL}" target="_blank" rel="noopener noreferrer">'
-        f'<img src="data:image/png;base64,{b64}" alt="PRバナー" '
+        f'<img src="{src}" alt="PRバナー" '
         f'style="width:auto;height:auto;max-width:100%;display:block;" />'
-        f"</a>",
-        unsafe_allow_html=True,
+        f"</a>"
     )
 
+
 # ── ブログ / YouTube バナー（600×200 原画を 300×100、横に密着配置） ──
 _BLOG_BANNER_URL = "https://www.turf-tools.jp/blog"
 _YOUTUBE_BANNER_URL = "https://www.youtube.com/channel/UCSRU0zk4Fj1ETWqMRlJDPJQ"
-banner_blog = os.path.join(os.path.dirname(__file__), "bloglink.png")
-banner_youtube = os.path.join(os.path.dirname(__file__), "youtubelink.png")
-_row_banners = [
-    _linked_png_banner_markup(banner_blog, _BLOG_BANNER_URL, "芝管理技術ブログ", 300, 100),
-    _linked_png_banner_markup(
-        banner_youtube, _YOUTUBE_BANNER_URL, "グロウアンドプログレス YouTube", 300, 100
-    ),
-]
-_row_banners = [h for h in _row_banners if h]
-if _row_banners:
-    st.markdown(
+
+
+def _build_banner_row_markup() -> str:
+    row_banners = [
+        _linked_png_banner_markup("bloglink.png", _BLOG_BANNER_URL, "芝管理技術ブログ", 300, 100),
+        _linked_png_banner_markup(
+            "youtubelink.png", _YOUTUBE_BANNER_URL, "グロウアンドプログレス YouTube", 300, 100
+        ),
+    ]
+    row_banners = [h for h in row_banners if h]
+    if not row_banners:
+        return ""
+    return (
         '<div style="display:flex;flex-wrap:wrap;align-items:flex-start;gap:6px;">'
-        + "".join(_row_banners)
-        + "</div>",
-        unsafe_allow_html=True,
+        + "".join(row_banners)
+        + "</div>"
     )
 
+
+# バナーのHTMLはプロセス内で1回だけ組み立てる
+for _banner_html in (
+    _ASSETS.markup("banner_pr", _build_banner_pr_markup),
+    _ASSETS.markup("banner_row", _build_banner_row_markup),
+):
+    if _banner_html:
+        st.markdown(_banner_html, unsafe_allow_html=True)
+
 st.markdown("## 基本条件（設計前提）")
 
 with st.container():
@@ -583,111 +466,114 @@ elif allocation_method == "GP準拠":
         "理論的ですが、気象データの品質に影響を受けます。"
     )
 
-# ===== Growth Potential（GP）表示 =====
-st.subheader("Growth Potential（GP）")
-st.caption(
-    "GPは「その地点で、その芝がどれだけ生育できるか」を表す"
-    "相対指標（0〜1）です。緯度から推定した年間気温カーブと、"
-    "芝種ごとの気温応答関数から算出しています。"
-)
-
-daily_gp = calculate_daily_gp(latitude, turf_type)
-monthly_gp = monthly_gp_averages(daily_gp)
-
-# ── GP値のリスト化・配分比率の計算 ──
-gp_values_list = [monthly_gp[str(m)] for m in range(1, 13)]
-_gp_sum = sum(gp_values_list)
-gp_ratios_list = (
-    [v / _gp_sum for v in gp_values_list] if _gp_sum > 0 else [1.0 / 12] * 12
-)
-
 # 管理対象 → 利用形態に変換
 if "ゴルフ" in management_target or "フェアウェイ" in management_target:
     _usage_type = "ゴルフ場"
 else:
     _usage_type = "競技場"
 
-# 季節補正係数を取得（春重点70/50/30 → "春重点" で季節係数をルックアップ）
-_base_stance = "春重点" if allocation_method.startswith("春重点") else allocation_method
-_season_factors = get_season_factors(
-    turf_type, _usage_type, _base_stance,
-    use_heavy=True,
-)
 
-# 月別配分比率を計算（全要素共通、allocation_method が反映される）
-monthly_dist_ratios = calculate_monthly_distribution_ratios(
-    gp_ratios_list, _season_factors, allocation_method, gp_values_list
+# ============================================================
+# GP・配分比率（入力が同じなら全セッションで計算結果を共有）
+# ============================================================
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def cached_distribution_plan(latitude, turf_type, usage_type, allocation_method):
+    """GP月別平均と月別配分比率（緯度・芝種・利用形態・配分方法のみに依存）"""
+    mark_cache_miss()
+    return compute_distribution_plan(latitude, turf_type, usage_type, allocation_method)
+
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def cached_gp_frame(latitude, turf_type):
+    """GPチャート・表用の DataFrame（緯度・芝種のみに依存）"""
+    mark_cache_miss()
+    gp_turf_labels = {
+        "寒地型芝": "寒地型GP",
+        "暖地型芝": "暖地型GP",
+        "日本芝": "日本芝GP",
+    }
+    monthly_gp = monthly_gp_averages(calculate_daily_gp(latitude, turf_type))
+
+    if turf_type == "ウィンターオーバーシード（WOS）":
+        monthly_cool = monthly_gp_averages(calculate_daily_gp(latitude, "寒地型芝"))
+        monthly_warm = monthly_gp_averages(calculate_daily_gp(latitude, "暖地型芝"))
+
+        df_gp = pd.DataFrame({
+            "寒地型GP": [monthly_cool[str(m)] for m in range(1, 13)],
+            "暖地型GP": [monthly_warm[str(m)] for m in range(1, 13)],
+            "WOS（合成GP）": [monthly_gp[str(m)] for m in range(1, 13)],
+        }, index=MONTHS_LABEL)
+    else:
+        label = gp_turf_labels.get(turf_type, turf_type)
+        df_gp = pd.DataFrame({
+            label: [monthly_gp[str(m)] for m in range(1, 13)],
+        }, index=MONTHS_LABEL)
+
+    # ── 月順を明示的に 1月〜12月 で固定 ──
+    return df_gp.reindex(MONTHS_LABEL)
+
+
+# 同じ条件のGP計算が複数セッションから同時に要求された場合は、st.cache_data がキーごとに
+# 1回だけ計算して待たせる（結果は共有されるため書き換えない。PlanState は複製して保持する）
+_plan = cache_lookup(
+    "gp_plan", cached_distribution_plan, latitude, turf_type, _usage_type, allocation_method
 )
 
-# ── 防御的正規化：負値クリップ＋合計 1.0 保証 ──
-monthly_dist_ratios = [max(0.0, r) for r in monthly_dist_ratios]
-_ratio_total = sum(monthly_dist_ratios)
-if _ratio_total > 0:
-    monthly_dist_ratios = [r / _ratio_total for r in monthly_dist_ratios]
-else:
-    monthly_dist_ratios = [1.0 / 12] * 12
 
-# ── GPチャート用 DataFrame ──
-gp_turf_labels = {
-    "寒地型芝": "寒地型GP",
-    "暖地型芝": "暖地型GP",
-    "日本芝": "日本芝GP",
-}
+# ============================================================
+# 画面の各セクション（st.fragment）
+# 土壌分析値の入力はフラグメント内にあるため、土壌値を変更しても
+# 再実行されるのは土壌セクションだけで、GPの計算・グラフは再描画されない。
+# 基本条件（緯度・芝種・配分方法）を変更した場合はページ全体が再実行される。
+# ============================================================
 
-if turf_type == "ウィンターオーバーシード（WOS）":
-    daily_cool = calculate_daily_gp(latitude, "寒地型芝")
-    daily_warm = calculate_daily_gp(latitude, "暖地型芝")
-    monthly_cool = monthly_gp_averages(daily_cool)
-    monthly_warm = monthly_gp_averages(daily_warm)
-
-    df_gp = pd.DataFrame({
-        "寒地型GP": [monthly_cool[str(m)] for m in range(1, 13)],
-        "暖地型GP": [monthly_warm[str(m)] for m in range(1, 13)],
-        "WOS（合成GP）": [monthly_gp[str(m)] for m in range(1, 13)],
-    }, index=MONTHS_LABEL)
-else:
-    label = gp_turf_labels.get(turf_type, turf_type)
-    df_gp = pd.DataFrame({
-        label: [monthly_gp[str(m)] for m in range(1, 13)],
-    }, index=MONTHS_LABEL)
-
-# ── 月順を明示的に 1月〜12月 で固定 ──
-df_gp = df_gp.reindex(MONTHS_LABEL)
-
-# ── 安全チェック：NaN / 全ゼロ / 空 ──
-if df_gp.empty:
-    st.error("⚠️ df_gp が空です。GP計算に問題がある可能性があります。")
-elif df_gp.isnull().any().any():
-    st.warning("⚠️ GP値に NaN が含まれています。緯度・芝種の設定を確認してください。")
-elif (df_gp == 0).all().any():
-    st.warning("⚠️ GP値がすべて 0 の列があります。緯度・芝種の設定を確認してください。")
-
-# ── Altair で GP グラフを描画（月順を明示的にカテゴリ制御） ──
-df_plot = df_gp.reset_index()
-df_plot.columns = ["月"] + list(df_gp.columns)
-
-# wide → long 形式に変換（複数系列に対応）
-df_long = df_plot.melt(id_vars="月", var_name="系列", value_name="GP")
-
-gp_chart = (
-    alt.Chart(df_long)
-    .mark_line(point=True)
-    .encode(
-        x=alt.X("月:N", sort=MONTHS_LABEL, title="月"),
-        y=alt.Y("GP:Q", scale=alt.Scale(domain=[0, 1]), title="Growth Potential"),
-        color=alt.Color("系列:N", title=""),
+@st.fragment
+def render_gp_section(latitude, turf_type):
+    """GPのグラフ・表（依存：緯度・芝種）"""
+    st.subheader("Growth Potential（GP）")
+    st.caption(
+        "GPは「その地点で、その芝がどれだけ生育できるか」を表す"
+        "相対指標（0〜1）です。緯度から推定した年間気温カーブと、"
+        "芝種ごとの気温応答関数から算出しています。"
     )
-    .properties(height=350)
-)
-st.altair_chart(gp_chart, use_container_width=True)
 
-st.dataframe(
-    df_gp.T.style.format("{:.2f}"),
-    use_container_width=True,
-)
+    df_gp = cache_lookup("gp_frame", cached_gp_frame, latitude, turf_type)
+
+    # ── 安全チェック：NaN / 全ゼロ / 空 ──
+    if df_gp.empty:
+        st.error("⚠️ df_gp が空です。GP計算に問題がある可能性があります。")
+    elif df_gp.isnull().any().any():
+        st.warning("⚠️ GP値に NaN が含まれています。緯度・芝種の設定を確認してください。")
+    elif (df_gp == 0).all().any():
+        st.warning("⚠️ GP値がすべて 0 の列があります。緯度・芝種の設定を確認してください。")
+
+    # ── Altair で GP グラフを描画（月順を明示的にカテゴリ制御） ──
+    df_plot = df_gp.reset_index()
+    df_plot.columns = ["月"] + list(df_gp.columns)
+
+    # wide → long 形式に変換（複数系列に対応）
+    df_long = df_plot.melt(id_vars="月", var_name="系列", value_name="GP")
+
+    gp_chart = (
+        alt.Chart(df_long)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("月:N", sort=MONTHS_LABEL, title="月"),
+            y=alt.Y("GP:Q", scale=alt.Scale(domain=[0, 1]), title="Growth Potential"),
+            color=alt.Color("系列:N", title=""),
+        )
+        .properties(height=350)
+    )
+    st.altair_chart(gp_chart, use_container_width=True)
+
+    st.dataframe(
+        df_gp.T.style.format("{:.2f}"),
+        use_container_width=True,
+    )
 
-with st.expander("GPの設計思想について"):
-    st.markdown("""
+    with st.expander("GPの設計思想について"):
+        st.markdown("""
 **Growth Potential（GP）とは**
 
 GPは、気温に対する芝の生育応答を 0〜1 の相対値で表した指標です。
@@ -709,103 +595,64 @@ WOS は寒地型と暖地型の単純平均ではなく、
 気温に応じた重み付き合成を行っています。
 """)
 
-st.subheader("2. 土壌分析値（mg/100g）")
-st.caption("※ 最新の土壌分析結果を入力してください（乾土基準）")
 
-col1, col2 = st.columns(2)
+@st.fragment
+def render_distribution_explain(latitude, turf_type, usage_type, allocation_method):
+    """月別配分比率の計算過程（依存：緯度・芝種・利用形態・配分方法）"""
+    if not st.toggle("🔍 月別配分の計算過程を表示", key="show_dist_explain"):
+        return
 
-with col1:
-    no3_n = st.number_input(
-        "硝酸態窒素（NO₃-N）",
-        min_value=0.0,
-        step=0.1,
-        help="mg/100g 乾土"
-    )
+    # 表示するときだけ計算過程を記録して再計算する（通常の計算では記録しない）
+    trace = DistributionTrace()
+    compute_distribution_plan(latitude, turf_type, usage_type, allocation_method, trace=trace)
 
-    nh4_n = st.number_input(
-        "アンモニア態窒素（NH₄-N）",
-        min_value=0.0,
-        step=0.1,
-        help="mg/100g 乾土"
+    st.caption(
+        "GP比率に季節係数（管理強度・春重点スケーリング適用後）を掛け、"
+        "GP制御で上限を抑えたあと、合計が1になるよう正規化して月別配分比率を求めています。"
     )
-
-with col2:
-    p2o5 = st.number_input(
-        "可給態リン酸（P₂O₅）",
-        min_value=0.0,
-        step=0.1,
-        help="mg/100g 乾土"
+    header, rows = trace.to_table()
+    st.dataframe(
+        pd.DataFrame(rows, columns=header).set_index("段階").style.format("{:.3f}"),
+        use_container_width=True,
     )
 
-    k2o = st.number_input(
-        "交換性カリ（K₂O）",
-        min_value=0.0,
-        step=0.1,
-        help="mg/100g 乾土"
+    month = st.selectbox(
+        "月ごとの内訳", list(range(1, 13)), index=3, format_func=lambda m: f"{m}月", key="dist_explain_month"
     )
-    ca = st.number_input(
-        "カルシウム（CaO）",
-        min_value=0.0,
-        step=0.1,
-        help="mg/100g 乾土"
-    )
-    mg = st.number_input(
-        "マグネシウム（MgO）",
-        min_value=0.0,
-        step=0.1,
-        help="mg/100g 乾土"
-    )
-
-values = {
-    "N": no3_n,
-    "P": p2o5,
-    "K": k2o,
-}
+    steps = trace.explain_month(month)
+    st.markdown(" → ".join(f"{s['label']} **{s['value']:.3f}**" for s in steps))
+    st.caption(f"{month}月の配分比率：{steps[-1]['value'] * 100:.1f}%（年間施肥量に対する割合）")
 
-
-
-
-# Ca:Mg 比（安全計算のみ ── 表示はセクション3で行う）
-if mg > 0:
-    ca_mg_ratio = ca / mg
-
-    if ca_mg_ratio >= 10:
-        comment_key = "high"
-    elif ca_mg_ratio >= 3:
-        comment_key = "balanced"
-    else:
-        comment_key = "low"
-
-else:
-    ca_mg_ratio = None
-
-st.subheader("3. 土壌分析値の評価")
-
-col1, col2 = st.columns(2)
-
-# ---- 左列：N / P / K ----
-with col1:
-    for elem, cfg in ELEMENTS.items():
-        render_soil_eval(
-            elem,
-            values[elem],
-            cfg["mlsn"],
-            cfg["slan"],
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "計算過程をCSVでダウンロード",
+            data=lambda: export_table(trace.to_table(), "csv"),
+            file_name="distribution_trace.csv",
+            mime="text/csv",
+            on_click="ignore",
+        )
+    with col2:
+        st.download_button(
+            "計算過程をJSONでダウンロード",
+            data=trace.to_json,
+            file_name="distribution_trace.json",
+            mime="application/json",
+            on_click="ignore",
         )
 
-# ===== 月別施肥計画（N・P・K 統合） =====
 
-monthly_all = {}
+def export_table(table, fmt):
+    """表のCSV・Excel（エクスポートのスケジューラで対話的なジョブとして作成し、完了まで待つ）"""
+    return get_scheduler().run(payload_job, user=_USER, kind=fmt, args=(table, fmt))
 
-for elem in ["N", "P", "K"]:
-    if elem in fert_results:
-        plan = split_by_month(fert_results[elem], elem)
-        for month, kg in plan.items():
-            if month not in monthly_all:
-                monthly_all[month] = {"N": 0.0, "P": 0.0, "K": 0.0}
-            monthly_all[month][elem] = kg
 
-if monthly_all:
+def render_monthly_plan(plan_state):
+    """月別施肥計画（N・P・K 統合）とダウンロード（依存：土壌評価の結果・GP・配分比率）"""
+    monthly_all = plan_state.monthly_plan()
+    if not monthly_all:
+        return
+
     # 全12ヶ月分を明示的に 1〜12 順で構築
     all_months_str = [str(m) for m in range(1, 13)]
     rows = []
@@ -819,73 +666,147 @@ if monthly_all:
     st.dataframe(df_all)
 
     # ===== CSV / Excel ダウンロード =====
-    export_rows = []
-    for m in range(1, 13):
-        m_str = str(m)
-        gp_val = round(monthly_gp.get(m_str, 0.0), 2)
-        dist_coeff = round(monthly_dist_ratios[m - 1], 3)
-
-        n_kgha = round(monthly_all.get(m_str, {}).get("N", 0.0), 2)
-        p_kgha = round(monthly_all.get(m_str, {}).get("P", 0.0), 2)
-        k_kgha = round(monthly_all.get(m_str, {}).get("K", 0.0), 2)
-
-        export_rows.append({
-            "月": f"{m}月",
-            "GP": gp_val,
-            "配分係数": dist_coeff,
-            "N (kg/ha)": n_kgha,
-            "P (kg/ha)": p_kgha,
-            "K (kg/ha)": k_kgha,
-            "N (g/㎡)": round(n_kgha * 0.1, 2),
-            "P (g/㎡)": round(p_kgha * 0.1, 2),
-            "K (g/㎡)": round(k_kgha * 0.1, 2),
-        })
-
-    export_rows.append({
-        "月": "年間合計",
-        "GP": "",
-        "配分係数": "",
-        "N (kg/ha)": round(sum(r["N (kg/ha)"] for r in export_rows), 2),
-        "P (kg/ha)": round(sum(r["P (kg/ha)"] for r in export_rows), 2),
-        "K (kg/ha)": round(sum(r["K (kg/ha)"] for r in export_rows), 2),
-        "N (g/㎡)": round(sum(r["N (g/㎡)"] for r in export_rows), 2),
-        "P (g/㎡)": round(sum(r["P (g/㎡)"] for r in export_rows), 2),
-        "K (g/㎡)": round(sum(r["K (g/㎡)"] for r in export_rows), 2),
-    })
-
-    df_export = pd.DataFrame(export_rows)
-
-    # CSV（BOM付きUTF-8で Excel でも文字化けしない）
-    csv_data = df_export.to_csv(index=False, encoding="utf-8-sig")
-
-    # Excel
-    excel_buffer = io.BytesIO()
-    with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
-        df_export.to_excel(writer, index=False, sheet_name="施肥設計")
-    excel_data = excel_buffer.getvalue()
+    # ファイルはボタンが押されたときにだけ生成する（同じ内容ならキャッシュを返す）
+    table = plan_table(plan_state.monthly_gp, plan_state.monthly_dist_ratios, monthly_all)
 
     col_dl1, col_dl2 = st.columns(2)
     with col_dl1:
         st.download_button(
             label="📥 CSVダウンロード",
-            data=csv_data,
+            data=lambda: export_table(table, "csv"),
             file_name="施肥設計.csv",
             mime="text/csv",
+            on_click="ignore",
         )
     with col_dl2:
         st.download_button(
             label="📥 Excelダウンロード",
-            data=excel_data,
+            data=lambda: export_table(table, "xlsx"),
             file_name="施肥設計.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
+            on_click="ignore",
         )
 
-# ---- 右列：Ca / Mg ----
-with col2:
-    render_soil_eval("Ca", ca, 100.0, 200.0)
-    render_soil_eval("Mg", mg, 2.0, 4.0)
 
-    render_ca_mg_ratio(ca, mg)
+def record_plan(plan_state, conditions, soil_values):
+    """
+    計算した施肥計画を施肥設計の履歴に記録する（FERT_DESIGN_HISTORY=0 のときは記録しない）
+
+    土壌分析値が未入力（すべて 0）のときと、同じ入力で再実行されたときは記録しない。
+    """
+    if not any(soil_values.values()):
+        return
+    input_data = {**conditions, "soil_values": dict(soil_values)}
+    key = design_key(input_data)
+    if st.session_state.get("_recorded_plan") == key:
+        return
+    rates = {elem: fert["rate"] for elem, fert in FERTILIZERS.items()}
+    design = plan_state.to_design("単一サイト", input_data, rates)
+    record_designs([design], rows=[None])
+    st.session_state["_recorded_plan"] = key
+
+
+@st.fragment
+def render_soil_section(monthly_gp, monthly_dist_ratios, conditions):
+    """土壌分析値の入力・評価・月別施肥計画・ダウンロード（依存：土壌分析値・GP・配分比率・設計条件）"""
+    # 施肥計画の状態は実行ごとに作り直し、各関数へ明示的に渡す
+    plan_state = PlanState(monthly_gp, monthly_dist_ratios)
+
+    st.subheader("2. 土壌分析値（mg/100g）")
+    st.caption("※ 最新の土壌分析結果を入力してください（乾土基準）")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        no3_n = st.number_input(
+            "硝酸態窒素（NO₃-N）",
+            min_value=0.0,
+            step=0.1,
+            help="mg/100g 乾土"
+        )
+
+        st.number_input(
+            "アンモニア態窒素（NH₄-N）",
+            min_value=0.0,
+            step=0.1,
+            help="mg/100g 乾土"
+        )
+
+    with col2:
+        p2o5 = st.number_input(
+            "可給態リン酸（P₂O₅）",
+            min_value=0.0,
+            step=0.1,
+            help="mg/100g 乾土"
+        )
+
+        k2o = st.number_input(
+            "交換性カリ（K₂O）",
+            min_value=0.0,
+            step=0.1,
+            help="mg/100g 乾土"
+        )
+        ca = st.number_input(
+            "カルシウム（CaO）",
+            min_value=0.0,
+            step=0.1,
+            help="mg/100g 乾土"
+        )
+        mg = st.number_input(
+            "マグネシウム（MgO）",
+            min_value=0.0,
+            step=0.1,
+            help="mg/100g 乾土"
+        )
+
+    values = {
+        "N": no3_n,
+        "P": p2o5,
+        "K": k2o,
+    }
+
+    # Ca:Mg 比の判定・表示はセクション3（render_ca_mg_ratio）で行う
+    st.subheader("3. 土壌分析値の評価")
+
+    col1, col2 = st.columns(2)
+
+    # ---- 左列：N / P / K ----
+    with col1:
+        for elem, cfg in ELEMENTS.items():
+            render_soil_eval(
+                elem,
+                values[elem],
+                cfg["mlsn"],
+                cfg["slan"],
+                plan_state,
+            )
+
+    render_monthly_plan(plan_state)
+    record_plan(plan_state, conditions, {"P": p2o5, "K": k2o, "Ca": ca, "Mg": mg, "NO3-N": no3_n})
+
+    # ---- 右列：Ca / Mg ----
+    with col2:
+        render_soil_eval("Ca", ca, 100.0, 200.0, plan_state)
+        render_soil_eval("Mg", mg, 2.0, 4.0, plan_state)
+
+        render_ca_mg_ratio(ca, mg)
+
+
+render_gp_section(latitude, turf_type)
+render_distribution_explain(latitude, turf_type, _usage_type, allocation_method)
+render_soil_section(
+    _plan["monthly_gp"],
+    _plan["monthly_dist_ratios"],
+    {
+        "grass_type": turf_type,
+        "usage_type": _usage_type,
+        "management_intensity": management_target,
+        "fertilizer_stance": msl_slan_position,
+        "distribution_stance": allocation_method,
+        "latitude": latitude,
+        "longitude": longitude,
+    },
+)
 
 # ===== 設計思想まとめ =====
 st.markdown("---")
@@ -977,3 +898,46 @@ st.markdown("""
     </a>
 </div>
 """, unsafe_allow_html=True)
+
+
+# ===== デバッグ：処理段階ごとの所要時間 =====
+def render_trace_panel(recorder):
+    """この実行で記録した span の集計と Chrome トレースのダウンロード"""
+    with st.expander("🔧 デバッグ：処理段階ごとの所要時間", expanded=True):
+        st.caption(
+            "ページ全体の実行中に記録した処理段階です。キャッシュ済みの計算と、"
+            "セクション単位の再実行（土壌値の変更など）は記録されません。"
+        )
+        summary = recorder.summary()
+        if not summary:
+            st.write("記録された処理はありません（計算結果はすべてキャッシュから取得されました）。")
+            return
+        df_trace = pd.DataFrame(summary)[["label", "name", "count", "total_ms", "mean_ms", "max_ms"]]
+        st.dataframe(
+            df_trace,
+            hide_index=True,
+            column_config={
+                "label": st.column_config.TextColumn("段階"),
+                "name": st.column_config.TextColumn("span"),
+                "count": st.column_config.NumberColumn("回数"),
+                "total_ms": st.column_config.NumberColumn("合計 (ms)", format="%.3f"),
+                "mean_ms": st.column_config.NumberColumn("平均 (ms)", format="%.3f"),
+                "max_ms": st.column_config.NumberColumn("最大 (ms)", format="%.3f"),
+            },
+        )
+        st.download_button(
+            "Chrome トレース（JSON）をダウンロード",
+            data=recorder.chrome_trace_json,
+            file_name="trace.json",
+            mime="application/json",
+            on_click="ignore",
+        )
+
+
+observe_rerun("main", _RERUN_START)
+
+if _TRACE is not None:
+    _trace_recorder, _trace_token = _TRACE
+    stop_recording(_trace_token)
+    if _DEBUG:
+        render_trace_panel(_trace_recorder)
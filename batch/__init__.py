@@ -0,0 +1,24 @@
+"""
+一括計算モジュール
+"""
+
+from .io import iter_site_chunks, iter_site_rows
+from .pipeline import run_file_batch
+from .runner import (
+    BatchProgress,
+    SiteRowError,
+    parse_site_row,
+    read_site_table,
+    run_batch_job,
+)
+
+__all__ = [
+    "BatchProgress",
+    "SiteRowError",
+    "iter_site_chunks",
+    "iter_site_rows",
+    "parse_site_row",
+    "read_site_table",
+    "run_batch_job",
+    "run_file_batch",
+]
@@ -0,0 +1,111 @@
+"""
+ファイルからの一括計算（コマンドライン）
+
+使い方：
+    python -m batch sites.parquet --out result/
+    python -m batch sites.csv --out result/ --memory-limit 256M --format csv
+    python -m batch sites.parquet --out result/ --memory-report   # 段階ごとのメモリ使用量（tracemalloc）
+    python -m batch sites.parquet --out result/ --verify          # 中断なしの再計算と出力を照合
+
+途中で止まった場合は、同じコマンドを再実行すると完了した入力チャンクを飛ばして続きから計算する。
+出力は batch.pipeline、チェックポイントは batch.checkpoint を参照。
+
+複数台で分担する場合は init / work / merge / status のサブコマンドを使う（batch.shard を参照）。
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from .checkpoint import CheckpointMismatch
+from .io import DEFAULT_CHUNK_SIZE
+from .memory_report import MemoryReport
+from .pipeline import SUMMARY_FORMATS, run_file_batch
+from . import shard
+from .spill import DEFAULT_MEMORY_LIMIT, parse_size
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in shard.COMMANDS:
+        return shard.main(argv)
+
+    parser = argparse.ArgumentParser(prog="python -m batch", description="ファイルからの一括計算（メモリ上限つき）")
+    parser.add_argument("input", type=Path, help="サイト一覧（.csv / .jsonl / .parquet / .xlsx）")
+    parser.add_argument("--out", type=Path, required=True, help="出力ディレクトリ")
+    parser.add_argument("--memory-limit", default=f"{DEFAULT_MEMORY_LIMIT >> 20}M",
+                        help="メモリ上限（例: 256M, 2G）。近づくと途中結果を一時ファイルに退避する")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="入力を読む単位（行数）")
+    parser.add_argument("--format", choices=SUMMARY_FORMATS, default="parquet", help="summary の出力形式")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="段階ごとのメモリ使用量を tracemalloc で計測する（計算は数倍遅くなる）")
+    parser.add_argument("--restart", action="store_true", help="途中結果を捨てて最初から計算する")
+    parser.add_argument("--verify", action="store_true",
+                        help="完了後に中断なしで計算し直し、出力が一致するか確かめる（計算時間は2倍）")
+    parser.add_argument("--keep-work", action="store_true", help="完了後も部分出力（.work/）を残す")
+    parser.add_argument("--no-memo", action="store_true",
+                        help="施肥量計算の永続メモ（storage.memo_cache）を使わずにすべて計算する")
+    parser.add_argument("--history", action="store_true",
+                        help="計算した設計を施肥設計の履歴（storage.history）に記録する（計算は遅くなる）")
+    parser.add_argument("--course", default="", help="履歴に記録するコース・施設名")
+    parser.add_argument("--season", help="履歴に記録するシーズン（省略時は今年）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    try:
+        memory_limit = parse_size(args.memory_limit)
+    except ValueError as e:
+        parser.error(str(e))
+
+    report = MemoryReport(trace=args.memory_report)
+    try:
+        result = run_file_batch(
+            args.input,
+            args.out,
+            memory_limit=memory_limit,
+            chunk_size=args.chunk_size,
+            summary_format=args.format,
+            report=report,
+            progress=lambda done, failed: print(f"  {done:,} サイト（エラー {failed:,}）", file=sys.stderr, flush=True),
+            restart=args.restart,
+            keep_work=args.keep_work,
+            verify=args.verify,
+            use_memo=not args.no_memo,
+            history=args.history,
+            course=args.course,
+            season=args.season,
+        )
+    except CheckpointMismatch as e:
+        print(f"error: 途中結果から再開できません：{e}（--restart で最初から計算します）", file=sys.stderr)
+        return 1
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    peak = result["peak_rss_bytes"]
+    peak_text = f"{peak / (1 << 20):.0f} MB" if peak else "-"
+    if result["resumed_chunks"]:
+        print(f"完了済みの {result['resumed_chunks']} / {result['chunks']} チャンクを飛ばしました（計算ルール {result['rule_version']}）")
+    print(f"{result['sites']:,} サイト（エラー {result['errors']:,}）, {result['seconds']:.1f} 秒, "
+          f"部分出力 {result['parts']} 件, ピークRSS {peak_text}")
+    for key, path in result["outputs"].items():
+        print(f"  {key}: {path}")
+    if args.memory_report:
+        print(report.format())
+        report_path = args.out / "memory_report.json"
+        report_path.write_bytes(report.to_json())
+        print(f"  memory_report: {report_path}")
+    if result["verified"] is not None:
+        if not result["verified"]:
+            print("照合：中断なしの計算と出力が異なります", file=sys.stderr)
+            for difference in result["differences"]:
+                print(f"  {difference}", file=sys.stderr)
+            return 1
+        print("照合：中断なしの計算と出力が一致しました")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
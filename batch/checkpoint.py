@@ -0,0 +1,268 @@
+"""
+ファイルからの一括計算のチェックポイント
+
+長時間の一括計算（ルール改定時の全会員コースの再計算など）が途中で止まっても、
+同じコマンドを再実行すれば終わった入力チャンクを飛ばして続きから計算できるようにする。
+
+出力ディレクトリの構成：
+- manifest.json：実行の条件（入力ファイルのハッシュ、チャンクの行数、計算ルールのバージョン）と状態
+- .work/ledger.jsonl：完了した入力チャンクの台帳（1チャンク1行、チャンクの部分出力のファイル名とハッシュ）
+- .work/*.npy, *.arrow, errors-*.csv：チャンクごとの部分出力
+
+ファイルはすべて一時ファイルに書いてから os.replace で置き換えるため、
+途中で止まっても書きかけのファイルが正しい名前で残ることはない。
+台帳の行は部分出力を書き終えてから追記し、fsync する。
+再開時は台帳に載っていて、ファイルのハッシュが一致するチャンクだけを完了とみなす。
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
+
+from logic.constants import RULE_VERSION, rule_fingerprint
+
+
+MANIFEST_NAME = "manifest.json"
+LEDGER_NAME = "ledger.jsonl"
+WORK_DIR_NAME = ".work"
+
+# マニフェストの形式のバージョン
+MANIFEST_FORMAT = 1
+
+# 書き出すファイルの権限（0666 から umask を除いたもの。umask は読み出すと戻す必要があるので起動時に1回だけ読む）
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_FILE_MODE = 0o666 & ~_UMASK
+
+
+class CheckpointMismatch(ValueError):
+    """途中結果が現在の入力・条件と一致しない（再開できない）ことを示す例外"""
+
+
+@contextmanager
+def atomic_write(path: Path, mode: str = "wb") -> Iterator[Any]:
+    """
+    一時ファイルに書いてから path に置き換える（with 文の中で書いたものだけが残る）
+
+    置き換えたファイルの権限は open() で作った場合と同じ（umask に従う）にする
+    （mkstemp の一時ファイルは所有者だけが読める 0600 のため）。
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8", "newline": ""})) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_sha256(source: Union[str, os.PathLike, BinaryIO]) -> str:
+    """
+    入力（パスまたはストリーム）の内容のハッシュ（ストリームは先頭に戻しておく）
+    """
+    if not hasattr(source, "read"):
+        return file_sha256(Path(source))
+    digest = hashlib.sha256()
+    position = source.tell()
+    for block in iter(lambda: source.read(1 << 20), b""):
+        digest.update(block)
+    source.seek(position)
+    return digest.hexdigest()
+
+
+def new_manifest(input_name: str, input_sha256: str, chunk_size: int) -> Dict[str, Any]:
+    """
+    実行の条件を記録したマニフェストを作る
+    """
+    return {
+        "format": MANIFEST_FORMAT,
+        "input": {"name": input_name, "sha256": input_sha256},
+        "chunk_size": chunk_size,
+        "rule_version": RULE_VERSION,
+        "rule_fingerprint": rule_fingerprint(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "completed": False,
+    }
+
+
+def check_manifest(saved: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """
+    保存済みのマニフェストから再開できるか確認する
+
+    Raises:
+        CheckpointMismatch: 入力・チャンクの行数・計算ルールが異なる場合
+    """
+    checks = [
+        ("format", "マニフェストの形式"),
+        ("chunk_size", "チャンクの行数"),
+        ("rule_version", "計算ルールのバージョン"),
+        ("rule_fingerprint", "計算ロジック"),
+    ]
+    for key, label in checks:
+        if saved.get(key) != current.get(key):
+            raise CheckpointMismatch(f"{label}が前回と異なります（前回 {saved.get(key)}、今回 {current.get(key)}）")
+    if saved.get("input", {}).get("sha256") != current["input"]["sha256"]:
+        raise CheckpointMismatch("入力ファイルの内容が前回と異なります")
+
+
+def load_manifest(out_dir: Path) -> Optional[Dict[str, Any]]:
+    path = Path(out_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir: Path, manifest: Dict[str, Any]) -> None:
+    with atomic_write(Path(out_dir) / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+class Ledger:
+    """
+    完了した入力チャンクの台帳（.work/ledger.jsonl）
+    """
+
+    def __init__(self, work_dir: Path):
+        self.work_dir = Path(work_dir)
+        self.path = self.work_dir / LEDGER_NAME
+        self.entries: Dict[int, Dict[str, Any]] = {}
+
+    def load(self) -> List[int]:
+        """
+        台帳を読み込み、部分出力がそろっているチャンクだけを完了として残す
+
+        Returns:
+            部分出力が欠けている・壊れているため捨てたチャンクの番号
+        """
+        self.entries = {}
+        dropped = []
+        if not self.path.exists():
+            return dropped
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 追記の途中で止まった最後の行
+                    continue
+                if self._intact(entry):
+                    self.entries[entry["chunk"]] = entry
+                else:
+                    dropped.append(entry["chunk"])
+        return dropped
+
+    def _intact(self, entry: Dict[str, Any]) -> bool:
+        for name, digest in entry.get("sha256", {}).items():
+            path = self.work_dir / name
+            if not path.exists() or file_sha256(path) != digest:
+                return False
+        return True
+
+    def is_done(self, chunk_no: int) -> bool:
+        return chunk_no in self.entries
+
+    def record(self, chunk_no: int, sites: int, errors: int, files: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        チャンクの完了を追記する（部分出力を書き終えてから呼ぶ）
+
+        Args:
+            files: {"plans": [...], "summary": [...], "errors": [...]}（.work 内のファイル名）
+        """
+        names = [name for group in files.values() for name in group]
+        entry = {
+            "chunk": chunk_no,
+            "sites": sites,
+            "errors": errors,
+            "files": files,
+            "sha256": {name: file_sha256(self.work_dir / name) for name in names},
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[chunk_no] = entry
+        return entry
+
+    def ordered(self) -> List[Dict[str, Any]]:
+        """
+        完了したチャンク（チャンク番号の順）
+        """
+        return [self.entries[k] for k in sorted(self.entries)]
+
+    def files(self, group: str) -> List[Path]:
+        """
+        完了したチャンクの部分出力（チャンク番号の順）
+        """
+        return [self.work_dir / name for entry in self.ordered() for name in entry["files"].get(group, [])]
+
+    def remove_unlisted(self) -> int:
+        """
+        台帳に載っていないファイル（完了前に止まったチャンクの部分出力・一時ファイル）を消す
+
+        Returns:
+            消したファイルの数
+        """
+        keep = {LEDGER_NAME} | {name for entry in self.entries.values() for name in entry["sha256"]}
+        removed = 0
+        for path in self.work_dir.iterdir():
+            if path.name not in keep and path.is_file():
+                path.unlink()
+                removed += 1
+        return removed
+
+
+def compare_outputs(expected_dir: Path, actual_dir: Path, summary_format: str) -> List[str]:
+    """
+    2つの一括計算の出力（summary / plans / errors）が一致するか比べる
+
+    Returns:
+        相違点の説明（一致すれば空）
+    """
+    import numpy as np
+
+    expected_dir, actual_dir = Path(expected_dir), Path(actual_dir)
+    differences = []
+
+    expected_plans = np.load(expected_dir / "plans.npy", mmap_mode="r")
+    actual_plans = np.load(actual_dir / "plans.npy", mmap_mode="r")
+    if expected_plans.shape != actual_plans.shape:
+        differences.append(f"plans.npy の形が異なります（{expected_plans.shape} / {actual_plans.shape}）")
+    elif not np.array_equal(expected_plans, actual_plans):
+        rows = int(np.any(expected_plans != actual_plans, axis=(1, 2)).sum())
+        differences.append(f"plans.npy の {rows} サイトの値が異なります")
+
+    summary = f"summary.{summary_format}"
+    if summary_format == "parquet":
+        import pyarrow.parquet as pq
+
+        if not pq.read_table(expected_dir / summary).equals(pq.read_table(actual_dir / summary)):
+            differences.append(f"{summary} の内容が異なります")
+    elif file_sha256(expected_dir / summary) != file_sha256(actual_dir / summary):
+        differences.append(f"{summary} の内容が異なります")
+
+    if file_sha256(expected_dir / "errors.csv") != file_sha256(actual_dir / "errors.csv"):
+        differences.append("errors.csv の内容が異なります")
+    return differences
@@ -0,0 +1,201 @@
+"""
+複数サイトのダッシュボード用インデックス
+
+一括計算の結果（数百〜数万サイト）を一覧表示するため、
+年間施肥量・春のN比率・状態・月別Nの推移を列ごとの配列として1回だけ集計しておき、
+並べ替え・絞り込み・ページ分割はインデックス（行番号の配列）の操作だけで行う。
+画面に渡すのは表示中のページの行だけで、全件の DataFrame は作らない。
+
+月別Nの推移は小さなSVG（スパークライン）にし、形が同じ曲線は使い回す。
+"""
+
+import base64
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from logic.constants import SOIL_REFERENCE_RANGES
+
+
+NUTRIENTS = ["N", "P", "K", "Ca", "Mg"]
+
+# 春（3〜5月、0-indexed: 2-4）
+SPRING_MONTHS = [2, 3, 4]
+
+STATUS_DEFICIT = "不足補正あり"
+STATUS_EXCESS = "過剰抑制あり"
+STATUS_OK = "標準"
+STATUSES = [STATUS_DEFICIT, STATUS_EXCESS, STATUS_OK]
+
+SORT_KEYS = ["site_id", "status", "spring_share"] + NUTRIENTS
+
+SPARKLINE_SIZE = (120, 28)
+
+
+def design_status(soil_values: Dict[str, Any]) -> str:
+    """
+    土壌診断値を基準範囲（SOIL_REFERENCE_RANGES）と比べてサイトの状態を判定
+    （年間施肥量の補正と同じ判定。補正内容の表示文言は要素ごとに異なるため使わない）
+    """
+    deficit = excess = False
+    for key, (low, high) in SOIL_REFERENCE_RANGES.items():
+        value = soil_values.get(key)
+        if value is None:
+            continue
+        value = float(value)
+        deficit = deficit or value < low
+        excess = excess or value > high
+    if deficit:
+        return STATUS_DEFICIT
+    if excess:
+        return STATUS_EXCESS
+    return STATUS_OK
+
+
+@lru_cache(maxsize=4096)
+def _sparkline_cached(points: Tuple[int, ...], width: int, height: int) -> str:
+    n = len(points)
+    step = (width - 4) / (n - 1) if n > 1 else 0.0
+    path = " ".join(
+        f"{2 + step * i:.1f},{height - 2 - (height - 4) * p / 100:.1f}" for i, p in enumerate(points)
+    )
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">'
+        f'<polyline points="{path}" fill="none" stroke="#2e7d32" stroke-width="1.5"/>'
+        f"</svg>"
+    )
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode("ascii")).decode("ascii")
+
+
+def sparkline_svg(values: Sequence[float], size: Tuple[int, int] = SPARKLINE_SIZE) -> str:
+    """
+    月別の推移をスパークライン（SVGの data URI）にする
+
+    値は最大値を100とした整数に丸めてからキャッシュを引くため、
+    同じ形の曲線（同じ芝種・配分方法のサイトなど）は1回しか生成しない。
+    """
+    peak = max(values) if len(values) else 0.0
+    points = tuple(int(round(100 * v / peak)) if peak > 0 else 0 for v in values)
+    return _sparkline_cached(points, size[0], size[1])
+
+
+class DashboardIndex:
+    """
+    ダッシュボードの集計済みデータ（列ごとの配列）
+    """
+
+    def __init__(self, designs: Sequence[Dict[str, Any]]):
+        count = len(designs)
+        self.site_ids: List[str] = []
+        self.statuses: List[str] = []
+        self.annual = {n: np.zeros(count) for n in NUTRIENTS}
+        self.spring_share = np.zeros(count)
+        self.monthly_n = np.zeros((count, 12))
+
+        for i, design in enumerate(designs):
+            results = design["calculation_results"]
+            self.site_ids.append(str(design.get("site_id", "")))
+            self.statuses.append(design_status(design["input_data"]["soil_values"]))
+            for n in NUTRIENTS:
+                # kg/ha → g/m²
+                self.annual[n][i] = results[n]["annual_value"] / 10
+            self.monthly_n[i] = results["N"]["monthly"]
+
+        totals = self.monthly_n.sum(axis=1)
+        spring = self.monthly_n[:, SPRING_MONTHS].sum(axis=1)
+        self.spring_share = np.divide(spring, totals, out=np.zeros(count), where=totals > 0)
+        self._site_id_array = np.array(self.site_ids, dtype=object)
+        self._site_ids_lower = np.array([s.lower() for s in self.site_ids], dtype=object)
+        self._status_array = np.array(self.statuses, dtype=object)
+        rank = {s: i for i, s in enumerate(STATUSES)}
+        self._status_rank = np.array([rank[s] for s in self.statuses], dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.site_ids)
+
+    def totals(self) -> Dict[str, Any]:
+        """
+        全サイトの集計（サイト数・状態別件数・年間施肥量の平均）
+        """
+        count = len(self)
+        return {
+            "sites": count,
+            "status_counts": {s: self.statuses.count(s) for s in STATUSES},
+            "mean_annual": {
+                n: float(self.annual[n].mean()) if count else 0.0 for n in NUTRIENTS
+            },
+        }
+
+    def _sort_values(self, sort_by: str):
+        if sort_by == "site_id":
+            return self._site_id_array
+        if sort_by == "status":
+            return self._status_rank
+        if sort_by == "spring_share":
+            return self.spring_share
+        return self.annual[sort_by]
+
+    def _filter(self, text: str, statuses: Optional[Sequence[str]]) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        if text:
+            needle = text.lower()
+            mask &= np.fromiter((needle in s for s in self._site_ids_lower), dtype=bool, count=len(self))
+        if statuses is not None:
+            mask &= np.isin(self._status_array, list(statuses))
+        return np.flatnonzero(mask)
+
+    def count(self, text: str = "", statuses: Optional[Sequence[str]] = None) -> int:
+        """
+        絞り込み条件に合うサイト数
+        """
+        return int(len(self._filter(text, statuses)))
+
+    def query(
+        self,
+        text: str = "",
+        statuses: Optional[Sequence[str]] = None,
+        sort_by: str = "site_id",
+        ascending: bool = True,
+        page: int = 0,
+        page_size: int = 50,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        絞り込み・並べ替えの結果から1ページ分の行を返す
+
+        Args:
+            text: サイト名に含まれる文字列（大文字小文字を区別しない）
+            statuses: 表示する状態（Noneの場合はすべて）
+            sort_by: 並べ替えの列（SORT_KEYS のいずれか）
+            ascending: 昇順の場合は True
+            page: ページ番号（0始まり）
+            page_size: 1ページの行数
+
+        Returns:
+            (ページ内の行のリスト, 条件に合うサイト数)
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"並べ替えできない列です: {sort_by}")
+
+        matched = self._filter(text, statuses)
+        values = self._sort_values(sort_by)[matched]
+        order = np.argsort(values, kind="stable")
+        if not ascending:
+            order = order[::-1]
+        ordered = matched[order]
+
+        start = max(0, page) * page_size
+        rows = [self.row(int(i)) for i in ordered[start:start + page_size]]
+        return rows, len(matched)
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """
+        1サイト分の表示行
+        """
+        row = {"site_id": self.site_ids[i], "status": self.statuses[i]}
+        for n in NUTRIENTS:
+            row[n] = float(self.annual[n][i])
+        row["spring_share"] = float(self.spring_share[i])
+        row["trend"] = sparkline_svg(self.monthly_n[i])
+        return row
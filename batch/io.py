@@ -0,0 +1,176 @@
+"""
+サイト一覧ファイルの読み込み（CSV / JSONL / Parquet / Excel）
+
+一括計算の入力（画面からのアップロード・コマンドライン・ベンチマーク）を共通の形式、
+つまり内部の項目名をキーとする行の辞書（parse_site_row に渡せる形）に変換する。
+CSV・JSONL・Parquet は chunk_size 行ずつ読み進めるため、
+数百万行のファイルでも全体をメモリに載せない（Excel は一括で読み込んでから分割する）。
+
+列名は英語・日本語のどちらでもよい（runner.COLUMN_ALIASES）。
+行の "row" には元ファイルでの位置（CSV / Excel は見出し行を1行目とした行番号、
+JSONL は行番号、Parquet はレコード番号）を入れ、エラー表示に使う。
+ただし入力に "row" 列があればその値を使う（分割したシャードで元ファイルの行番号を保つため）。
+"""
+
+import json
+import os
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
+
+from .runner import REQUIRED_COLUMNS, _column_map
+
+
+DEFAULT_CHUNK_SIZE = 10000
+
+SUPPORTED_SUFFIXES = (".csv", ".jsonl", ".parquet", ".xlsx", ".xlsm")
+
+# 元ファイルの行番号の列（batch.shard が書き出すシャードに含まれる）
+ROW_COLUMN = "row"
+
+Source = Union[str, os.PathLike, BinaryIO]
+
+
+def detect_format(filename: str) -> str:
+    """
+    ファイル名の拡張子から形式を判定（"csv" / "jsonl" / "parquet" / "excel"）
+    """
+    name = str(filename).lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        return "excel"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if name.endswith(".parquet"):
+        return "parquet"
+    if name.endswith(".csv"):
+        return "csv"
+    raise ValueError(f"未対応のファイル形式です: {filename}（{' / '.join(SUPPORTED_SUFFIXES)}）")
+
+
+def _checked_mapping(columns: List[Any]) -> Dict[str, Any]:
+    mapping = _column_map(columns)
+    missing = [key for key in REQUIRED_COLUMNS if key not in mapping]
+    if missing:
+        raise ValueError(f"必須列がありません: {', '.join(missing)}")
+    return mapping
+
+
+def _remap(records: List[Dict[str, Any]], mapping: Dict[str, Any], first_row: int) -> List[Dict[str, Any]]:
+    rows = []
+    for i, record in enumerate(records, start=first_row):
+        row = {key: record.get(col) for key, col in mapping.items()}
+        row["row"] = record.get(ROW_COLUMN, i)
+        rows.append(row)
+    return rows
+
+
+def _iter_csv(source: Source, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    import pandas as pd
+
+    reader = pd.read_csv(source, dtype=object, encoding="utf-8-sig", chunksize=chunk_size)
+    mapping = None
+    next_row = 2  # 1行目は見出し
+    for df in reader:
+        if mapping is None:
+            mapping = _checked_mapping(list(df.columns))
+        records = df.to_dict("records")
+        yield _remap(records, mapping, next_row)
+        next_row += len(records)
+
+
+def _iter_jsonl(source: Source, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    stream = open(source, "rb") if not hasattr(source, "read") else source
+    try:
+        mapping = None
+        chunk: List[Dict[str, Any]] = []
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if mapping is None:
+                mapping = _checked_mapping(list(record.keys()))
+            row = {key: record.get(col) for key, col in mapping.items()}
+            row["row"] = record.get(ROW_COLUMN, line_no)
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+def _iter_parquet(source: Source, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet の読み込みには pyarrow が必要です（pip install pyarrow）")
+
+    parquet_file = pq.ParquetFile(source)
+    names = parquet_file.schema_arrow.names
+    mapping = _checked_mapping(names)
+    columns = list(mapping.values()) + ([ROW_COLUMN] if ROW_COLUMN in names else [])
+    next_row = 1
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        records = batch.to_pylist()
+        yield _remap(records, mapping, next_row)
+        next_row += len(records)
+
+
+def _iter_excel(source: Source, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    import pandas as pd
+
+    df = pd.read_excel(source, dtype=object)
+    mapping = _checked_mapping(list(df.columns))
+    records = df.to_dict("records")
+    for start in range(0, len(records), chunk_size):
+        yield _remap(records[start:start + chunk_size], mapping, start + 2)
+
+
+_READERS = {
+    "csv": _iter_csv,
+    "jsonl": _iter_jsonl,
+    "parquet": _iter_parquet,
+    "excel": _iter_excel,
+}
+
+
+def iter_site_chunks(
+    source: Source,
+    filename: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    サイト一覧を chunk_size 行ずつ読み込む
+
+    Args:
+        source: ファイルのパス、またはバイナリストリーム
+        filename: 形式の判定に使うファイル名（省略時は source のパス）
+        chunk_size: 1回に返す行数
+
+    Yields:
+        [{"row": 行番号, "site_id": ..., "P": ..., ...}, ...]
+
+    Raises:
+        ValueError: 未対応の形式・必須列がない場合
+    """
+    if filename is None:
+        if hasattr(source, "read"):
+            filename = getattr(source, "name", "")
+        else:
+            filename = os.fspath(source)
+    yield from _READERS[detect_format(filename)](source, chunk_size)
+
+
+def iter_site_rows(
+    source: Source,
+    filename: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    サイト一覧を1行ずつ読み込む（iter_site_chunks を平坦にしたもの）
+    """
+    for chunk in iter_site_chunks(source, filename, chunk_size):
+        yield from chunk
+
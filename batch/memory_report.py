@@ -0,0 +1,92 @@
+"""
+一括計算の段階ごとのメモリ使用量（tracemalloc）
+
+MemoryReport.stage() で囲んだ区間ごとに、tracemalloc で追跡した
+Pythonのメモリ確保量のピーク（区間の開始時点からの増分と、全体）と、区間終了時のRSSを記録する。
+同じ名前の区間は何度通っても1行にまとめ、最大値を残す。
+
+tracemalloc は確保のたびに記録するため計算が数倍遅くなる。既定では無効で、
+無効のときの stage() は所要時間とRSSだけを記録する。区間は入れ子にしないこと
+（tracemalloc のピークは区間の開始時にリセットする）。
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .spill import current_rss_bytes
+
+
+class MemoryReport:
+    """
+    段階ごとのメモリ使用量の記録
+    """
+
+    def __init__(self, trace: bool = False):
+        self.trace = trace
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._started_tracing = False
+
+    def start(self) -> None:
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        区間 name のメモリ使用量を記録する
+        """
+        tracing = self.trace and tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self._stages.setdefault(name, {
+                "stage": name, "count": 0, "seconds": 0.0,
+                "peak_traced_bytes": None, "peak_delta_bytes": None, "rss_bytes": None,
+            })
+            entry["count"] += 1
+            entry["seconds"] += elapsed
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                entry["peak_traced_bytes"] = max(entry["peak_traced_bytes"] or 0, peak)
+                entry["peak_delta_bytes"] = max(entry["peak_delta_bytes"] or 0, peak - before)
+            rss = current_rss_bytes()
+            if rss is not None:
+                entry["rss_bytes"] = max(entry["rss_bytes"] or 0, rss)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """
+        段階ごとの記録（最初に通った順）
+        """
+        return [dict(entry) for entry in self._stages.values()]
+
+    def to_json(self) -> bytes:
+        return json.dumps({"tracemalloc": self.trace, "stages": self.rows()}, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def format(self) -> str:
+        """
+        表形式の文字列にする
+        """
+        def _mb(value: Optional[int]) -> str:
+            return f"{value / (1 << 20):.1f} MB" if value is not None else "-"
+
+        lines = [f"{'stage':<10} {'count':>7} {'seconds':>9} {'peak':>11} {'peak Δ':>11} {'RSS':>11}"]
+        for row in self.rows():
+            lines.append(
+                f"{row['stage']:<10} {row['count']:>7} {row['seconds']:>9.2f} "
+                f"{_mb(row['peak_traced_bytes']):>11} {_mb(row['peak_delta_bytes']):>11} {_mb(row['rss_bytes']):>11}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,410 @@
+"""
+ファイルからの一括計算（メモリ上限つき）
+
+サイト一覧のファイル（CSV / JSONL / Parquet / Excel）を chunk_size 行ずつ読み、
+1サイトずつ設計して、次の出力をディレクトリにまとめる。
+
+- summary.parquet（または summary.csv）：サイトごとの入力・状態・年間施肥量・春のN比率
+- plans.npy：月別施肥量の配列（サイト数 × 要素[N, P, K, Ca, Mg] × 12ヶ月、float32）
+- errors.csv：読み込めなかった行（行番号・サイト名・エラー内容）
+
+設計データ（辞書）は1サイトごとに出力行と配列に変換して捨てる。出力行と配列は
+メモリ上限（MemoryBudget）に近づいたとき、または入力チャンクを1つ終えたときに
+部分出力（batch.spill）として書き出し、最後にまとめる。
+summary の i 行目と plans の i 番目は同じサイト。
+
+入力チャンクを終えるごとにチェックポイント（batch.checkpoint）の台帳に記録するため、
+途中で止まっても同じコマンドを再実行すれば続きから計算する。
+
+画面の一括計算（runner.run_batch_job）は結果を画面で使うため設計データを保持するが、
+こちらはコマンドライン（python -m batch）から大規模なファイルを処理するためのもの。
+
+施肥量計算の結果は永続メモ（storage.memo_cache）から再利用するため、
+同じ計算ルールでの再実行は、計算済みのサイトを計算し直さない。
+history=True のときは、計算した設計を施肥設計の履歴（storage.history）にも記録する
+（部分出力を書き出すたびにまとめて書き込む）。
+"""
+
+import csv
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logic.design import build_site_design
+from storage.history import default_season, history_enabled, history_row, insert_history_rows
+from storage.memo_cache import get_design_memo
+
+from .checkpoint import (
+    WORK_DIR_NAME,
+    Ledger,
+    atomic_write,
+    check_manifest,
+    compare_outputs,
+    load_manifest,
+    new_manifest,
+    save_manifest,
+    source_sha256,
+)
+from .dashboard import NUTRIENTS, design_status
+from .io import DEFAULT_CHUNK_SIZE, Source, iter_site_chunks
+from .memory_report import MemoryReport
+from .runner import _BATCH_SITE_SECONDS, _BATCH_SITES, SiteRowError, parse_site_row
+from .spill import (
+    DEFAULT_MEMORY_LIMIT,
+    MemoryBudget,
+    PlanSpill,
+    RowSpill,
+    require_pyarrow,
+    peak_rss_bytes,
+)
+
+
+SUMMARY_FORMATS = ("parquet", "csv")
+ERROR_COLUMNS = ["row", "site_id", "error"]
+
+# 配列のバッファの行数の上限（メモリ上限が大きくても1チャンクをこれ以上大きくしない）
+MAX_BUFFER_ROWS = 1_000_000
+# 出力行1件のおおよその大きさ（バッファの行数の見積もり用）
+_ROW_NBYTES_HINT = 1024
+# 履歴の行1件の、計算結果の JSON 以外のおおよその大きさ（タプル・数値・文字列のオブジェクト）
+_HISTORY_ROW_NBYTES_HINT = 2048
+
+
+def summary_schema():
+    """
+    summary の列（Arrow のスキーマ）
+    """
+    pa = require_pyarrow()
+    return pa.schema(
+        [("row", pa.int64()), ("site_id", pa.string())]
+        + [(key, pa.string()) for key in (
+            "grass_type", "usage_type", "management_intensity", "fertilizer_stance", "distribution_stance",
+        )]
+        + [("latitude", pa.float64()), ("longitude", pa.float64()), ("status", pa.string())]
+        + [(n, pa.float64()) for n in NUTRIENTS]
+        + [("spring_share", pa.float64())]
+    )
+
+
+def summary_row(row_no: Any, design: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    設計データから summary の1行を作る（年間施肥量は g/m²）
+    """
+    from pdf.book import summarize_design
+
+    input_data = design["input_data"]
+    summary = summarize_design(design)
+    result = {"row": row_no, "site_id": str(design["site_id"])}
+    for key in ("grass_type", "usage_type", "management_intensity", "fertilizer_stance", "distribution_stance",
+                "latitude", "longitude"):
+        result[key] = input_data[key]
+    result["status"] = design_status(input_data["soil_values"])
+    for n in NUTRIENTS:
+        result[n] = summary[n]
+    result["spring_share"] = summary["spring_share"]
+    return result
+
+
+def plan_matrix(design: Dict[str, Any]) -> List[List[float]]:
+    """
+    設計データから月別施肥量の配列（要素 × 12ヶ月）を作る
+    """
+    results = design["calculation_results"]
+    return [results[n]["monthly"] for n in NUTRIENTS]
+
+
+class _Buffers:
+    """
+    退避前の出力（配列・出力行）と、処理中の入力チャンクの部分出力
+    """
+
+    def __init__(self, work_dir: Path, budget: MemoryBudget, history: Optional[Dict[str, Any]] = None):
+        self.budget = budget
+        # 履歴に書き込む行（history は history_row の run_id 以降の引数）
+        self.history = history
+        self._history_rows: List[tuple] = []
+        self._history_nbytes = 0
+        plan_nbytes = len(NUTRIENTS) * 12 * 4
+        capacity = min(MAX_BUFFER_ROWS, max(1, budget.buffer_limit // (plan_nbytes + _ROW_NBYTES_HINT)))
+        self.plans = PlanSpill(work_dir, "plans", (len(NUTRIENTS), 12), capacity)
+        self.rows = RowSpill(work_dir, "summary", summary_schema())
+        self.parts = 0
+        self._files: Dict[str, List[str]] = {"plans": [], "summary": []}
+
+    def add(self, row_no: Any, design: Dict[str, Any]) -> None:
+        self.plans.append(plan_matrix(design))
+        self.rows.append(summary_row(row_no, design))
+        if self.history is not None:
+            row = history_row(design, row=row_no, **self.history)
+            self._history_rows.append(row)
+            self._history_nbytes += len(row[-1]) + _HISTORY_ROW_NBYTES_HINT
+
+    def needs_spill(self) -> bool:
+        if self.plans.full:
+            return True
+        return self.budget.should_spill(
+            self.plans.buffered * self.plans.row_nbytes + self.rows.nbytes + self._history_nbytes
+        )
+
+    def spill(self, chunk_no: int) -> None:
+        """
+        溜めた出力を入力チャンク chunk_no の部分出力として書き出す
+        """
+        if self.plans.buffered == 0:
+            return
+        if self._history_rows:
+            insert_history_rows(self._history_rows)
+            self._history_rows = []
+            self._history_nbytes = 0
+        label = f"{chunk_no:06d}-{len(self._files['plans']):03d}"
+        self._files["plans"].append(self.plans.flush(label).name)
+        self._files["summary"].append(self.rows.flush(label).name)
+        self.parts += 1
+        self.budget.after_spill()
+
+    def finish_chunk(self, chunk_no: int) -> Dict[str, List[str]]:
+        """
+        入力チャンクの残りを書き出し、そのチャンクの部分出力のファイル名を返す
+        """
+        self.spill(chunk_no)
+        files, self._files = self._files, {"plans": [], "summary": []}
+        return files
+
+
+def _design_rows(
+    chunk: List[Dict[str, Any]], start: int, buffers: _Buffers, errors: List[List[Any]], use_memo: bool = True
+) -> Tuple[int, bool]:
+    """
+    chunk の start 行目から設計する（エラーになった行は errors に追加）
+
+    Returns:
+        (次に設計する位置, 退避が必要か)
+    """
+    for i in range(start, len(chunk)):
+        row = chunk[i]
+        t0 = time.perf_counter()
+        try:
+            design = build_site_design(**parse_site_row(row), use_memo=use_memo)
+        except (SiteRowError, KeyError, ValueError) as e:
+            errors.append([row.get("row"), row.get("site_id"), str(e)])
+            _BATCH_SITES.inc(result="error")
+            continue
+        buffers.add(row.get("row"), design)
+        _BATCH_SITES.inc(result="ok")
+        _BATCH_SITE_SECONDS.observe(time.perf_counter() - t0)
+        if buffers.needs_spill():
+            return i + 1, True
+    return len(chunk), False
+
+
+def _write_chunk_errors(work_dir: Path, chunk_no: int, errors: List[List[Any]]) -> List[str]:
+    if not errors:
+        return []
+    name = f"errors-{chunk_no:06d}.csv"
+    with atomic_write(work_dir / name, "w") as f:
+        csv.writer(f).writerows(errors)
+    return [name]
+
+
+def _merge_errors(chunks: List[Path], out_path: Path) -> None:
+    with atomic_write(out_path, "w") as out:
+        # Excel で開けるよう BOM 付き UTF-8 にする
+        out.write("\ufeff")
+        csv.writer(out).writerow(ERROR_COLUMNS)
+        for path in chunks:
+            with open(path, encoding="utf-8", newline="") as f:
+                shutil.copyfileobj(f, out)
+
+
+def _input_name(source: Source, filename: Optional[str]) -> str:
+    if filename is not None:
+        return filename
+    if hasattr(source, "read"):
+        return getattr(source, "name", "")
+    return os.fspath(source)
+
+
+def _rewind(source: Source) -> None:
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def run_file_batch(
+    source: Source,
+    out_dir: Path,
+    filename: Optional[str] = None,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    summary_format: str = "parquet",
+    report: Optional[MemoryReport] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    restart: bool = False,
+    keep_work: bool = False,
+    verify: bool = False,
+    use_memo: bool = True,
+    history: bool = False,
+    course: str = "",
+    season: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    サイト一覧のファイルを一括計算して out_dir に書き出す
+
+    out_dir に同じ入力・条件の途中結果（manifest.json と .work/）があれば、
+    完了した入力チャンクを飛ばして続きから計算する（batch.checkpoint）。
+
+    Args:
+        source: 入力ファイルのパス、またはバイナリストリーム
+        out_dir: 出力ディレクトリ（無ければ作る）
+        filename: 形式の判定に使うファイル名（省略時は source のパス）
+        memory_limit: メモリ上限（バイト）
+        chunk_size: 入力を読む単位（行数）。チェックポイントの単位でもある
+        summary_format: "parquet" / "csv"
+        report: 段階ごとのメモリ使用量の記録先
+        progress: 入力のチャンクを1つ処理するごとに (完了サイト数, エラー数) を受け取る関数
+        restart: 途中結果を捨てて最初から計算する
+        keep_work: 完了後も部分出力（.work/）を残す（調査用）
+        verify: 完了後に別のディレクトリで中断なしに計算し直し、出力が一致するか確かめる
+            （照合用の計算は永続メモを使わない）
+        use_memo: 施肥量計算の結果を永続メモから再利用する
+        history: 計算した設計を施肥設計の履歴に記録する（FERT_DESIGN_HISTORY=0 のときは記録しない。
+            記録の分だけ計算が遅くなり、メモリ上限に達しやすくなる）
+        course: 履歴に記録するコース・施設名
+        season: 履歴に記録するシーズン（省略時は今年）
+
+    Returns:
+        {"sites", "errors", "chunks", "resumed_chunks", "parts", "outputs",
+         "rule_version", "peak_rss_bytes", "seconds", "verified", "differences"}
+
+    Raises:
+        CheckpointMismatch: 途中結果と入力・条件が異なる場合（restart=True でやり直せる）
+    """
+    if summary_format not in SUMMARY_FORMATS:
+        raise ValueError(f"未対応の出力形式です: {summary_format}（{' / '.join(SUMMARY_FORMATS)}）")
+
+    started = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    work_dir = out_dir / WORK_DIR_NAME
+    outputs = {
+        "summary": out_dir / f"summary.{summary_format}",
+        "plans": out_dir / "plans.npy",
+        "errors": out_dir / "errors.csv",
+    }
+
+    manifest = new_manifest(_input_name(source, filename), source_sha256(source), chunk_size)
+    saved = None if restart else load_manifest(out_dir)
+    if saved is not None:
+        check_manifest(saved, manifest)
+        manifest["created_at"] = saved["created_at"]
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result: Dict[str, Any] = {
+        "outputs": {key: str(path) for key, path in outputs.items()},
+        "rule_version": manifest["rule_version"],
+        "verified": None,
+        "differences": [],
+    }
+
+    if saved is not None and saved.get("completed") and all(path.exists() for path in outputs.values()):
+        # 前回の実行で完了している
+        result.update({
+            "sites": saved["sites"], "errors": saved["errors"], "chunks": saved["chunks"],
+            "resumed_chunks": saved["chunks"], "parts": 0, "peak_rss_bytes": None,
+        })
+    else:
+        work_dir.mkdir(parents=True, exist_ok=True)
+        save_manifest(out_dir, manifest)
+        ledger = Ledger(work_dir)
+        ledger.load()
+        ledger.remove_unlisted()
+
+        report = report if report is not None else MemoryReport()
+        budget = MemoryBudget(memory_limit)
+        history_args = None
+        if history and history_enabled():
+            # 再開しても同じ run_id になるので、記録済みの行は重複しない
+            history_args = {
+                "run_id": f"{manifest['input']['sha256'][:16]}-{manifest['created_at']}",
+                "course": course,
+                "season": season or default_season(),
+                "created_at": manifest["created_at"],
+                "rules": get_design_memo().rules,
+            }
+        buffers = _Buffers(work_dir, budget, history_args)
+        resumed = len(ledger.entries)
+        chunk_count = 0
+
+        report.start()
+        try:
+            chunks = iter_site_chunks(source, filename, chunk_size)
+            for chunk_no in itertools.count():
+                with report.stage("read"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                chunk_count = chunk_no + 1
+                if ledger.is_done(chunk_no):
+                    continue
+
+                errors: List[List[Any]] = []
+                pos = 0
+                while pos < len(chunk):
+                    with report.stage("design"):
+                        pos, spill = _design_rows(chunk, pos, buffers, errors, use_memo)
+                    if spill:
+                        with report.stage("spill"):
+                            buffers.spill(chunk_no)
+                with report.stage("spill"):
+                    files = buffers.finish_chunk(chunk_no)
+                    files["errors"] = _write_chunk_errors(work_dir, chunk_no, errors)
+                    ledger.record(chunk_no, len(chunk) - len(errors), len(errors), files)
+                    if use_memo:
+                        get_design_memo().flush()
+                del chunk
+                if progress:
+                    entries = ledger.ordered()
+                    progress(sum(e["sites"] for e in entries), sum(e["errors"] for e in entries))
+
+            with report.stage("merge"):
+                buffers.plans.merge(ledger.files("plans"), outputs["plans"])
+                buffers.rows.merge(ledger.files("summary"), outputs["summary"], summary_format)
+                _merge_errors(ledger.files("errors"), outputs["errors"])
+        finally:
+            report.stop()
+
+        entries = ledger.ordered()
+        manifest.update({
+            "completed": True,
+            "completed_at": datetime.now().isoformat(timespec="seconds"),
+            "chunks": chunk_count,
+            "sites": sum(e["sites"] for e in entries),
+            "errors": sum(e["errors"] for e in entries),
+        })
+        save_manifest(out_dir, manifest)
+        if not keep_work:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        result.update({
+            "sites": manifest["sites"], "errors": manifest["errors"], "chunks": chunk_count,
+            "resumed_chunks": resumed, "parts": buffers.parts,
+            "peak_rss_bytes": max(budget.peak_rss, peak_rss_bytes() or 0) or None,
+        })
+
+    if verify:
+        with tempfile.TemporaryDirectory(prefix=".verify-", dir=out_dir) as reference:
+            _rewind(source)
+            run_file_batch(
+                source, Path(reference), filename=filename, memory_limit=memory_limit,
+                chunk_size=chunk_size, summary_format=summary_format, restart=True, use_memo=False, history=False,
+            )
+            result["differences"] = compare_outputs(Path(reference), out_dir, summary_format)
+        result["verified"] = not result["differences"]
+
+    result["seconds"] = time.perf_counter() - started
+    return result
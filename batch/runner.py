@@ -0,0 +1,275 @@
+"""
+複数サイトの一括計算
+
+CSV / Excel で受け取ったサイト一覧（サイト名・緯度・芝種・利用形態・土壌診断値など）を
+logic の計算エンジン（build_site_design）で1件ずつ設計し、結果を BatchProgress に追記する。
+
+計算はエクスポートジョブのスケジューラ（export.jobs）のワーカースレッドで行うため、
+Streamlit のスクリプト実行とは独立して進み、画面の再実行をまたいで継続する。
+途中経過（完了したサイト・エラー）は BatchProgress から随時参照できる。
+"""
+
+import io
+import math
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional, Type
+
+from logic.constants import (
+    GrassType,
+    UsageType,
+    ManagementIntensity,
+    FertilizerStance,
+)
+from logic.design import build_site_design
+from runtime.metrics import get_registry
+from storage.history import record_designs
+from storage.memo_cache import get_design_memo
+
+
+SOIL_KEYS = ["P", "K", "Ca", "Mg"]
+DISTRIBUTION_STANCES = ["春重点70", "春重点50", "春重点30", "GP準拠"]
+
+# 列名（英語・日本語のどちらでも受け付ける）→ 内部の項目名
+COLUMN_ALIASES = {
+    "site_id": ["site_id", "site", "サイト", "サイト名", "グリーン"],
+    "latitude": ["latitude", "lat", "緯度"],
+    "longitude": ["longitude", "lon", "経度"],
+    "grass_type": ["grass_type", "turf", "芝種", "芝種区分"],
+    "usage_type": ["usage_type", "usage", "利用形態"],
+    "management_intensity": ["management_intensity", "intensity", "管理強度"],
+    "fertilizer_stance": ["fertilizer_stance", "stance", "施肥スタンス"],
+    "distribution_stance": ["distribution_stance", "distribution", "配分スタンス", "配分方法"],
+    "P": ["P", "P2O5", "リン酸"],
+    "K": ["K", "K2O", "カリ"],
+    "Ca": ["Ca", "CaO", "カルシウム"],
+    "Mg": ["Mg", "MgO", "マグネシウム"],
+}
+
+REQUIRED_COLUMNS = ["site_id", "grass_type", "usage_type"] + SOIL_KEYS
+
+# 一括計算のスループット（サイト数の増え方）と1サイトあたりの計算時間
+_BATCH_SITES = get_registry().counter("fert_batch_sites_total", "一括計算で処理したサイト数", ["result"])
+_BATCH_SITE_SECONDS = get_registry().histogram(
+    "fert_batch_site_seconds", "一括計算の1サイトあたりの計算時間",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0),
+)
+
+# 省略時の値
+DEFAULTS = {
+    "latitude": 35.7,
+    "longitude": 139.8,
+    "management_intensity": ManagementIntensity.MEDIUM,
+    "fertilizer_stance": FertilizerStance.CENTER,
+    "distribution_stance": "春重点50",
+}
+
+
+class SiteRowError(ValueError):
+    """サイト一覧の1行が不正であることを示す例外"""
+
+
+def _normalize_header(name: Any) -> str:
+    return str(name).strip().replace("₂", "2").replace("₅", "5")
+
+
+def _column_map(columns: List[Any]) -> Dict[str, Any]:
+    """
+    入力ファイルの列名 → 内部の項目名 の対応を作る
+    """
+    lookup = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            lookup[alias.lower()] = key
+    mapping = {}
+    for col in columns:
+        key = lookup.get(_normalize_header(col).lower())
+        if key is not None and key not in mapping:
+            mapping[key] = col
+    return mapping
+
+
+def _is_blank(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and not value.strip()
+
+
+def _parse_enum(enum_cls: Type[Enum], value: Any, label: str) -> Enum:
+    """
+    列挙値を値（"寒地型（ゴルフグリーン）"）または名前（"COOL_GREEN"）から解決
+    """
+    text = str(value).strip()
+    for member in enum_cls:
+        if text == member.value or text.upper() == member.name:
+            return member
+    choices = " / ".join(m.value for m in enum_cls)
+    raise SiteRowError(f"{label}「{text}」は不明です（{choices}）")
+
+
+def _parse_float(value: Any, label: str) -> float:
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        raise SiteRowError(f"{label}「{value}」は数値ではありません")
+    if math.isnan(result):
+        raise SiteRowError(f"{label}が空欄です")
+    return result
+
+
+def parse_site_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    サイト一覧の1行（内部の項目名をキーとする辞書）を build_site_design の引数に変換
+
+    Raises:
+        SiteRowError: 必須項目の欠落・不正な値
+    """
+    for key in REQUIRED_COLUMNS:
+        if _is_blank(row.get(key)):
+            raise SiteRowError(f"必須項目 {key} が空欄です")
+
+    def _value(key):
+        value = row.get(key)
+        return DEFAULTS[key] if _is_blank(value) else value
+
+    distribution_stance = str(_value("distribution_stance")).strip()
+    if distribution_stance not in DISTRIBUTION_STANCES:
+        raise SiteRowError(f"配分スタンス「{distribution_stance}」は不明です")
+
+    management_intensity = _value("management_intensity")
+    fertilizer_stance = _value("fertilizer_stance")
+    return {
+        "site_id": str(row["site_id"]).strip(),
+        "grass_type": _parse_enum(GrassType, row["grass_type"], "芝種区分"),
+        "usage_type": _parse_enum(UsageType, row["usage_type"], "利用形態"),
+        "management_intensity": (
+            management_intensity if isinstance(management_intensity, ManagementIntensity)
+            else _parse_enum(ManagementIntensity, management_intensity, "管理強度")
+        ),
+        "fertilizer_stance": (
+            fertilizer_stance if isinstance(fertilizer_stance, FertilizerStance)
+            else _parse_enum(FertilizerStance, fertilizer_stance, "施肥スタンス")
+        ),
+        "soil_values": {key: _parse_float(row[key], key) for key in SOIL_KEYS},
+        "latitude": _parse_float(_value("latitude"), "緯度"),
+        "longitude": _parse_float(_value("longitude"), "経度"),
+        "distribution_stance": distribution_stance,
+    }
+
+
+def read_site_table(data: bytes, filename: str) -> List[Dict[str, Any]]:
+    """
+    アップロードされたCSV / Excel / JSONL / Parquetを読み込み、行ごとの辞書（内部の項目名がキー）を返す
+
+    Args:
+        data: ファイルの内容
+        filename: ファイル名（拡張子で形式を判定）
+
+    Returns:
+        [{"row": 行番号, "site_id": ..., "P": ..., ...}, ...]
+
+    Raises:
+        ValueError: 未対応の形式・必須列がない場合
+    """
+    from .io import iter_site_rows
+
+    return list(iter_site_rows(io.BytesIO(data), filename))
+
+
+class BatchProgress:
+    """
+    一括計算の途中経過（ワーカースレッドが追記し、画面が参照する）
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self._lock = threading.Lock()
+        self._designs: List[Dict[str, Any]] = []
+        self._summaries: List[Dict[str, Any]] = []
+        self._errors: List[Dict[str, Any]] = []
+
+    def add_design(self, design: Dict[str, Any], summary: Dict[str, Any]) -> None:
+        with self._lock:
+            self._designs.append(design)
+            self._summaries.append(summary)
+
+    def add_error(self, row: Any, site_id: Any, message: str) -> None:
+        with self._lock:
+            self._errors.append({"row": row, "site_id": site_id, "error": message})
+
+    @property
+    def done(self) -> int:
+        with self._lock:
+            return len(self._designs) + len(self._errors)
+
+    def designs(self) -> List[Dict[str, Any]]:
+        """完了した設計データ（その時点のコピー）"""
+        with self._lock:
+            return list(self._designs)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """完了したサイトのサマリー行（その時点のコピー）"""
+        with self._lock:
+            return list(self._summaries)
+
+    def errors(self) -> List[Dict[str, Any]]:
+        """エラーになった行（その時点のコピー）"""
+        with self._lock:
+            return list(self._errors)
+
+    def get_design(self, index: int) -> Optional[Dict[str, Any]]:
+        """完了した設計データの index 番目（summaries と同じ順。site_id は重複しうるため位置で選ぶ）"""
+        with self._lock:
+            if 0 <= index < len(self._designs):
+                return self._designs[index]
+        return None
+
+
+def run_batch_job(
+    job,
+    rows: List[Dict[str, Any]],
+    progress: BatchProgress,
+    course: str = "",
+    history: bool = False,
+) -> BatchProgress:
+    """
+    一括計算のジョブ関数（export.jobs の ExportScheduler で実行する）
+
+    不正な行はエラーとして記録し、残りの行の計算を続ける。
+    history=True のときは、計算した設計を最後に施肥設計の履歴（storage.history）にまとめて記録する。
+
+    Args:
+        job: 実行中のジョブ（進捗報告・キャンセル確認に使う）
+        rows: read_site_table の戻り値
+        progress: 途中経過の書き込み先
+        course: 履歴に記録するコース・施設名
+        history: 計算した設計を施肥設計の履歴に記録する
+
+    Returns:
+        progress
+    """
+    from pdf.book import summarize_design
+
+    total = len(rows)
+    designed_rows = []
+    for i, row in enumerate(rows):
+        job.report_progress(i / total if total else 0.0, f"{i}/{total} サイト")
+        start = time.perf_counter()
+        try:
+            design = build_site_design(**parse_site_row(row))
+        except (SiteRowError, KeyError, ValueError) as e:
+            progress.add_error(row.get("row"), row.get("site_id"), str(e))
+            _BATCH_SITES.inc(result="error")
+            continue
+        progress.add_design(design, summarize_design(design))
+        designed_rows.append(row.get("row"))
+        _BATCH_SITES.inc(result="ok")
+        _BATCH_SITE_SECONDS.observe(time.perf_counter() - start)
+    get_design_memo().flush()
+    if history:
+        record_designs(progress.designs(), course=course, run_id=job.id, rows=designed_rows)
+    job.report_progress(1.0, f"{total}/{total} サイト")
+    return progress
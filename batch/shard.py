@@ -0,0 +1,676 @@
+"""
+複数台での一括計算（共有ディレクトリによる作業の分担）
+
+キューのサービスを立てずに、共有ディレクトリ（NFS など）だけで複数のマシンが
+同じ一括計算を分担する。台数を増やせばその分だけ処理が速くなる。
+
+ジョブのディレクトリの構成：
+- job.json：ジョブの条件（入力のハッシュ、シャードの数・行数、計算ルールのバージョン）
+- shards/shard-NNNNNN.parquet：入力を shard_size 行ずつに分けたもの（元ファイルの行番号つき）
+- leases/shard-NNNNNN.gGGGG.lease：シャードの貸し出し（担当ワーカーと有効期限）
+- results/shard-NNNNNN/：シャードの計算結果（summary.parquet / plans.npy / errors.csv）
+- tmp/shard-NNNNNN.gGGGG/：貸し出しの世代ごとの計算中の結果（完了すると results/ へ移す）
+
+貸し出しは世代番号つきのファイルを O_EXCL で作ることで取る。期限切れの貸し出しは
+次の世代のファイルを作った1台だけが引き継ぐ（止まった・遅れたワーカーの分を他のワーカーが計算し直す）。
+引き継いだワーカーは、前の世代の計算中の結果（tmp/）を消してから最初から計算する。
+計算中のワーカーは期限の1/3ごとに延長する。結果はディレクトリの rename で公開し、
+先に公開した方だけが残る（同じシャードを2台が計算しても結果は同じ）。
+有効期限は各マシンの時計で判定するため、時刻を同期（NTP）しておくこと。
+
+使い方：
+    python -m batch init sites.parquet --job /shared/job1 --shard-size 50000   # 1回だけ（どのマシンでもよい）
+    python -m batch work --job /shared/job1                                    # 各マシンで
+    python -m batch merge --job /shared/job1 --out /shared/result1             # 全シャードの完了後
+    python -m batch status --job /shared/job1
+"""
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .checkpoint import (
+    CheckpointMismatch,
+    atomic_write,
+    new_manifest,
+    save_manifest,
+    source_sha256,
+)
+from .io import DEFAULT_CHUNK_SIZE, ROW_COLUMN, Source, iter_site_chunks
+from .pipeline import ERROR_COLUMNS, SUMMARY_FORMATS, run_file_batch, summary_schema
+from .dashboard import NUTRIENTS
+from .runner import COLUMN_ALIASES
+from .spill import DEFAULT_MEMORY_LIMIT, require_pyarrow, merge_plan_files, merge_row_files, parse_size
+
+
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "job.json"
+DEFAULT_SHARD_SIZE = 50000
+# 貸し出しの有効期限（秒）
+DEFAULT_LEASE_SECONDS = 300.0
+# 空いているシャードが無いときに待つ間隔（秒）
+DEFAULT_POLL_SECONDS = 5.0
+
+_LEASE_SUFFIX = ".lease"
+
+
+def _shard_name(shard_no: int) -> str:
+    return f"shard-{shard_no:06d}"
+
+
+def default_worker_id() -> str:
+    """
+    ワーカーの識別子（ホスト名:プロセスID:乱数）
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# ── ジョブの作成 ──
+
+def _shard_schema():
+    pa = require_pyarrow()
+    # 値は文字列のまま保存し、計算時に parse_site_row で解釈する（元ファイルの型に依存しない）
+    return pa.schema([(ROW_COLUMN, pa.int64())] + [(key, pa.string()) for key in COLUMN_ALIASES])
+
+
+def _shard_value(value: Any) -> Optional[str]:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+
+def init_job(
+    source: Source,
+    job_dir: Path,
+    filename: Optional[str] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    入力をシャードに分けてジョブを作る（同じ入力のジョブが既にあれば、それを返す）
+
+    Returns:
+        job.json の内容
+
+    Raises:
+        CheckpointMismatch: 異なる入力・条件のジョブが既にある場合
+    """
+    pa = require_pyarrow()
+    import pyarrow.parquet as pq
+
+    job_dir = Path(job_dir)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    input_name = filename or (getattr(source, "name", "") if hasattr(source, "read") else os.fspath(source))
+    job = new_manifest(input_name, source_sha256(source), chunk_size)
+    job["shard_size"] = shard_size
+
+    existing = load_job(job_dir)
+    if existing is not None:
+        for key in ("chunk_size", "shard_size", "rule_version", "rule_fingerprint"):
+            if existing.get(key) != job.get(key):
+                raise CheckpointMismatch(f"既存のジョブと {key} が異なります（{existing.get(key)} / {job.get(key)}）")
+        if existing["input"]["sha256"] != job["input"]["sha256"]:
+            raise CheckpointMismatch("既存のジョブと入力ファイルの内容が異なります")
+        return existing
+
+    shards_dir = job_dir / "shards"
+    shutil.rmtree(shards_dir, ignore_errors=True)
+    shards_dir.mkdir()
+    for name in ("leases", "results", "tmp"):
+        (job_dir / name).mkdir(exist_ok=True)
+
+    schema = _shard_schema()
+    shard_count = 0
+    rows = 0
+    # シャードは iter_site_chunks の chunk_size 行ずつ書き足し、shard_size 行で次のファイルにする
+    writer = None
+    in_shard = 0
+    try:
+        for chunk in iter_site_chunks(source, filename, min(chunk_size, shard_size)):
+            start = 0
+            while start < len(chunk):
+                if writer is None:
+                    tmp_path = shards_dir / f".{_shard_name(shard_count)}.parquet.tmp"
+                    writer = pq.ParquetWriter(str(tmp_path), schema, compression="zstd")
+                    in_shard = 0
+                take = chunk[start:start + shard_size - in_shard]
+                columns = {ROW_COLUMN: [int(row["row"]) for row in take]}
+                for key in COLUMN_ALIASES:
+                    columns[key] = [_shard_value(row.get(key)) for row in take]
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                in_shard += len(take)
+                rows += len(take)
+                start += len(take)
+                if in_shard >= shard_size:
+                    writer.close()
+                    writer = None
+                    os.replace(tmp_path, shards_dir / f"{_shard_name(shard_count)}.parquet")
+                    shard_count += 1
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp_path, shards_dir / f"{_shard_name(shard_count)}.parquet")
+            shard_count += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+    job.update({"shards": shard_count, "rows": rows})
+    # job.json があればジョブの準備ができている（ワーカーはこれを待つ）
+    with atomic_write(job_dir / JOB_NAME, "w") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return job
+
+
+def load_job(job_dir: Path) -> Optional[Dict[str, Any]]:
+    path = Path(job_dir) / JOB_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _check_rules(job: Dict[str, Any]) -> None:
+    """
+    このマシンの計算ルールがジョブと同じか確認する（異なるコードのワーカーが混ざるのを防ぐ）
+    """
+    current = new_manifest("", "", job["chunk_size"])
+    for key, label in (("rule_version", "計算ルールのバージョン"), ("rule_fingerprint", "計算ロジック")):
+        if job.get(key) != current[key]:
+            raise CheckpointMismatch(f"このマシンの{label}がジョブと異なります（ジョブ {job.get(key)}、このマシン {current[key]}）")
+
+
+# ── 貸し出し ──
+
+class LeaseTable:
+    """
+    シャードの貸し出し（leases/ のファイル）
+    """
+
+    def __init__(self, job_dir: Path, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.directory = Path(job_dir) / "leases"
+        self.lease_seconds = lease_seconds
+
+    def _path(self, shard_no: int, generation: int) -> Path:
+        return self.directory / f"{_shard_name(shard_no)}.g{generation:04d}{_LEASE_SUFFIX}"
+
+    def current(self) -> Dict[int, Dict[str, Any]]:
+        """
+        シャードごとの最新の世代の貸し出し
+
+        Returns:
+            {シャード番号: {"generation", "owner", "expires_at", ...}}
+        """
+        latest: Dict[int, int] = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(_LEASE_SUFFIX) or not name.startswith("shard-"):
+                continue
+            stem = name[:-len(_LEASE_SUFFIX)]
+            shard_part, _, gen_part = stem.rpartition(".g")
+            try:
+                shard_no, generation = int(shard_part[len("shard-"):]), int(gen_part)
+            except ValueError:
+                continue
+            latest[shard_no] = max(latest.get(shard_no, 0), generation)
+
+        leases = {}
+        for shard_no, generation in latest.items():
+            try:
+                with open(self._path(shard_no, generation), encoding="utf-8") as f:
+                    lease = json.load(f)
+            except (OSError, ValueError):
+                # 作成直後で中身がまだ無い貸し出し：有効として扱う
+                lease = {"owner": None, "expires_at": time.time() + self.lease_seconds}
+            lease["generation"] = generation
+            leases[shard_no] = lease
+        return leases
+
+    def _write(self, path: Path, owner: str, generation: int) -> Dict[str, Any]:
+        now = time.time()
+        lease = {
+            "owner": owner,
+            "generation": generation,
+            "acquired_at": now,
+            "expires_at": now + self.lease_seconds,
+        }
+        with atomic_write(path, "w") as f:
+            json.dump(lease, f)
+        return lease
+
+    def try_acquire(self, shard_no: int, owner: str, current: Optional[Dict[str, Any]]) -> Optional[int]:
+        """
+        シャードを借りる（貸し出し中で期限内なら借りられない）
+
+        Args:
+            current: current() で得たそのシャードの貸し出し（無ければ None）
+
+        Returns:
+            借りた世代（借りられなければ None）
+        """
+        if current is not None and current["expires_at"] > time.time():
+            return None
+        generation = (current["generation"] if current else 0) + 1
+        path = self._path(shard_no, generation)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            # 他のワーカーが先に同じ世代を取った
+            return None
+        os.close(fd)
+        self._write(path, owner, generation)
+        if current is not None:
+            logger.info("期限切れのシャード %s を引き継ぎました（前の担当 %s）", _shard_name(shard_no), current.get("owner"))
+        return generation
+
+    def renew(self, shard_no: int, owner: str, generation: int) -> bool:
+        """
+        貸し出しを延長する（次の世代が作られた・結果が公開済みなら延長せず False）
+        """
+        if self._path(shard_no, generation + 1).exists():
+            return False
+        if (self.directory.parent / "results" / _shard_name(shard_no)).exists():
+            return False
+        self._write(self._path(shard_no, generation), owner, generation)
+        return True
+
+    def release(self, shard_no: int) -> None:
+        """
+        シャードの貸し出しをすべて消す（結果の公開後）
+        """
+        prefix = f"{_shard_name(shard_no)}.g"
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                try:
+                    os.unlink(self.directory / name)
+                except FileNotFoundError:
+                    pass
+
+
+class _Renewer:
+    """
+    計算中に貸し出しを定期的に延長するスレッド
+    """
+
+    def __init__(self, leases: LeaseTable, shard_no: int, owner: str, generation: int):
+        self._leases = leases
+        self._args = (shard_no, owner, generation)
+        self._stop = threading.Event()
+        self.lost = False
+        self._thread = threading.Thread(target=self._run, name=f"lease-{_shard_name(shard_no)}", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._leases.lease_seconds / 3):
+            try:
+                if not self._leases.renew(*self._args):
+                    self.lost = True
+                    return
+            except OSError as e:
+                logger.warning("貸し出しを延長できませんでした: %s", e)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+# ── ワーカー ──
+
+def _result_dir(job_dir: Path, shard_no: int) -> Path:
+    return Path(job_dir) / "results" / _shard_name(shard_no)
+
+
+def _done_shards(job_dir: Path) -> set:
+    done = set()
+    for name in os.listdir(Path(job_dir) / "results"):
+        if name.startswith("shard-"):
+            try:
+                done.add(int(name[len("shard-"):]))
+            except ValueError:
+                continue
+    return done
+
+
+def _clear_stale_tmp(job_dir: Path, shard_no: int, generation: int) -> None:
+    """
+    シャードの、generation より前の世代の計算中の結果を消す（止まったワーカーの残り）
+    """
+    prefix = f"{_shard_name(shard_no)}.g"
+    tmp_root = Path(job_dir) / "tmp"
+    for name in os.listdir(tmp_root):
+        if not name.startswith(prefix):
+            continue
+        try:
+            stale = int(name[len(prefix):]) < generation
+        except ValueError:
+            continue
+        if stale:
+            shutil.rmtree(tmp_root / name, ignore_errors=True)
+
+
+def _compute_shard(
+    job_dir: Path,
+    job: Dict[str, Any],
+    shard_no: int,
+    generation: int,
+    memory_limit: int,
+    use_memo: bool = True,
+) -> bool:
+    """
+    シャードを計算して results/ に公開する
+
+    計算中の結果は貸し出しの世代ごとのディレクトリに置く。前の世代（止まったワーカー）の
+    ディレクトリは消し、途中からの再開はしない（最初から計算する）。
+
+    Returns:
+        このワーカーの結果が公開されたか（他のワーカーが先に公開していれば False）
+    """
+    job_dir = Path(job_dir)
+    name = _shard_name(shard_no)
+    _clear_stale_tmp(job_dir, shard_no, generation)
+    tmp_dir = job_dir / "tmp" / f"{name}.g{generation:04d}"
+    # 履歴は各マシンの手元に記録されてしまうため記録しない
+    run_file_batch(
+        job_dir / "shards" / f"{name}.parquet",
+        tmp_dir,
+        memory_limit=memory_limit,
+        chunk_size=job["chunk_size"],
+        summary_format="parquet",
+        restart=True,
+        use_memo=use_memo,
+        history=False,
+    )
+    try:
+        os.rename(tmp_dir, _result_dir(job_dir, shard_no))
+    except OSError:
+        # 先に他のワーカーが公開した
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+    return True
+
+
+def run_worker(
+    job_dir: Path,
+    worker_id: Optional[str] = None,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    poll_seconds: float = DEFAULT_POLL_SECONDS,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    max_shards: Optional[int] = None,
+    wait_for_job: float = 0.0,
+    progress: Optional[Callable[[str], None]] = None,
+    use_memo: bool = True,
+) -> Dict[str, Any]:
+    """
+    空いているシャードを借りて計算する（全シャードの結果がそろうまで続ける）
+
+    期限内の貸し出ししか残っていないときは poll_seconds ごとに待ち、
+    担当のワーカーが止まって期限が切れたシャードは引き継いで計算する。
+
+    Args:
+        job_dir: ジョブのディレクトリ（共有ディレクトリ）
+        worker_id: ワーカーの識別子（省略時はホスト名・プロセスIDから作る）
+        lease_seconds: 貸し出しの有効期限（秒）
+        poll_seconds: 空きを待つ間隔（秒）
+        memory_limit: 1シャードを計算するときのメモリ上限（バイト）
+        max_shards: このワーカーが計算するシャードの上限（省略時は無制限）
+        wait_for_job: job.json ができるまで待つ時間（秒）
+        progress: 状況のメッセージを受け取る関数
+        use_memo: 施肥量計算の結果をこのマシンの永続メモ（storage.memo_cache）から再利用する
+
+    Returns:
+        {"worker", "computed": [公開したシャード番号], "duplicates": [他に先を越されたシャード番号], "seconds"}
+    """
+    started = time.perf_counter()
+    job_dir = Path(job_dir)
+    worker_id = worker_id or default_worker_id()
+    deadline = time.time() + wait_for_job
+    job = load_job(job_dir)
+    while job is None and time.time() < deadline:
+        time.sleep(min(poll_seconds, 1.0))
+        job = load_job(job_dir)
+    if job is None:
+        raise FileNotFoundError(f"ジョブがありません: {job_dir / JOB_NAME}（python -m batch init で作成）")
+    _check_rules(job)
+
+    leases = LeaseTable(job_dir, lease_seconds)
+    computed: List[int] = []
+    duplicates: List[int] = []
+    rng = random.Random(worker_id)
+
+    while max_shards is None or len(computed) + len(duplicates) < max_shards:
+        pending = sorted(set(range(job["shards"])) - _done_shards(job_dir))
+        if not pending:
+            break
+        current = leases.current()
+        # 複数台が同じ順に取り合わないよう、開始位置をワーカーごとにずらす
+        offset = rng.randrange(len(pending))
+        acquired = None
+        for shard_no in pending[offset:] + pending[:offset]:
+            generation = leases.try_acquire(shard_no, worker_id, current.get(shard_no))
+            if generation is not None:
+                acquired = (shard_no, generation)
+                break
+        if acquired is None:
+            if progress:
+                progress(f"空いているシャードがありません（残り {len(pending)}）。{poll_seconds:.0f} 秒待ちます")
+            time.sleep(poll_seconds)
+            continue
+
+        shard_no, generation = acquired
+        if _result_dir(job_dir, shard_no).exists():
+            # 一覧を取った後に他のワーカーが完了させた
+            continue
+        if progress:
+            progress(f"{_shard_name(shard_no)} を計算します（世代 {generation}）")
+        with _Renewer(leases, shard_no, worker_id, generation) as renewer:
+            try:
+                published = _compute_shard(job_dir, job, shard_no, generation, memory_limit, use_memo)
+            except OSError:
+                if not renewer.lost:
+                    raise
+                # 期限切れで引き継いだワーカーが計算中の結果を消した
+                published = False
+        if published:
+            computed.append(shard_no)
+            leases.release(shard_no)
+        else:
+            duplicates.append(shard_no)
+        if renewer.lost and progress:
+            progress(f"{_shard_name(shard_no)} の貸し出しは他のワーカーに引き継がれていました")
+
+    return {
+        "worker": worker_id,
+        "computed": computed,
+        "duplicates": duplicates,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+# ── 状況・まとめ ──
+
+def job_status(job_dir: Path) -> Dict[str, Any]:
+    """
+    シャードの状況（完了・貸し出し中・期限切れ・未着手）
+    """
+    job_dir = Path(job_dir)
+    job = load_job(job_dir)
+    if job is None:
+        raise FileNotFoundError(f"ジョブがありません: {job_dir / JOB_NAME}")
+    done = _done_shards(job_dir)
+    now = time.time()
+    leased, expired = [], []
+    for shard_no, lease in LeaseTable(job_dir).current().items():
+        if shard_no in done:
+            continue
+        (leased if lease["expires_at"] > now else expired).append(shard_no)
+    total = job["shards"]
+    return {
+        "shards": total,
+        "done": len(done),
+        "leased": sorted(leased),
+        "expired": sorted(expired),
+        "pending": total - len(done) - len(leased) - len(expired),
+        "workers": sorted({
+            lease.get("owner") for shard_no, lease in LeaseTable(job_dir).current().items()
+            if shard_no not in done and lease["expires_at"] > now and lease.get("owner")
+        }),
+    }
+
+
+def _merge_error_files(paths: List[Path], out_path: Path) -> int:
+    count = 0
+    with atomic_write(out_path, "w") as out:
+        # Excel で開けるよう BOM 付き UTF-8 にする
+        out.write("\ufeff")
+        writer = csv.writer(out)
+        writer.writerow(ERROR_COLUMNS)
+        for path in paths:
+            with open(path, encoding="utf-8-sig", newline="") as f:
+                reader = csv.reader(f)
+                next(reader, None)  # 見出し
+                for row in reader:
+                    writer.writerow(row)
+                    count += 1
+    return count
+
+
+def merge_job(job_dir: Path, out_dir: Path, summary_format: str = "parquet") -> Dict[str, Any]:
+    """
+    全シャードの結果をシャードの順にまとめ、out_dir に書き出す
+    （出力は1台で計算した run_file_batch と同じ形式・内容）
+
+    Raises:
+        RuntimeError: 結果がそろっていないシャードがある場合
+    """
+    if summary_format not in SUMMARY_FORMATS:
+        raise ValueError(f"未対応の出力形式です: {summary_format}（{' / '.join(SUMMARY_FORMATS)}）")
+    job_dir, out_dir = Path(job_dir), Path(out_dir)
+    job = load_job(job_dir)
+    if job is None:
+        raise FileNotFoundError(f"ジョブがありません: {job_dir / JOB_NAME}")
+    missing = sorted(set(range(job["shards"])) - _done_shards(job_dir))
+    if missing:
+        raise RuntimeError(f"結果がそろっていないシャードがあります（{len(missing)} 件: {', '.join(map(_shard_name, missing[:5]))} ...）")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    results = [_result_dir(job_dir, k) for k in range(job["shards"])]
+    outputs = {
+        "summary": out_dir / f"summary.{summary_format}",
+        "plans": out_dir / "plans.npy",
+        "errors": out_dir / "errors.csv",
+    }
+    merge_plan_files([r / "plans.npy" for r in results], outputs["plans"], (len(NUTRIENTS), 12))
+    merge_row_files([r / "summary.parquet" for r in results], outputs["summary"], summary_schema(), summary_format)
+    errors = _merge_error_files([r / "errors.csv" for r in results], outputs["errors"])
+
+    sites = 0
+    for r in results:
+        with open(r / "manifest.json", encoding="utf-8") as f:
+            sites += json.load(f)["sites"]
+    manifest = dict(job)
+    manifest.update({
+        "completed": True,
+        "completed_at": datetime.now().isoformat(timespec="seconds"),
+        "sites": sites,
+        "errors": errors,
+    })
+    save_manifest(out_dir, manifest)
+    # 全シャードが公開済みなので、計算中の結果の残り（止まったワーカーの分）は不要
+    for name in os.listdir(job_dir / "tmp"):
+        shutil.rmtree(job_dir / "tmp" / name, ignore_errors=True)
+    return {"sites": sites, "errors": errors, "shards": job["shards"],
+            "outputs": {key: str(path) for key, path in outputs.items()}}
+
+
+# ── コマンドライン ──
+
+COMMANDS = ("init", "work", "merge", "status")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m batch", description="複数台での一括計算（共有ディレクトリによる分担）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_init = sub.add_parser("init", help="入力をシャードに分けてジョブを作る")
+    p_init.add_argument("input", type=Path, help="サイト一覧（.csv / .jsonl / .parquet / .xlsx）")
+    p_init.add_argument("--job", type=Path, required=True, help="ジョブのディレクトリ（共有ディレクトリ）")
+    p_init.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="1シャードの行数")
+    p_init.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="シャード内のチェックポイントの行数")
+
+    p_work = sub.add_parser("work", help="空いているシャードを計算する（全シャードの完了まで）")
+    p_work.add_argument("--job", type=Path, required=True)
+    p_work.add_argument("--memory-limit", default=f"{DEFAULT_MEMORY_LIMIT >> 20}M", help="メモリ上限（例: 256M, 2G）")
+    p_work.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS, help="貸し出しの有効期限（秒）")
+    p_work.add_argument("--poll-seconds", type=float, default=DEFAULT_POLL_SECONDS, help="空きを待つ間隔（秒）")
+    p_work.add_argument("--wait-for-job", type=float, default=600.0, help="ジョブの作成を待つ時間（秒）")
+    p_work.add_argument("--max-shards", type=int, default=None, help="計算するシャードの上限")
+    p_work.add_argument("--worker-id", default=None, help="ワーカーの識別子")
+    p_work.add_argument("--no-memo", action="store_true",
+                        help="施肥量計算の永続メモ（storage.memo_cache）を使わずにすべて計算する")
+
+    p_merge = sub.add_parser("merge", help="全シャードの結果をまとめる")
+    p_merge.add_argument("--job", type=Path, required=True)
+    p_merge.add_argument("--out", type=Path, required=True, help="出力ディレクトリ")
+    p_merge.add_argument("--format", choices=SUMMARY_FORMATS, default="parquet", help="summary の出力形式")
+
+    p_status = sub.add_parser("status", help="シャードの状況を表示する")
+    p_status.add_argument("--job", type=Path, required=True)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        if args.command == "init":
+            job = init_job(args.input, args.job, shard_size=args.shard_size, chunk_size=args.chunk_size)
+            print(f"{args.job}: {job['rows']:,} 行, {job['shards']} シャード（計算ルール {job['rule_version']}）")
+        elif args.command == "work":
+            try:
+                memory_limit = parse_size(args.memory_limit)
+            except ValueError as e:
+                parser.error(str(e))
+            result = run_worker(
+                args.job,
+                worker_id=args.worker_id,
+                lease_seconds=args.lease_seconds,
+                poll_seconds=args.poll_seconds,
+                memory_limit=memory_limit,
+                max_shards=args.max_shards,
+                wait_for_job=args.wait_for_job,
+                progress=lambda message: print(f"  {message}", file=sys.stderr, flush=True),
+                use_memo=not args.no_memo,
+            )
+            print(f"{result['worker']}: {len(result['computed'])} シャードを計算, "
+                  f"重複 {len(result['duplicates'])}, {result['seconds']:.1f} 秒")
+        elif args.command == "merge":
+            result = merge_job(args.job, args.out, args.format)
+            print(f"{result['sites']:,} サイト（エラー {result['errors']:,}）, {result['shards']} シャード")
+            for key, path in result["outputs"].items():
+                print(f"  {key}: {path}")
+        else:
+            status = job_status(args.job)
+            print(json.dumps(status, ensure_ascii=False, indent=2))
+    except CheckpointMismatch as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    return 0
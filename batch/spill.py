@@ -0,0 +1,310 @@
+"""
+一括計算のメモリ上限と一時ファイルへの退避（spill）
+
+全国規模のサイト一覧は、設計データ（辞書の入れ子）のまま保持するとメモリに収まらない。
+ファイルからの一括計算（batch.pipeline）では、サイトごとに
+月別施肥量の配列（PlanSpill、NumPy）と出力行（RowSpill、Arrow IPC）だけを残し、
+それも MemoryBudget が上限に近いと判断したところ（と入力チャンクの区切り）で
+一時ファイル（部分出力）に書き出す。最後に部分出力を順に読み（memmap / memory_map）、
+1つの出力ファイルにまとめる。
+
+部分出力の名前（label）は PlanSpill と RowSpill で共通にするため、
+まとめた後の配列の i 行目と出力行の i 行目は同じサイトになる。
+書き出しはすべて一時ファイル経由の置き換え（checkpoint.atomic_write）で行う。
+"""
+
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .checkpoint import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+# 既定のメモリ上限
+DEFAULT_MEMORY_LIMIT = 512 * 1024 * 1024
+# バッファ（退避前の配列・出力行）に使ってよい割合
+DEFAULT_BUFFER_FRACTION = 0.25
+# プロセスのRSSがこの割合を超えたら、バッファの大きさによらず退避する
+DEFAULT_HIGH_WATER = 0.85
+# RSS を確認する間隔（サイト数）
+RSS_CHECK_INTERVAL = 256
+
+_SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(text: Any) -> int:
+    """
+    "512M" / "2G" / "1048576" のような大きさをバイト数にする
+    """
+    if isinstance(text, (int, float)):
+        return int(text)
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"大きさを解釈できません: {text}（例: 512M, 2G）")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def current_rss_bytes() -> Optional[int]:
+    """
+    プロセスの現在のRSS（取得できない環境では None）
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    プロセスのピークRSS（取得できない環境では None）
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryBudget:
+    """
+    メモリ上限に対するバッファの使用量の管理
+
+    退避するのは次のどちらかのとき：
+    - バッファの見積もりが limit × buffer_fraction を超えた
+    - プロセスのRSSが limit × high_water を超えた（RSS_CHECK_INTERVAL サイトごとに確認）
+    """
+
+    def __init__(
+        self,
+        limit: int = DEFAULT_MEMORY_LIMIT,
+        buffer_fraction: float = DEFAULT_BUFFER_FRACTION,
+        high_water: float = DEFAULT_HIGH_WATER,
+    ):
+        self.limit = limit
+        self.buffer_limit = int(limit * buffer_fraction)
+        self.high_water = int(limit * high_water)
+        self.peak_rss = 0
+        self.over_limit = False
+        self._since_check = 0
+
+    def rss(self) -> Optional[int]:
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def should_spill(self, buffered_bytes: int) -> bool:
+        """
+        バッファ（見積もり buffered_bytes バイト）を退避すべきか
+        """
+        if buffered_bytes >= self.buffer_limit:
+            return True
+        self._since_check += 1
+        if self._since_check < RSS_CHECK_INTERVAL:
+            return False
+        self._since_check = 0
+        rss = self.rss()
+        return rss is not None and rss >= self.high_water and buffered_bytes > 0
+
+    def after_spill(self) -> None:
+        """
+        退避後のRSSを確認（上限を超えたままなら1回だけ警告する）
+        """
+        self._since_check = 0
+        rss = self.rss()
+        if rss is not None and rss > self.limit and not self.over_limit:
+            self.over_limit = True
+            logger.warning(
+                "退避後もRSSがメモリ上限を超えています（%.0f MB > %.0f MB）。"
+                "--chunk-size を小さくしてください。",
+                rss / (1 << 20), self.limit / (1 << 20),
+            )
+
+
+class PlanSpill:
+    """
+    サイトごとの固定長の数値配列（shape）を溜め、部分出力の .npy へ書き出す
+    """
+
+    def __init__(self, directory: Path, name: str, shape: tuple, capacity: int, dtype=np.float32):
+        self.directory = Path(directory)
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._buffer = np.empty((max(1, capacity),) + self.shape, dtype=self.dtype)
+        self._count = 0
+
+    @property
+    def row_nbytes(self) -> int:
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def buffered(self) -> int:
+        return self._count
+
+    @property
+    def full(self) -> bool:
+        return self._count >= len(self._buffer)
+
+    def append(self, values: Any) -> None:
+        self._buffer[self._count] = values
+        self._count += 1
+
+    def flush(self, label: str) -> Optional[Path]:
+        """
+        溜めた行を部分出力「<name>-<label>.npy」に書き出して空にする（空なら何もしない）
+        """
+        if self._count == 0:
+            return None
+        path = self.directory / f"{self.name}-{label}.npy"
+        with atomic_write(path) as f:
+            np.save(f, self._buffer[:self._count])
+        self._count = 0
+        return path
+
+    def merge(self, chunks: List[Path], out_path: Path) -> Path:
+        """
+        部分出力を順に連結して1つの .npy にする
+        """
+        return merge_plan_files(chunks, out_path, self.shape, self.dtype)
+
+
+def merge_plan_files(chunks: List[Path], out_path: Path, shape: tuple, dtype=np.float32) -> Path:
+    """
+    .npy（サイト数 × shape）を順に連結して1つの .npy にする
+    （部分出力は memmap で読んで書き足し、全体をメモリに載せない）
+    """
+    dtype = np.dtype(dtype)
+    total = sum(len(np.load(path, mmap_mode="r")) for path in chunks)
+    with atomic_write(out_path) as f:
+        # 見出し（形・型）を書いた後、部分出力をそのまま後ろに並べる
+        np.lib.format.write_array_header_1_0(f, {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": False,
+            "shape": (total,) + tuple(shape),
+        })
+        for path in chunks:
+            chunk = np.load(path, mmap_mode="r")
+            f.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+            del chunk
+    return Path(out_path)
+
+
+def require_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("ファイルからの一括計算には pyarrow が必要です（pip install pyarrow）")
+    return pa
+
+
+class RowSpill:
+    """
+    出力行（辞書）を溜め、部分出力の Arrow IPC ファイルへ書き出す
+    """
+
+    def __init__(self, directory: Path, name: str, schema):
+        self.directory = Path(directory)
+        self.name = name
+        self.schema = schema
+        self._rows: List[Dict[str, Any]] = []
+        self._nbytes = 0
+        self._row_nbytes: Optional[int] = None
+
+    @property
+    def buffered(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        溜めている行のおおよそのメモリ使用量
+        """
+        return self._nbytes
+
+    def append(self, row: Dict[str, Any]) -> None:
+        if self._row_nbytes is None:
+            # 1行目の大きさ（辞書と値）で見積もる
+            self._row_nbytes = sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+        self._rows.append(row)
+        self._nbytes += self._row_nbytes
+
+    def flush(self, label: str) -> Optional[Path]:
+        """
+        溜めた行を部分出力「<name>-<label>.arrow」に書き出して空にする（空なら何もしない）
+        """
+        if not self._rows:
+            return None
+        pa = require_pyarrow()
+        path = self.directory / f"{self.name}-{label}.arrow"
+        table = pa.Table.from_pylist(self._rows, schema=self.schema)
+        with atomic_write(path) as f:
+            with pa.ipc.new_file(pa.PythonFile(f, mode="w"), self.schema) as writer:
+                writer.write_table(table)
+        self._rows = []
+        self._nbytes = 0
+        return path
+
+    def merge(self, chunks: List[Path], out_path: Path, fmt: str) -> Path:
+        """
+        部分出力を順に連結して1つのファイル（"parquet" / "csv"）にする
+        """
+        return merge_row_files(chunks, out_path, self.schema, fmt)
+
+
+def iter_record_batches(chunks: List[Path]):
+    """
+    Arrow IPC（.arrow）・Parquet のファイルを順に読む（読み込みは必要な分だけ）
+    """
+    pa = require_pyarrow()
+    for path in chunks:
+        if Path(path).suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            yield from pq.ParquetFile(str(path)).iter_batches()
+            continue
+        with pa.memory_map(str(path), "r") as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+def merge_row_files(chunks: List[Path], out_path: Path, schema, fmt: str) -> Path:
+    """
+    Arrow IPC・Parquet のファイルを順に連結して1つのファイル（"parquet" / "csv"）にする
+    """
+    pa = require_pyarrow()
+    with atomic_write(out_path) as f:
+        sink = pa.PythonFile(f, mode="w")
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+                for batch in iter_record_batches(chunks):
+                    writer.write_batch(batch)
+        elif fmt == "csv":
+            import pyarrow.csv as pcsv
+
+            # Excel で開けるよう BOM 付き UTF-8 にする
+            f.write(b"\xef\xbb\xbf")
+            with pcsv.CSVWriter(sink, schema) as writer:
+                for batch in iter_record_batches(chunks):
+                    writer.write_batch(batch)
+        else:
+            raise ValueError(f"未対応の出力形式です: {fmt}")
+    return Path(out_path)
@@ -0,0 +1,35 @@
+"""
+エクスポートモジュール
+"""
+
+from .zip_export import design_csv_bytes, iter_bulk_zip, write_bulk_zip
+from .tabular import export_payload, plan_table, write_multi_site_xlsx
+from .jobs import (
+    PRIORITY_INTERACTIVE,
+    PRIORITY_BULK,
+    ExportScheduler,
+    JobCancelled,
+    bulk_zip_job,
+    get_scheduler,
+    multi_site_xlsx_job,
+    payload_job,
+    report_book_job,
+)
+
+__all__ = [
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_BULK",
+    "ExportScheduler",
+    "JobCancelled",
+    "bulk_zip_job",
+    "get_scheduler",
+    "multi_site_xlsx_job",
+    "payload_job",
+    "report_book_job",
+    "design_csv_bytes",
+    "iter_bulk_zip",
+    "write_bulk_zip",
+    "export_payload",
+    "plan_table",
+    "write_multi_site_xlsx",
+]
@@ -0,0 +1,494 @@
+"""
+エクスポートジョブのスケジューラ（プロセス内キュー）
+
+PDF・Excel・一括ZIPなどの重いエクスポートを、Streamlitのスクリプト実行から
+切り離してワーカースレッドで処理する。
+
+- 優先度付きキュー：単票の対話的なエクスポート（PRIORITY_INTERACTIVE）は
+  一括エクスポート（PRIORITY_BULK）より先に処理する
+- 対話的なジョブ用のワーカーの予約：一括のジョブはワーカーを1つ空けて実行するため、
+  一括のジョブがいくつあっても対話的なジョブは待たされない
+- ユーザー（セッション）ごとの同時実行数の上限（対話的・一括のそれぞれ）
+- キャンセル（待機中は即時、実行中は次の進捗報告時に中断）
+- 進捗のポーリング（get() でジョブの状態・進捗を参照）、または完了まで待つ（run()）
+- 結果の一時ファイル（add_temp_file() で登録）は、キャンセル・失敗時、完了後に cancel() されたときと
+  保持期間の経過時（submit()・run()・get() の呼び出し時と、待機中のワーカーが一定間隔で確認）に削除する
+"""
+
+import itertools
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from runtime.metrics import get_registry
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+# 完了したジョブを保持する時間（秒）
+DEFAULT_RETENTION_SEC = 3600
+# 待機中のワーカーが保持期間切れのジョブを確認する間隔（秒）
+PURGE_INTERVAL_SEC = 60.0
+
+# ジョブの待ち時間・実行時間（一括計算は数分かかるため区切りを長めにとる）
+_JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+_JOB_WAIT_SECONDS = get_registry().histogram(
+    "fert_export_job_wait_seconds", "ジョブが実行されるまでの待ち時間", ["kind"], buckets=_JOB_BUCKETS
+)
+_JOB_RUN_SECONDS = get_registry().histogram(
+    "fert_export_job_run_seconds", "ジョブの実行時間", ["kind", "status"], buckets=_JOB_BUCKETS
+)
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたことを示す例外"""
+
+
+class ExportJob:
+    """
+    エクスポートジョブ1件分の状態
+
+    ジョブ関数は第1引数にこのオブジェクトを受け取り、
+    report_progress() で進捗を報告する（キャンセル時は JobCancelled が送出される）。
+    """
+
+    def __init__(self, fn: Callable, user: str, kind: str, priority: int, args: tuple, kwargs: dict):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.kind = kind
+        self.priority = priority
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel_event = threading.Event()
+        self._temp_files: List[str] = []
+
+    @property
+    def is_bulk(self) -> bool:
+        return self.priority > PRIORITY_INTERACTIVE
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def report_progress(self, fraction: float, message: str = "") -> None:
+        """
+        進捗（0.0〜1.0）を報告する。キャンセル済みの場合は JobCancelled を送出
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+        self.progress = max(0.0, min(1.0, fraction))
+        if message:
+            self.message = message
+
+    def add_temp_file(self, path: str) -> None:
+        """
+        結果の一時ファイルを登録する（キャンセル・失敗時、完了後の cancel() と保持期間の経過時に削除される）
+        """
+        self._temp_files.append(path)
+
+    def remove_temp_files(self) -> None:
+        for path in self._temp_files:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._temp_files = []
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        表示用に状態をまとめて返す
+        """
+        return {
+            "id": self.id,
+            "user": self.user,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+        }
+
+
+class ExportScheduler:
+    """
+    優先度・ユーザー別同時実行数の上限つきジョブキュー
+
+    interactive_reserved 個のワーカーは対話的なジョブ専用にする
+    （ワーカーが1つの場合は予約しない。一括のジョブが実行できなくなるため）。
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        per_user_limit: int = 1,
+        retention_sec: float = DEFAULT_RETENTION_SEC,
+        interactive_reserved: int = 1,
+    ):
+        self.per_user_limit = per_user_limit
+        self.retention_sec = retention_sec
+        self.bulk_limit = workers - min(interactive_reserved, workers - 1)
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []  # (priority, seq, job)
+        self._seq = itertools.count()
+        self._jobs: Dict[str, ExportJob] = {}
+        # (ユーザー, 一括か) ごとの実行中のジョブ数
+        self._running_by_user: Dict[tuple, int] = {}
+        self._running_bulk = 0
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"export-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(
+        self,
+        fn: Callable,
+        user: str,
+        kind: str,
+        priority: int = PRIORITY_BULK,
+        args: tuple = (),
+        kwargs: Optional[dict] = None,
+    ) -> str:
+        """
+        ジョブを登録
+
+        Args:
+            fn: ジョブ関数 fn(job, *args, **kwargs)。戻り値がジョブの結果になる
+            user: ユーザー（セッション）識別子
+            kind: ジョブの種類（"pdf", "excel", "zip" など、表示用）
+            priority: 優先度（小さいほど先に処理）
+
+        Returns:
+            ジョブID
+        """
+        job = ExportJob(fn, user, kind, priority, args, kwargs or {})
+        with self._cond:
+            self._purge_finished()
+            self._jobs[job.id] = job
+            self._queue.append((priority, next(self._seq), job))
+            self._cond.notify_all()
+        return job.id
+
+    def run(
+        self,
+        fn: Callable,
+        user: str,
+        kind: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        args: tuple = (),
+        kwargs: Optional[dict] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        ジョブを登録して完了まで待ち、結果を返す（小さな対話的エクスポート向け）
+
+        Raises:
+            JobCancelled: ジョブがキャンセルされた場合
+            TimeoutError: timeout 秒以内に終わらなかった場合（ジョブはキャンセルする）
+            RuntimeError: ジョブ関数が例外を送出した場合
+        """
+        job_id = self.submit(fn, user, kind, priority, args, kwargs)
+        with self._cond:
+            job = self._jobs[job_id]
+            if not self._cond.wait_for(lambda: job.is_finished, timeout):
+                self.cancel(job_id)
+                raise TimeoutError(f"エクスポートが {timeout} 秒以内に終わりませんでした（{kind}）")
+            self._purge_finished()
+        if job.status == CANCELLED:
+            raise JobCancelled()
+        if job.status == FAILED:
+            raise RuntimeError(f"エクスポートに失敗しました（{kind}）:\n{job.error}")
+        return job.result
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        """
+        ジョブを返す（存在しない・保持期間切れの場合は None）
+        """
+        with self._cond:
+            self._purge_finished()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        ジョブをキャンセル
+
+        結果の一時ファイルがある完了済みのジョブは、一時ファイルを削除してキャンセル扱いにする。
+
+        Returns:
+            キャンセルを受け付けた場合は True（一時ファイルのない完了済みのジョブは False）
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            if job.is_finished:
+                if not job._temp_files:
+                    return False
+                job.remove_temp_files()
+                job.status = CANCELLED
+                job.result = None
+                return True
+            job._cancel_event.set()
+            if job.status == QUEUED:
+                self._queue = [item for item in self._queue if item[2] is not job]
+                job.status = CANCELLED
+                job.finished_at = time.time()
+            self._cond.notify_all()
+            return True
+
+    def jobs_for(self, user: str) -> List[ExportJob]:
+        """
+        ユーザーのジョブ一覧（登録順）
+        """
+        with self._cond:
+            return sorted(
+                (job for job in self._jobs.values() if job.user == user),
+                key=lambda job: job.created_at,
+            )
+
+    def queue_depth(self) -> int:
+        """
+        待機中のジョブ数
+        """
+        with self._cond:
+            return len(self._queue)
+
+    def running_count(self) -> int:
+        """
+        実行中のジョブ数
+        """
+        with self._cond:
+            return sum(self._running_by_user.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        ワーカーを停止（待機中のジョブはキャンセル扱い）
+        """
+        with self._cond:
+            self._shutdown = True
+            for _, _, job in self._queue:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+            self._queue = []
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def _purge_finished(self) -> None:
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and job.finished_at and now - job.finished_at > self.retention_sec
+        ]
+        for job_id in expired:
+            self._jobs.pop(job_id).remove_temp_files()
+
+    def _next_runnable(self) -> Optional[ExportJob]:
+        """
+        同時実行数の上限に達していないユーザーのうち、最も優先度の高いジョブを取り出す
+
+        一括のジョブは、対話的なジョブ用に予約したワーカーを使わない。
+        """
+        best = None
+        for item in self._queue:
+            job = item[2]
+            if job.is_bulk and self._running_bulk >= self.bulk_limit:
+                continue
+            if self._running_by_user.get((job.user, job.is_bulk), 0) >= self.per_user_limit:
+                continue
+            if best is None or item[:2] < best[:2]:
+                best = item
+        if best is None:
+            return None
+        self._queue.remove(best)
+        return best[2]
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    job = self._next_runnable()
+                    if job is not None:
+                        break
+                    # 待機中も一定間隔で保持期間切れのジョブ（と一時ファイル）を削除する
+                    self._purge_finished()
+                    self._cond.wait(PURGE_INTERVAL_SEC)
+                if job is None:
+                    return
+                job.status = RUNNING
+                job.started_at = time.time()
+                _JOB_WAIT_SECONDS.observe(job.started_at - job.created_at, kind=job.kind)
+                slot = (job.user, job.is_bulk)
+                self._running_by_user[slot] = self._running_by_user.get(slot, 0) + 1
+                self._running_bulk += job.is_bulk
+
+            try:
+                result = job._fn(job, *job._args, **job._kwargs)
+            except JobCancelled:
+                status, result, error = CANCELLED, None, None
+            except Exception:
+                status, result, error = FAILED, None, traceback.format_exc()
+            else:
+                status, error = (CANCELLED if job.is_cancelled else DONE), None
+
+            if status != DONE:
+                # キャンセル・失敗したジョブの書きかけの結果ファイルは残さない
+                job.remove_temp_files()
+
+            with self._cond:
+                job.result = result
+                job.error = error
+                job.status = status
+                if status == DONE:
+                    job.progress = 1.0
+                job.finished_at = time.time()
+                _JOB_RUN_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind, status=status)
+                self._running_by_user[slot] -= 1
+                if self._running_by_user[slot] <= 0:
+                    del self._running_by_user[slot]
+                self._running_bulk -= job.is_bulk
+                self._cond.notify_all()
+
+
+_default_scheduler: Optional[ExportScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> ExportScheduler:
+    """
+    プロセス共通のスケジューラを返す（全セッションで共有）
+
+    ワーカー数・ユーザーごとの同時実行数・対話的なジョブ用に予約するワーカー数は環境変数
+    FERT_EXPORT_WORKERS / FERT_EXPORT_PER_USER / FERT_EXPORT_INTERACTIVE_RESERVED で変更できる。
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = ExportScheduler(
+                workers=int(os.environ.get("FERT_EXPORT_WORKERS", 2)),
+                per_user_limit=int(os.environ.get("FERT_EXPORT_PER_USER", 1)),
+                interactive_reserved=int(os.environ.get("FERT_EXPORT_INTERACTIVE_RESERVED", 1)),
+            )
+            registry = get_registry()
+            registry.gauge(
+                "fert_export_queue_depth", "待機中のエクスポートジョブ数"
+            ).set_function(_default_scheduler.queue_depth)
+            registry.gauge(
+                "fert_export_running_jobs", "実行中のエクスポートジョブ数"
+            ).set_function(_default_scheduler.running_count)
+        return _default_scheduler
+
+
+def payload_job(job: ExportJob, table: tuple, fmt: str) -> bytes:
+    """
+    表をCSV・Excelに変換するジョブ関数（export_payload を実行する）
+    """
+    from .tabular import export_payload
+
+    return export_payload(table, fmt)
+
+
+def _write_temp_file(job: ExportJob, suffix: str, write: Callable[[Any], None]) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    job.add_temp_file(path)
+    with os.fdopen(fd, "wb") as f:
+        write(f)
+    return path
+
+
+def _tracked(job: ExportJob, designs: Iterable[Dict[str, Any]], total: int):
+    for i, design in enumerate(designs):
+        job.report_progress(i / total if total else 0.0, f"{i}/{total} サイト")
+        yield design
+
+
+def bulk_zip_job(
+    job: ExportJob,
+    designs: Iterable[Dict[str, Any]],
+    total: int,
+    report_format: str = "html",
+) -> str:
+    """
+    一括ZIPを一時ファイルに書き出すジョブ関数
+
+    Args:
+        job: 実行中のジョブ
+        designs: 設計データのイテラブル
+        total: サイト数（進捗計算用）
+        report_format: レポート形式（"html" または "pdf"）
+
+    Returns:
+        書き出したZIPファイルのパス（ジョブの保持期間が過ぎると削除される）
+    """
+    from .zip_export import iter_bulk_zip
+
+    def _write(f) -> None:
+        for chunk in iter_bulk_zip(_tracked(job, designs, total), report_format):
+            f.write(chunk)
+
+    return _write_temp_file(job, ".zip", _write)
+
+
+def multi_site_xlsx_job(job: ExportJob, designs: Iterable[Dict[str, Any]], total: int) -> str:
+    """
+    全サイトの月別施肥設計（1サイト1シート）を一時ファイルに書き出すジョブ関数
+
+    Returns:
+        書き出したExcelファイルのパス（ジョブの保持期間が過ぎると削除される）
+    """
+    from .tabular import write_multi_site_xlsx
+
+    return _write_temp_file(job, ".xlsx", lambda f: write_multi_site_xlsx(_tracked(job, designs, total), f))
+
+
+def report_book_job(
+    job: ExportJob,
+    designs: Iterable[Dict[str, Any]],
+    total: int,
+    title: str = "施肥設計レポートブック",
+    facility_name: str = "",
+) -> str:
+    """
+    全サイトのレポートブック（1冊のHTML）を一時ファイルに書き出すジョブ関数
+
+    Returns:
+        書き出したHTMLファイルのパス（ジョブの保持期間が過ぎると削除される）
+    """
+    from pdf.book import write_report_book
+
+    return _write_temp_file(
+        job, ".html",
+        lambda f: write_report_book(_tracked(job, designs, total), f, title=title, facility_name=facility_name),
+    )
@@ -0,0 +1,293 @@
+"""
+表形式（CSV / Excel）のエクスポート
+
+月別施肥計画を表（見出し行＋データ行のリスト）に変換し、CSV・Excelのバイト列を生成する。
+画面ではダウンロードが押されたときにだけ生成し（st.download_button の遅延データ）、
+生成結果は表の内容のハッシュをキーにキャッシュする。
+
+複数サイトのExcelは openpyxl の write_only モードで1行ずつ書き出すため、
+サイト数にかかわらずメモリ使用量はおおむね一定となる。
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from runtime.metrics import get_registry
+from runtime.singleflight import coalesce
+from runtime.tracing import traced
+
+
+NUTRIENTS = ["N", "P", "K", "Ca", "Mg"]
+PLAN_NUTRIENTS = ["N", "P", "K"]
+MONTHS_LABEL = ["1月", "2月", "3月", "4月", "5月", "6月",
+                "7月", "8月", "9月", "10月", "11月", "12月"]
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# メモリ上に保持するエクスポート結果の最大数
+DEFAULT_MAX_PAYLOADS = 128
+
+# Excelのシート名に使えない文字（最大31文字）
+_UNSAFE_SHEET_CHARS = re.compile(r"[\\/:*?\[\]]")
+
+Table = Tuple[List[str], List[List[Any]]]
+
+
+def plan_table(
+    monthly_gp: Dict[str, float],
+    monthly_dist_ratios: Sequence[float],
+    monthly_all: Dict[str, Dict[str, float]],
+) -> Table:
+    """
+    画面の月別施肥計画（N・P・K）をエクスポート用の表に変換
+
+    Args:
+        monthly_gp: キー "1"〜"12" の月平均GP
+        monthly_dist_ratios: 月別配分比率（1月〜12月）
+        monthly_all: {"1": {"N": kg, "P": kg, "K": kg}, ...}
+
+    Returns:
+        (見出し行, データ行のリスト)。最終行は年間合計
+    """
+    header = ["月", "GP", "配分係数"]
+    header += [f"{n} (kg/ha)" for n in PLAN_NUTRIENTS]
+    header += [f"{n} (g/㎡)" for n in PLAN_NUTRIENTS]
+
+    rows: List[List[Any]] = []
+    totals_kg = {n: 0.0 for n in PLAN_NUTRIENTS}
+    totals_m2 = {n: 0.0 for n in PLAN_NUTRIENTS}
+    for m in range(1, 13):
+        m_str = str(m)
+        kg_ha = [round(monthly_all.get(m_str, {}).get(n, 0.0), 2) for n in PLAN_NUTRIENTS]
+        g_m2 = [round(v * 0.1, 2) for v in kg_ha]
+        for n, kg, g in zip(PLAN_NUTRIENTS, kg_ha, g_m2):
+            totals_kg[n] += kg
+            totals_m2[n] += g
+        rows.append(
+            [f"{m}月", round(monthly_gp.get(m_str, 0.0), 2), round(monthly_dist_ratios[m - 1], 3)]
+            + kg_ha
+            + g_m2
+        )
+
+    rows.append(
+        ["年間合計", "", ""]
+        + [round(totals_kg[n], 2) for n in PLAN_NUTRIENTS]
+        + [round(totals_m2[n], 2) for n in PLAN_NUTRIENTS]
+    )
+    return header, rows
+
+
+def design_table(design: Dict[str, Any]) -> Table:
+    """
+    1サイト分の設計データ（build_site_design の戻り値）を表に変換
+
+    Returns:
+        (見出し行, データ行のリスト)。最終行は年間合計
+    """
+    results = design["calculation_results"]
+    gp_values = design.get("gp_values") or [0.0] * 12
+
+    header = ["月", "GP"]
+    header += [f"{n} (kg/ha)" for n in NUTRIENTS]
+    header += [f"{n} (g/㎡)" for n in NUTRIENTS]
+
+    rows: List[List[Any]] = []
+    totals = {n: 0.0 for n in NUTRIENTS}
+    for i, label in enumerate(MONTHS_LABEL):
+        kg_ha = [results[n]["monthly"][i] for n in NUTRIENTS]
+        for n, v in zip(NUTRIENTS, kg_ha):
+            totals[n] += v
+        rows.append(
+            [label, round(gp_values[i], 2)]
+            + [round(v, 2) for v in kg_ha]
+            + [round(v * 0.1, 2) for v in kg_ha]
+        )
+
+    rows.append(
+        ["年間合計", ""]
+        + [round(totals[n], 2) for n in NUTRIENTS]
+        + [round(totals[n] * 0.1, 2) for n in NUTRIENTS]
+    )
+    return header, rows
+
+
+@traced("export.serialize")
+def table_csv_bytes(table: Table) -> bytes:
+    """
+    表をCSV（BOM付きUTF-8で Excel でも文字化けしない）に変換
+    """
+    header, rows = table
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def _header_cells(ws, header: List[str]) -> list:
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    cells = []
+    for value in header:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = Font(bold=True)
+        cells.append(cell)
+    return cells
+
+
+def _safe_sheet_title(name: Any, used: set) -> str:
+    base = _UNSAFE_SHEET_CHARS.sub("_", str(name)).strip("'") or "site"
+    base = base[:31]
+    title = base
+    i = 2
+    while title.lower() in used:
+        suffix = f"_{i}"
+        title = base[:31 - len(suffix)] + suffix
+        i += 1
+    used.add(title.lower())
+    return title
+
+
+@traced("export.serialize")
+def table_xlsx_bytes(table: Table, sheet_name: str = "施肥設計") -> bytes:
+    """
+    表をExcel（1シート）に変換
+    """
+    from openpyxl import Workbook
+
+    header, rows = table
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name)
+    ws.append(_header_cells(ws, header))
+    for row in rows:
+        ws.append(row)
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@traced("export.serialize")
+def write_multi_site_xlsx(
+    designs: Iterable[Dict[str, Any]],
+    dest: Union[str, os.PathLike, BinaryIO],
+) -> int:
+    """
+    複数サイトの月別施肥設計を1冊のExcelに書き出す（1サイト1シート）
+
+    write_only モードで行を逐次書き出すため、サイト数が多くてもメモリ使用量は増えない。
+
+    Args:
+        designs: 設計データのイテラブル（build_site_design の戻り値、ジェネレータ可）
+        dest: 出力先のパス、またはバイナリストリーム
+
+    Returns:
+        書き出したシート数
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    used_titles: set = set()
+    count = 0
+    for design in designs:
+        header, rows = design_table(design)
+        ws = wb.create_sheet(title=_safe_sheet_title(design.get("site_id", ""), used_titles))
+        ws.append(_header_cells(ws, header))
+        for row in rows:
+            ws.append(row)
+        count += 1
+
+    if count == 0:
+        wb.create_sheet(title="施肥設計")
+    wb.save(dest)
+    return count
+
+
+def table_key(table: Table, fmt: str) -> str:
+    """
+    表の内容と形式から生成結果のキャッシュキーを作る
+    """
+    payload = json.dumps([fmt, table[0], table[1]], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PayloadCache:
+    """
+    エクスポート結果（バイト列）のLRUキャッシュ
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_PAYLOADS):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: str, build) -> bytes:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        # 同じ内容の生成が同時に要求された場合は1回だけ生成する
+        return coalesce("export_payload", key, self._build_and_store, key, build)
+
+    def _build_and_store(self, key: str, build) -> bytes:
+        data = build()
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_default_cache: Optional[PayloadCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_payload_cache() -> PayloadCache:
+    """
+    プロセス共通のエクスポート結果キャッシュを返す
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PayloadCache()
+            cache = _default_cache
+            get_registry().counter(
+                "fert_export_payload_cache_requests_total", "エクスポート結果キャッシュの参照回数", ["result"]
+            ).set_function(lambda: {("hit",): cache.hits, ("miss",): cache.misses})
+        return _default_cache
+
+
+def export_payload(table: Table, fmt: str) -> bytes:
+    """
+    表をCSVまたはExcelに変換（同じ内容の表は2回目以降キャッシュから返す）
+
+    Args:
+        table: (見出し行, データ行のリスト)
+        fmt: "csv" または "xlsx"
+    """
+    if fmt == "csv":
+        build = lambda: table_csv_bytes(table)
+    elif fmt == "xlsx":
+        build = lambda: table_xlsx_bytes(table)
+    else:
+        raise ValueError(f"未対応の形式です: {fmt}")
+    return get_payload_cache().get_or_build(table_key(table, fmt), build)
@@ -0,0 +1,173 @@
+"""
+複数サイトの一括ZIPエクスポート
+
+サイトごとにレポート（HTMLまたはPDF）1件とCSV1件を生成し、
+生成した順にZIPへ書き出す。ZIPはチャンク単位でストリーム出力するため、
+バッチの件数にかかわらず、メモリ上に載るのはおおむねレポート1件分となる。
+"""
+
+import os
+import re
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Union
+
+from .tabular import design_table, table_csv_bytes
+
+
+REPORT_FORMATS = ("html", "pdf")
+
+# ZIPエントリ名に使えない文字
+_UNSAFE_NAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def _safe_entry_name(site_id: Any) -> str:
+    name = _UNSAFE_NAME_CHARS.sub("_", str(site_id)).strip(" .")
+    return name or "site"
+
+
+def design_csv_bytes(design: Dict[str, Any]) -> bytes:
+    """
+    1サイト分の月別施肥設計をCSV（BOM付きUTF-8）に変換
+
+    Args:
+        design: build_site_design の戻り値と同じ形式の設計データ
+
+    Returns:
+        CSVのバイト列
+    """
+    return table_csv_bytes(design_table(design))
+
+
+def _render_report(design: Dict[str, Any], report_format: str) -> bytes:
+    """
+    1サイト分のレポートを生成
+    """
+    from pdf.generator import generate_pdf, render_report_html
+
+    args = (
+        design["input_data"],
+        design["calculation_results"],
+        design["gp_values"],
+        design["gp_dict"],
+        design["monthly_n"],
+    )
+    if report_format == "html":
+        return render_report_html(*args).encode("utf-8")
+
+    pdf_path = generate_pdf(*args)
+    try:
+        with open(pdf_path, "rb") as f:
+            return f.read()
+    finally:
+        try:
+            os.unlink(pdf_path)
+        except OSError:
+            pass
+
+
+class _ChunkSink:
+    """
+    ZIPの書き出し先（シーク不可のストリーム）
+
+    書き込まれたバイト列を溜めておき、take() で取り出す。
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _write_site_entries(
+    zf: zipfile.ZipFile,
+    design: Dict[str, Any],
+    report_format: str,
+    used_names: Dict[str, int],
+) -> None:
+    # used_names: 使用済みのフォルダ名 → 次に試す連番（実在の "A_2" とも重ならない名前を探す）
+    base = _safe_entry_name(design.get("site_id", "site"))
+    name = base
+    if name in used_names:
+        count = used_names[base]
+        while name in used_names:
+            count += 1
+            name = f"{base}_{count}"
+        used_names[base] = count
+    used_names.setdefault(name, 1)
+
+    with zf.open(f"{name}/施肥設計.csv", "w") as fp:
+        fp.write(design_csv_bytes(design))
+
+    report = _render_report(design, report_format)
+    with zf.open(f"{name}/施肥設計レポート.{report_format}", "w") as fp:
+        fp.write(report)
+
+
+def iter_bulk_zip(
+    designs: Iterable[Dict[str, Any]],
+    report_format: str = "html",
+) -> Iterator[bytes]:
+    """
+    複数サイトのZIPをチャンク単位で生成
+
+    サイト1件分のエントリを書き終えるごとに、そこまでのバイト列を返す。
+
+    Args:
+        designs: 設計データのイテラブル（ジェネレータ可）
+        report_format: レポート形式（"html" または "pdf"）
+
+    Yields:
+        ZIPのバイト列（連結するとZIPファイル全体になる）
+    """
+    if report_format not in REPORT_FORMATS:
+        raise ValueError(f"未対応のレポート形式です: {report_format}")
+
+    sink = _ChunkSink()
+    used_names: Dict[str, int] = {}
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for design in designs:
+            _write_site_entries(zf, design, report_format, used_names)
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    chunk = sink.take()
+    if chunk:
+        yield chunk
+
+
+def write_bulk_zip(
+    designs: Iterable[Dict[str, Any]],
+    dest: Union[str, os.PathLike, BinaryIO],
+    report_format: str = "html",
+) -> int:
+    """
+    複数サイトのZIPをファイルまたはストリームに書き出す
+
+    Args:
+        designs: 設計データのイテラブル（ジェネレータ可）
+        dest: 出力先のパス、またはバイナリストリーム
+            （Streamlitのダウンロードには一時ファイルを渡す）
+        report_format: レポート形式（"html" または "pdf"）
+
+    Returns:
+        書き出したバイト数
+    """
+    if isinstance(dest, (str, os.PathLike)):
+        with open(dest, "wb") as f:
+            return write_bulk_zip(designs, f, report_format)
+
+    written = 0
+    for chunk in iter_bulk_zip(designs, report_format):
+        dest.write(chunk)
+        written += len(chunk)
+    return written
@@ -10,6 +10,9 @@ from .constants import (
 )
 from .gp import calculate_growth_potential, calculate_growth_potentials
 from .fertilizer import calculate_fertilizer_requirements
+from .design import build_site_design
+from .plan_state import PlanState
+from .explain import DistributionTrace
 
 __all__ = [
     "GrassType",
@@ -19,4 +22,7 @@ __all__ = [
     "calculate_growth_potential",
     "calculate_growth_potentials",
     "calculate_fertilizer_requirements",
+    "build_site_design",
+    "PlanState",
+    "DistributionTrace",
 ]
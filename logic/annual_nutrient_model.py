@@ -5,6 +5,9 @@ GPには一切依存せず、年間施肥量のみを決定する。
 """
 
 from typing import Dict, Tuple
+
+from runtime.tracing import traced
+
 from .constants import (
     GrassType,
     UsageType,
@@ -425,6 +428,7 @@ def calculate_annual_magnesium(
     }
 
 
+@traced("nutrients.annual_rules")
 def calculate_annual_nutrient_requirements(
     grass_type: GrassType,
     usage_type: UsageType,
@@ -2,10 +2,34 @@
 定数定義
 """
 
+import hashlib
 from enum import Enum
+from functools import lru_cache
+from pathlib import Path
 from typing import Dict, Tuple
 
 
+# 計算ルールのバージョン（施肥量・配分の計算結果に影響する変更をしたら上げる）
+# 一括計算のチェックポイントに記録され、異なるバージョンの途中結果からは再開しない
+RULE_VERSION = "1"
+
+_LOGIC_DIR = Path(__file__).resolve().parent
+
+
+@lru_cache(maxsize=1)
+def rule_fingerprint() -> str:
+    """
+    計算ロジック（logic/*.py）のソースのハッシュ（プロセスで1回だけ計算する）
+
+    RULE_VERSION の上げ忘れがあっても、計算ロジックが変わった途中結果・永続メモを使わないようにする。
+    """
+    digest = hashlib.sha256()
+    for path in sorted(_LOGIC_DIR.glob("*.py")):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
 class GrassType(str, Enum):
     """芝種区分"""
     COOL_COMPETITION = "寒地型（競技場）"
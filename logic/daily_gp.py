@@ -0,0 +1,175 @@
+"""
+日別 Growth Potential（GP）と月別配分比率の計算モジュール
+
+緯度から推定した仮想年間気温カーブと芝種ごとの気温応答関数から
+365日分のGPを算出し、月別平均と施肥の月別配分比率を求める。
+UIから切り離し、入力（緯度・芝種・利用形態・配分方法）だけで結果が決まる純粋関数にしている。
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+
+from runtime.tracing import span, traced
+
+from .explain import DistributionTrace
+from .monthly_distribution import (
+    calculate_monthly_distribution_ratios,
+    get_season_factors,
+)
+
+
+MONTH_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+
+def estimate_temperature(day, latitude):
+    """
+    緯度から仮想的な年間気温カーブを生成する。
+    T(d) = T_mean + A * sin(2π * (d - φ) / 365)
+
+    ・T_mean : 年平均気温（緯度から簡易推定）
+    ・A       : 年較差の半分（緯度から簡易推定）
+    ・φ       : 位相（日本国内では定数: 最高気温が8月上旬に来るよう設定）
+    ※ 実測値ではなく「地点の気候的傾向」を表すためのモデル
+    """
+    t_mean    = 36.0 - 0.6 * latitude
+    amplitude = 0.35 * latitude - 2.5
+    phase     = 121  # sin ピークが day≒212（8月上旬）になる位相
+
+    return t_mean + amplitude * math.sin(2 * math.pi * (day - phase) / 365)
+
+
+def gp_cool(temp):
+    """寒地型芝の GP（気温応答関数）"""
+    if temp <= 0:
+        return 0.0
+    elif temp <= 20:
+        return temp / 20.0
+    elif temp < 35:
+        return (35.0 - temp) / 15.0
+    else:
+        return 0.0
+
+
+def gp_warm(temp):
+    """暖地型芝の GP（気温応答関数）"""
+    if temp <= 10:
+        return 0.0
+    elif temp <= 30:
+        return (temp - 10.0) / 20.0
+    elif temp < 45:
+        return (45.0 - temp) / 15.0
+    else:
+        return 0.0
+
+
+def weight_cool(temp):
+    """WOS 時の寒地型寄与率 w(T)"""
+    if temp <= 12:
+        return 1.0
+    elif temp < 22:
+        return (22.0 - temp) / 10.0
+    else:
+        return 0.0
+
+
+def calculate_daily_gp(latitude, turf_type):
+    """
+    365 日分の GP を算出する。
+    戻り値: list[float]（長さ 365）
+    """
+    with span("gp.temperature"):
+        temps = [estimate_temperature(day, latitude) for day in range(1, 366)]
+
+    with span("gp.evaluate"):
+        daily_gp = []
+        for temp in temps:
+            if turf_type == "寒地型芝":
+                gp = gp_cool(temp)
+            elif turf_type in ("暖地型芝", "日本芝"):
+                gp = gp_warm(temp)
+            elif turf_type == "ウィンターオーバーシード（WOS）":
+                w = weight_cool(temp)
+                gp = w * gp_cool(temp) + (1 - w) * gp_warm(temp)
+            else:
+                gp = 0.0
+
+            daily_gp.append(gp)
+
+    return daily_gp
+
+
+@traced("gp.monthly")
+def monthly_gp_averages(daily_gp):
+    """
+    365 日分の GP を月別平均に集約する。
+    戻り値: dict（キー "1"〜"12"、値: 月平均 GP）
+    """
+    monthly = {}
+    start = 0
+    for m, days in enumerate(MONTH_DAYS, 1):
+        end = start + days
+        monthly[str(m)] = sum(daily_gp[start:end]) / days
+        start = end
+    return monthly
+
+
+def compute_distribution_plan(
+    latitude: float,
+    turf_type: str,
+    usage_type: str,
+    allocation_method: str,
+    trace: Optional[DistributionTrace] = None,
+) -> Dict[str, Any]:
+    """
+    GPの月別平均と施肥の月別配分比率を計算
+
+    Args:
+        latitude: 緯度
+        turf_type: 芝種（"寒地型芝" / "暖地型芝" / "日本芝" / "ウィンターオーバーシード（WOS）"）
+        usage_type: 利用形態（"ゴルフ場" / "競技場"）
+        allocation_method: 配分方法（"春重点70" / "春重点50" / "春重点30" / "GP準拠"）
+        trace: 配分の計算過程の記録先（省略時は記録しない）
+
+    Returns:
+        {
+            "monthly_gp": Dict[str, float],          # キー "1"〜"12" の月平均GP
+            "gp_values": List[float],                # 月平均GP（1月〜12月）
+            "monthly_dist_ratios": List[float],      # 月別配分比率（合計1.0）
+        }
+    """
+    monthly_gp = monthly_gp_averages(calculate_daily_gp(latitude, turf_type))
+
+    # ── GP値のリスト化・配分比率の計算 ──
+    gp_values: List[float] = [monthly_gp[str(m)] for m in range(1, 13)]
+    gp_sum = sum(gp_values)
+    gp_ratios = [v / gp_sum for v in gp_values] if gp_sum > 0 else [1.0 / 12] * 12
+
+    # 季節補正係数を取得（春重点70/50/30 → "春重点" で季節係数をルックアップ）
+    base_stance = "春重点" if allocation_method.startswith("春重点") else allocation_method
+    season_factors = get_season_factors(
+        turf_type, usage_type, base_stance,
+        use_heavy=True,
+        trace=trace,
+    )
+
+    # 月別配分比率を計算（全要素共通、allocation_method が反映される）
+    ratios = calculate_monthly_distribution_ratios(
+        gp_ratios, season_factors, allocation_method, gp_values, trace=trace
+    )
+
+    # ── 防御的正規化：負値クリップ＋合計 1.0 保証 ──
+    with span("distribution.normalize"):
+        ratios = [max(0.0, r) for r in ratios]
+        ratio_total = sum(ratios)
+        if ratio_total > 0:
+            ratios = [r / ratio_total for r in ratios]
+        else:
+            ratios = [1.0 / 12] * 12
+    if trace is not None:
+        trace.record("ratios", ratios)
+
+    return {
+        "monthly_gp": monthly_gp,
+        "gp_values": gp_values,
+        "monthly_dist_ratios": ratios,
+    }
@@ -0,0 +1,90 @@
+"""
+サイト単位の施肥設計モジュール
+
+1サイト（グリーン・競技場など）分の入力から、レポート出力に必要な
+入力データ・計算結果・GP値をまとめた設計データを作る。
+"""
+
+from typing import Any, Dict
+
+from storage.memo_cache import cached_fertilizer_requirements
+
+from .constants import (
+    GrassType,
+    UsageType,
+    ManagementIntensity,
+    FertilizerStance,
+)
+from .fertilizer import calculate_fertilizer_requirements
+from .gp import calculate_growth_potentials
+
+
+def build_site_design(
+    site_id: str,
+    grass_type: GrassType,
+    usage_type: UsageType,
+    management_intensity: ManagementIntensity,
+    soil_values: Dict[str, float],
+    fertilizer_stance: FertilizerStance,
+    latitude: float = 35.7,
+    longitude: float = 139.8,
+    distribution_stance: str = "春重点50",
+    use_memo: bool = True,
+) -> Dict[str, Any]:
+    """
+    1サイト分の施肥設計を計算
+
+    Args:
+        site_id: サイト識別子（グリーン名など）
+        grass_type: 芝種区分
+        usage_type: 利用形態
+        management_intensity: 管理強度
+        soil_values: 土壌診断値
+        fertilizer_stance: 施肥スタンス
+        latitude: 緯度
+        longitude: 経度
+        distribution_stance: 配分スタンス
+        use_memo: 施肥量計算の結果を永続メモ（storage.memo_cache）から再利用するか
+
+    Returns:
+        {
+            "site_id": str,
+            "input_data": Dict,           # レポート用の入力データ
+            "calculation_results": Dict,  # calculate_fertilizer_requirements の結果
+            "gp_values": List[float],     # 月別GP値
+            "gp_dict": Dict,              # 芝種別のGP値
+            "monthly_n": List[float],     # 月別N配分量
+        }
+    """
+    requirements = cached_fertilizer_requirements if use_memo else calculate_fertilizer_requirements
+    results = requirements(
+        grass_type,
+        usage_type,
+        management_intensity,
+        soil_values,
+        fertilizer_stance,
+        latitude=latitude,
+        longitude=longitude,
+        distribution_stance=distribution_stance,
+    )
+
+    input_data = {
+        "site_id": site_id,
+        "grass_type": grass_type.value,
+        "usage_type": usage_type.value,
+        "management_intensity": management_intensity.value,
+        "fertilizer_stance": fertilizer_stance.value,
+        "distribution_stance": distribution_stance,
+        "latitude": latitude,
+        "longitude": longitude,
+        "soil_values": dict(soil_values),
+    }
+
+    return {
+        "site_id": site_id,
+        "input_data": input_data,
+        "calculation_results": results,
+        "gp_values": results["N"]["gp_values"],
+        "gp_dict": calculate_growth_potentials(grass_type.value),
+        "monthly_n": results["N"]["monthly"],
+    }
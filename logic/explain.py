@@ -0,0 +1,115 @@
+"""
+月別配分の計算過程の記録（explain trace）
+
+「なぜ4月にNの22%が配分されたのか」を説明できるように、
+calculate_monthly_distribution_ratios などの途中の12ヶ月ベクトル
+（GP比率、季節係数、管理強度・春重点スケーリングの適用後、GP制御係数、正規化前後）を記録する。
+
+記録先は段階数×12の固定長バッファ（array('d')）を1つだけ確保し、
+各段階の値はその中に上書きで書き込む。計算関数は trace=None（既定）のとき何も記録せず、
+追加のメモリも確保しない。
+"""
+
+import json
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+MONTHS_LABEL = ["1月", "2月", "3月", "4月", "5月", "6月",
+                "7月", "8月", "9月", "10月", "11月", "12月"]
+
+# 記録する段階（計算の順）：(キー, 表示名)
+STAGES: List[Tuple[str, str]] = [
+    ("gp_values", "月別GP"),
+    ("gp_ratios", "① GP比率"),
+    ("season_base", "② 季節係数（基準）"),
+    ("season_factors", "③ 季節係数（管理強度適用後）"),
+    ("scaled_season", "④ 季節係数（春重点スケーリング後）"),
+    ("raw_weights", "⑤ GP比率 × 季節係数"),
+    ("gp_control", "⑥ GP制御係数"),
+    ("gp_controlled", "⑦ GP制御後"),
+    ("clamped", "⑧ 負値クリップ後"),
+    ("ratios", "⑨ 配分比率（正規化後）"),
+]
+
+_INDEX = {key: i for i, (key, _) in enumerate(STAGES)}
+_LABELS = dict(STAGES)
+
+
+class DistributionTrace:
+    """
+    月別配分の途中経過（段階数×12の固定長バッファ）
+    """
+
+    __slots__ = ("_buffer", "_recorded", "meta")
+
+    def __init__(self):
+        self._buffer = array("d", bytes(8 * 12 * len(STAGES)))
+        self._recorded = 0  # 記録済みの段階（ビットマスク）
+        self.meta: Dict[str, Any] = {}
+
+    def record(self, stage: str, values: Iterable[float]) -> None:
+        """
+        段階 stage の12ヶ月分の値を記録（同じ段階を再度記録すると上書き）
+        """
+        index = _INDEX[stage]
+        offset = index * 12
+        n = 0
+        for n, value in enumerate(values, 1):
+            if n > 12:
+                raise ValueError(f"{stage} は12ヶ月分の値にしてください")
+            self._buffer[offset + n - 1] = value
+        if n != 12:
+            raise ValueError(f"{stage} は12ヶ月分の値にしてください（{n}件）")
+        self._recorded |= 1 << index
+
+    def has(self, stage: str) -> bool:
+        return bool(self._recorded & (1 << _INDEX[stage]))
+
+    def get(self, stage: str) -> Optional[List[float]]:
+        """
+        段階 stage の値（記録されていなければ None）
+        """
+        if not self.has(stage):
+            return None
+        offset = _INDEX[stage] * 12
+        return self._buffer[offset:offset + 12].tolist()
+
+    def stages(self) -> List[str]:
+        """
+        記録済みの段階（計算の順）
+        """
+        return [key for key, _ in STAGES if self.has(key)]
+
+    def explain_month(self, month: int) -> List[Dict[str, Any]]:
+        """
+        1か月分の値を段階の順に並べる（画面の説明用）
+
+        Args:
+            month: 1〜12
+
+        Returns:
+            [{"stage": キー, "label": 表示名, "value": float}, ...]
+        """
+        i = month - 1
+        return [
+            {"stage": key, "label": _LABELS[key], "value": self._buffer[_INDEX[key] * 12 + i]}
+            for key in self.stages()
+        ]
+
+    def to_table(self) -> Tuple[List[str], List[List[Any]]]:
+        """
+        (見出し行, データ行のリスト) の表（export.tabular でCSV・Excelにできる形）
+        """
+        header = ["段階"] + MONTHS_LABEL
+        rows = [[_LABELS[key]] + [round(v, 6) for v in self.get(key)] for key in self.stages()]
+        return header, rows
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "meta": dict(self.meta),
+            "stages": {key: self.get(key) for key in self.stages()},
+        }
+
+    def to_json(self) -> bytes:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2).encode("utf-8")
@@ -13,6 +13,7 @@ from .constants import (
     FertilizerStance,
 )
 from .annual_nutrient_model import calculate_annual_nutrient_requirements
+from .explain import DistributionTrace
 from .gp_model import calculate_monthly_gp, normalize_gp_ratios
 from .monthly_distribution import calculate_monthly_fertilizer_distribution
 
@@ -26,6 +27,7 @@ def calculate_fertilizer_requirements(
     latitude: float = 35.7,  # デフォルト：東京
     longitude: float = 139.8,
     distribution_stance: str = "春重点50",  # 配分スタンス
+    trace: Optional[DistributionTrace] = None,
 ) -> Dict[str, Dict]:
     """
     年間施肥設計を計算（MSLN/SLAN理論 + GP × 季節補正配分）
@@ -39,6 +41,7 @@ def calculate_fertilizer_requirements(
         latitude: 緯度
         longitude: 経度
         distribution_stance: 配分スタンス（"春重点70", "春重点50", "春重点30", "GP準拠"）
+        trace: 月別配分の計算過程の記録先（配分比率は全成分共通。省略時は記録しない）
     
     Returns:
         計算結果の辞書
@@ -80,6 +83,7 @@ def calculate_fertilizer_requirements(
             distribution_stance,
             management_intensity.value,  # 管理強度を渡す
             monthly_gp,  # GP値（GP制御用）
+            trace=trace,
         )
         monthly = [round(x, 1) for x in monthly]
         
@@ -5,6 +5,8 @@
 import math
 from typing import List, Optional
 
+from runtime.tracing import span, traced
+
 
 def calculate_gp_from_temperature(
     temperature: float,
@@ -49,6 +51,7 @@ def get_optimal_temperature(grass_type: str) -> float:
         return 22.0  # 中間
 
 
+@traced("gp.temperature")
 def get_monthly_temperatures(
     latitude: float,
     longitude: float,
@@ -120,10 +123,11 @@ def calculate_monthly_gp(
     t_opt = get_optimal_temperature(grass_type)
     
     # 各月のGPを計算
-    monthly_gp = [
-        calculate_gp_from_temperature(temp, t_opt=t_opt)
-        for temp in monthly_temps
-    ]
+    with span("gp.evaluate"):
+        monthly_gp = [
+            calculate_gp_from_temperature(temp, t_opt=t_opt)
+            for temp in monthly_temps
+        ]
     
     return monthly_gp
 
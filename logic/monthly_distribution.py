@@ -5,9 +5,13 @@ GP（生理的成長能）と季節補正係数（管理戦略）を組み合わ
 月別配分を決定する。
 """
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from enum import Enum
+
+from runtime.tracing import span, traced
+
 from .constants import GrassType, UsageType
+from .explain import DistributionTrace
 
 
 class DistributionStance(str, Enum):
@@ -301,6 +305,7 @@ def gp_zone(gp: float) -> str:
         return "excess"   # GPが過剰：効きすぎ防止
 
 
+@traced("distribution.gp_control")
 def apply_gp_control(
     monthly_weights: List[float],
     gp_values: List[float]
@@ -358,12 +363,14 @@ def apply_management_intensity(
     return adjusted
 
 
+@traced("distribution.season_factors")
 def get_season_factors(
     grass_type: str,
     usage_type: str,
     stance: str,
     use_heavy: bool = True,  # 強化版を使用するか（デフォルト：True）
-    management_intensity: str = "中"  # 管理強度（デフォルト：中）
+    management_intensity: str = "中",  # 管理強度（デフォルト：中）
+    trace: Optional[DistributionTrace] = None,
 ) -> List[float]:
     """
     季節補正係数を取得
@@ -373,6 +380,7 @@ def get_season_factors(
         usage_type: 利用形態（"ゴルフ場", "競技場"）
         stance: 配分スタンス（"春重点", "GP準拠"）
         use_heavy: 強化版を使用するか（春重点の場合のみ有効）
+        trace: 計算過程の記録先（基準の係数と管理強度適用後の係数を記録）
     
     Returns:
         12ヶ月分の季節補正係数
@@ -396,7 +404,11 @@ def get_season_factors(
     # 配分スタンスに応じた処理
     if stance == "GP準拠":
         # GPのみ（季節補正なし）
-        return [1.0] * 12
+        factors = [1.0] * 12
+        if trace is not None:
+            trace.record("season_base", factors)
+            trace.record("season_factors", factors)
+        return factors
     else:  # 春重点（デフォルト：70/50/30）
         # 強化版を使用する場合
         if use_heavy:
@@ -404,7 +416,7 @@ def get_season_factors(
             base_factors = SEASON_FACTOR_SPRING_HEAVY.get(heavy_key)
             if base_factors is not None:
                 # 管理強度による春ピーク倍率を適用
-                return apply_management_intensity(base_factors, management_intensity)
+                return _apply_intensity(base_factors, management_intensity, trace)
         
         # 標準版を使用
         stance_key = "春重点"
@@ -416,7 +428,21 @@ def get_season_factors(
             base_factors = SEASON_FACTOR_TABLE.get(("寒地型", "ゴルフ場", "春重点"), [1.0] * 12)
         
         # 管理強度による春ピーク倍率を適用
-        return apply_management_intensity(base_factors, management_intensity)
+        return _apply_intensity(base_factors, management_intensity, trace)
+
+
+def _apply_intensity(
+    base_factors: List[float],
+    management_intensity: str,
+    trace: Optional[DistributionTrace],
+) -> List[float]:
+    adjusted = apply_management_intensity(base_factors, management_intensity)
+    if trace is not None:
+        trace.record("season_base", base_factors)
+        trace.record("season_factors", adjusted)
+        trace.meta["management_intensity"] = management_intensity
+        trace.meta["spring_peak_multiplier"] = MANAGEMENT_PEAK_MULTIPLIER.get(management_intensity, 0.85)
+    return adjusted
 
 
 def _get_spring_scale(stance: str) -> float:
@@ -445,6 +471,7 @@ def calculate_monthly_distribution_ratios(
     season_factors: List[float],
     stance: str,
     gp_values: List[float],  # 月別GP値（制御用）
+    trace: Optional[DistributionTrace] = None,
 ) -> List[float]:
     """
     GP比率と季節補正係数から月別配分比率を計算
@@ -461,6 +488,7 @@ def calculate_monthly_distribution_ratios(
         season_factors: 季節補正係数（管理強度適用済み）
         stance: 配分スタンス（"春重点70", "春重点50", "春重点30", "GP準拠"）
         gp_values: 月別GP値（0.0〜1.0、GP制御用）
+        trace: 計算過程の記録先（省略時は記録しない）
     
     Returns:
         月別配分比率（合計=1.0）
@@ -469,6 +497,8 @@ def calculate_monthly_distribution_ratios(
         # GPのみ（季節補正なし、GP制御は適用）
         raw_weights = gp_ratios.copy()
         gp_controlled = apply_gp_control(raw_weights, gp_values)
+        if trace is not None:
+            trace.record("scaled_season", [1.0] * 12)
     
     else:  # 春重点（70/50/30）
         # 春重点スケーリング：50%を基準に偏差を拡縮
@@ -485,13 +515,30 @@ def calculate_monthly_distribution_ratios(
         
         # ② GP制御を適用（GPを上限リミッターとして使用）
         gp_controlled = apply_gp_control(raw_weights, gp_values)
+        if trace is not None:
+            trace.record("scaled_season", scaled_season)
+            trace.meta["spring_scale"] = spring_scale
+
+    if trace is not None:
+        trace.meta["stance"] = stance
+        trace.record("gp_values", gp_values)
+        trace.record("gp_ratios", gp_ratios)
+        trace.record("raw_weights", raw_weights)
+        trace.record("gp_control", (GP_CONTROL_FACTOR[gp_zone(gp)] for gp in gp_values))
+        trace.record("gp_controlled", gp_controlled)
     
     # ── 負値クリップ + 正規化（全配分方法共通） ──
-    clamped = [max(0.0, w) for w in gp_controlled]
-    total = sum(clamped)
-    if total == 0:
-        return [1.0 / 12] * 12
-    monthly_ratios = [w / total for w in clamped]
+    with span("distribution.normalize"):
+        clamped = [max(0.0, w) for w in gp_controlled]
+        total = sum(clamped)
+        if total == 0:
+            monthly_ratios = [1.0 / 12] * 12
+        else:
+            monthly_ratios = [w / total for w in clamped]
+        if trace is not None:
+            trace.record("clamped", clamped)
+            trace.record("ratios", monthly_ratios)
+            trace.meta["total_before_normalize"] = total
     
     assert all(v >= 0 for v in monthly_ratios), \
         f"配分係数に負値が含まれています: {monthly_ratios}"
@@ -507,6 +554,7 @@ def calculate_monthly_fertilizer_distribution(
     stance: str,
     management_intensity: str = "中",  # 管理強度
     gp_values: List[float] = None,  # 月別GP値（GP制御用）
+    trace: Optional[DistributionTrace] = None,
 ) -> List[float]:
     """
     年間施肥量を月別に配分
@@ -526,6 +574,7 @@ def calculate_monthly_fertilizer_distribution(
         stance: 配分スタンス（"春重点70", "春重点50", "春重点30", "GP準拠"）
         management_intensity: 管理強度（"低", "中", "高"）
         gp_values: 月別GP値（0.0〜1.0、GP制御用）
+        trace: 計算過程の記録先（省略時は記録しない）
     
     Returns:
         12ヶ月分の月別施肥量（kg/ha）
@@ -543,12 +592,13 @@ def calculate_monthly_fertilizer_distribution(
     # 春重点70/50/30 → いずれも "春重点" として季節係数を取得
     base_stance = "春重点" if stance.startswith("春重点") else stance
     season_factors = get_season_factors(
-        grass_type, usage_type, base_stance, use_heavy=True, management_intensity=management_intensity
+        grass_type, usage_type, base_stance, use_heavy=True, management_intensity=management_intensity,
+        trace=trace,
     )
     
     # 月別配分比率を計算（GP制御を含む）
     monthly_ratios = calculate_monthly_distribution_ratios(
-        gp_ratios, season_factors, stance, gp_values
+        gp_ratios, season_factors, stance, gp_values, trace=trace
     )
     
     # 年間量を配分
@@ -0,0 +1,109 @@
+"""
+施肥計画の状態（1回の画面実行・1セッション分）
+
+土壌評価で算出した補正量と、GPから求めた月別配分比率をまとめて保持する。
+モジュール変数ではなく画面の実行ごとに作成して明示的に受け渡すため、
+同じサーバーで複数のセッションが同時に再実行されても状態が混ざらない。
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+
+PLAN_ELEMENTS = ["N", "P", "K"]
+# 設計データ（build_site_design の戻り値）の要素
+DESIGN_NUTRIENTS = ["N", "P", "K", "Ca", "Mg"]
+
+
+def split_by_month(total_kg_10a: float, ratios: Sequence[float]) -> Dict[str, float]:
+    """
+    年間施肥量を月別配分比率で12ヶ月に配分する
+
+    Args:
+        total_kg_10a: 年間施肥量（kg/10a）
+        ratios: 月別配分比率（1月〜12月、合計1.0）
+
+    Returns:
+        キー "1"〜"12" の月別施肥量
+    """
+    return {str(m + 1): total_kg_10a * ratios[m] for m in range(12)}
+
+
+class PlanState:
+    """
+    施肥計画の状態
+
+    Attributes:
+        monthly_gp: キー "1"〜"12" の月平均GP
+        monthly_dist_ratios: 月別配分比率（1月〜12月）
+        fert_results: 要素ごとの肥料換算の補正量（kg/10a）
+    """
+
+    def __init__(self, monthly_gp: Dict[str, float], monthly_dist_ratios: Sequence[float]):
+        # キャッシュされた計算結果を共有しても書き換えが波及しないよう複製して持つ
+        self.monthly_gp: Dict[str, float] = dict(monthly_gp)
+        self.monthly_dist_ratios: List[float] = list(monthly_dist_ratios)
+        self.fert_results: Dict[str, float] = {}
+
+    def set_fertilizer(self, elem: str, fert_kg: float) -> Dict[str, float]:
+        """
+        要素の補正量を登録し、月別配分を返す
+        """
+        self.fert_results[elem] = fert_kg
+        return self.split_by_month(fert_kg)
+
+    def split_by_month(self, total_kg_10a: float) -> Dict[str, float]:
+        """
+        年間施肥量をこの計画の月別配分比率で配分する
+        """
+        return split_by_month(total_kg_10a, self.monthly_dist_ratios)
+
+    def monthly_plan(self) -> Optional[Dict[str, Dict[str, float]]]:
+        """
+        N・P・K を統合した月別施肥計画
+
+        Returns:
+            {"1": {"N": kg, "P": kg, "K": kg}, ...}（補正量が1つもない場合は None）
+        """
+        monthly_all: Dict[str, Dict[str, float]] = {}
+        for elem in PLAN_ELEMENTS:
+            if elem in self.fert_results:
+                for month, kg in self.split_by_month(self.fert_results[elem]).items():
+                    monthly_all.setdefault(month, {e: 0.0 for e in PLAN_ELEMENTS})[elem] = kg
+        return monthly_all or None
+
+    def to_design(
+        self,
+        site_id: str,
+        input_data: Dict[str, Any],
+        nutrient_rates: Dict[str, float],
+    ) -> Dict[str, Any]:
+        """
+        build_site_design の戻り値と同じ形の設計データにする（施肥設計の履歴に記録する）
+
+        補正量（肥料換算 kg/10a）を成分量 kg/ha に換算する。補正のない要素は 0。
+
+        Args:
+            site_id: サイト識別子
+            input_data: 入力（grass_type・usage_type・latitude・soil_values など）
+            nutrient_rates: 要素ごとの肥料の成分含有率
+        """
+        gp_values = [self.monthly_gp[str(m)] for m in range(1, 13)]
+        results: Dict[str, Dict[str, Any]] = {}
+        for elem in DESIGN_NUTRIENTS:
+            corrected = elem in self.fert_results and elem in nutrient_rates
+            kg_ha = self.fert_results[elem] * nutrient_rates[elem] * 10 if corrected else 0.0
+            results[elem] = {
+                "annual_value": kg_ha,
+                "msln": None,
+                "slan": None,
+                "position": "不足補正" if corrected else "補正なし",
+                "monthly": [kg_ha * r for r in self.monthly_dist_ratios],
+            }
+        results["N"]["gp_values"] = gp_values
+        return {
+            "site_id": site_id,
+            "input_data": {"site_id": site_id, **input_data},
+            "calculation_results": results,
+            "gp_values": gp_values,
+            "monthly_n": results["N"]["monthly"],
+        }
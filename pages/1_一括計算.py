@@ -0,0 +1,275 @@
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from batch import BatchProgress, read_site_table, run_batch_job
+from export import bulk_zip_job, get_scheduler, multi_site_xlsx_job, report_book_job
+from export.jobs import PRIORITY_BULK, DONE, FAILED, CANCELLED
+from export.tabular import XLSX_MIME, design_table
+from runtime import bootstrap
+from runtime.metrics import observe_rerun
+
+_RERUN_START = time.perf_counter()
+
+# ページ設定（最初のStreamlitコマンドでなければならない）
+st.set_page_config(
+    page_title="一括計算｜芝しごと・施肥設計ナビ",
+    page_icon="🌱",
+    layout="wide",
+)
+
+_ASSETS = bootstrap()["assets"]
+st.markdown(_ASSETS.stylesheet_markup("style.css"), unsafe_allow_html=True)
+
+# 実行中の進捗を再描画する間隔（秒）
+POLL_INTERVAL_SEC = 1.0
+
+SUMMARY_COLUMNS = {
+    "site_id": "サイト",
+    "N": "N (g/㎡)",
+    "P": "P (g/㎡)",
+    "K": "K (g/㎡)",
+    "Ca": "Ca (g/㎡)",
+    "Mg": "Mg (g/㎡)",
+    "spring_share": "春（3〜5月）のN比率",
+}
+
+SAMPLE_CSV = (
+    "サイト,緯度,経度,芝種区分,利用形態,管理強度,施肥スタンス,配分スタンス,P,K,Ca,Mg\n"
+    "グリーン1,35.7,139.8,寒地型（ゴルフグリーン）,ゴルフ場,高,中央,春重点50,12,80,600,90\n"
+    "グリーン2,34.7,135.5,暖地型（暖地芝グリーン）,ゴルフ場,中,下限寄り,GP準拠,8,60,500,70\n"
+)
+
+st.title("一括計算（複数グリーン）")
+st.markdown(
+    '<div class="subtitle">— サイト一覧のCSV / Excelから施肥設計をまとめて計算 —</div>',
+    unsafe_allow_html=True
+)
+st.caption(
+    "計算はサーバーのバックグラウンドで行います。"
+    "計算中もページを操作でき、完了したサイトから順に結果を確認できます。"
+)
+
+# セッション（ユーザー）ごとの識別子（ジョブの同時実行数の制御に使う）
+_user = st.session_state.setdefault("_session_user", uuid.uuid4().hex)
+scheduler = get_scheduler()
+
+st.subheader("1. サイト一覧のアップロード")
+st.download_button(
+    label="📄 入力例（CSV）",
+    data=SAMPLE_CSV.encode("utf-8-sig"),
+    file_name="サイト一覧_入力例.csv",
+    mime="text/csv",
+    on_click="ignore",
+)
+uploaded = st.file_uploader(
+    "サイト一覧（CSV / Excel / JSONL / Parquet）",
+    type=["csv", "xlsx", "jsonl", "parquet"],
+)
+
+if uploaded is not None:
+    try:
+        rows = read_site_table(uploaded.getvalue(), uploaded.name)
+    except (ValueError, RuntimeError) as e:
+        st.error(f"⚠️ ファイルを読み込めませんでした：{e}")
+        rows = None
+
+    if rows is not None:
+        st.write(f"{len(rows)} サイトを読み込みました。")
+        record_history = st.checkbox("計算した設計を設計履歴に記録する", value=False)
+        course = st.text_input(
+            "コース・施設名（レポートブックの表紙・設計履歴に記録）",
+            value=uploaded.name.rsplit(".", 1)[0],
+        )
+        if st.button("▶ 一括計算を開始", type="primary", disabled=not rows):
+            # 前回の計算のエクスポートは表示しなくなるため、作成中のものは止め、作成済みのファイルは削除する
+            for export_id in st.session_state.get("batch_job", {}).get("exports", {}).values():
+                scheduler.cancel(export_id)
+            progress = BatchProgress(len(rows))
+            job_id = scheduler.submit(
+                run_batch_job,
+                user=_user,
+                kind="batch",
+                priority=PRIORITY_BULK,
+                args=(rows, progress, course, record_history),
+            )
+            st.session_state["batch_job"] = {
+                "job_id": job_id,
+                "progress": progress,
+                "filename": uploaded.name,
+                "course": course,
+                "exports": {},
+            }
+
+
+# 一括計算の結果のエクスポート（スケジューラのジョブで一時ファイルに書き出す）
+EXPORTS = {
+    "zip": {
+        "job": bulk_zip_job,
+        "create_label": "📦 レポート＋CSV（ZIP）を作成",
+        "label": "📥 レポート＋CSV（ZIP）",
+        "file_name": "施肥設計_一括.zip",
+        "mime": "application/zip",
+    },
+    "xlsx": {
+        "job": multi_site_xlsx_job,
+        "create_label": "📦 Excel（全サイト）を作成",
+        "label": "📥 Excel（全サイト）",
+        "file_name": "施肥設計_一括.xlsx",
+        "mime": XLSX_MIME,
+    },
+    "book": {
+        "job": report_book_job,
+        "create_label": "📦 レポートブック（HTML）を作成",
+        "label": "📥 レポートブック（全サイト1冊）",
+        "file_name": "施肥設計_レポートブック.html",
+        "mime": "text/html",
+        # 表紙の施設名
+        "kwargs": lambda batch: {"facility_name": batch.get("course", "")},
+    },
+}
+
+
+def _export_running(batch) -> bool:
+    for job_id in batch["exports"].values():
+        job = scheduler.get(job_id)
+        if job is not None and not job.is_finished:
+            return True
+    return False
+
+
+def render_export(batch, kind, designs):
+    """エクスポートの作成ボタン・進捗・ダウンロード"""
+    spec = EXPORTS[kind]
+    job_id = batch["exports"].get(kind)
+    job = scheduler.get(job_id) if job_id else None
+
+    if job is None or job.status in (FAILED, CANCELLED):
+        if job is not None and job.status == FAILED:
+            st.error("⚠️ ファイルを作成できませんでした。")
+        if st.button(spec["create_label"], key=f"create_{kind}"):
+            batch["exports"][kind] = scheduler.submit(
+                spec["job"],
+                user=_user,
+                kind=kind,
+                priority=PRIORITY_BULK,
+                args=(designs, len(designs)),
+                kwargs=spec["kwargs"](batch) if "kwargs" in spec else None,
+            )
+            st.rerun()
+    elif not job.is_finished:
+        st.progress(job.progress, text=job.message or "作成待ち")
+        if st.button("⏹ 作成を中止", key=f"cancel_{kind}"):
+            scheduler.cancel(job.id)
+    else:
+        path = job.result
+        st.download_button(
+            label=spec["label"],
+            data=Path(path).read_bytes,
+            file_name=spec["file_name"],
+            mime=spec["mime"],
+            on_click="ignore",
+        )
+
+
+def render_batch_status(batch):
+    """ジョブの進捗・途中結果・ダウンロード"""
+    job = scheduler.get(batch["job_id"])
+    progress = batch["progress"]
+
+    if job is None:
+        st.warning("⚠️ ジョブの保持期間が過ぎました。もう一度計算してください。")
+        return
+
+    st.subheader(f"2. 計算結果（{batch['filename']}）")
+    st.progress(
+        progress.done / progress.total if progress.total else 1.0,
+        text=f"{progress.done} / {progress.total} サイト",
+    )
+
+    if not job.is_finished:
+        if st.button("⏹ 計算を中止"):
+            scheduler.cancel(job.id)
+    elif job.status == DONE:
+        st.success("✅ 計算が完了しました。")
+    elif job.status == CANCELLED:
+        st.info("計算を中止しました（完了したサイトの結果は表示しています）。")
+    elif job.status == FAILED:
+        st.error("⚠️ 計算中にエラーが発生しました。")
+        with st.expander("エラーの詳細"):
+            st.code(job.error or "")
+
+    errors = progress.errors()
+    if errors:
+        with st.expander(f"⚠️ 計算できなかった行（{len(errors)} 件）"):
+            st.dataframe(
+                pd.DataFrame(errors).rename(columns={"row": "行", "site_id": "サイト", "error": "内容"}),
+                hide_index=True,
+            )
+
+    summaries = progress.summaries()
+    if not summaries:
+        return
+
+    df_summary = pd.DataFrame(summaries)[list(SUMMARY_COLUMNS)].rename(columns=SUMMARY_COLUMNS)
+    st.dataframe(
+        df_summary.style.format({
+            **{SUMMARY_COLUMNS[k]: "{:.2f}" for k in ("N", "P", "K", "Ca", "Mg")},
+            SUMMARY_COLUMNS["spring_share"]: "{:.0%}",
+        }),
+        hide_index=True,
+    )
+
+    # 同じサイト名の行があっても別々に選べるよう、位置で選ぶ（重複した名前には何件目かを付ける）
+    site_ids = [row["site_id"] for row in summaries]
+    counts = Counter(site_ids)
+    seen = Counter()
+    labels = []
+    for site_id in site_ids:
+        seen[site_id] += 1
+        labels.append(f"{site_id}（{seen[site_id]}件目）" if counts[site_id] > 1 else str(site_id))
+    selected = st.selectbox(
+        "月別施肥設計を表示するサイト",
+        range(len(labels)),
+        format_func=labels.__getitem__,
+        key="batch_site",
+    )
+    design = progress.get_design(selected) if selected is not None else None
+    if design is not None:
+        header, table_rows = design_table(design)
+        # 年間合計行の空欄（GP）は表示用に欠損値にする
+        df_design = pd.DataFrame(table_rows, columns=header).replace("", None)
+        st.dataframe(df_design, hide_index=True)
+
+    if job.is_finished:
+        designs = progress.designs()
+        col_dl1, col_dl2, col_dl3 = st.columns(3)
+        with col_dl1:
+            render_export(batch, "zip", designs)
+        with col_dl2:
+            render_export(batch, "xlsx", designs)
+        with col_dl3:
+            render_export(batch, "book", designs)
+
+
+_batch = st.session_state.get("batch_job")
+if _batch is not None:
+    _batch.setdefault("exports", {})
+    _job = scheduler.get(_batch["job_id"])
+    _running = (_job is not None and not _job.is_finished) or _export_running(_batch)
+
+    # 計算・エクスポートの実行中だけ一定間隔で再描画する（完了したらページ全体を再実行して停止）
+    @st.fragment(run_every=POLL_INTERVAL_SEC if _running else None)
+    def _batch_status_fragment():
+        render_batch_status(_batch)
+        job = scheduler.get(_batch["job_id"])
+        if _running and (job is None or job.is_finished) and not _export_running(_batch):
+            st.rerun()
+
+    _batch_status_fragment()
+
+observe_rerun("batch", _RERUN_START)
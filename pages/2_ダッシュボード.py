@@ -0,0 +1,124 @@
+import math
+import time
+
+import pandas as pd
+import streamlit as st
+
+from batch.dashboard import NUTRIENTS, SORT_KEYS, STATUSES, DashboardIndex
+from runtime import bootstrap
+from runtime.metrics import observe_rerun
+
+_RERUN_START = time.perf_counter()
+
+# ページ設定（最初のStreamlitコマンドでなければならない）
+st.set_page_config(
+    page_title="ダッシュボード｜芝しごと・施肥設計ナビ",
+    page_icon="🌱",
+    layout="wide",
+)
+
+_ASSETS = bootstrap()["assets"]
+st.markdown(_ASSETS.stylesheet_markup("style.css"), unsafe_allow_html=True)
+
+PAGE_SIZES = [25, 50, 100, 200]
+
+SORT_LABELS = {
+    "site_id": "サイト",
+    "status": "状態",
+    "spring_share": "春のN比率",
+    **{n: f"{n} (g/㎡)" for n in NUTRIENTS},
+}
+
+st.title("ダッシュボード（全サイト）")
+st.caption(
+    "一括計算の結果をサイトごとに一覧表示します。"
+    "表示中のページの行だけを読み込むため、数千サイトでも軽快に操作できます。"
+)
+
+_batch = st.session_state.get("batch_job")
+if _batch is None:
+    st.info("一括計算の結果がありません。「一括計算」ページでサイト一覧をアップロードしてください。")
+    observe_rerun("dashboard", _RERUN_START)
+    st.stop()
+
+_progress = _batch["progress"]
+
+
+def _dashboard_index() -> DashboardIndex:
+    """
+    集計済みのインデックス（完了サイト数が変わったときだけ作り直す）
+    """
+    key = (_batch["job_id"], _progress.done)
+    cached = st.session_state.get("_dashboard_index")
+    if cached is None or cached[0] != key:
+        cached = (key, DashboardIndex(_progress.designs()))
+        st.session_state["_dashboard_index"] = cached
+    return cached[1]
+
+
+index = _dashboard_index()
+if len(index) == 0:
+    st.info("計算が完了したサイトはまだありません。")
+    observe_rerun("dashboard", _RERUN_START)
+    st.stop()
+
+# ── 全体の集計 ──
+totals = index.totals()
+cols = st.columns(1 + len(STATUSES))
+cols[0].metric("サイト数", f"{totals['sites']:,}")
+for col, status in zip(cols[1:], STATUSES):
+    col.metric(status, f"{totals['status_counts'][status]:,}")
+st.caption(
+    "年間施肥量の平均（g/㎡）："
+    + " / ".join(f"{n} {totals['mean_annual'][n]:.2f}" for n in NUTRIENTS)
+)
+
+
+@st.fragment
+def render_site_table(index: DashboardIndex):
+    """絞り込み・並べ替え・ページ送り（操作してもこの一覧だけを再実行する）"""
+    col1, col2, col3, col4 = st.columns([3, 3, 2, 1])
+    with col1:
+        text = st.text_input("サイト名で絞り込み", key="dash_text")
+    with col2:
+        statuses = st.multiselect("状態", STATUSES, default=STATUSES, key="dash_status")
+    with col3:
+        sort_by = st.selectbox(
+            "並べ替え", SORT_KEYS, format_func=lambda k: SORT_LABELS[k], key="dash_sort"
+        )
+    with col4:
+        descending = st.toggle("降順", key="dash_desc")
+
+    col5, col6 = st.columns([1, 1])
+    with col6:
+        page_size = st.selectbox("1ページの行数", PAGE_SIZES, index=1, key="dash_page_size")
+
+    pages = max(1, math.ceil(index.count(text, statuses) / page_size))
+    with col5:
+        page = st.number_input(
+            f"ページ（全 {pages} ページ）", min_value=1, max_value=pages, value=1, step=1, key="dash_page"
+        )
+
+    rows, matched = index.query(text, statuses, sort_by, not descending, page=page - 1, page_size=page_size)
+    st.caption(f"{matched:,} サイト中 {len(rows)} サイトを表示")
+    if not rows:
+        return
+
+    df_page = pd.DataFrame(rows)[["site_id", "status", *NUTRIENTS, "spring_share", "trend"]]
+    df_page["spring_share"] = df_page["spring_share"] * 100
+    st.dataframe(
+        df_page,
+        hide_index=True,
+        column_config={
+            "site_id": st.column_config.TextColumn("サイト"),
+            "status": st.column_config.TextColumn("状態"),
+            **{n: st.column_config.NumberColumn(f"{n} (g/㎡)", format="%.2f") for n in NUTRIENTS},
+            "spring_share": st.column_config.NumberColumn("春のN比率", format="%.0f%%"),
+            "trend": st.column_config.ImageColumn("月別Nの推移"),
+        },
+    )
+
+
+render_site_table(index)
+
+observe_rerun("dashboard", _RERUN_START)
@@ -2,6 +2,7 @@
 PDF生成モジュール
 """
 
-from .generator import generate_pdf
+from .generator import generate_pdf, render_report_html
+from .book import write_report_book
 
-__all__ = ["generate_pdf"]
+__all__ = ["generate_pdf", "render_report_html", "write_report_book"]
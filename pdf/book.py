@@ -0,0 +1,296 @@
+"""
+複数サイトのレポートブック生成
+
+36ホールの施設など、多数のグリーンを1冊にまとめる。
+表紙・全サイトのサマリー・設計ロジック説明を先頭に1回だけ置き、
+その後にサイトごとのセクション（template.html と同じ sections/ の部品）を続ける。
+
+使い方（コマンドライン）:
+    python -m pdf.book sites.csv --out book.html --facility "○○カントリークラブ"
+
+CSS・フォント定義・グラフの枠（軸・目盛り・凡例）は冊子の先頭で1回だけ埋め込み、
+各セクションは共有定義を参照する。セクションは1件ずつレンダリングして
+逐次書き出すため、200セクションの冊子でも文書全体をメモリに載せない。
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, TextIO, Union
+
+from runtime.tracing import traced
+
+from .fonts import get_font_service
+from .generator import (
+    CHART_RENDER_SECONDS,
+    REPORT_RENDER_SECONDS,
+    build_report_context,
+    load_template,
+    register_japanese_fonts,
+)
+
+
+MONTHS_LABEL = ["1月", "2月", "3月", "4月", "5月", "6月",
+                "7月", "8月", "9月", "10月", "11月", "12月"]
+
+_NUTRIENT_CLASSES = [
+    ("N", "n", "N（窒素）"),
+    ("P", "p", "P（リン酸）"),
+    ("K", "k", "K（カリウム）"),
+    ("Ca", "ca", "Ca（カルシウム）"),
+    ("Mg", "mg", "Mg（マグネシウム）"),
+]
+
+# 冊子用グラフの座標系（viewBox 単位）
+CHART_LAYOUT = {
+    "width": 640,
+    "height": 330,
+    "plot_left": 50,
+    "plot_right": 620,
+    "gp_top": 20,
+    "gp_bottom": 110,
+    "bar_top": 145,
+    "bar_bottom": 290,
+}
+
+# 春（3〜5月、0-indexed: 2-4）
+_SPRING_MONTHS = [2, 3, 4]
+
+
+def _month_slot(layout: Dict[str, float]) -> float:
+    return (layout["plot_right"] - layout["plot_left"]) / 12
+
+
+def _chart_frame(layout: Dict[str, float] = CHART_LAYOUT) -> Dict[str, Any]:
+    """
+    冊子全体で共有するグラフ枠の座標を計算
+    """
+    slot = _month_slot(layout)
+    frame = dict(layout)
+    frame["gp_mid"] = (layout["gp_top"] + layout["gp_bottom"]) / 2
+    frame["month_labels"] = [
+        {"x": round(layout["plot_left"] + slot * (i + 0.5), 1), "text": label}
+        for i, label in enumerate(MONTHS_LABEL)
+    ]
+    frame["legend"] = [
+        {"x": layout["plot_left"] + 110 * i, "cls": cls, "text": text}
+        for i, (_, cls, text) in enumerate(_NUTRIENT_CLASSES)
+    ]
+    return frame
+
+
+@traced("report.chart")
+@CHART_RENDER_SECONDS.time(kind="svg")
+def _chart_svg(design: Dict[str, Any], layout: Dict[str, float] = CHART_LAYOUT) -> Dict[str, Any]:
+    """
+    1サイト分のグラフ（GP折れ線と施肥量の棒）の座標を計算
+
+    枠や目盛りは含まず、サイト固有の図形だけを返す。
+    """
+    results = design["calculation_results"]
+    gp_values = design["gp_values"]
+    slot = _month_slot(layout)
+    left = layout["plot_left"]
+
+    gp_height = layout["gp_bottom"] - layout["gp_top"]
+    gp_points = " ".join(
+        f"{left + slot * (i + 0.5):.1f},{layout['gp_bottom'] - gp_height * max(0.0, min(1.0, gp)):.1f}"
+        for i, gp in enumerate(gp_values)
+    )
+
+    # kg/ha → g/m²
+    monthly_m2 = {
+        key: [v / 10 for v in results[key]["monthly"]] for key, _, _ in _NUTRIENT_CLASSES
+    }
+    bar_max = max([max(values) for values in monthly_m2.values()] + [0.0])
+    bar_height = layout["bar_bottom"] - layout["bar_top"]
+    bar_width = slot * 0.8 / len(_NUTRIENT_CLASSES)
+
+    bars = []
+    for i in range(12):
+        x0 = left + slot * i + slot * 0.1
+        for j, (key, cls, _) in enumerate(_NUTRIENT_CLASSES):
+            value = monthly_m2[key][i]
+            h = bar_height * value / bar_max if bar_max > 0 else 0.0
+            if h <= 0:
+                continue
+            bars.append({
+                "x": round(x0 + bar_width * j, 1),
+                "y": round(layout["bar_bottom"] - h, 1),
+                "w": round(bar_width, 1),
+                "h": round(h, 1),
+                "cls": cls,
+            })
+
+    svg = dict(layout)
+    svg["gp_points"] = gp_points
+    svg["bars"] = bars
+    svg["bar_max_label"] = f"{bar_max:.2f}"
+    return svg
+
+
+def summarize_design(design: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    サマリー表の1行分（年間施肥量 g/m² と春のN比率）を作る
+    """
+    results = design["calculation_results"]
+    row = {"site_id": design.get("site_id", "")}
+    for key, _, _ in _NUTRIENT_CLASSES:
+        row[key] = results[key]["annual_value"] / 10
+    monthly_n = results["N"]["monthly"]
+    total_n = sum(monthly_n)
+    row["spring_share"] = (
+        sum(monthly_n[m] for m in _SPRING_MONTHS) / total_n if total_n > 0 else 0.0
+    )
+    return row
+
+
+@traced("report.template")
+def _write_stream(template_name: str, out: TextIO, glyphs: Optional[set] = None, **context) -> None:
+    for chunk in load_template(template_name).generate(**context):
+        out.write(chunk)
+        if glyphs is not None:
+            glyphs.update(chunk)
+
+
+@REPORT_RENDER_SECONDS.time(format="book")
+def _render_book(
+    designs: Iterable[Dict[str, Any]],
+    out: TextIO,
+    title: str,
+    facility_name: str,
+    font_face_css: Optional[str],
+) -> int:
+    registered_font_name = register_japanese_fonts()
+    font_family = registered_font_name if registered_font_name else "HeiseiKakuGo-W5"
+    creation_date = datetime.now().strftime("%Y年%m月%d日")
+
+    summary_rows: List[Dict[str, Any]] = []
+    # フォントのサブセット化に使う文字集合（セクションを書き出しながら集める）
+    glyphs = set(title) | set(facility_name)
+
+    # サイトごとのセクションは一時ファイルへ逐次書き出す
+    # （表紙・サマリーは全サイトの集計が必要なため、セクションの後に確定する）
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as sections:
+        for design in designs:
+            context = build_report_context(
+                design["input_data"],
+                design["calculation_results"],
+                design["gp_values"],
+                design["gp_dict"],
+                design["monthly_n"],
+                render_graph=False,
+            )
+            _write_stream(
+                "book_section.html",
+                sections,
+                glyphs=glyphs,
+                section_title=design.get("site_id", ""),
+                creation_date=creation_date,
+                input_data=design["input_data"],
+                calculation_results=design["calculation_results"],
+                monthly_fertilizer_data=context["monthly_fertilizer_data"],
+                months=context["months"],
+                chart_svg=_chart_svg(design),
+                has_graph=True,
+                font_family=font_family,
+            )
+            summary_rows.append(summarize_design(design))
+
+        if font_face_css is None and registered_font_name:
+            font_face_css = get_font_service().font_face_css(
+                "".join(glyphs), family=registered_font_name
+            )
+
+        _write_stream(
+            "book_head.html",
+            out,
+            title=title,
+            facility_name=facility_name,
+            creation_date=creation_date,
+            summary_rows=summary_rows,
+            frame=_chart_frame(),
+            font_face_css=font_face_css,
+            font_family=font_family,
+        )
+        sections.seek(0)
+        shutil.copyfileobj(sections, out)
+
+    out.write("</body>\n</html>\n")
+    return len(summary_rows)
+
+
+def write_report_book(
+    designs: Iterable[Dict[str, Any]],
+    dest: Union[str, os.PathLike, BinaryIO],
+    title: str = "施肥設計レポートブック",
+    facility_name: str = "",
+    font_face_css: Optional[str] = None,
+) -> int:
+    """
+    複数サイトのレポートブック（HTML）を書き出す
+
+    Args:
+        designs: 設計データのイテラブル（build_site_design の戻り値、ジェネレータ可）
+        dest: 出力先のパス、またはバイナリストリーム
+        title: 冊子のタイトル
+        facility_name: 施設名（表紙に表示）
+        font_face_css: 冊子の先頭に1回だけ埋め込む @font-face 定義
+            （Noneの場合は冊子で使う文字だけのサブセットフォントを自動で埋め込む）
+
+    Returns:
+        書き出したサイトセクション数
+    """
+    if isinstance(dest, (str, os.PathLike)):
+        with open(dest, "w", encoding="utf-8") as out:
+            return _render_book(designs, out, title, facility_name, font_face_css)
+
+    out = io.TextIOWrapper(dest, encoding="utf-8", write_through=True)
+    try:
+        return _render_book(designs, out, title, facility_name, font_face_css)
+    finally:
+        out.flush()
+        out.detach()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from batch.io import iter_site_rows
+    from batch.runner import SiteRowError, parse_site_row
+    from logic.design import build_site_design
+
+    parser = argparse.ArgumentParser(prog="python -m pdf.book", description="複数サイトのレポートブック（HTML）")
+    parser.add_argument("input", type=Path, help="サイト一覧（.csv / .jsonl / .parquet / .xlsx）")
+    parser.add_argument("--out", type=Path, required=True, help="出力ファイル（.html）")
+    parser.add_argument("--title", default="施肥設計レポートブック", help="冊子のタイトル")
+    parser.add_argument("--facility", default="", help="施設名（表紙に表示）")
+    args = parser.parse_args(argv)
+
+    errors = 0
+
+    def designs():
+        nonlocal errors
+        for row in iter_site_rows(args.input):
+            try:
+                yield build_site_design(**parse_site_row(row))
+            except (SiteRowError, KeyError, ValueError) as e:
+                errors += 1
+                print(f"  {row.get('row')} 行目: {e}", file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        count = write_report_book(designs(), args.out, title=args.title, facility_name=args.facility)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(f"{count:,} サイト（エラー {errors:,}）, {time.perf_counter() - started:.1f} 秒: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
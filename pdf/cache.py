@@ -0,0 +1,251 @@
+"""
+レポートキャッシュ（内容ハッシュ方式）
+
+入力データ・計算結果・テンプレートのハッシュ・エンジンバージョンから
+キーを作り、生成済みレポートのバイト列をディスクに保存する。
+同一条件での再出力（同じユーザーの連打、別セッションの同一入力）は
+保存済みバイト列をそのまま返し、重いレンダリング処理を行わない。
+
+使い方（コマンドライン）:
+    python -m pdf.cache stats
+    python -m pdf.cache purge
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+# キャッシュディレクトリ（環境変数で上書き可能）
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get(
+        "FERT_REPORT_CACHE_DIR",
+        Path(tempfile.gettempdir()) / "fertilization-design" / "reports",
+    )
+)
+
+# キャッシュ容量の上限（バイト）。超えた分は古い順に削除する
+DEFAULT_MAX_BYTES = int(os.environ.get("FERT_REPORT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+_ENTRY_SUFFIX = ".bin"
+
+
+def _canonical_json(value: Any) -> str:
+    """
+    辞書・リスト・Enumを含む値を、順序に依存しないJSON文字列に変換
+    """
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=lambda v: getattr(v, "value", str(v)),
+    )
+
+
+def file_hash(path: Path) -> str:
+    """
+    ファイル内容のSHA-256（16進）を返す
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_report_key(
+    input_data: Dict[str, Any],
+    calculation_results: Dict[str, Dict],
+    template_hash: str,
+    engine_version: str,
+    extra: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    レポートのキャッシュキーを生成
+
+    Args:
+        input_data: 入力データ
+        calculation_results: 計算結果
+        template_hash: テンプレートファイルのハッシュ
+        engine_version: レポートエンジンのバージョン
+        extra: その他レポート内容に影響する値（作成日・出力形式など）
+
+    Returns:
+        SHA-256の16進文字列
+    """
+    payload = _canonical_json({
+        "input_data": input_data,
+        "calculation_results": calculation_results,
+        "template_hash": template_hash,
+        "engine_version": engine_version,
+        "extra": extra or {},
+    })
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """
+    ディスク上のレポートキャッシュ
+
+    エントリは「キー.bin」として保存し、書き込みは一時ファイル経由の
+    置き換えで行う（読み込み中のプロセスが壊れたファイルを見ない）。
+    ヒット時に更新時刻を進め、容量超過時は更新時刻の古い順に削除する。
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{_ENTRY_SUFFIX}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        キャッシュされたバイト列を返す（存在しない場合はNone）
+        """
+        path = self._entry_path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path, None)  # LRU用に最終利用時刻を更新
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        バイト列を保存し、必要に応じて容量調整を行う
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def _entries(self):
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for path in self.cache_dir.glob(f"*{_ENTRY_SUFFIX}"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self) -> int:
+        """
+        容量上限を超えている場合、古いエントリから削除する
+
+        Returns:
+            削除したエントリ数
+        """
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            return removed
+
+    def purge(self) -> int:
+        """
+        すべてのエントリを削除する
+
+        Returns:
+            削除したエントリ数
+        """
+        with self._lock:
+            removed = 0
+            for _, _, path in self._entries():
+                try:
+                    path.unlink()
+                    removed += 1
+                except OSError:
+                    continue
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        エントリ数・合計サイズ・ヒット数を返す
+        """
+        entries = self._entries()
+        return {
+            "cache_dir": str(self.cache_dir),
+            "entries": len(entries),
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_default_cache: Optional[ReportCache] = None
+
+
+def get_report_cache() -> ReportCache:
+    """
+    プロセス共通のレポートキャッシュを返す
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ReportCache()
+        _register_cache_metrics(_default_cache)
+    return _default_cache
+
+
+def _register_cache_metrics(cache: ReportCache) -> None:
+    from runtime.metrics import get_registry
+
+    get_registry().counter(
+        "fert_report_cache_requests_total", "レポートキャッシュの参照回数", ["result"]
+    ).set_function(lambda: {("hit",): cache.hits, ("miss",): cache.misses})
+
+
+def main(argv=None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    command = argv[0] if argv else "stats"
+    cache = get_report_cache()
+    if command == "purge":
+        removed = cache.purge()
+        print(f"{removed} 件のキャッシュを削除しました（{cache.cache_dir}）")
+    elif command == "stats":
+        for name, value in cache.stats().items():
+            print(f"{name}: {value}")
+    else:
+        print("使い方: python -m pdf.cache [stats|purge]", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""
+日本語フォントのサブセット化サービス
+
+HeiseiKakuGo・MS ゴシックなどのCJKフォントは数MB〜数十MBあり、
+レポートごとに丸ごと読み込み・埋め込みを行うとPDF生成時間とサイズの大半を占める。
+本モジュールでは、フォントファイルをプロセス内で1回だけ読み込み、
+レポートで実際に使う文字だけを含むサブセットを作成する。
+サブセットは文字集合のハッシュをキーとしてキャッシュし、レンダリング間で再利用する。
+
+テンプレートの固定文言とASCII文字は常にサブセットに含めるため、
+語彙がほぼ共通のレポートではキャッシュがほぼ毎回ヒットする。
+
+fontTools が利用できない場合やフォントが見つからない場合は None を返し、
+従来どおりフォント名の指定のみで出力する。
+"""
+
+import base64
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+# 候補となる日本語フォント（パス, TTCのサブフォント番号）
+# 環境変数 FERT_REPORT_FONT でフォントファイルを明示指定できる
+FONT_CANDIDATES: List[Tuple[str, int]] = [
+    # Windows
+    (r"C:\Windows\Fonts\msgothic.ttc", 0),
+    (r"C:\Windows\Fonts\meiryo.ttc", 0),
+    (r"C:\Windows\Fonts\yugothic.ttf", 0),
+    (r"C:\Windows\Fonts\msmincho.ttc", 0),
+    # macOS
+    ("/System/Library/Fonts/ヒラギノ角ゴシック W3.ttc", 0),
+    # Linux（Noto CJK / IPAexフォント）
+    ("/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc", 0),
+    ("/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc", 0),
+    ("/usr/share/fonts/opentype/ipaexfont-gothic/ipaexg.ttf", 0),
+    ("/usr/share/fonts/truetype/fonts-japanese-gothic.ttf", 0),
+]
+
+# レポート内で使用するフォントファミリー名
+REPORT_FONT_FAMILY = "ReportJapanese"
+
+# メモリ上に保持するサブセットの最大数
+DEFAULT_MAX_SUBSETS = 64
+
+# 常にサブセットに含める文字（ASCII印字可能文字＋全角の基本記号）
+_BASE_CHARS = set(chr(c) for c in range(0x20, 0x7F)) | set("　、。・：（）「」〜％＋－×÷")
+
+# テンプレートの変数・制御タグ
+_TEMPLATE_TAG = re.compile(r"\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\}", re.DOTALL)
+
+
+def template_glyphs(template_dir: Path) -> Set[str]:
+    """
+    テンプレートの固定文言に含まれる文字集合を返す
+    """
+    chars: Set[str] = set()
+    for path in sorted(template_dir.glob("*.html")) + sorted((template_dir / "sections").glob("*.html")):
+        try:
+            text = path.read_text(encoding="utf-8")
+        except OSError:
+            continue
+        chars.update(_TEMPLATE_TAG.sub("", text))
+    return chars
+
+
+class FontService:
+    """
+    フォント読み込み・サブセットのキャッシュ
+
+    - フォントファイルのバイト列と cmap（収録文字）はプロセス内で1回だけ読み込む
+    - サブセットは (フォント, 文字集合) のハッシュをキーにLRUで保持する
+    """
+
+    def __init__(self, max_subsets: int = DEFAULT_MAX_SUBSETS):
+        self.max_subsets = max_subsets
+        self._lock = threading.Lock()
+        self._font_data: Dict[Tuple[str, int], bytes] = {}
+        self._font_cmaps: Dict[Tuple[str, int], Set[int]] = {}
+        self._subsets: "OrderedDict[str, bytes]" = OrderedDict()
+        self._base_chars: Set[str] = set(_BASE_CHARS)
+        self.hits = 0
+        self.misses = 0
+
+    def add_base_chars(self, chars: Iterable[str]) -> None:
+        """
+        常にサブセットに含める文字を追加（テンプレートの固定文言など）
+        """
+        with self._lock:
+            self._base_chars.update(chars)
+
+    def find_font(self) -> Optional[Tuple[str, int]]:
+        """
+        利用可能な日本語フォント（パス, サブフォント番号）を返す
+        """
+        override = os.environ.get("FERT_REPORT_FONT")
+        candidates = [(override, 0)] if override else FONT_CANDIDATES
+        for path, index in candidates:
+            if os.path.exists(path):
+                return path, index
+        return None
+
+    def _load(self, font: Tuple[str, int]) -> Tuple[bytes, Set[int]]:
+        """
+        フォントを読み込む（2回目以降は保持しているものを返す）
+        """
+        with self._lock:
+            if font in self._font_data:
+                return self._font_data[font], self._font_cmaps[font]
+
+        from fontTools.ttLib import TTFont
+
+        path, index = font
+        with open(path, "rb") as f:
+            data = f.read()
+        tt = TTFont(io.BytesIO(data), fontNumber=index, lazy=True)
+        cmap = set(tt.getBestCmap() or {})
+        tt.close()
+
+        with self._lock:
+            self._font_data.setdefault(font, data)
+            self._font_cmaps.setdefault(font, cmap)
+            return self._font_data[font], self._font_cmaps[font]
+
+    def subset(self, text: str, font: Optional[Tuple[str, int]] = None) -> Optional[bytes]:
+        """
+        text で使われる文字（＋基本文字）だけを含むフォントを返す
+
+        Args:
+            text: レポートの本文（HTMLのままでよい）
+            font: (フォントパス, サブフォント番号)。Noneの場合は自動検出
+
+        Returns:
+            サブセット化したフォント（WOFF2、brotliがない場合はTTF）のバイト列。
+            fontTools がない、またはフォントが見つからない場合は None
+        """
+        font = font or self.find_font()
+        if font is None:
+            return None
+        try:
+            data, cmap = self._load(font)
+        except (ImportError, OSError):
+            return None
+
+        with self._lock:
+            chars = self._base_chars | set(text)
+        # フォントに収録されていない文字はキーに含めない（キーを安定させる）
+        codepoints = sorted(ord(c) for c in chars if ord(c) in cmap)
+        key = hashlib.sha256(
+            f"{font[0]}|{font[1]}|".encode("utf-8")
+            + ",".join(map(str, codepoints)).encode("ascii")
+        ).hexdigest()
+
+        with self._lock:
+            cached = self._subsets.get(key)
+            if cached is not None:
+                self._subsets.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        subset_bytes = self._make_subset(data, font[1], codepoints)
+
+        with self._lock:
+            self._subsets[key] = subset_bytes
+            self._subsets.move_to_end(key)
+            while len(self._subsets) > self.max_subsets:
+                self._subsets.popitem(last=False)
+        return subset_bytes
+
+    @staticmethod
+    def _make_subset(data: bytes, index: int, codepoints: List[int]) -> bytes:
+        from fontTools import subset as ft_subset
+        from fontTools.ttLib import TTFont
+
+        options = ft_subset.Options()
+        options.layout_features = ["*"]
+        options.name_IDs = ["*"]
+        options.notdef_outline = True
+        try:
+            import brotli  # noqa: F401
+            options.flavor = "woff2"
+        except ImportError:
+            options.flavor = None
+
+        tt = TTFont(io.BytesIO(data), fontNumber=index)
+        subsetter = ft_subset.Subsetter(options=options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(tt)
+
+        out = io.BytesIO()
+        tt.flavor = options.flavor
+        tt.save(out)
+        tt.close()
+        return out.getvalue()
+
+    def font_face_css(self, text: str, family: str = REPORT_FONT_FAMILY) -> Optional[str]:
+        """
+        サブセットフォントを埋め込んだ @font-face 定義を返す
+
+        Returns:
+            CSS文字列（フォントが利用できない場合は None）
+        """
+        subset_bytes = self.subset(text)
+        if subset_bytes is None:
+            return None
+        if subset_bytes[:4] == b"wOF2":
+            mime, fmt = "font/woff2", "woff2"
+        else:
+            mime, fmt = "font/ttf", "truetype"
+        b64 = base64.b64encode(subset_bytes).decode("ascii")
+        return (
+            f'@font-face {{ font-family: "{family}"; '
+            f'src: url(data:{mime};base64,{b64}) format("{fmt}"); }}'
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """
+        読み込み済みフォント数・サブセット数・ヒット数を返す
+        """
+        with self._lock:
+            return {
+                "fonts_loaded": len(self._font_data),
+                "subsets": len(self._subsets),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_default_service: Optional[FontService] = None
+_default_service_lock = threading.Lock()
+
+
+def get_font_service() -> FontService:
+    """
+    プロセス共通のフォントサービスを返す
+    """
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            service = FontService()
+            service.add_base_chars(template_glyphs(Path(__file__).parent))
+            _default_service = service
+        return _default_service
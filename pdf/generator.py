@@ -3,12 +3,13 @@ PDF生成ロジック
 """
 
 import os
+import hashlib
 import tempfile
 import base64
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, Optional
-from jinja2 import Template
+from jinja2 import Environment, FileSystemLoader, Template
 # PDF機能を一時的に無効化（Streamlit Community Cloud対応）
 # from xhtml2pdf import pisa
 # from reportlab.pdfbase import pdfmetrics
@@ -18,7 +19,40 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import platform
 
+from runtime.metrics import get_registry
+from runtime.singleflight import coalesce
+from runtime.tracing import traced
 
+from .cache import file_hash, get_report_cache, make_report_key
+from .fonts import REPORT_FONT_FAMILY, get_font_service
+
+
+# レポートエンジンのバージョン（出力内容に影響する変更をしたら上げる）
+# レポートキャッシュのキーに含まれるため、上げると既存キャッシュは使われなくなる
+ENGINE_VERSION = "1"
+
+_TEMPLATE_DIR = Path(__file__).parent
+_TEMPLATE_PATH = _TEMPLATE_DIR / "template.html"
+_template_hash_cache = None
+
+# テンプレート環境（コンパイル済みテンプレートをプロセス内で再利用し、
+# ファイル更新時のみ再読み込みする）
+_TEMPLATE_ENV = Environment(loader=FileSystemLoader(str(_TEMPLATE_DIR)))
+
+# レポート・グラフの描画時間（メトリクス）
+REPORT_RENDER_SECONDS = get_registry().histogram(
+    "fert_report_render_seconds", "レポートの描画時間（キャッシュミス時）", ["format"]
+)
+CHART_RENDER_SECONDS = get_registry().histogram(
+    "fert_chart_render_seconds", "レポート用グラフの描画時間", ["kind"]
+)
+
+# @font-face 定義の差し込み位置（使用文字はレンダリング後に確定するため、後から置換する）
+_FONT_FACE_PLACEHOLDER = "/* @font-face subset */"
+
+
+@traced("report.chart")
+@CHART_RENDER_SECONDS.time(kind="plotly")
 def _create_graph_image(
     gp_values: list,
     gp_dict: dict,
@@ -245,21 +279,30 @@ def _create_graph_image(
         img_bytes = fig.to_image(format="png", width=800, height=600)
         img_base64 = base64.b64encode(img_bytes).decode("utf-8")
         return f"data:image/png;base64,{img_base64}"
-    except (ValueError, ImportError) as e:
+    except (ValueError, ImportError, RuntimeError) as e:
         # kaleidoが利用できない場合はNoneを返す
+        # （plotly 6以降は RuntimeError で通知される）
         if "kaleido" in str(e).lower():
             return None
         raise
 
 
-# PDF機能を一時的に無効化（Streamlit Community Cloud対応）
-def _register_japanese_fonts():
+def register_japanese_fonts():
     """
-    Windows環境で日本語フォントを登録
-    登録されたフォント名を返す
+    日本語フォントを検索し、サブセット埋め込み用のフォント名を返す
+    
+    フォントファイルの読み込み・サブセット化はフォントサービス（pdf.fonts）が
+    プロセス内で1回だけ行う。fontTools がない、またはフォントが見つからない場合は None。
     """
-    # PDF機能が無効化されているため、ダミー値を返す
-    return None
+    if get_font_service().find_font() is None:
+        return None
+    try:
+        import fontTools  # noqa: F401
+    except ImportError:
+        return None
+    return REPORT_FONT_FAMILY
+    # PDF機能を一時的に無効化（Streamlit Community Cloud対応）
+    # 以下は xhtml2pdf（ReportLab）へ直接フォントを登録していた旧実装
     # registered_font_name = None
     # 
     # if platform.system() != "Windows":
@@ -310,38 +353,74 @@ def _register_japanese_fonts():
     # return registered_font_name
 
 
-def generate_pdf(
+def _template_files() -> list:
+    """
+    レポート出力に使うテンプレートファイル（本体・セクション・冊子用）の一覧
+    """
+    files = sorted(_TEMPLATE_DIR.glob("*.html"))
+    files += sorted((_TEMPLATE_DIR / "sections").glob("*"))
+    return files
+
+
+def _template_hash() -> str:
+    """
+    テンプレートファイル群のハッシュを返す（更新時刻が変わった場合のみ再計算）
+    """
+    global _template_hash_cache
+    files = _template_files()
+    mtimes = tuple((f.name, f.stat().st_mtime_ns) for f in files)
+    if _template_hash_cache is None or _template_hash_cache[0] != mtimes:
+        combined = "".join(f"{f.name}:{file_hash(f)};" for f in files)
+        _template_hash_cache = (mtimes, hashlib.sha256(combined.encode("utf-8")).hexdigest())
+    return _template_hash_cache[1]
+
+
+def _write_output(pdf_bytes: bytes, output_path: Optional[str]) -> str:
+    """
+    PDFバイト列を出力パス（Noneの場合は一時ファイル）に書き込む
+    """
+    if output_path is None:
+        fd, output_path = tempfile.mkstemp(suffix=".pdf")
+        os.close(fd)
+    with open(output_path, "wb") as f:
+        f.write(pdf_bytes)
+    return output_path
+
+
+def load_template(name: str = "template.html") -> Template:
+    """
+    HTMLテンプレートを読み込む（セクションは sections/ 以下から include される）
+    """
+    return _TEMPLATE_ENV.get_template(name)
+
+
+def _embed_font_subset(html_content: str, registered_font_name: Optional[str]) -> str:
+    """
+    レンダリング済みHTMLで使われている文字だけのフォントを @font-face として埋め込む
+    """
+    css = ""
+    if registered_font_name:
+        css = get_font_service().font_face_css(html_content, family=registered_font_name) or ""
+    return html_content.replace(_FONT_FACE_PLACEHOLDER, css, 1)
+
+
+def build_report_context(
     input_data: Dict[str, Any],
     calculation_results: Dict[str, Dict],
     gp_values: list,
     gp_dict: dict,
     monthly_n: list,
-    output_path: Optional[str] = None
-) -> str:
+    render_graph: bool = True,
+) -> Dict[str, Any]:
     """
-    PDFを生成
+    テンプレートに渡す表データとグラフ画像（data URI）を準備
     
     Args:
-        input_data: 入力データ（芝種区分、利用形態など）
-        calculation_results: 計算結果
-        gp_values: 12ヶ月分のGP値（メイン）
-        gp_dict: GP値の辞書（cool, warmを含む可能性）
-        monthly_n: 12ヶ月分のN配分量
-        output_path: 出力パス（Noneの場合は一時ファイル）
+        render_graph: グラフ画像を生成するか（冊子のように別の描画方法を使う場合はFalse）
     
     Returns:
-        生成されたPDFファイルのパス
+        {"months", "gp_n_data", "monthly_fertilizer_data", "graph_image"}
     """
-    # 日本語フォントを登録（最初に実行）
-    registered_font_name = _register_japanese_fonts()
-    
-    # HTMLテンプレートを読み込み
-    template_path = Path(__file__).parent / "template.html"
-    with open(template_path, "r", encoding="utf-8") as f:
-        template_content = f.read()
-    
-    template = Template(template_content)
-    
     # データを準備
     months = ["1月", "2月", "3月", "4月", "5月", "6月", 
               "7月", "8月", "9月", "10月", "11月", "12月"]
@@ -377,9 +456,221 @@ def generate_pdf(
     if calculation_results and "N" in calculation_results:
         monthly_gp = calculation_results["N"].get("gp_values")
     
-    graph_image = _create_graph_image(
-        gp_values, gp_dict, monthly_n, monthly_p, monthly_k, monthly_ca, monthly_mg, months, monthly_gp
+    graph_image = None
+    if render_graph:
+        graph_image = _create_graph_image(
+            gp_values, gp_dict, monthly_n, monthly_p, monthly_k, monthly_ca, monthly_mg, months, monthly_gp
+        )
+    
+    return {
+        "months": months,
+        "gp_n_data": gp_n_data,
+        "monthly_fertilizer_data": monthly_fertilizer_data,
+        "graph_image": graph_image,
+    }
+
+
+@traced("report.template")
+def render_template(
+    input_data: Dict[str, Any],
+    calculation_results: Dict[str, Dict],
+    context: Dict[str, Any],
+    graph_image: Optional[str],
+    font_family: str,
+    creation_date: str,
+    has_graph: Optional[bool] = None,
+) -> str:
+    """
+    テンプレートのレンダリング（HTML・PDF共通の段階。フォントの埋め込み前）
+
+    Args:
+        context: build_report_context の戻り値
+        graph_image: テンプレートに渡すグラフ画像（data URI またはファイルパス）
+        has_graph: グラフ欄を表示するか（省略時は graph_image の有無）
+
+    Returns:
+        @font-face の差し込み位置を含むHTML文字列
+    """
+    return load_template().render(
+        title="芝しごと・施肥設計ナビ",
+        creation_date=creation_date,
+        input_data=input_data,
+        calculation_results=calculation_results,
+        gp_n_data=context["gp_n_data"],
+        monthly_fertilizer_data=context["monthly_fertilizer_data"],
+        months=context["months"],
+        graph_image=graph_image,
+        has_graph=graph_image is not None if has_graph is None else has_graph,
+        font_family=font_family,
+        font_face_css=_FONT_FACE_PLACEHOLDER,
     )
+
+
+def render_report_html(
+    input_data: Dict[str, Any],
+    calculation_results: Dict[str, Dict],
+    gp_values: list,
+    gp_dict: dict,
+    monthly_n: list,
+    use_cache: bool = True,
+) -> str:
+    """
+    レポートをHTML文字列として生成（グラフはdata URIで埋め込み）
+    
+    PDF変換が使えない環境での出力や、一括エクスポートに使用する。
+    
+    Args:
+        input_data: 入力データ（芝種区分、利用形態など）
+        calculation_results: 計算結果
+        gp_values: 12ヶ月分のGP値（メイン）
+        gp_dict: GP値の辞書（cool, warmを含む可能性）
+        monthly_n: 12ヶ月分のN配分量
+        use_cache: レポートキャッシュを使用するか
+    
+    Returns:
+        HTML文字列
+    """
+    creation_date = datetime.now().strftime("%Y年%m月%d日")
+    
+    cache_key = None
+    if use_cache:
+        cache = get_report_cache()
+        cache_key = make_report_key(
+            input_data,
+            calculation_results,
+            _template_hash(),
+            ENGINE_VERSION,
+            extra={
+                "format": "html",
+                "creation_date": creation_date,
+                "gp_values": gp_values,
+                "gp_dict": gp_dict,
+                "monthly_n": monthly_n,
+            },
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached.decode("utf-8")
+    
+    if cache_key is None:
+        return _render_report_html(
+            input_data, calculation_results, gp_values, gp_dict, monthly_n, creation_date, None
+        )
+    # 同じレポートの生成が同時に要求された場合は1回だけレンダリングする
+    return coalesce(
+        "report_html", cache_key, _render_report_html,
+        input_data, calculation_results, gp_values, gp_dict, monthly_n, creation_date, cache_key,
+    )
+
+
+@REPORT_RENDER_SECONDS.time(format="html")
+def _render_report_html(
+    input_data: Dict[str, Any],
+    calculation_results: Dict[str, Dict],
+    gp_values: list,
+    gp_dict: dict,
+    monthly_n: list,
+    creation_date: str,
+    cache_key: Optional[str],
+) -> str:
+    """
+    レポートHTMLをレンダリング（cache_key があればレポートキャッシュに保存）
+    """
+    registered_font_name = register_japanese_fonts()
+    font_family = registered_font_name if registered_font_name else "HeiseiKakuGo-W5"
+    
+    context = build_report_context(
+        input_data, calculation_results, gp_values, gp_dict, monthly_n
+    )
+    html_content = render_template(
+        input_data, calculation_results, context, context["graph_image"], font_family, creation_date
+    )
+    html_content = _embed_font_subset(html_content, registered_font_name)
+    
+    if cache_key is not None:
+        get_report_cache().put(cache_key, html_content.encode("utf-8"))
+    
+    return html_content
+
+
+def generate_pdf(
+    input_data: Dict[str, Any],
+    calculation_results: Dict[str, Dict],
+    gp_values: list,
+    gp_dict: dict,
+    monthly_n: list,
+    output_path: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    """
+    PDFを生成
+
+    同一条件（入力・計算結果・テンプレート・エンジンバージョン・作成日）の
+    PDFが既にレポートキャッシュにあれば、レンダリングせずにそれを返す。
+
+    Args:
+        input_data: 入力データ（芝種区分、利用形態など）
+        calculation_results: 計算結果
+        gp_values: 12ヶ月分のGP値（メイン）
+        gp_dict: GP値の辞書（cool, warmを含む可能性）
+        monthly_n: 12ヶ月分のN配分量
+        output_path: 出力パス（Noneの場合は一時ファイル）
+        use_cache: レポートキャッシュを使用するか
+
+    Returns:
+        生成されたPDFファイルのパス
+    """
+    creation_date = datetime.now().strftime("%Y年%m月%d日")
+
+    cache_key = None
+    if use_cache:
+        cache = get_report_cache()
+        cache_key = make_report_key(
+            input_data,
+            calculation_results,
+            _template_hash(),
+            ENGINE_VERSION,
+            extra={
+                "format": "pdf",
+                "creation_date": creation_date,
+                "gp_values": gp_values,
+                "gp_dict": gp_dict,
+                "monthly_n": monthly_n,
+            },
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return _write_output(cached, output_path)
+
+    args = (input_data, calculation_results, gp_values, gp_dict, monthly_n, creation_date, cache_key)
+    if cache_key is None:
+        pdf_bytes = _render_pdf_bytes(*args)
+    else:
+        # 同じPDFの生成が同時に要求された場合は1回だけレンダリングする
+        pdf_bytes = coalesce("report_pdf", cache_key, _render_pdf_bytes, *args)
+    return _write_output(pdf_bytes, output_path)
+
+
+@REPORT_RENDER_SECONDS.time(format="pdf")
+def _render_pdf_bytes(
+    input_data: Dict[str, Any],
+    calculation_results: Dict[str, Dict],
+    gp_values: list,
+    gp_dict: dict,
+    monthly_n: list,
+    creation_date: str,
+    cache_key: Optional[str],
+) -> bytes:
+    """
+    PDFをレンダリング（cache_key があればレポートキャッシュに保存）
+    """
+    # 日本語フォントを登録（最初に実行）
+    registered_font_name = register_japanese_fonts()
+    
+    context = build_report_context(
+        input_data, calculation_results, gp_values, gp_dict, monthly_n
+    )
+    graph_image = context["graph_image"]
     
     # グラフ画像を一時ファイルとして保存（xhtml2pdfはdata URIをサポートしていない可能性があるため）
     graph_file_path = None
@@ -397,76 +688,92 @@ def generate_pdf(
     # フォント名をテンプレートに渡す
     font_family = registered_font_name if registered_font_name else "HeiseiKakuGo-W5"
     
-    html_content = template.render(
-        title="芝しごと・施肥設計ナビ",
-        creation_date=datetime.now().strftime("%Y年%m月%d日"),
-        input_data=input_data,
-        calculation_results=calculation_results,
-        gp_n_data=gp_n_data,
-        monthly_fertilizer_data=monthly_fertilizer_data,
-        months=months,
-        graph_image=graph_file_path if graph_file_path else (graph_image if graph_image else None),
+    html_content = render_template(
+        input_data,
+        calculation_results,
+        context,
+        graph_file_path if graph_file_path else (graph_image if graph_image else None),
+        font_family,
+        creation_date,
         has_graph=graph_image is not None,
-        font_family=font_family,
     )
+    html_content = _embed_font_subset(html_content, registered_font_name)
     
+    pdf_bytes = _html_to_pdf(html_content, font_family, graph_file_path)
+
+    if cache_key is not None:
+        get_report_cache().put(cache_key, pdf_bytes)
+
+    return pdf_bytes
+
+
+def _html_to_pdf(html_content: str, font_family: str, graph_file_path: Optional[str]) -> bytes:
+    """
+    HTMLをPDFバイト列に変換
+
+    Args:
+        html_content: レンダリング済みHTML
+        font_family: 使用するフォント名
+        graph_file_path: グラフ画像の一時ファイル（変換後に削除）
+
+    Returns:
+        PDFのバイト列
+    """
     # PDF機能を一時的に無効化（Streamlit Community Cloud対応）
     # PDFを生成
-    # if output_path is None:
-    #     output_path = tempfile.mktemp(suffix=".pdf")
+    # pdf_buffer = io.BytesIO()
     # 
-    #     # xhtml2pdfでPDFを生成
-    #     with open(output_path, "wb") as pdf_file:
-    #         # CSSでフォントを明示的に指定（PDF出力用の追加設定）
-    #         # xhtml2pdfではmm単位が確実に機能する
-    #         # 左余白を確保しつつ、日本語の折り返しを確実にする
-    #         css_content = f"""
-    #         @page {{
-    #             size: A4;
-    #             margin: 20mm 25mm;
-    #         }}
-    #         * {{
-    #             font-family: "{font_family}", "HeiseiKakuGo-W5", "HeiseiMin-W3", sans-serif !important;
-    #             box-sizing: border-box;
-    #         }}
-    #         html {{
-    #             width: 100%;
-    #             margin: 0;
-    #             padding: 0;
-    #             overflow-x: hidden;
-    #         }}
-    #         body {{
-    #             font-family: "{font_family}", "HeiseiKakuGo-W5", "HeiseiMin-W3", sans-serif !important;
-    #             width: 100%;
-    #             max-width: 100%;
-    #             margin: 0;
-    #             padding: 0;
-    #             overflow: hidden;
-    #         }}
-    #         div, section, article {{
-    #             max-width: 100%;
-    #             overflow: hidden;
-    #         }}
-    #         p, li, span, td, th {{
-    #             word-break: break-all;
-    #             word-wrap: break-word;
-    #             white-space: normal;
-    #             overflow: hidden;
-    #             max-width: 100%;
-    #         }}
-    #         table {{
-    #             width: 100%;
-    #             max-width: 100%;
-    #             table-layout: fixed;
-    #             overflow: hidden;
-    #         }}
-    #         """
-    #         pisa_status = pisa.CreatePDF(
-    #             html_content,
-    #             dest=pdf_file,
-    #             encoding="utf-8",
-    #             default_css=css_content
-    #         )
+    # # xhtml2pdfでPDFを生成
+    # # CSSでフォントを明示的に指定（PDF出力用の追加設定）
+    # # xhtml2pdfではmm単位が確実に機能する
+    # # 左余白を確保しつつ、日本語の折り返しを確実にする
+    # css_content = f"""
+    # @page {{
+    #     size: A4;
+    #     margin: 20mm 25mm;
+    # }}
+    # * {{
+    #     font-family: "{font_family}", "HeiseiKakuGo-W5", "HeiseiMin-W3", sans-serif !important;
+    #     box-sizing: border-box;
+    # }}
+    # html {{
+    #     width: 100%;
+    #     margin: 0;
+    #     padding: 0;
+    #     overflow-x: hidden;
+    # }}
+    # body {{
+    #     font-family: "{font_family}", "HeiseiKakuGo-W5", "HeiseiMin-W3", sans-serif !important;
+    #     width: 100%;
+    #     max-width: 100%;
+    #     margin: 0;
+    #     padding: 0;
+    #     overflow: hidden;
+    # }}
+    # div, section, article {{
+    #     max-width: 100%;
+    #     overflow: hidden;
+    # }}
+    # p, li, span, td, th {{
+    #     word-break: break-all;
+    #     word-wrap: break-word;
+    #     white-space: normal;
+    #     overflow: hidden;
+    #     max-width: 100%;
+    # }}
+    # table {{
+    #     width: 100%;
+    #     max-width: 100%;
+    #     table-layout: fixed;
+    #     overflow: hidden;
+    # }}
+    # """
+    # pisa_status = pisa.CreatePDF(
+    #     html_content,
+    #     dest=pdf_buffer,
+    #     encoding="utf-8",
+    #     default_css=css_content
+    # )
     # 
     # # 一時画像ファイルを削除
     # if graph_file_path and os.path.exists(graph_file_path):
@@ -479,7 +786,7 @@ def generate_pdf(
     # if pisa_status.err:
     #     raise Exception(f"PDF生成エラー: {pisa_status.err}")
     # 
-    # return output_path
+    # return pdf_buffer.getvalue()
     
     # PDF機能が無効化されているため、エラーを発生させる
     raise NotImplementedError("PDF機能は一時的に無効化されています（Streamlit Community Cloud対応のため）")
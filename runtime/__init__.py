@@ -0,0 +1,16 @@
+"""
+アプリ実行時の共通処理モジュール
+"""
+
+from .bootstrap import AssetRegistry, bootstrap
+from .singleflight import SingleFlight, coalesce
+from .tracing import recording, span
+
+__all__ = [
+    "AssetRegistry",
+    "bootstrap",
+    "SingleFlight",
+    "coalesce",
+    "recording",
+    "span",
+]
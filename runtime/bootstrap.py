@@ -0,0 +1,194 @@
+"""
+プロセス単位の起動処理と静的アセットの登録
+
+Streamlit はユーザー操作のたびに app.py 全体を再実行するため、
+ファイルの読み込みや index.html の書き換えを app.py の直下に書くと毎回実行される。
+ここではそれらをプロセス内で1回だけ行い、結果を保持する。
+
+バナー画像・CSSは static/ に置く。画像は Streamlit の静的ファイル配信
+（.streamlit/config.toml の server.enableStaticServing）から配信する。
+URLには内容ハッシュを付けるため、ファイルを差し替えるとURLが変わり、
+ブラウザのキャッシュ（ETag / Last-Modified による再検証）と矛盾しない。
+各再実行で送るのは <img> タグだけとなり、base64の画像本体は送らない。
+
+CSSは静的配信しない（Streamlit の静的配信は画像・フォントなど許可された拡張子以外を
+text/plain・nosniff で返すため、ブラウザがスタイルシートとして使わない）。
+ファイルは起動時に1回だけ読み込み、<style> の断片として保持したものを埋め込む。
+
+メトリクスの出力（runtime.metrics）も、環境変数で指定されていればここで開始する。
+"""
+
+import base64
+import hashlib
+import re
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import start_exporter_from_env
+
+
+APP_DIR = Path(__file__).resolve().parent.parent
+STATIC_DIR = APP_DIR / "static"
+
+# Streamlit の静的ファイル配信のURLプレフィックス
+STATIC_URL_PREFIX = "app/static"
+
+# ── Google Analytics（gtag）: <head> 直後に相当する位置への埋め込み ──
+# Streamlit にはカスタム head がないため、起動時に static/index.html を1回だけ修正する。
+# 書き込み不可の環境では iframe 経由で親 document.head へ注入するフォールバックを使う。
+GA_MEASUREMENT_ID = "G-KQ7S0XT9JP"
+GOOGLE_TAG_SNIPPET = f"""<!-- Google tag (gtag.js) -->
+<script async src="https://www.googletagmanager.com/gtag/js?id={GA_MEASUREMENT_ID}"></script>
+<script>
+  window.dataLayer = window.dataLayer || [];
+  function gtag(){{dataLayer.push(arguments);}}
+  gtag('js', new Date());
+
+  gtag('config', '{GA_MEASUREMENT_ID}');
+</script>"""
+
+
+def _inject_google_tag_into_streamlit_index_html() -> bool:
+    """Streamlit パッケージ内 index.html の <head> 直後に gtag を埋め込む（重複挿入しない）。"""
+    import streamlit as st
+
+    try:
+        index_path = Path(st.__file__).resolve().parent / "static" / "index.html"
+        text = index_path.read_text(encoding="utf-8")
+    except OSError:
+        return False
+    if GA_MEASUREMENT_ID in text:
+        return True
+    m = re.search(r"<head[^>]*>", text, flags=re.IGNORECASE)
+    if not m:
+        return False
+    insert_at = m.end()
+    new_text = text[:insert_at] + "\n" + GOOGLE_TAG_SNIPPET + "\n" + text[insert_at:]
+    try:
+        index_path.write_text(new_text, encoding="utf-8")
+    except OSError:
+        return False
+    return True
+
+
+class StaticAsset:
+    """
+    static/ 以下の配信ファイル1件分（内容ハッシュ付きURLを持つ）
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = STATIC_DIR / name
+        data = self.path.read_bytes()
+        self.size = len(data)
+        self.content_hash = hashlib.sha256(data).hexdigest()[:12]
+        self._data = data
+
+    @property
+    def url(self) -> str:
+        return f"{STATIC_URL_PREFIX}/{self.name}?v={self.content_hash}"
+
+    def data_uri(self, mime: str) -> str:
+        """静的配信が無効な環境向けのインライン表現"""
+        return f"data:{mime};base64,{base64.b64encode(self._data).decode()}"
+
+    def text(self) -> str:
+        return self._data.decode("utf-8")
+
+
+class AssetRegistry:
+    """
+    static/ 以下のファイルを登録し、配信URL（またはフォールバック用のインライン表現）を返す
+    """
+
+    def __init__(self, static_serving: bool):
+        self.static_serving = static_serving
+        self._assets: Dict[str, StaticAsset] = {}
+        self._markup: Dict[str, str] = {}
+        self._markup_lock = threading.Lock()
+
+    def register(self, name: str) -> Optional[StaticAsset]:
+        """
+        ファイルを登録（存在しない場合は None）
+        """
+        if name not in self._assets:
+            try:
+                self._assets[name] = StaticAsset(name)
+            except OSError:
+                return None
+        return self._assets[name]
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        return self._assets.get(name)
+
+    def image_src(self, name: str, mime: str = "image/png") -> Optional[str]:
+        """
+        <img src> に使う値（静的配信URL、無効時は data URI）
+        """
+        asset = self.get(name)
+        if asset is None:
+            return None
+        return asset.url if self.static_serving else asset.data_uri(mime)
+
+    def stylesheet_markup(self, name: str) -> str:
+        """
+        CSSを埋め込むHTML断片（<style>、組み立ては1回だけ）
+
+        静的配信は .css を text/plain で返すため、静的配信の有無によらずインラインにする。
+        """
+        asset = self.get(name)
+        if asset is None:
+            return ""
+        return self.markup(f"stylesheet:{name}", lambda: f"<style>{asset.text()}</style>")
+
+    def markup(self, key: str, build: Callable[[], str]) -> str:
+        """
+        アセットを参照するHTML断片を1回だけ組み立てて保持する
+
+        Args:
+            key: 断片の識別名
+            build: 断片を組み立てる関数（初回のみ呼ばれる）
+        """
+        with self._markup_lock:
+            if key not in self._markup:
+                self._markup[key] = build()
+            return self._markup[key]
+
+
+_state: Optional[Dict[str, Any]] = None
+_state_lock = threading.Lock()
+
+
+def _static_serving_enabled() -> bool:
+    import streamlit as st
+
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def bootstrap() -> Dict[str, Any]:
+    """
+    プロセス単位の起動処理（2回目以降は保持している結果を返す）
+
+    Returns:
+        {
+            "ga_index_patch_ok": bool,    # index.html への gtag 埋め込みに成功したか
+            "assets": AssetRegistry,      # 静的アセット
+            "metrics": Dict,              # メトリクスの出力先（start_exporter_from_env の戻り値）
+        }
+    """
+    global _state
+    with _state_lock:
+        if _state is None:
+            assets = AssetRegistry(_static_serving_enabled())
+            for name in ("style.css", "banner_pr_size1.png", "bloglink.png", "youtubelink.png"):
+                assets.register(name)
+            _state = {
+                "ga_index_patch_ok": _inject_google_tag_into_streamlit_index_html(),
+                "assets": assets,
+                "metrics": start_exporter_from_env(),
+            }
+        return _state
@@ -0,0 +1,444 @@
+"""
+プロセス内のメトリクス（カウンタ・ゲージ・ヒストグラム）
+
+アプリの再実行時間、GP計算キャッシュのヒット率、レポート・グラフの描画時間、
+エクスポートジョブの待ち行列、一括計算のスループットなどを1か所に集め、
+Prometheus のテキスト形式で出力する。レプリカごとに出力されるので、
+どのレプリカのどの処理が詰まっているかをプロファイラなしで確認できる。
+
+出力先（bootstrap() で起動時に1回だけ開始する）：
+- FERT_METRICS_PORT : 指定したポートで /metrics を返すHTTPサーバーを起動
+  （待ち受けアドレスは FERT_METRICS_HOST、既定 127.0.0.1）
+- FERT_METRICS_FILE : 指定したパスに定期的に書き出す（node_exporter の textfile collector 向け。
+  パスの {pid} はプロセスIDに置き換える）。間隔は FERT_METRICS_INTERVAL 秒（既定15秒）
+
+ラベルはキーワード引数で渡す：
+    requests = get_registry().counter("fert_x_total", "説明", ["result"])
+    requests.inc(result="hit")
+"""
+
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from . import singleflight
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒単位のヒストグラムの既定の区切り
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DEFAULT_INTERVAL_SEC = 15.0
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """メトリクスの共通部分（ラベルごとの値を持つ）"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, Any] = {}
+        self._function: Optional[Callable[[], Any]] = None
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} のラベルは {list(self.labelnames)} です（指定: {sorted(labels)}）")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def set_function(self, fn: Callable[[], Any]) -> None:
+        """
+        出力するたびに fn() の値を使う（他のモジュールが持つ集計値をそのまま出す場合）
+
+        fn はラベルなしなら数値、ラベルありなら {ラベル値のタプル: 数値} を返す。
+        """
+        self._function = fn
+
+    def _current(self) -> Dict[LabelKey, Any]:
+        if self._function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self._function()
+        if isinstance(value, dict):
+            return {tuple(str(v) for v in k): float(x) for k, x in value.items()}
+        return {(): float(value)}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(self._current().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """単調増加するカウンタ"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("カウンタは減らせません")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """増減する値（待ち行列の長さなど）"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class _Timer(ContextDecorator):
+    """ヒストグラムに所要時間を記録する with 文／デコレータ"""
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, Any]):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0.0
+
+    def _recreate_cm(self):
+        # デコレータとして使うときは呼び出しごとに別のタイマーにする（スレッドセーフ）
+        return _Timer(self._histogram, self._labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class Histogram(_Metric):
+    """所要時間などの分布（区切りごとの累積件数・合計・件数）"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """
+        with 文またはデコレータで所要時間（秒）を記録する
+        """
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def set_function(self, fn: Callable[[], Any]) -> None:
+        raise TypeError("ヒストグラムには set_function を使えません")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    メトリクスの登録先（同じ名前で再登録すると既存のものを返す）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"メトリクス {name} は別の種類・ラベルで登録済みです")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_text(self) -> str:
+        """
+        Prometheus のテキスト形式で全メトリクスを出力
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # 集計元の不具合で出力全体を止めない
+                logger.exception("メトリクス %s の出力に失敗しました", metric.name)
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> str:
+        """
+        ファイルに書き出す（読み手が途中の内容を読まないよう、一時ファイルから置き換える）
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render_text())
+        os.replace(tmp_path, path)
+        return path
+
+
+def _register_process_metrics(registry: MetricsRegistry) -> None:
+    """
+    プロセス情報と single-flight の集計を登録
+    """
+    start_time = time.time()
+    registry.gauge("fert_process_start_time_seconds", "プロセスの開始時刻（UNIX時刻）").set_function(
+        lambda: start_time
+    )
+    registry.gauge("fert_process_threads", "プロセスのスレッド数").set_function(threading.active_count)
+
+    def _group_stat(field: str) -> Callable[[], Dict[LabelKey, float]]:
+        return lambda: {(name,): s[field] for name, s in singleflight.stats().items()}
+
+    registry.counter(
+        "fert_singleflight_calls_total", "single-flight の呼び出し回数", ["group"]
+    ).set_function(_group_stat("calls"))
+    registry.counter(
+        "fert_singleflight_executed_total", "single-flight で実際に実行した回数", ["group"]
+    ).set_function(_group_stat("executed"))
+    registry.counter(
+        "fert_singleflight_coalesced_total", "実行中の計算にまとめられた呼び出し回数", ["group"]
+    ).set_function(_group_stat("coalesced"))
+    registry.gauge(
+        "fert_singleflight_in_flight", "single-flight で実行中の計算の数", ["group"]
+    ).set_function(_group_stat("in_flight"))
+
+
+_default_registry: Optional[MetricsRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry() -> MetricsRegistry:
+    """
+    プロセス共通のメトリクス登録先を返す
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry()
+            _register_process_metrics(_default_registry)
+        return _default_registry
+
+
+# ── st.cache_data などのキャッシュのヒット・ミスの計測 ──
+# キャッシュされる関数の本体で mark_cache_miss() を呼ぶと、呼び出し元の cache_lookup() がミスとして数える
+
+_cache_miss: "contextvars.ContextVar[Optional[List[bool]]]" = contextvars.ContextVar(
+    "fert_cache_miss", default=None
+)
+
+
+def mark_cache_miss() -> None:
+    """
+    キャッシュされる関数の本体から呼ぶ（本体が実行された＝キャッシュミス）
+    """
+    box = _cache_miss.get()
+    if box is not None:
+        box[0] = True
+
+
+def cache_lookup(cache: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    fn(*args, **kwargs) を呼び、キャッシュのヒット・ミスを fert_cache_requests_total に数える
+
+    同時に同じ計算を待っていた呼び出し（single-flight の待ち側）は、自分では計算していないためヒットとする。
+    """
+    token = _cache_miss.set([False])
+    try:
+        result = fn(*args, **kwargs)
+        missed = _cache_miss.get()[0]
+    finally:
+        _cache_miss.reset(token)
+    get_registry().counter(
+        "fert_cache_requests_total", "計算結果キャッシュの参照回数", ["cache", "result"]
+    ).inc(cache=cache, result="miss" if missed else "hit")
+    return result
+
+
+# ── ページ全体の再実行時間 ──
+
+def observe_rerun(page: str, started: float) -> None:
+    """
+    ページのスクリプト1回分の実行時間を fert_app_rerun_seconds に記録する
+
+    Args:
+        page: ページ名（"main" / "batch" / "dashboard"）
+        started: スクリプトの先頭で取った time.perf_counter() の値
+    """
+    get_registry().histogram(
+        "fert_app_rerun_seconds", "ページ全体の再実行にかかった時間", ["page"]
+    ).observe(time.perf_counter() - started, page=page)
+
+
+# ── 出力（HTTP / ファイル） ──
+
+def _handler_for(registry: MetricsRegistry):
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # スクレイプのたびにアクセスログを出さない
+            pass
+
+    return _MetricsHandler
+
+
+def serve_http(port: int, host: str = "127.0.0.1", registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """
+    /metrics を返すHTTPサーバーをデーモンスレッドで起動
+    """
+    server = ThreadingHTTPServer((host, port), _handler_for(registry or get_registry()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_textfile_writer(
+    path: str,
+    interval: float = DEFAULT_INTERVAL_SEC,
+    registry: Optional[MetricsRegistry] = None,
+) -> threading.Thread:
+    """
+    interval 秒ごとにファイルへ書き出すデーモンスレッドを起動
+    """
+    registry = registry or get_registry()
+    path = path.replace("{pid}", str(os.getpid()))
+
+    def _loop():
+        while True:
+            try:
+                registry.write_textfile(path)
+            except OSError:
+                logger.exception("メトリクスを %s に書き出せませんでした", path)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_loop, name="metrics-textfile", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_exporter_from_env() -> Dict[str, Any]:
+    """
+    環境変数の設定に従って出力を開始（設定がなければ何もしない）
+
+    Returns:
+        {"http": "host:port" | None, "textfile": path | None}
+    """
+    started: Dict[str, Any] = {"http": None, "textfile": None}
+    port = os.environ.get("FERT_METRICS_PORT")
+    if port:
+        host = os.environ.get("FERT_METRICS_HOST", "127.0.0.1")
+        try:
+            serve_http(int(port), host)
+            started["http"] = f"{host}:{port}"
+        except (OSError, ValueError):
+            # 同じホストの別レプリカがポートを使っている場合など。アプリは止めない
+            logger.exception("メトリクスのHTTPサーバーを起動できませんでした（%s:%s）", host, port)
+    path = os.environ.get("FERT_METRICS_FILE")
+    if path:
+        interval = float(os.environ.get("FERT_METRICS_INTERVAL", DEFAULT_INTERVAL_SEC))
+        start_textfile_writer(path, interval)
+        started["textfile"] = path.replace("{pid}", str(os.getpid()))
+    return started
@@ -0,0 +1,132 @@
+"""
+同一計算の同時実行をまとめる（single-flight）
+
+講習会などで多数のセッションが同時に同じ画面を開くと、同じ条件のGP計算や
+同じ内容のエクスポートが同時に何十回も要求される。
+ここでは同じキーの計算が実行中であれば新たに実行せず、実行中の計算の完了を待って
+その結果（または例外）を共有する。
+
+結果は呼び出し元の間で同じオブジェクトを共有するため、書き換えずに使うこと。
+グループごとに、実行回数・まとめられた回数（coalesced）を数える。
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """実行中の計算1件分"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    キーごとに同時実行を1回にまとめるグループ
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        fn(*args, **kwargs) を実行する。同じキーの計算が実行中なら、その結果を待って返す
+
+        Args:
+            key: 計算を識別するキー（同じ結果になる呼び出しは同じキーにする）
+            fn: 計算する関数
+
+        Returns:
+            fn の戻り値（同時に待っていた呼び出し元とは同じオブジェクト）
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        """
+        実行中の計算の数
+        """
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        呼び出し回数・実行回数・まとめられた回数・エラー回数
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "in_flight": len(self._calls),
+            }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    """
+    名前つきのグループを返す（プロセス内で共有）
+    """
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = SingleFlight(name)
+            _groups[name] = group
+        return group
+
+
+def coalesce(name: str, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    グループ name の中で、キーが同じ同時呼び出しを1回の実行にまとめる
+    """
+    return get_group(name).do(key, fn, *args, **kwargs)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """
+    全グループの集計
+    """
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
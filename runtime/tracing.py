@@ -0,0 +1,255 @@
+"""
+処理段階ごとの所要時間の計測（トレース）
+
+設計・レポートの各段階（気温推定、GP評価、月別集計、季節係数、GP制御、正規化、
+年間施肥量ルール、グラフ描画、テンプレート描画、エクスポート）を span で囲み、
+記録中であれば開始時刻と所要時間を TraceRecorder に溜める。
+溜めた結果は段階別の集計、Chrome のトレース形式（chrome://tracing / Perfetto で表示）、
+構造化ログ（1 span 1行のJSON）として取り出せる。
+
+記録は contextvars 単位で、recording() の中（または start_recording() から
+stop_recording() まで）だけ有効になる。記録していないときの span() は
+共有の何もしないオブジェクトを返すだけなので、計算ロジックに埋め込んでも負荷はほぼない。
+
+環境変数 FERT_TRACE_LOG=1 のとき、アプリは毎回の実行を記録して span をログに出す。
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# span をログに出すか（アプリ・一括計算で毎回記録する）
+LOG_SPANS = os.environ.get("FERT_TRACE_LOG", "").lower() in ("1", "true", "yes")
+
+# 段階名 → 表示名（デバッグ画面の並び順）
+STAGES = {
+    "gp.temperature": "気温推定",
+    "gp.evaluate": "GP評価",
+    "gp.monthly": "月別集計",
+    "distribution.season_factors": "季節係数",
+    "distribution.gp_control": "GP制御",
+    "distribution.normalize": "正規化",
+    "nutrients.annual_rules": "年間施肥量ルール",
+    "report.chart": "グラフ描画",
+    "report.template": "テンプレート描画",
+    "export.serialize": "エクスポート",
+}
+
+_recorder: "contextvars.ContextVar[Optional[TraceRecorder]]" = contextvars.ContextVar(
+    "fert_trace_recorder", default=None
+)
+
+
+class _NoopSpan:
+    """記録していないときの span（何もしない）"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    """記録中の span 1件"""
+
+    __slots__ = ("_recorder", "name", "args", "_start")
+
+    def __init__(self, recorder: "TraceRecorder", name: str, args: Dict[str, Any]):
+        self._recorder = recorder
+        self.name = name
+        self.args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self._recorder.add(self.name, self._start, end, self.args)
+        return False
+
+    def set(self, **args) -> None:
+        """
+        span に属性を追加（件数・サイズなど）
+        """
+        self.args.update(args)
+
+
+class TraceRecorder:
+    """
+    span の記録先（スレッドセーフ）
+    """
+
+    def __init__(self, log: bool = False):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._log = log
+        self.events: List[Dict[str, Any]] = []
+
+    def add(self, name: str, start_ns: int, end_ns: int, args: Optional[Dict[str, Any]] = None) -> None:
+        """
+        完了した span を1件追加
+        """
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": (start_ns - self._origin) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = dict(args)
+        with self._lock:
+            self.events.append(event)
+        if self._log:
+            logger.info(json.dumps(
+                {"span": name, "ms": round(event["dur"] / 1000, 3), **(args or {})},
+                ensure_ascii=False,
+                default=str,
+            ))
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        段階ごとの集計（STAGES の順、それ以外は名前順で後ろに並べる）
+
+        Returns:
+            [{"name", "label", "count", "total_ms", "mean_ms", "max_ms"}, ...]
+        """
+        with self._lock:
+            events = list(self.events)
+
+        by_name: Dict[str, List[float]] = {}
+        for e in events:
+            by_name.setdefault(e["name"], []).append(e["dur"] / 1000)
+
+        order = list(STAGES)
+        names = sorted(by_name, key=lambda n: (order.index(n) if n in order else len(order), n))
+        return [
+            {
+                "name": name,
+                "label": STAGES.get(name, name),
+                "count": len(by_name[name]),
+                "total_ms": sum(by_name[name]),
+                "mean_ms": sum(by_name[name]) / len(by_name[name]),
+                "max_ms": max(by_name[name]),
+            }
+            for name in names
+        ]
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """
+        Chrome のトレース形式（Trace Event Format）の辞書
+        """
+        with self._lock:
+            events = list(self.events)
+        threads = {(e["pid"], e["tid"]) for e in events}
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+             "args": {"name": names.get(tid, str(tid))}}
+            for pid, tid in sorted(threads)
+        ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def chrome_trace_json(self) -> bytes:
+        return json.dumps(self.chrome_trace(), ensure_ascii=False).encode("utf-8")
+
+    def write_chrome_trace(self, path: str) -> str:
+        """
+        Chrome のトレース形式でファイルに保存
+        """
+        with open(path, "wb") as f:
+            f.write(self.chrome_trace_json())
+        return path
+
+
+def span(name: str, **args):
+    """
+    処理段階を囲む span（with 文で使う）
+
+    記録中でなければ何もしないオブジェクトを返す。
+
+    Args:
+        name: 段階名（STAGES のキーなど）
+        **args: span に付ける属性
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NOOP
+    return _Span(recorder, name, args)
+
+
+def traced(name: str) -> Callable:
+    """
+    関数全体を span で囲むデコレータ
+    """
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get()
+            if recorder is None:
+                return fn(*args, **kwargs)
+            with _Span(recorder, name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def is_recording() -> bool:
+    """
+    現在のコンテキストで記録中か
+    """
+    return _recorder.get() is not None
+
+
+def start_recording(log: bool = LOG_SPANS) -> Tuple[TraceRecorder, contextvars.Token]:
+    """
+    現在のコンテキストで記録を始める（with 文で囲めない Streamlit のスクリプト用）
+
+    Returns:
+        (記録先, stop_recording() に渡すトークン)
+    """
+    recorder = TraceRecorder(log=log)
+    return recorder, _recorder.set(recorder)
+
+
+def stop_recording(token: contextvars.Token) -> None:
+    """
+    start_recording() で始めた記録を終える
+    """
+    _recorder.reset(token)
+
+
+@contextmanager
+def recording(log: bool = LOG_SPANS) -> Iterator[TraceRecorder]:
+    """
+    with 文の中で記録する
+    """
+    recorder, token = start_recording(log)
+    try:
+        yield recorder
+    finally:
+        stop_recording(token)
@@ -0,0 +1,8 @@
+"""
+計算結果の保存モジュール
+
+- memo_cache: 施肥量計算の結果の永続メモ（SQLite）
+- history: 施肥設計の履歴（SQLite）
+- plan_store: 施肥設計の固定長レコード形式（.fplan）
+- soil_history: 土壌分析値の履歴（Parquet）と傾向の分析
+"""
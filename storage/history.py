@@ -0,0 +1,493 @@
+"""
+施肥設計の履歴（SQLite）
+
+計算した施肥設計を、入力・計算結果・計算ルールのバージョン・日時とともに記録する。
+「コースXの全設計」「グリーンごとの最新の設計」「6月のNが基準を超える設計」のような
+問い合わせを、数百万件でもインデックスでミリ秒単位で返す。
+
+- WAL モードで開き、書き込み中も別のプロセス・スレッドから読める
+- 書き込みは executemany でまとめて行う（1トランザクション BATCH_ROWS 件）
+- インデックス：コース・サイト・日時、サイト・日時、シーズン、設計のキー、6月のN
+  （月別Nのインデックスは INDEXED_MONTHS の月だけ。記録のたびに更新されるため増やさない）
+- 同じ計算（run_id）の同じ入力行は1件だけ記録する（一括計算を再開しても重複しない）
+
+記録する計算結果は、数値（年間量・MSLN/SLAN・月別量・GP値）と位置の区分だけ。
+説明文は記録しない（design_key と入力から計算し直せる）。
+
+使い方（コマンドライン）:
+    python -m storage.history stats
+    python -m storage.history course "○○カントリー倶楽部"
+    python -m storage.history latest --course "○○カントリー倶楽部"
+    python -m storage.history monthly-n --month 6 --above 3.0
+
+FERT_DESIGN_HISTORY=0 で記録しない。
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# 履歴のファイル（環境変数で上書き可能）
+DEFAULT_HISTORY_PATH = Path(
+    os.environ.get(
+        "FERT_DESIGN_HISTORY_PATH",
+        Path.home() / ".fertilization-design" / "history.sqlite3",
+    )
+)
+
+# 1トランザクションで書き込む件数
+BATCH_ROWS = 5000
+
+NUTRIENTS = ["N", "P", "K", "Ca", "Mg"]
+SOIL_KEYS = ["P", "K", "Ca", "Mg"]
+MONTH_COLUMNS = [f"n_{m:02d}" for m in range(1, 13)]
+# インデックスを作る月（plans_by_monthly_n で絞り込む月。ほかの月は全件を走査する）
+INDEXED_MONTHS = [6]
+
+_INPUT_COLUMNS = [
+    "grass_type", "usage_type", "management_intensity", "fertilizer_stance", "distribution_stance",
+    "latitude", "longitude",
+]
+_COLUMNS = (
+    ["run_id", "row", "course", "site_id", "season", "design_key", "rule_version", "created_at"]
+    + _INPUT_COLUMNS
+    + [f"soil_{k.lower()}" for k in SOIL_KEYS]
+    + [f"annual_{n.lower()}" for n in NUTRIENTS]
+    + MONTH_COLUMNS
+    + ["outputs"]
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    row INTEGER,
+    course TEXT NOT NULL,
+    site_id TEXT NOT NULL,
+    season TEXT NOT NULL,
+    design_key TEXT NOT NULL,
+    rule_version TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    grass_type TEXT,
+    usage_type TEXT,
+    management_intensity TEXT,
+    fertilizer_stance TEXT,
+    distribution_stance TEXT,
+    latitude REAL,
+    longitude REAL,
+    {", ".join(f"soil_{k.lower()} REAL" for k in SOIL_KEYS)},
+    {", ".join(f"annual_{n.lower()} REAL" for n in NUTRIENTS)},
+    {", ".join(f"{c} REAL" for c in MONTH_COLUMNS)},
+    outputs TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS plans_run_row ON plans (run_id, row);
+CREATE INDEX IF NOT EXISTS plans_course_site ON plans (course, site_id, created_at);
+CREATE INDEX IF NOT EXISTS plans_site ON plans (site_id, created_at);
+CREATE INDEX IF NOT EXISTS plans_season ON plans (season);
+CREATE INDEX IF NOT EXISTS plans_design_key ON plans (design_key);
+""" + "".join(
+    # 以前の版で作った、対象外の月のインデックスは消す
+    f"CREATE INDEX IF NOT EXISTS plans_{c} ON plans ({c});\n" if m in INDEXED_MONTHS
+    else f"DROP INDEX IF EXISTS plans_{c};\n"
+    for m, c in enumerate(MONTH_COLUMNS, start=1)
+)
+
+_INSERT = (
+    f"INSERT OR IGNORE INTO plans ({', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in _COLUMNS)})"
+)
+
+
+def default_season() -> str:
+    """
+    既定のシーズン（今年）
+    """
+    return str(datetime.now().year)
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _outputs(results: Dict[str, Dict]) -> str:
+    outputs: Dict[str, Any] = {
+        n: {
+            "annual_value": results[n]["annual_value"],
+            "msln": results[n]["msln"],
+            "slan": results[n]["slan"],
+            "position": results[n]["position"],
+            "monthly": results[n]["monthly"],
+        }
+        for n in NUTRIENTS
+    }
+    outputs["gp_values"] = results["N"]["gp_values"]
+    return json.dumps(outputs, ensure_ascii=False, separators=(",", ":"))
+
+
+def history_row(
+    design: Dict[str, Any],
+    run_id: str,
+    row: Optional[int] = None,
+    course: str = "",
+    season: Optional[str] = None,
+    created_at: Optional[str] = None,
+    rules: Optional[str] = None,
+) -> tuple:
+    """
+    設計データ（build_site_design の戻り値）を履歴の1行にする
+
+    Args:
+        design: 設計データ
+        run_id: 計算の識別子（同じ run_id・row の行は1件だけ記録する）
+        row: 入力の行番号
+        course: コース・施設名
+        season: シーズン（省略時は今年）
+        created_at: 日時（ISO形式、省略時は現在）
+        rules: design_key に使う計算ルールのハッシュ（省略時は現在の計算ルール）
+    """
+    from logic.constants import RULE_VERSION
+    from .memo_cache import design_key
+
+    input_data = design["input_data"]
+    results = design["calculation_results"]
+    soil = input_data["soil_values"]
+    return tuple(
+        [
+            run_id,
+            row,
+            course,
+            str(design["site_id"]),
+            season or default_season(),
+            design_key(input_data, rules),
+            RULE_VERSION,
+            created_at or datetime.now().isoformat(timespec="seconds"),
+        ]
+        + [input_data[c] for c in _INPUT_COLUMNS]
+        + [soil.get(k) for k in SOIL_KEYS]
+        + [results[n]["annual_value"] for n in NUTRIENTS]
+        + list(results["N"]["monthly"])
+        + [_outputs(results)]
+    )
+
+
+def _to_dict(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    record = {column[0]: value for column, value in zip(cursor.description, row)}
+    if "outputs" in record:
+        record["outputs"] = json.loads(record["outputs"])
+    return record
+
+
+class DesignHistory:
+    """
+    施肥設計の履歴の SQLite ファイル
+    """
+
+    def __init__(self, path: Path = DEFAULT_HISTORY_PATH):
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            conn.row_factory = _to_dict
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ── 記録 ──
+
+    def insert_rows(self, rows: Iterable[tuple]) -> int:
+        """
+        history_row で作った行を BATCH_ROWS 件ずつまとめて書き込む
+
+        Returns:
+            書き込んだ件数（既に記録済みの run_id・row は数えない）
+        """
+        inserted = 0
+        batch: List[tuple] = []
+        with self._lock:
+            conn = self._connect()
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= BATCH_ROWS:
+                    inserted += self._insert(conn, batch)
+                    batch = []
+            if batch:
+                inserted += self._insert(conn, batch)
+        return inserted
+
+    def _insert(self, conn: sqlite3.Connection, batch: List[tuple]) -> int:
+        before = conn.total_changes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_INSERT, batch)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return conn.total_changes - before
+
+    def record_designs(
+        self,
+        designs: Iterable[Dict[str, Any]],
+        course: str = "",
+        season: Optional[str] = None,
+        run_id: Optional[str] = None,
+        rows: Optional[Iterable[Optional[int]]] = None,
+    ) -> int:
+        """
+        設計データをまとめて記録する
+
+        Args:
+            designs: 設計データのイテラブル（build_site_design の戻り値、ジェネレータ可）
+            course: コース・施設名
+            season: シーズン（省略時は今年）
+            run_id: 計算の識別子（省略時は新しく作る）
+            rows: 設計データごとの入力の行番号（省略時は 0, 1, 2, ...）
+
+        Returns:
+            記録した件数
+        """
+        from .memo_cache import get_design_memo
+
+        run_id = run_id or new_run_id()
+        season = season or default_season()
+        created_at = datetime.now().isoformat(timespec="seconds")
+        rules = get_design_memo().rules
+        numbers = iter(rows) if rows is not None else iter(range(sys.maxsize))
+        return self.insert_rows(
+            history_row(design, run_id, next(numbers), course, season, created_at, rules) for design in designs
+        )
+
+    # ── 問い合わせ ──
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._connect().execute(sql, params).fetchall()
+
+    def plans_for_course(self, course: str, season: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        コースの全設計（サイト・日時の順）
+        """
+        sql = "SELECT * FROM plans WHERE course = ?"
+        params: List[Any] = [course]
+        if season is not None:
+            sql += " AND season = ?"
+            params.append(season)
+        sql += " ORDER BY site_id, created_at, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, tuple(params))
+
+    def plans_for_site(self, site_id: str, course: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        サイト（グリーン）の設計の履歴（日時の順）
+        """
+        if course is None:
+            return self._query("SELECT * FROM plans WHERE site_id = ? ORDER BY created_at, id", (site_id,))
+        return self._query(
+            "SELECT * FROM plans WHERE course = ? AND site_id = ? ORDER BY created_at, id", (course, site_id)
+        )
+
+    def latest_per_site(self, course: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        サイト（グリーン）ごとの最新の設計（course を省略すると全コース）
+        """
+        # 日時は秒単位のため、同じ日時の設計は後に記録したもの（id の大きいもの）を最新とする
+        # （コース・サイト・日時のインデックスの順に番号を付けられる）
+        where, params = ("WHERE course = ?", (course,)) if course is not None else ("", ())
+        sql = (
+            "SELECT * FROM (SELECT *, row_number() OVER "
+            "(PARTITION BY course, site_id ORDER BY created_at DESC, id DESC) AS _rank "
+            f"FROM plans {where}) WHERE _rank = 1 ORDER BY course, site_id"
+        )
+        rows = self._query(sql, params)
+        for row in rows:
+            del row["_rank"]
+        return rows
+
+    def plans_by_monthly_n(
+        self,
+        month: int,
+        above: Optional[float] = None,
+        below: Optional[float] = None,
+        season: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        ある月のN施肥量で絞り込んだ設計（例：6月のNが3.0を超える設計）
+
+        INDEXED_MONTHS の月はインデックスを使い、ほかの月は全件を走査する。
+
+        Args:
+            month: 1〜12
+            above: この値を超える
+            below: この値未満
+            season: シーズン
+            limit: 最大件数
+        """
+        if not 1 <= month <= 12:
+            raise ValueError(f"月は1〜12で指定してください: {month}")
+        if above is None and below is None:
+            raise ValueError("above または below を指定してください")
+        column = MONTH_COLUMNS[month - 1]
+        conditions, params = [], []
+        if above is not None:
+            conditions.append(f"{column} > ?")
+            params.append(above)
+        if below is not None:
+            conditions.append(f"{column} < ?")
+            params.append(below)
+        if season is not None:
+            conditions.append("season = ?")
+            params.append(season)
+        sql = f"SELECT * FROM plans WHERE {' AND '.join(conditions)} ORDER BY {column} DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, tuple(params))
+
+    def plans_by_design_key(self, key: str) -> List[Dict[str, Any]]:
+        """
+        同じ入力・計算ルールで計算した設計
+        """
+        return self._query("SELECT * FROM plans WHERE design_key = ? ORDER BY created_at, id", (key,))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        件数・コース数・サイト数・ファイルサイズを返す
+        """
+        row = self._query(
+            "SELECT COUNT(*) AS plans, COUNT(DISTINCT course) AS courses, COUNT(DISTINCT run_id) AS runs, "
+            "MIN(created_at) AS first, MAX(created_at) AS last FROM plans"
+        )[0]
+        row["path"] = str(self.path)
+        row["file_bytes"] = sum(p.stat().st_size for p in (self.path, Path(f"{self.path}-wal")) if p.exists())
+        return row
+
+
+def history_enabled() -> bool:
+    return os.environ.get("FERT_DESIGN_HISTORY", "1").lower() not in ("0", "false", "off", "no")
+
+
+_default_history: Optional[DesignHistory] = None
+_default_lock = threading.Lock()
+
+
+def get_design_history() -> DesignHistory:
+    """
+    プロセス共通の施肥設計の履歴を返す
+    """
+    global _default_history
+    with _default_lock:
+        if _default_history is None:
+            _default_history = DesignHistory()
+        return _default_history
+
+
+def record_designs(designs: Iterable[Dict[str, Any]], **kwargs: Any) -> int:
+    """
+    設計データを履歴に記録する（FERT_DESIGN_HISTORY=0 のとき・書き込めないときは記録しない）
+
+    引数は DesignHistory.record_designs と同じ。
+
+    Returns:
+        記録した件数
+    """
+    if not history_enabled():
+        return 0
+    history = get_design_history()
+    try:
+        return history.record_designs(designs, **kwargs)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("施肥設計の履歴に記録できませんでした（%s）: %s", history.path, e)
+        return 0
+
+
+def insert_history_rows(rows: List[tuple]) -> int:
+    """
+    history_row で作った行を履歴に書き込む（書き込めないときは警告を出して記録しない）
+
+    Returns:
+        記録した件数
+    """
+    history = get_design_history()
+    try:
+        return history.insert_rows(rows)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("施肥設計の履歴に記録できませんでした（%s）: %s", history.path, e)
+        return 0
+
+
+def _print_rows(rows: List[Dict[str, Any]]) -> None:
+    columns = ["course", "site_id", "season", "created_at", "rule_version", "annual_n", "n_06"]
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join(str(row[c]) for c in columns))
+    print(f"{len(rows):,} 件", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m storage.history", description="施肥設計の履歴（SQLite）")
+    parser.add_argument("--db", type=Path, default=DEFAULT_HISTORY_PATH, help="履歴のファイル")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="件数・コース数")
+    course = commands.add_parser("course", help="コースの全設計")
+    course.add_argument("course")
+    course.add_argument("--season")
+    latest = commands.add_parser("latest", help="グリーンごとの最新の設計")
+    latest.add_argument("--course")
+    monthly = commands.add_parser("monthly-n", help="ある月のN施肥量で絞り込む")
+    monthly.add_argument("--month", type=int, required=True)
+    monthly.add_argument("--above", type=float)
+    monthly.add_argument("--below", type=float)
+    monthly.add_argument("--season")
+    monthly.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    history = DesignHistory(args.db)
+    started = time.perf_counter()
+    try:
+        if args.command == "stats":
+            for name, value in history.stats().items():
+                print(f"{name}: {value}")
+            return 0
+        if args.command == "course":
+            rows = history.plans_for_course(args.course, season=args.season)
+        elif args.command == "latest":
+            rows = history.latest_per_site(args.course)
+        else:
+            rows = history.plans_by_monthly_n(args.month, args.above, args.below, args.season, args.limit)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    _print_rows(rows)
+    print(f"{(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
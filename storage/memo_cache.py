@@ -0,0 +1,495 @@
+"""
+施肥量計算の結果の永続メモ（SQLite）
+
+calculate_fertilizer_requirements の結果を、正規化した入力と
+計算ルールの表のハッシュをキーにして1つの SQLite ファイルに保存する。
+一括計算の再実行やアプリの再起動のあとも、同じ条件のサイトは計算せずに保存済みの結果を返す。
+
+キーに含める計算ルール（rules_hash）：
+- annual_nutrient_model の ANNUAL_N_RANGE / STANCE_POSITION / NUTRIENT_RATIO_TO_N
+- monthly_distribution の SEASON_FACTOR_TABLE / SEASON_FACTOR_SPRING_HEAVY /
+  MANAGEMENT_PEAK_MULTIPLIER / GP_CONTROL_FACTOR
+- constants の SOIL_REFERENCE_RANGES と RULE_VERSION
+- 計算ロジックのソースのハッシュ（constants.rule_fingerprint、一括計算のチェックポイントと同じ）
+
+表・計算式を変えるとキーが変わるため、古い結果は参照されなくなる（開いたときに削除する）。
+ハッシュはプロセスで最初に使うときに1回だけ計算する。
+
+結果は数値（年間量・MSLN/SLAN・月別量・GP値）を float64 の配列、
+文字列（位置・補正・説明）を JSON にして保存する（結果全体を JSON にするより読み出しが数倍速い）。
+1件は2KB強なので、ページの大きさを16KBにして1ページに複数件入るようにする。
+保存は一定件数ごとにまとめて書き込む（プロセス終了時にも書き込む）。
+SQLite のエラー（ロック・容量不足など）が起きたら警告を出してメモを使わずに計算する。
+
+使い方（コマンドライン）:
+    python -m storage.memo_cache stats
+    python -m storage.memo_cache prune
+    python -m storage.memo_cache purge
+
+FERT_DESIGN_MEMO=0 でメモを使わない。
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# メモのファイル（環境変数で上書き可能、施肥設計の履歴と同じディレクトリ）
+DEFAULT_MEMO_PATH = Path(
+    os.environ.get(
+        "FERT_DESIGN_MEMO_PATH",
+        Path.home() / ".fertilization-design" / "design_memo.sqlite3",
+    )
+)
+
+# 件数の上限。超えた分は古い順（書き込んだ順）に削除する
+DEFAULT_MAX_ENTRIES = int(os.environ.get("FERT_DESIGN_MEMO_MAX_ENTRIES", 2_000_000))
+
+# まとめて書き込む件数
+FLUSH_EVERY = 512
+
+NUTRIENTS = ["N", "P", "K", "Ca", "Mg"]
+_SCALAR_KEYS = ["annual", "annual_value", "msln", "slan"]
+_TEXT_KEYS = ["position", "correction", "explanation"]
+_MONTHS = 12
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memo (
+    key TEXT PRIMARY KEY,
+    rules TEXT NOT NULL,
+    texts TEXT NOT NULL,
+    numbers BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS memo_rules ON memo (rules);
+"""
+
+
+def _canonical_json(value: Any) -> str:
+    """
+    辞書・リスト・Enumを含む値を、順序に依存しないJSON文字列に変換
+    """
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=lambda v: getattr(v, "value", str(v)),
+    )
+
+
+def _plain(value: Any) -> Any:
+    """
+    タプル・Enumのキーを含む表を、JSONにできる形に変換
+    """
+    if isinstance(value, dict):
+        return {
+            "|".join(str(getattr(k, "value", k)) for k in (key if isinstance(key, tuple) else (key,))): _plain(v)
+            for key, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return getattr(value, "value", value)
+
+
+def rule_tables() -> Dict[str, Any]:
+    """
+    メモのキーに含める計算ルールの表
+    """
+    from logic import annual_nutrient_model, constants, monthly_distribution
+
+    return {
+        "RULE_VERSION": constants.RULE_VERSION,
+        "RULE_FINGERPRINT": constants.rule_fingerprint(),
+        "SOIL_REFERENCE_RANGES": constants.SOIL_REFERENCE_RANGES,
+        "ANNUAL_N_RANGE": annual_nutrient_model.ANNUAL_N_RANGE,
+        "STANCE_POSITION": annual_nutrient_model.STANCE_POSITION,
+        "NUTRIENT_RATIO_TO_N": annual_nutrient_model.NUTRIENT_RATIO_TO_N,
+        "SEASON_FACTOR_TABLE": monthly_distribution.SEASON_FACTOR_TABLE,
+        "SEASON_FACTOR_SPRING_HEAVY": monthly_distribution.SEASON_FACTOR_SPRING_HEAVY,
+        "MANAGEMENT_PEAK_MULTIPLIER": monthly_distribution.MANAGEMENT_PEAK_MULTIPLIER,
+        "GP_CONTROL_FACTOR": monthly_distribution.GP_CONTROL_FACTOR,
+    }
+
+
+def rules_hash() -> str:
+    """
+    計算ルールの表のハッシュ（いずれかの表・計算ロジックのソースが変わると変わる）
+    """
+    return hashlib.sha256(_canonical_json(_plain(rule_tables())).encode("utf-8")).hexdigest()[:16]
+
+
+def _number(value: Any) -> Any:
+    # 35 と 35.0 を同じキーにする
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def _encode(results: Dict[str, Dict]) -> Optional[Tuple[str, bytes]]:
+    """
+    計算結果を (文字列のJSON, 数値の配列のバイト列) にする（想定外の形ならNone）
+    """
+    if set(results) != set(NUTRIENTS):
+        return None
+    gp_values = results["N"]["gp_values"]
+    if len(gp_values) != _MONTHS:
+        return None
+    values = list(gp_values)
+    texts = []
+    for nutrient in NUTRIENTS:
+        entry = results[nutrient]
+        if len(entry["monthly"]) != _MONTHS or entry["gp_values"] != gp_values:
+            return None
+        values.extend(entry[k] for k in _SCALAR_KEYS)
+        values.extend(entry["monthly"])
+        texts.append([entry[k] for k in _TEXT_KEYS])
+    # int が混ざると読み出し時に float になって型が変わるので保存しない
+    if set(map(type, values)) != {float}:
+        return None
+    return json.dumps(texts, ensure_ascii=False, separators=(",", ":")), array("d", values).tobytes()
+
+
+def _decode(texts: str, data: bytes) -> Dict[str, Dict]:
+    """
+    _encode の逆（calculate_fertilizer_requirements と同じ形の辞書を作る）
+    """
+    numbers = array("d")
+    numbers.frombytes(data)
+    gp_values = numbers[:_MONTHS].tolist()
+    width = len(_SCALAR_KEYS) + _MONTHS
+    results = {}
+    for i, (nutrient, strings) in enumerate(zip(NUTRIENTS, json.loads(texts))):
+        start = _MONTHS + i * width
+        values = numbers[start:start + width].tolist()
+        entry = dict(zip(_SCALAR_KEYS, values))
+        entry["monthly"] = values[len(_SCALAR_KEYS):]
+        entry["gp_values"] = list(gp_values)
+        entry.update(zip(_TEXT_KEYS, strings))
+        results[nutrient] = entry
+    return results
+
+
+def make_requirements_key(
+    rules: str,
+    grass_type: Any,
+    usage_type: Any,
+    management_intensity: Any,
+    soil_values: Dict[str, Any],
+    fertilizer_stance: Any,
+    latitude: float,
+    longitude: float,
+    distribution_stance: str,
+) -> str:
+    """
+    calculate_fertilizer_requirements の入力と計算ルールのハッシュからキーを作る
+    """
+    # repr は浮動小数点数を一意に表すので、JSON より速く同じ正規化ができる
+    inputs = (
+        rules,
+        getattr(grass_type, "value", grass_type),
+        getattr(usage_type, "value", usage_type),
+        getattr(management_intensity, "value", management_intensity),
+        sorted((k, _number(v)) for k, v in soil_values.items()),
+        getattr(fertilizer_stance, "value", fertilizer_stance),
+        _number(latitude),
+        _number(longitude),
+        distribution_stance,
+    )
+    return hashlib.blake2b(repr(inputs).encode("utf-8"), digest_size=16).hexdigest()
+
+
+# 設計データの入力（build_site_design の input_data）のうちキーに使う項目
+_KEY_FIELDS = [
+    "grass_type", "usage_type", "management_intensity", "soil_values",
+    "fertilizer_stance", "latitude", "longitude", "distribution_stance",
+]
+
+
+def design_key(input_data: Dict[str, Any], rules: Optional[str] = None) -> str:
+    """
+    設計データの入力（build_site_design の input_data）からメモと同じキーを作る
+
+    Args:
+        input_data: 設計データの input_data
+        rules: 計算ルールのハッシュ（省略時は現在の計算ルール）
+    """
+    if rules is None:
+        rules = get_design_memo().rules
+    return make_requirements_key(rules, **{field: input_data[field] for field in _KEY_FIELDS})
+
+
+class DesignMemo:
+    """
+    施肥量計算の結果を保存する SQLite ファイル
+    """
+
+    def __init__(self, path: Path = DEFAULT_MEMO_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.disabled = False
+        self._rules: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, Tuple[str, str, bytes, float]] = {}
+        # 件数の見積もり（置き換えも数えるので実際より多め。上限を超えたら数え直す）
+        self._count = 0
+        self._lock = threading.RLock()
+
+    @property
+    def rules(self) -> str:
+        if self._rules is None:
+            self._rules = rules_hash()
+        return self._rules
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+            # page_size は表を作る前（新しいファイル）にだけ効く
+            conn.execute("PRAGMA page_size=16384")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            # 表が変わる前の結果は二度と参照されないので、開いたときに削除する
+            self._prune(conn)
+            self._count = conn.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+        return self._conn
+
+    def _disable(self, error: Exception) -> None:
+        logger.warning("施肥量計算のメモを使えません（%s）。以降は毎回計算します: %s", self.path, error)
+        self.disabled = True
+        self._pending.clear()
+
+    def key(self, **inputs: Any) -> str:
+        """
+        calculate_fertilizer_requirements の引数（trace を除く）からキーを作る
+        """
+        return make_requirements_key(self.rules, **inputs)
+
+    def get(self, key: str) -> Optional[Dict[str, Dict]]:
+        """
+        保存済みの計算結果を返す（存在しない場合はNone）
+        """
+        with self._lock:
+            if self.disabled:
+                return None
+            pending = self._pending.get(key)
+            if pending is not None:
+                row = pending[1:3]
+            else:
+                try:
+                    row = self._connect().execute("SELECT texts, numbers FROM memo WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    self._disable(e)
+                    return None
+                if row is None:
+                    self.misses += 1
+                    return None
+            self.hits += 1
+        return _decode(*row)
+
+    def put(self, key: str, results: Dict[str, Dict]) -> None:
+        """
+        計算結果を保存する（FLUSH_EVERY 件ごとにまとめて書き込む。想定外の形の結果は保存しない）
+        """
+        encoded = _encode(results)
+        if encoded is None:
+            return
+        with self._lock:
+            if self.disabled:
+                return
+            self._pending[key] = (self.rules, encoded[0], encoded[1], time.time())
+            if len(self._pending) >= FLUSH_EVERY:
+                self.flush()
+
+    def flush(self) -> int:
+        """
+        まだ書き込んでいない結果を書き込む
+
+        Returns:
+            書き込んだ件数
+        """
+        with self._lock:
+            if self.disabled or not self._pending:
+                return 0
+            rows = [(key,) + values for key, values in self._pending.items()]
+            try:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?)", rows)
+                    self._count += len(rows)
+                    self._evict(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                self._disable(e)
+                return 0
+            self._pending.clear()
+            return len(rows)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        if self._count <= self.max_entries:
+            return 0
+        self._count = conn.execute("SELECT COUNT(*) FROM memo").fetchone()[0]
+        over = self._count - self.max_entries
+        if over <= 0:
+            return 0
+        self._count -= over
+        conn.execute("DELETE FROM memo WHERE rowid IN (SELECT rowid FROM memo ORDER BY rowid LIMIT ?)", (over,))
+        return over
+
+    def _prune(self, conn: sqlite3.Connection) -> int:
+        return conn.execute("DELETE FROM memo WHERE rules != ?", (self.rules,)).rowcount
+
+    def prune(self) -> int:
+        """
+        現在の計算ルールと異なる表で計算した結果を削除する
+
+        Returns:
+            削除した件数
+        """
+        with self._lock:
+            self.flush()
+            return self._prune(self._connect())
+
+    def purge(self) -> int:
+        """
+        すべての結果を削除する
+
+        Returns:
+            削除した件数
+        """
+        with self._lock:
+            self._pending.clear()
+            removed = self._connect().execute("DELETE FROM memo").rowcount
+            self._conn.execute("VACUUM")
+            return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        件数・ファイルサイズ・ヒット数を返す
+        """
+        with self._lock:
+            self.flush()
+            entries = self._connect().execute("SELECT COUNT(*) FROM memo").fetchone()[0] if not self.disabled else 0
+        return {
+            "path": str(self.path),
+            "rules": self.rules,
+            "entries": entries,
+            "file_bytes": sum(p.stat().st_size for p in (self.path, Path(f"{self.path}-wal")) if p.exists()),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def memo_enabled() -> bool:
+    return os.environ.get("FERT_DESIGN_MEMO", "1").lower() not in ("0", "false", "off", "no")
+
+
+_default_memo: Optional[DesignMemo] = None
+_default_lock = threading.Lock()
+
+
+def get_design_memo() -> DesignMemo:
+    """
+    プロセス共通の施肥量計算のメモを返す
+    """
+    global _default_memo
+    with _default_lock:
+        if _default_memo is None:
+            _default_memo = DesignMemo()
+            _register_memo_metrics(_default_memo)
+            atexit.register(_default_memo.close)
+        return _default_memo
+
+
+def _register_memo_metrics(memo: DesignMemo) -> None:
+    from runtime.metrics import get_registry
+
+    get_registry().counter(
+        "fert_design_memo_requests_total", "施肥量計算のメモの参照回数", ["result"]
+    ).set_function(lambda: {("hit",): memo.hits, ("miss",): memo.misses})
+
+
+def cached_fertilizer_requirements(
+    grass_type: Any,
+    usage_type: Any,
+    management_intensity: Any,
+    soil_values: Dict[str, Any],
+    fertilizer_stance: Any,
+    latitude: float = 35.7,
+    longitude: float = 139.8,
+    distribution_stance: str = "春重点50",
+) -> Dict[str, Dict]:
+    """
+    calculate_fertilizer_requirements と同じ結果を、メモにあればそこから返す
+    """
+    from logic.fertilizer import calculate_fertilizer_requirements
+
+    inputs = {
+        "grass_type": grass_type,
+        "usage_type": usage_type,
+        "management_intensity": management_intensity,
+        "soil_values": soil_values,
+        "fertilizer_stance": fertilizer_stance,
+        "latitude": latitude,
+        "longitude": longitude,
+        "distribution_stance": distribution_stance,
+    }
+    if not memo_enabled():
+        return calculate_fertilizer_requirements(**inputs)
+    memo = get_design_memo()
+    key = memo.key(**inputs)
+    results = memo.get(key)
+    if results is None:
+        results = calculate_fertilizer_requirements(**inputs)
+        memo.put(key, results)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    command = argv[0] if argv else "stats"
+    memo = get_design_memo()
+    if command == "purge":
+        removed = memo.purge()
+        print(f"{removed} 件の結果を削除しました（{memo.path}）")
+    elif command == "prune":
+        removed = memo.prune()
+        print(f"計算ルールが古い {removed} 件の結果を削除しました（{memo.path}）")
+    elif command == "stats":
+        for name, value in memo.stats().items():
+            print(f"{name}: {value}")
+    else:
+        print("使い方: python -m storage.memo_cache [stats|prune|purge]", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+施肥設計の固定長レコード形式（.fplan）
+
+数百万サイト分の施肥設計を、1サイト1レコードの固定長バイナリとして保存する。
+JSON / CSV と違って読み込み時の変換がなく、ファイルを memory map して
+i 番目の設計を O(1) で取り出し（NumPy のビュー、コピーなし）、
+「4月のN」のような列をメモリの帯域で走査できる。
+
+ファイルの構成：
+- 先頭 HEADER_SIZE バイト：マジック（b"FERTPLAN"）、形式のバージョン（uint32）、
+  見出しの長さ（uint32）、見出し（JSON：レコードの型・要素の並び・作成日時）
+- 以降：レコード（RECORD_DTYPE、リトルエンディアン）を隙間なく並べたもの
+
+レコード数はファイルサイズから求める（追記の途中で止まった末尾の半端なレコードは無視する）。
+
+レコードの項目：
+- site_id：サイト識別子（UTF-8、SITE_ID_BYTES バイトまで）
+- design_key：施肥量計算のキー（storage.memo_cache.design_key、入力と計算ルールの表のハッシュ）
+- rule_version：計算ルールのバージョン（logic.constants.RULE_VERSION）
+- annual / msln / slan：要素（N, P, K, Ca, Mg）ごとの年間量（calculation_results の値のまま）
+- monthly：要素 × 12ヶ月の月別施肥量
+- gp：月別GP値
+
+値は float32 で保存する（計算結果は小数第1位までなので精度は足りる）。
+
+使い方（コマンドライン）:
+    python -m storage.plan_store build sites.parquet --out plans.fplan
+    python -m storage.plan_store info plans.fplan
+    python -m storage.plan_store show plans.fplan 12345
+    python -m storage.plan_store scan plans.fplan --nutrient N --month 4 --above 1.0
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+
+MAGIC = b"FERTPLAN"
+FORMAT_VERSION = 1
+# 見出しの領域（レコードの先頭をページ境界にそろえる）
+HEADER_SIZE = 4096
+
+NUTRIENTS = ["N", "P", "K", "Ca", "Mg"]
+MONTHS = 12
+SITE_ID_BYTES = 64
+
+RECORD_DTYPE = np.dtype([
+    ("site_id", f"S{SITE_ID_BYTES}"),
+    ("design_key", "S32"),
+    ("rule_version", "S8"),
+    ("annual", "<f4", (len(NUTRIENTS),)),
+    ("msln", "<f4", (len(NUTRIENTS),)),
+    ("slan", "<f4", (len(NUTRIENTS),)),
+    ("monthly", "<f4", (len(NUTRIENTS), MONTHS)),
+    ("gp", "<f4", (MONTHS,)),
+])
+
+# 書き込み時にまとめる既定のレコード数
+DEFAULT_BUFFER_RECORDS = 4096
+
+_PREFIX = struct.Struct("<8sII")
+
+
+def _header_bytes() -> bytes:
+    header = json.dumps({
+        "dtype": [list(field) for field in np.lib.format.dtype_to_descr(RECORD_DTYPE)],
+        "record_size": RECORD_DTYPE.itemsize,
+        "nutrients": NUTRIENTS,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }, ensure_ascii=False).encode("utf-8")
+    data = _PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)) + header
+    return data.ljust(HEADER_SIZE, b"\0")
+
+
+def read_header(path: Union[str, os.PathLike]) -> Dict[str, Any]:
+    """
+    見出しを読み、この形式のファイルか確かめる
+
+    Raises:
+        ValueError: .fplan ではない、または対応していないバージョン・レコードの型の場合
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise ValueError(f"施肥設計のファイルではありません: {path}")
+        magic, version, length = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError(f"施肥設計のファイルではありません: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"対応していない形式のバージョンです: {version}（対応 {FORMAT_VERSION}）")
+        header = json.loads(f.read(length))
+    if header.get("record_size") != RECORD_DTYPE.itemsize or header.get("nutrients") != NUTRIENTS:
+        raise ValueError(f"レコードの型が異なります: {path}")
+    return header
+
+
+def _encode_site_id(site_id: Any) -> bytes:
+    data = str(site_id).encode("utf-8")
+    if len(data) > SITE_ID_BYTES:
+        raise ValueError(f"サイト識別子が長すぎます（UTF-8で{SITE_ID_BYTES}バイトまで）: {site_id}")
+    return data
+
+
+def design_record(design: Dict[str, Any], rules: Optional[str] = None) -> tuple:
+    """
+    設計データ（build_site_design の戻り値）を1レコード分の値にする
+
+    Args:
+        design: 設計データ
+        rules: design_key に使う計算ルールのハッシュ（省略時は現在の計算ルール）
+    """
+    from logic.constants import RULE_VERSION
+    from .memo_cache import design_key
+
+    results = design["calculation_results"]
+    return (
+        _encode_site_id(design["site_id"]),
+        design_key(design["input_data"], rules).encode("ascii"),
+        RULE_VERSION.encode("ascii"),
+        [results[n]["annual_value"] for n in NUTRIENTS],
+        [results[n]["msln"] for n in NUTRIENTS],
+        [results[n]["slan"] for n in NUTRIENTS],
+        [results[n]["monthly"] for n in NUTRIENTS],
+        results["N"]["gp_values"],
+    )
+
+
+class PlanStoreWriter:
+    """
+    .fplan への書き込み（with 文で使う）
+
+    新しく作る場合は一時ファイルに書いてから閉じるときに置き換える。
+    append=True で既存のファイルに追記する（末尾の半端なレコードは切り捨てる）。
+    """
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike],
+        append: bool = False,
+        buffer_records: int = DEFAULT_BUFFER_RECORDS,
+    ):
+        self.path = Path(path)
+        self.append_mode = append and self.path.exists()
+        self.count = 0
+        self._buffer = np.zeros(max(1, buffer_records), dtype=RECORD_DTYPE)
+        self._buffered = 0
+        self._rules: Optional[str] = None
+        self._tmp_path: Optional[str] = None
+        if self.append_mode:
+            read_header(self.path)
+            size = self.path.stat().st_size
+            self.count = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+            self._file = open(self.path, "r+b")
+            self._file.truncate(HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(_header_bytes())
+
+    def __enter__(self) -> "PlanStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, record: tuple) -> int:
+        """
+        1レコードを追加する
+
+        Returns:
+            追加したレコードの番号
+        """
+        self._buffer[self._buffered] = record
+        self._buffered += 1
+        if self._buffered == len(self._buffer):
+            self.flush()
+        self.count += 1
+        return self.count - 1
+
+    def append_design(self, design: Dict[str, Any]) -> int:
+        """
+        設計データ（build_site_design の戻り値）を1レコードとして追加する
+        """
+        if self._rules is None:
+            from .memo_cache import get_design_memo
+
+            self._rules = get_design_memo().rules
+        return self.append(design_record(design, self._rules))
+
+    def extend(self, designs: Iterable[Dict[str, Any]]) -> int:
+        """
+        設計データを順に追加する
+
+        Returns:
+            追加したレコード数
+        """
+        added = 0
+        for design in designs:
+            self.append_design(design)
+            added += 1
+        return added
+
+    def flush(self) -> None:
+        if self._buffered:
+            self._file.write(self._buffer[:self._buffered].tobytes())
+            self._buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        if self._tmp_path is not None:
+            os.replace(self._tmp_path, self.path)
+            self._tmp_path = None
+
+    def abort(self) -> None:
+        """
+        書き込みをやめる（新しく作る場合は一時ファイルを消す。追記は書き込み済みの分だけ残る）
+        """
+        self._file.close()
+        if self._tmp_path is not None:
+            try:
+                os.unlink(self._tmp_path)
+            except OSError:
+                pass
+            self._tmp_path = None
+
+
+def write_plan_store(path: Union[str, os.PathLike], designs: Iterable[Dict[str, Any]]) -> int:
+    """
+    設計データのイテラブル（ジェネレータ可）を .fplan に書き出す
+
+    Returns:
+        書き出したレコード数
+    """
+    with PlanStoreWriter(path) as writer:
+        return writer.extend(designs)
+
+
+class PlanStore:
+    """
+    .fplan の読み出し（memory map。レコードはコピーせずに NumPy のビューで返す）
+
+        store = PlanStore("plans.fplan")
+        plan = store.plan(12345)                # 1サイト分（O(1)）
+        april_n = store.monthly("N", 4)         # 全サイトの4月のN（ビュー）
+        heavy = np.flatnonzero(april_n > 1.0)
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = Path(path)
+        self.header = read_header(self.path)
+        self.records = self._map()
+
+    def _map(self) -> np.ndarray:
+        count = (self.path.stat().st_size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count <= 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.memmap(self.path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+    def refresh(self) -> int:
+        """
+        追記された分を読めるように map し直す
+
+        Returns:
+            レコード数
+        """
+        self.records = self._map()
+        return len(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def plan(self, index: int) -> Dict[str, Any]:
+        """
+        i 番目の設計（数値の項目はファイルを指すビュー）
+        """
+        record = self.records[index]
+        return {
+            "site_id": record["site_id"].decode("utf-8"),
+            "design_key": record["design_key"].decode("ascii"),
+            "rule_version": record["rule_version"].decode("ascii"),
+            "annual": record["annual"],
+            "msln": record["msln"],
+            "slan": record["slan"],
+            "monthly": record["monthly"],
+            "gp": record["gp"],
+        }
+
+    def column(self, field: str, nutrient: Optional[str] = None) -> np.ndarray:
+        """
+        全レコードの1項目（ビュー）。nutrient を指定すると要素ごとの項目からその要素だけを取り出す
+
+        例: column("annual", "N") → 全サイトの年間N量、column("gp") → サイト数 × 12
+        """
+        values = self.records[field]
+        if nutrient is None:
+            return values
+        return values[:, NUTRIENTS.index(nutrient)]
+
+    def monthly(self, nutrient: str, month: int) -> np.ndarray:
+        """
+        全サイトのある月のある要素の施肥量（ビュー）
+
+        Args:
+            nutrient: "N" / "P" / "K" / "Ca" / "Mg"
+            month: 1〜12
+        """
+        if not 1 <= month <= MONTHS:
+            raise ValueError(f"月は1〜12で指定してください: {month}")
+        return self.records["monthly"][:, NUTRIENTS.index(nutrient), month - 1]
+
+    def find(self, site_id: Any) -> np.ndarray:
+        """
+        サイト識別子が一致するレコードの番号
+        """
+        return np.flatnonzero(self.records["site_id"] == _encode_site_id(site_id))
+
+    def close(self) -> None:
+        mmap = getattr(self.records, "_mmap", None)
+        self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        if mmap is not None:
+            mmap.close()
+
+
+def _build(args: argparse.Namespace) -> int:
+    from batch.io import iter_site_rows
+    from batch.runner import SiteRowError, parse_site_row
+    from logic.design import build_site_design
+
+    errors = 0
+
+    def designs():
+        nonlocal errors
+        for row in iter_site_rows(args.input):
+            try:
+                yield build_site_design(**parse_site_row(row))
+            except (SiteRowError, KeyError, ValueError) as e:
+                errors += 1
+                print(f"  {row.get('row')} 行目: {e}", file=sys.stderr)
+
+    started = time.perf_counter()
+    count = write_plan_store(args.out, designs())
+    print(f"{count:,} サイト（エラー {errors:,}）, {time.perf_counter() - started:.1f} 秒: {args.out}")
+    return 0
+
+
+def _info(args: argparse.Namespace) -> int:
+    store = PlanStore(args.path)
+    print(f"path: {store.path}")
+    print(f"records: {len(store):,}")
+    print(f"record_size: {RECORD_DTYPE.itemsize} バイト")
+    print(f"file_bytes: {store.path.stat().st_size:,}")
+    print(f"created_at: {store.header.get('created_at')}")
+    if len(store):
+        versions, counts = np.unique(store.records["rule_version"], return_counts=True)
+        print("rule_version: " + ", ".join(f"{v.decode('ascii')} ({c:,})" for v, c in zip(versions, counts)))
+    return 0
+
+
+def _show(args: argparse.Namespace) -> int:
+    store = PlanStore(args.path)
+    plan = store.plan(args.index)
+    print(f"site_id: {plan['site_id']}  design_key: {plan['design_key']}  rule_version: {plan['rule_version']}")
+    for i, n in enumerate(NUTRIENTS):
+        monthly = " ".join(f"{v:5.1f}" for v in plan["monthly"][i])
+        print(f"{n:>2}: 年間 {plan['annual'][i]:6.1f}（MSLN {plan['msln'][i]:.1f}〜SLAN {plan['slan'][i]:.1f}）  {monthly}")
+    print("GP: " + " ".join(f"{v:.2f}" for v in plan["gp"]))
+    return 0
+
+
+def _scan(args: argparse.Namespace) -> int:
+    store = PlanStore(args.path)
+    started = time.perf_counter()
+    values = store.monthly(args.nutrient, args.month)
+    summary = {"records": len(values)}
+    if len(values):
+        summary.update({"mean": float(values.mean()), "min": float(values.min()), "max": float(values.max())})
+    if args.above is not None:
+        summary["above"] = int(np.count_nonzero(values > args.above))
+    summary["seconds"] = time.perf_counter() - started
+    for name, value in summary.items():
+        print(f"{name}: {value:,.4f}" if isinstance(value, float) else f"{name}: {value:,}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m storage.plan_store", description="施肥設計の固定長レコード形式（.fplan）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="サイト一覧を設計して .fplan に書き出す")
+    build.add_argument("input", type=Path, help="サイト一覧（.csv / .jsonl / .parquet / .xlsx）")
+    build.add_argument("--out", type=Path, required=True, help="出力ファイル（.fplan）")
+    build.set_defaults(func=_build)
+
+    info = commands.add_parser("info", help="レコード数・計算ルールのバージョン")
+    info.add_argument("path", type=Path)
+    info.set_defaults(func=_info)
+
+    show = commands.add_parser("show", help="i 番目の設計を表示")
+    show.add_argument("path", type=Path)
+    show.add_argument("index", type=int)
+    show.set_defaults(func=_show)
+
+    scan = commands.add_parser("scan", help="ある月のある要素の施肥量を全サイト分集計")
+    scan.add_argument("path", type=Path)
+    scan.add_argument("--nutrient", choices=NUTRIENTS, default="N")
+    scan.add_argument("--month", type=int, required=True, help="1〜12")
+    scan.add_argument("--above", type=float, help="この値を超えるサイト数も数える")
+    scan.set_defaults(func=_scan)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (ValueError, RuntimeError, OSError, IndexError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,571 @@
+"""
+土壌分析値の履歴（Parquet）と傾向の分析
+
+サイト（グリーン）ごとの過去の土壌分析値を、列形式（Parquet）で保存する。
+値はアプリで入力する P / K / Ca / Mg / NO₃-N / NH₄-N（mg/100g 乾土）。
+保存先はディレクトリで、追加のたびに Parquet ファイル（part-*.parquet）を1つ書き足す
+（既存のファイルは書き換えない）。
+
+傾向の分析は全サイトをまとめて NumPy の配列演算で行い、サイトごとのループを持たない：
+- 傾き：要素・サイトごとの最小二乗の直線の傾き（mg/100g/年）
+- 下限までの年数：傾向線の最新値から、下限（MSLN_FLOORS）を下回るまでの年数
+  （下限を下回っていれば 0、減っていなければ inf）
+- 外れ値：傾向線からの残差を、サイトごとの残差の中央値（MAD）で割ったロバストZ値で判定する
+
+傾向線を先に延ばした値（project_soil_values）は、設計の土壌診断値（build_site_design の
+soil_values）としてそのまま使える。
+
+1千グリーン × 20年（年4回）の8万件で、読み込みと分析は1秒未満。
+
+使い方（コマンドライン）:
+    python -m storage.soil_history import tests.csv --store soil_history/
+    python -m storage.soil_history stats --store soil_history/
+    python -m storage.soil_history trends --store soil_history/ --out trends.csv --outliers outliers.csv
+    python -m storage.soil_history synth --sites 1000 --years 20 --store soil_history/   # 計測用の合成データ
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from logic.constants import SOIL_REFERENCE_RANGES
+
+
+# 保存先（環境変数で上書き可能）
+DEFAULT_SOIL_HISTORY_PATH = Path(
+    os.environ.get(
+        "FERT_SOIL_HISTORY_PATH",
+        Path.home() / ".fertilization-design" / "soil_history",
+    )
+)
+
+# 要素（表示名）と列名
+SOIL_COLUMNS = {
+    "P": "p",
+    "K": "k",
+    "Ca": "ca",
+    "Mg": "mg",
+    "NO3-N": "no3_n",
+    "NH4-N": "nh4_n",
+}
+
+# 下限（MSLN）：P/K/Ca/Mg は設計の基準範囲の下限、NO₃-N はアプリの評価の MLSN。
+# NH₄-N は下限を設けない（NaN：下限までの年数を計算しない）
+MSLN_FLOORS: Dict[str, float] = {
+    **{key: low for key, (low, _high) in SOIL_REFERENCE_RANGES.items()},
+    "NO3-N": 5.0,
+    "NH4-N": math.nan,
+}
+
+# 傾きを計算する最少の件数（要素ごと）
+MIN_SAMPLES = 3
+# 外れ値を判定する最少の件数（要素ごと）
+OUTLIER_MIN_SAMPLES = 5
+# 外れ値とするロバストZ値（Iglewicz-Hoaglin の 3.5）
+OUTLIER_Z = 3.5
+
+_DAYS_PER_YEAR = 365.25
+
+# 読み込み時に受け付ける列名（英語・日本語）
+COLUMN_ALIASES = {
+    "site_id": ["site_id", "サイト", "サイト名", "グリーン"],
+    "course": ["course", "コース", "施設"],
+    "sampled_on": ["sampled_on", "date", "採取日", "分析日"],
+    "p": ["p", "P", "リン酸", "可給態リン酸"],
+    "k": ["k", "K", "カリ", "交換性カリ"],
+    "ca": ["ca", "Ca", "カルシウム"],
+    "mg": ["mg", "Mg", "マグネシウム"],
+    "no3_n": ["no3_n", "NO3-N", "NO3_N", "硝酸態窒素"],
+    "nh4_n": ["nh4_n", "NH4-N", "NH4_N", "アンモニア態窒素"],
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("土壌分析値の履歴には pyarrow が必要です（pip install pyarrow）")
+    return pa
+
+
+def soil_schema():
+    pa = _require_pyarrow()
+    return pa.schema(
+        [
+            ("site_id", pa.string()),
+            ("course", pa.string()),
+            ("sampled_on", pa.date32()),
+        ]
+        + [(column, pa.float64()) for column in SOIL_COLUMNS.values()]
+    )
+
+
+def normalize_table(table):
+    """
+    列名を内部の名前にそろえ、型を soil_schema に合わせる（ない要素の列・コースは空で補う）
+
+    Raises:
+        ValueError: site_id・採取日の列がない場合
+    """
+    pa = _require_pyarrow()
+    renamed = {}
+    for name in table.column_names:
+        for column, aliases in COLUMN_ALIASES.items():
+            if name in aliases and column not in renamed.values():
+                renamed[name] = column
+                break
+    table = table.rename_columns([renamed.get(name, name) for name in table.column_names])
+    missing = [c for c in ("site_id", "sampled_on") if c not in table.column_names]
+    if missing:
+        raise ValueError(f"必須の列がありません: {', '.join(missing)}")
+
+    schema = soil_schema()
+    columns = []
+    for field in schema:
+        if field.name in table.column_names:
+            column = table[field.name]
+            if field.name == "sampled_on" and pa.types.is_string(column.type):
+                column = column.cast(pa.timestamp("s"))
+            columns.append(column.cast(field.type))
+        elif field.name == "course":
+            columns.append(pa.array([""] * table.num_rows, pa.string()))
+        else:
+            columns.append(pa.nulls(table.num_rows, field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def fill_course(table, course: str):
+    """
+    コースが空欄（null・空文字列）の行にだけ course を入れる（normalize_table でそろえた表）
+    """
+    import pyarrow.compute as pc
+
+    column = table["course"]
+    # null との比較は null になるため、空文字列にそろえてから比べる
+    missing = pc.equal(pc.fill_null(column, ""), "")
+    filled = pc.if_else(missing, course, column)
+    return table.set_column(table.schema.get_field_index("course"), "course", filled)
+
+
+def read_soil_file(path: Union[str, os.PathLike]):
+    """
+    土壌分析値のファイル（.csv / .parquet）を読み込む
+    """
+    _require_pyarrow()
+    suffix = Path(path).suffix.lower()
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+    elif suffix == ".csv":
+        import pyarrow.csv as pacsv
+
+        table = pacsv.read_csv(path)
+    else:
+        raise ValueError(f"未対応の形式です: {suffix}（.csv / .parquet）")
+    return normalize_table(table)
+
+
+class SoilHistory:
+    """
+    土壌分析値の履歴（Parquet ファイルのディレクトリ）
+    """
+
+    def __init__(self, path: Union[str, os.PathLike] = DEFAULT_SOIL_HISTORY_PATH):
+        self.path = Path(path)
+
+    def parts(self) -> List[Path]:
+        if not self.path.is_dir():
+            return []
+        return sorted(self.path.glob("part-*.parquet"))
+
+    def append(self, table) -> int:
+        """
+        分析値を追加する（列名・型は normalize_table でそろえる）
+
+        Returns:
+            追加した件数
+        """
+        import pyarrow.parquet as pq
+
+        table = normalize_table(table)
+        if table.num_rows == 0:
+            return 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        name = f"part-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        # 読み込み中のプロセスに書きかけのファイルを見せない
+        tmp_path = self.path / f".{name}.tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, self.path / name)
+        return table.num_rows
+
+    def append_records(self, records: List[Dict[str, Any]]) -> int:
+        """
+        分析値の辞書（{"site_id", "course", "sampled_on", "P", "K", ...}）のリストを追加する
+        """
+        pa = _require_pyarrow()
+        return self.append(pa.Table.from_pylist(records))
+
+    def read(self, columns: Optional[List[str]] = None, course: Optional[str] = None):
+        """
+        履歴を1つの Arrow の表として読み込む
+
+        Args:
+            columns: 読み込む列（省略時はすべて）
+            course: コースで絞り込む
+        """
+        pa = _require_pyarrow()
+        import pyarrow.parquet as pq
+
+        parts = self.parts()
+        if not parts:
+            empty = soil_schema().empty_table()
+            return empty if columns is None else empty.select(columns)
+        filters = [("course", "=", course)] if course is not None else None
+        tables = [pq.read_table(part, columns=columns, filters=filters, schema=soil_schema()) for part in parts]
+        return pa.concat_tables(tables)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        件数・サイト数・期間・ファイルサイズを返す
+        """
+        import pyarrow.compute as pc
+
+        table = self.read(["site_id", "course", "sampled_on"])
+        sites = table.group_by(["course", "site_id"]).aggregate([]).num_rows if table.num_rows else 0
+        dates = pc.min_max(table["sampled_on"]).as_py() if table.num_rows else {"min": None, "max": None}
+        parts = self.parts()
+        return {
+            "path": str(self.path),
+            "tests": table.num_rows,
+            "sites": sites,
+            "first": dates["min"],
+            "last": dates["max"],
+            "files": len(parts),
+            "file_bytes": sum(p.stat().st_size for p in parts),
+        }
+
+
+# ── 傾向の分析 ──
+
+def _group_medians(groups: np.ndarray, values: np.ndarray, valid: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    グループごとの中央値（valid の値だけ、件数0のグループは NaN）
+    """
+    keyed = np.where(valid, values, np.inf)
+    order = np.lexsort((keyed, groups))
+    counts = np.bincount(groups, weights=valid, minlength=n_groups).astype(np.int64)
+    starts = np.concatenate(([0], np.cumsum(np.bincount(groups, minlength=n_groups))[:-1]))
+    has = counts > 0
+    sorted_values = keyed[order]
+    lower = sorted_values[starts[has] + (counts[has] - 1) // 2]
+    upper = sorted_values[starts[has] + counts[has] // 2]
+    medians = np.full(n_groups, np.nan)
+    medians[has] = (lower + upper) / 2
+    return medians
+
+
+def analyze_trends(
+    table,
+    floors: Optional[Dict[str, float]] = None,
+    min_samples: int = MIN_SAMPLES,
+    outlier_z: float = OUTLIER_Z,
+) -> Dict[str, Any]:
+    """
+    全サイトの傾向をまとめて計算する
+
+    Args:
+        table: SoilHistory.read の戻り値（normalize_table でそろえた表）
+        floors: 要素ごとの下限（省略時は MSLN_FLOORS）
+        min_samples: 傾きを計算する最少の件数（要素ごと、少ないサイトの傾きは NaN）
+        outlier_z: 外れ値とするロバストZ値
+
+    Returns:
+        {
+            "sites": {                         # サイトごとの列（配列の i 番目が同じサイト）
+                "course", "site_id", "samples", "first", "last",
+                "{列名}_slope",                # 傾き（mg/100g/年）
+                "{列名}_latest",               # 最新の分析値
+                "{列名}_trend",                # 傾向線の最新の採取日での値
+                "{列名}_years_to_floor",       # 下限を下回るまでの年数
+                "{列名}_outliers",             # 外れ値の件数
+            },
+            "outliers": {                      # 外れ値の分析値（1件1行）
+                "course", "site_id", "sampled_on", "nutrient", "value", "trend", "z",
+            },
+        }
+    """
+    pa = _require_pyarrow()
+    import pyarrow.compute as pc
+
+    floors = {**MSLN_FLOORS, **(floors or {})}
+
+    # サイト（コース・サイト識別子の組）の番号
+    course_codes = pc.dictionary_encode(table["course"].fill_null("")).combine_chunks()
+    site_codes = pc.dictionary_encode(table["site_id"]).combine_chunks()
+    combined = (
+        course_codes.indices.to_numpy(zero_copy_only=False).astype(np.int64) * len(site_codes.dictionary)
+        + site_codes.indices.to_numpy(zero_copy_only=False)
+    )
+    unique_keys, groups = np.unique(combined, return_inverse=True)
+    n_groups = len(unique_keys)
+    course_names = np.asarray(course_codes.dictionary.to_pylist(), dtype=object)
+    site_names = np.asarray(site_codes.dictionary.to_pylist(), dtype=object)
+
+    days = table["sampled_on"].cast(pa.int32()).to_numpy(zero_copy_only=False).astype(np.float64)
+
+    # サイト・採取日の順に並べる（サイトごとの範囲は starts から counts 件）
+    order = np.lexsort((days, groups))
+    groups = groups[order]
+    years = days[order] / _DAYS_PER_YEAR
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = np.arange(len(groups))
+
+    sites: Dict[str, np.ndarray] = {
+        "course": course_names[unique_keys // len(site_names)] if n_groups else np.array([], dtype=object),
+        "site_id": site_names[unique_keys % len(site_names)] if n_groups else np.array([], dtype=object),
+        "samples": counts,
+        "first": days[order][starts].astype("datetime64[D]") if n_groups else np.array([], "datetime64[D]"),
+        "last": days[order][starts + counts - 1].astype("datetime64[D]") if n_groups else np.array([], "datetime64[D]"),
+    }
+    outlier_parts = []
+
+    for nutrient, column in SOIL_COLUMNS.items():
+        values = table[column].to_numpy(zero_copy_only=False).astype(np.float64)[order]
+        valid = ~np.isnan(values)
+        weight = valid.astype(np.float64)
+        safe = np.where(valid, values, 0.0)
+
+        # 採取時期を中心化した最小二乗（Σ(t-t̄)(y-ȳ) / Σ(t-t̄)²）
+        n = np.bincount(groups, weights=weight, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t_mean = np.bincount(groups, weights=weight * years, minlength=n_groups) / n
+            y_mean = np.bincount(groups, weights=safe, minlength=n_groups) / n
+            t_centered = np.where(valid, years - t_mean[groups], 0.0)
+            s_tt = np.bincount(groups, weights=t_centered * t_centered, minlength=n_groups)
+            s_ty = np.bincount(groups, weights=t_centered * safe, minlength=n_groups)
+            slope = np.where((n >= min_samples) & (s_tt > 0), s_ty / s_tt, np.nan)
+
+        # 最新の分析値（サイト内で最後の有効な値の位置）
+        last_valid = (
+            np.maximum.reduceat(np.where(valid, positions, -1), starts) if n_groups else np.array([], np.int64)
+        )
+        has_value = last_valid >= 0
+        latest = np.full(n_groups, np.nan)
+        latest[has_value] = values[last_valid[has_value]]
+        trend = np.full(n_groups, np.nan)
+        trend[has_value] = y_mean[has_value] + slope[has_value] * (years[last_valid[has_value]] - t_mean[has_value])
+        current = np.where(np.isnan(trend), latest, trend)
+
+        floor = floors.get(nutrient, math.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            to_floor = np.where(
+                current <= floor, 0.0, np.where(slope < 0, (current - floor) / -slope, np.inf)
+            )
+        to_floor[np.isnan(slope) & ~(current <= floor)] = np.nan
+        if math.isnan(floor):
+            to_floor[:] = np.nan
+
+        # 外れ値：傾向線からの残差のロバストZ値（0.6745 × 残差 / 残差の絶対値の中央値）
+        fitted = y_mean[groups] + slope[groups] * (years - t_mean[groups])
+        checked = valid & (n[groups] >= OUTLIER_MIN_SAMPLES) & ~np.isnan(fitted)
+        residual = np.where(checked, values - fitted, 0.0)
+        mad = _group_medians(groups, np.abs(residual), checked, n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.where(checked & (mad[groups] > 0), 0.6745 * residual / mad[groups], 0.0)
+        is_outlier = np.abs(z) > outlier_z
+
+        sites[f"{column}_slope"] = slope
+        sites[f"{column}_latest"] = latest
+        sites[f"{column}_trend"] = trend
+        sites[f"{column}_years_to_floor"] = to_floor
+        sites[f"{column}_outliers"] = np.bincount(groups[is_outlier], minlength=n_groups)
+
+        rows = np.flatnonzero(is_outlier)
+        outlier_parts.append({
+            "course": sites["course"][groups[rows]],
+            "site_id": sites["site_id"][groups[rows]],
+            "sampled_on": days[order][rows].astype("datetime64[D]"),
+            "nutrient": np.full(len(rows), nutrient, dtype=object),
+            "value": values[rows],
+            "trend": fitted[rows],
+            "z": z[rows],
+        })
+
+    outliers = {
+        key: np.concatenate([part[key] for part in outlier_parts]) for key in outlier_parts[0]
+    }
+    return {"sites": sites, "outliers": outliers}
+
+
+def project_soil_values(
+    trends: Dict[str, Any],
+    years_ahead: float = 1.0,
+    course: Optional[str] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    傾向線を years_ahead 年先に延ばした P/K/Ca/Mg を、設計の土壌診断値の形で返す
+
+    傾きのないサイト（件数不足）は最新の分析値をそのまま使う。値は 0 未満にしない。
+
+    Args:
+        trends: analyze_trends の戻り値
+        years_ahead: 最新の採取日から何年先の値にするか
+        course: コースで絞り込む（省略時は全コース、同じ site_id は後のコースが優先）
+
+    Returns:
+        {site_id: {"P": ..., "K": ..., "Ca": ..., "Mg": ...}}（build_site_design の soil_values）
+    """
+    sites = trends["sites"]
+    selected = np.ones(len(sites["site_id"]), dtype=bool) if course is None else sites["course"] == course
+    projected = {}
+    for key in SOIL_REFERENCE_RANGES:
+        column = SOIL_COLUMNS[key]
+        slope = sites[f"{column}_slope"]
+        value = np.where(
+            np.isnan(slope), sites[f"{column}_latest"], sites[f"{column}_trend"] + slope * years_ahead
+        )
+        projected[key] = np.maximum(value, 0.0)
+    return {
+        str(site_id): {
+            key: float(projected[key][i]) for key in SOIL_REFERENCE_RANGES if not np.isnan(projected[key][i])
+        }
+        for i, site_id in zip(np.flatnonzero(selected), sites["site_id"][selected])
+    }
+
+
+def trends_table(columns: Dict[str, np.ndarray]):
+    """
+    analyze_trends の "sites" / "outliers" を Arrow の表にする（書き出し用）
+    """
+    pa = _require_pyarrow()
+    return pa.table({name: pa.array(values) for name, values in columns.items()})
+
+
+def _write_table(table, path: Path) -> None:
+    if path.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, path)
+    else:
+        import pyarrow.csv as pacsv
+
+        pacsv.write_csv(table, path)
+
+
+# ── 計測用の合成データ ──
+
+def synthetic_history(
+    sites: int = 1000,
+    years: int = 20,
+    tests_per_year: int = 4,
+    seed: int = 0,
+    end: Optional[date] = None,
+):
+    """
+    計測・確認用の土壌分析値の履歴を作る
+
+    サイトごとに初期値・年あたりの増減を決め、季節変動と測定誤差を加える。
+    約1%の分析値は外れ値（3〜5倍）にする。
+    """
+    pa = _require_pyarrow()
+    rng = np.random.default_rng(seed)
+    end = end or date.today()
+    per_site = years * tests_per_year
+    total = sites * per_site
+
+    start_day = (np.datetime64(end, "D") - np.timedelta64(int(years * _DAYS_PER_YEAR), "D")).astype(np.int64)
+    offsets = np.arange(per_site) * (_DAYS_PER_YEAR / tests_per_year)
+    jitter = rng.integers(-10, 11, size=total)
+    days = (start_day + np.tile(offsets, sites) + jitter).astype(np.int32)
+    t = (days - start_day) / _DAYS_PER_YEAR
+    site_index = np.repeat(np.arange(sites), per_site)
+
+    columns: Dict[str, Any] = {
+        "site_id": pa.array([f"G{i:05d}" for i in site_index], pa.string()),
+        "course": pa.array([f"C{i // 18:04d}" for i in site_index], pa.string()),
+        "sampled_on": pa.array(days, pa.int32()).cast(pa.date32()),
+    }
+    bases = {"P": 20.0, "K": 20.0, "Ca": 300.0, "Mg": 30.0, "NO3-N": 8.0, "NH4-N": 3.0}
+    for nutrient, column in SOIL_COLUMNS.items():
+        base = bases[nutrient]
+        initial = rng.normal(base, base * 0.25, size=sites).clip(base * 0.2)
+        drift = rng.normal(0.0, base * 0.02, size=sites)
+        seasonal = base * 0.05 * np.sin(2 * np.pi * t)
+        noise = rng.normal(0.0, base * 0.05, size=total)
+        values = initial[site_index] + drift[site_index] * t + seasonal + noise
+        spikes = rng.random(total) < 0.01
+        values[spikes] *= rng.uniform(3.0, 5.0, size=spikes.sum())
+        columns[column] = pa.array(np.round(values.clip(0.0), 2))
+    return pa.table(columns, schema=soil_schema())
+
+
+def _print_counts(trends: Dict[str, Any]) -> None:
+    sites = trends["sites"]
+    print(f"{len(sites['site_id']):,} サイト、外れ値 {len(trends['outliers']['value']):,} 件", file=sys.stderr)
+    for nutrient, column in SOIL_COLUMNS.items():
+        to_floor = sites[f"{column}_years_to_floor"]
+        declining = np.count_nonzero(sites[f"{column}_slope"] < 0)
+        below = np.count_nonzero(to_floor == 0)
+        within5 = np.count_nonzero((to_floor > 0) & (to_floor <= 5))
+        print(f"{nutrient}\t減少 {declining:,}\t下限未満 {below:,}\t5年以内に下限 {within5:,}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m storage.soil_history", description="土壌分析値の履歴（Parquet）")
+    parser.add_argument("--store", type=Path, default=DEFAULT_SOIL_HISTORY_PATH, help="履歴のディレクトリ")
+    commands = parser.add_subparsers(dest="command", required=True)
+    p_import = commands.add_parser("import", help="分析値のファイル（.csv / .parquet）を追加する")
+    p_import.add_argument("input", type=Path)
+    p_import.add_argument("--course", help="コース（ファイルにコースの列がない行・空欄の行に入れる）")
+    commands.add_parser("stats", help="件数・サイト数・期間")
+    p_trends = commands.add_parser("trends", help="傾き・下限までの年数・外れ値")
+    p_trends.add_argument("--course")
+    p_trends.add_argument("--out", type=Path, help="サイトごとの傾向（.csv / .parquet）")
+    p_trends.add_argument("--outliers", type=Path, help="外れ値の分析値（.csv / .parquet）")
+    p_synth = commands.add_parser("synth", help="計測用の合成データを追加する")
+    p_synth.add_argument("--sites", type=int, default=1000)
+    p_synth.add_argument("--years", type=int, default=20)
+    p_synth.add_argument("--tests-per-year", type=int, default=4)
+    p_synth.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    history = SoilHistory(args.store)
+    started = time.perf_counter()
+    try:
+        if args.command == "import":
+            table = read_soil_file(args.input)
+            if args.course:
+                table = fill_course(table, args.course)
+            print(f"{history.append(table):,} 件を追加しました", file=sys.stderr)
+        elif args.command == "synth":
+            table = synthetic_history(args.sites, args.years, args.tests_per_year, args.seed)
+            print(f"{history.append(table):,} 件を追加しました", file=sys.stderr)
+        elif args.command == "stats":
+            for name, value in history.stats().items():
+                print(f"{name}: {value}")
+        else:
+            trends = analyze_trends(history.read(course=args.course))
+            if args.out:
+                _write_table(trends_table(trends["sites"]), args.out)
+            if args.outliers:
+                _write_table(trends_table(trends["outliers"]), args.outliers)
+            _print_counts(trends)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(f"{(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
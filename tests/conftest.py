@@ -0,0 +1,41 @@
+"""
+テスト共通の設定
+
+施肥量計算のメモ・施肥設計の履歴・土壌診断の履歴は既定でホームディレクトリに作られるため、
+モジュールを読み込む前に保存先を一時ディレクトリに向ける。
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+_STORE_DIR = Path(tempfile.mkdtemp(prefix="fert-tests-"))
+os.environ.setdefault("FERT_DESIGN_MEMO_PATH", str(_STORE_DIR / "design_memo.sqlite3"))
+os.environ.setdefault("FERT_DESIGN_HISTORY_PATH", str(_STORE_DIR / "history.sqlite3"))
+os.environ.setdefault("FERT_SOIL_HISTORY_PATH", str(_STORE_DIR / "soil_history"))
+
+from tools import workload  # noqa: E402
+
+
+@pytest.fixture
+def sites_csv(tmp_path):
+    """
+    合成データのサイト一覧（CSV）を作る関数（末尾に入力エラーの行を bad 行加える）
+    """
+
+    def make(n=200, bad=2, name="sites.csv"):
+        path = tmp_path / name
+        workload.write_corpus(path, n, seed=1)
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            for i in range(bad):
+                f.write(f"bad-{i},35.0,139.0,不明な芝種,ゴルフ場,中,中間,春重点50,30,20,250,30\n")
+        return path
+
+    return make
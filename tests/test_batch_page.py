@@ -0,0 +1,44 @@
+import time
+import uuid
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+from batch import BatchProgress, read_site_table, run_batch_job
+from export import get_scheduler
+
+PAGE = str(Path(__file__).resolve().parent.parent / "pages" / "1_一括計算.py")
+
+HEADER = "サイト,緯度,経度,芝種区分,利用形態,管理強度,施肥スタンス,配分スタンス,P,K,Ca,Mg\n"
+
+
+def _finished_batch(csv):
+    rows = read_site_table((HEADER + csv).encode("utf-8"), "sites.csv")
+    progress = BatchProgress(len(rows))
+    user = uuid.uuid4().hex
+    job_id = get_scheduler().submit(run_batch_job, user=user, kind="batch", args=(rows, progress))
+    deadline = time.monotonic() + 30
+    while not get_scheduler().get(job_id).is_finished and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return user, {"job_id": job_id, "progress": progress, "filename": "sites.csv", "course": "", "exports": {}}
+
+
+def test_duplicate_site_ids_are_selected_by_position():
+    user, batch = _finished_batch(
+        "A,35.7,139.8,寒地型（ゴルフグリーン）,ゴルフ場,高,中央,春重点50,12,80,600,90\n"
+        "A,26.2,127.7,暖地型（暖地芝グリーン）,ゴルフ場,中,下限寄り,GP準拠,8,60,500,70\n"
+    )
+    at = AppTest.from_file(PAGE, default_timeout=30)
+    at.session_state["_session_user"] = user
+    at.session_state["batch_job"] = batch
+    at.run()
+    assert not at.exception
+
+    select = at.selectbox(key="batch_site")
+    assert select.options == ["A（1件目）", "A（2件目）"]
+    first = at.dataframe[-1].value
+    select.set_value(1).run()
+    second = at.dataframe[-1].value
+    assert not first.equals(second)
+    assert batch["progress"].get_design(1) is batch["progress"].designs()[1]
+    assert batch["progress"].get_design(2) is None
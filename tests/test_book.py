@@ -0,0 +1,62 @@
+import io
+import os
+
+from batch import parse_site_row
+from export.jobs import ExportScheduler, report_book_job
+from logic.design import build_site_design
+from pdf.book import main, write_report_book
+from tools import workload
+
+FONT_CSS = "@font-face { font-family: 'BookTestFont'; src: url(data:font/woff2;base64,AAAA); }"
+
+
+def _designs(n, seed=6):
+    return [build_site_design(**parse_site_row(row)) for row in workload.iter_rows(n, seed)]
+
+
+def _render(designs, **kwargs):
+    out = io.BytesIO()
+    count = write_report_book(designs, out, **kwargs)
+    return count, out.getvalue().decode("utf-8")
+
+
+def test_shared_resources_appear_once():
+    designs = _designs(4)
+    count, html = _render(designs, facility_name="テストCC", font_face_css=FONT_CSS)
+
+    assert count == 4
+    assert html.count("BookTestFont'; src:") == 1
+    assert html.count("@font-face") == 1
+    assert html.count("<style>") == 1
+    assert html.count("@page {") == 1
+    assert html.count('id="book-chart-frame"') == 1
+    assert html.count('<use href="#book-chart-frame"') == 4
+    for design in designs:
+        assert f"<td>{design['site_id']}</td>" in html
+    assert "テストCC" in html
+
+
+def test_subset_font_is_embedded_at_most_once():
+    _, html = _render(_designs(3))
+    assert html.count("@font-face") <= 1
+
+
+def test_report_book_job_writes_html_file():
+    scheduler = ExportScheduler(workers=1)
+    try:
+        designs = _designs(3)
+        path = scheduler.run(report_book_job, user="u", kind="book", args=(designs, len(designs)),
+                             kwargs={"facility_name": "テストCC"}, timeout=60)
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        assert html.count('<use href="#book-chart-frame"') == 3
+        os.unlink(path)
+    finally:
+        scheduler.shutdown()
+
+
+def test_command_line(sites_csv, tmp_path):
+    source = sites_csv(n=5, bad=1)
+    out = tmp_path / "book.html"
+    assert main([str(source), "--out", str(out), "--facility", "テストCC"]) == 0
+    assert out.read_text(encoding="utf-8").count('<use href="#book-chart-frame"') == 5
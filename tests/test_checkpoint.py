@@ -0,0 +1,119 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from batch.checkpoint import WORK_DIR_NAME, CheckpointMismatch, Ledger, compare_outputs
+from batch.pipeline import run_file_batch
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class _Stop(Exception):
+    pass
+
+
+def _stop_after(chunks):
+    seen = []
+
+    def progress(done, errors):
+        seen.append(done)
+        if len(seen) == chunks:
+            raise _Stop()
+
+    return progress
+
+
+def _kill_after(source, out_dir, chunks, chunk_size):
+    # chunks 個目のチャンクの完了直後にプロセスを強制終了する（finally も atexit も走らない）
+    script = textwrap.dedent(f"""
+        import os
+        from batch.pipeline import run_file_batch
+
+        seen = []
+
+        def progress(done, errors):
+            seen.append(done)
+            if len(seen) == {chunks}:
+                os._exit(9)
+
+        run_file_batch({str(source)!r}, {str(out_dir)!r}, chunk_size={chunk_size}, use_memo=False, progress=progress)
+    """)
+    proc = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=os.environ.copy())
+    assert proc.returncode == 9
+
+
+def test_resume_after_kill_matches_uninterrupted_run(sites_csv, tmp_path):
+    source = sites_csv(n=200, bad=2)
+    run_file_batch(source, tmp_path / "reference", chunk_size=40, use_memo=False)
+
+    _kill_after(source, tmp_path / "out", chunks=2, chunk_size=40)
+    manifest = json.loads((tmp_path / "out" / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["completed"] is False
+
+    result = run_file_batch(source, tmp_path / "out", chunk_size=40, use_memo=False)
+
+    assert result["resumed_chunks"] == 2
+    assert (result["sites"], result["errors"], result["chunks"]) == (200, 2, 6)
+    assert compare_outputs(tmp_path / "reference", tmp_path / "out", "parquet") == []
+
+
+def test_resume_after_exception(sites_csv, tmp_path):
+    source = sites_csv(n=120, bad=0)
+    with pytest.raises(_Stop):
+        run_file_batch(source, tmp_path / "out", chunk_size=30, use_memo=False, progress=_stop_after(3))
+
+    result = run_file_batch(source, tmp_path / "out", chunk_size=30, use_memo=False, verify=True)
+    assert result["resumed_chunks"] == 3
+    assert result["verified"] is True
+
+
+def test_torn_ledger_and_damaged_part_are_recomputed(sites_csv, tmp_path):
+    source = sites_csv(n=120, bad=1)
+    out_dir = tmp_path / "out"
+    with pytest.raises(_Stop):
+        run_file_batch(source, out_dir, chunk_size=30, use_memo=False, progress=_stop_after(3))
+
+    work_dir = out_dir / WORK_DIR_NAME
+    ledger = Ledger(work_dir)
+    ledger.load()
+    damaged = ledger.files("plans")[0]
+    damaged.write_bytes(damaged.read_bytes()[:-8])
+    with open(work_dir / "ledger.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"chunk": 3, "sites"')
+
+    assert Ledger(work_dir).load() == [0]
+
+    result = run_file_batch(source, out_dir, chunk_size=30, use_memo=False, verify=True)
+    assert result["resumed_chunks"] == 2
+    assert result["verified"] is True
+
+
+def test_completed_run_is_not_recomputed(sites_csv, tmp_path):
+    source = sites_csv(n=60, bad=0)
+    run_file_batch(source, tmp_path / "out", chunk_size=20, use_memo=False)
+    again = run_file_batch(source, tmp_path / "out", chunk_size=20, use_memo=False)
+    assert again["resumed_chunks"] == again["chunks"] == 3
+    assert again["parts"] == 0
+
+
+def test_changed_conditions_refuse_to_resume(sites_csv, tmp_path):
+    source = sites_csv(n=60, bad=0)
+    with pytest.raises(_Stop):
+        run_file_batch(source, tmp_path / "out", chunk_size=20, use_memo=False, progress=_stop_after(1))
+
+    with pytest.raises(CheckpointMismatch):
+        run_file_batch(source, tmp_path / "out", chunk_size=10, use_memo=False)
+
+    with open(source, "a", encoding="utf-8") as f:
+        f.write("extra,35.0,139.0,不明な芝種,ゴルフ場,中,中間,春重点50,30,20,250,30\n")
+    with pytest.raises(CheckpointMismatch):
+        run_file_batch(source, tmp_path / "out", chunk_size=20, use_memo=False)
+
+    result = run_file_batch(source, tmp_path / "out", chunk_size=20, use_memo=False, restart=True)
+    assert result["resumed_chunks"] == 0
+    assert (result["sites"], result["errors"]) == (60, 1)
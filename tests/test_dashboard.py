@@ -0,0 +1,47 @@
+import pytest
+
+from batch.dashboard import (
+    STATUS_DEFICIT,
+    STATUS_EXCESS,
+    STATUS_OK,
+    DashboardIndex,
+    design_status,
+)
+from batch.pipeline import summary_row
+from logic.constants import FertilizerStance, GrassType, ManagementIntensity, UsageType
+from logic.design import build_site_design
+
+NORMAL = {"P": 20.0, "K": 20.0, "Ca": 300.0, "Mg": 30.0}
+
+
+def _design(site_id, **soil):
+    return build_site_design(
+        site_id,
+        GrassType.COOL_GREEN,
+        UsageType.GOLF,
+        ManagementIntensity.MEDIUM,
+        {**NORMAL, **soil},
+        FertilizerStance.CENTER,
+        use_memo=False,
+    )
+
+
+@pytest.mark.parametrize("soil, expected", [
+    ({}, STATUS_OK),
+    ({"K": 1.0}, STATUS_DEFICIT),
+    ({"P": 5.0}, STATUS_DEFICIT),
+    ({"Ca": 800.0}, STATUS_EXCESS),
+    ({"Mg": 90.0}, STATUS_EXCESS),
+    ({"P": 50.0}, STATUS_EXCESS),
+    # 不足と過剰が両方ある場合は不足を優先する
+    ({"K": 1.0, "Ca": 800.0}, STATUS_DEFICIT),
+])
+def test_design_status_from_soil_values(soil, expected):
+    assert design_status({**NORMAL, **soil}) == expected
+
+
+def test_status_reaches_dashboard_and_summary():
+    designs = [_design("ok"), _design("low-k", K=1.0), _design("high-ca", Ca=800.0), _design("high-mg", Mg=90.0)]
+    index = DashboardIndex(designs)
+    assert index.statuses == [STATUS_OK, STATUS_DEFICIT, STATUS_EXCESS, STATUS_EXCESS]
+    assert [summary_row(i, d)["status"] for i, d in enumerate(designs)] == index.statuses
@@ -0,0 +1,154 @@
+import uuid
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from batch import parse_site_row
+from batch.pipeline import run_file_batch
+from logic.design import build_site_design
+from logic.plan_state import PlanState
+from storage.history import DesignHistory, get_design_history, history_row
+from tools import workload
+
+
+def _designs(n, seed=5):
+    return [build_site_design(**parse_site_row(row)) for row in workload.iter_rows(n, seed)]
+
+
+@pytest.fixture
+def history(tmp_path):
+    store = DesignHistory(tmp_path / "history.sqlite3")
+    yield store
+    store.close()
+
+
+def test_latest_per_site_prefers_newest_then_highest_id(history):
+    a, b = _designs(2)
+    b = dict(b, site_id=a["site_id"])
+    rows = [
+        history_row(a, "run-1", 0, "course", "2026", "2026-04-01T10:00:00"),
+        history_row(a, "run-2", 0, "course", "2026", "2026-05-01T10:00:00"),
+        # 同じ日時（秒単位）で後から記録した設計
+        history_row(b, "run-3", 0, "course", "2026", "2026-05-01T10:00:00"),
+        history_row(a, "run-4", 0, "other", "2026", "2026-06-01T10:00:00"),
+    ]
+    assert history.insert_rows(rows) == 4
+
+    latest = history.latest_per_site("course")
+    assert [(r["run_id"], r["site_id"]) for r in latest] == [("run-3", a["site_id"])]
+    assert "_rank" not in latest[0]
+    assert [r["course"] for r in history.latest_per_site()] == ["course", "other"]
+
+
+def test_same_run_and_row_is_recorded_once(history):
+    designs = _designs(5)
+    rows = [history_row(d, "run-1", i, "course") for i, d in enumerate(designs)]
+    assert history.insert_rows(rows) == 5
+    assert history.insert_rows(rows[2:]) == 0
+    assert history.stats()["plans"] == 5
+
+
+def test_queries(history):
+    designs = _designs(40)
+    history.record_designs(designs, course="course", season="2026", run_id="run-1")
+
+    site = designs[3]["site_id"]
+    assert [r["site_id"] for r in history.plans_for_site(site)] == [site]
+    assert len(history.plans_for_course("course", season="2026")) == 40
+    assert history.plans_for_course("course", season="2025") == []
+
+    june = [d["calculation_results"]["N"]["monthly"][5] for d in designs]
+    threshold = sorted(june)[len(june) // 2]
+    found = history.plans_by_monthly_n(6, above=threshold)
+    assert len(found) == sum(v > threshold for v in june)
+    assert all(r["n_06"] > threshold for r in found)
+    assert found[0]["outputs"]["N"]["monthly"][5] == pytest.approx(found[0]["n_06"])
+    with pytest.raises(ValueError):
+        history.plans_by_monthly_n(13, above=1.0)
+
+
+def test_only_june_n_is_indexed(history):
+    history.stats()
+    indexes = {r["name"] for r in history._query("PRAGMA index_list(plans)")}
+    assert {name for name in indexes if name.startswith("plans_n_")} == {"plans_n_06"}
+    history._query("CREATE INDEX plans_n_01 ON plans (n_01)")
+    history.close()
+    # 以前の版で作った月のインデックスは開いたときに消す
+    assert "plans_n_01" not in {r["name"] for r in history._query("PRAGMA index_list(plans)")}
+    plan = history._query("EXPLAIN QUERY PLAN SELECT * FROM plans WHERE n_06 > 3.0")
+    assert any("plans_n_06" in r["detail"] for r in plan)
+
+
+def test_batch_records_history_only_when_asked(sites_csv, tmp_path):
+    source = sites_csv(n=60, bad=1)
+    course = uuid.uuid4().hex
+    run_file_batch(source, tmp_path / "off", chunk_size=20, use_memo=False, course=course)
+    assert get_design_history().plans_for_course(course) == []
+
+    run_file_batch(source, tmp_path / "on", chunk_size=20, use_memo=False, history=True, course=course)
+    assert len(get_design_history().plans_for_course(course)) == 60
+
+
+def test_resumed_batch_does_not_duplicate_history(sites_csv, tmp_path):
+    source = sites_csv(n=90, bad=0)
+    course = uuid.uuid4().hex
+
+    class Stop(Exception):
+        pass
+
+    def stop(done, errors):
+        if done >= 60:
+            raise Stop()
+
+    with pytest.raises(Stop):
+        run_file_batch(source, tmp_path / "out", chunk_size=30, use_memo=False, history=True, course=course,
+                       progress=stop)
+    run_file_batch(source, tmp_path / "out", chunk_size=30, use_memo=False, history=True, course=course)
+
+    rows = get_design_history().plans_for_course(course)
+    assert len(rows) == 90
+    assert len({r["run_id"] for r in rows}) == 1
+    assert sorted(r["row"] for r in rows) == sorted({r["row"] for r in rows})
+
+
+def test_plan_state_design_round_trips(history):
+    gp = {str(m): m / 12 for m in range(1, 13)}
+    plan = PlanState(gp, [1 / 12] * 12)
+    plan.set_fertilizer("K", 10.0)
+    input_data = {
+        "grass_type": "寒地型芝", "usage_type": "ゴルフ場", "management_intensity": "中",
+        "fertilizer_stance": "中間", "distribution_stance": "春重点50", "latitude": 35.0, "longitude": 139.0,
+        "soil_values": {"P": 20.0, "K": 5.0, "Ca": 300.0, "Mg": 30.0},
+    }
+    design = plan.to_design("単一サイト", input_data, {"N": 0.21, "K": 0.60})
+    history.record_designs([design], run_id="run-1", rows=[None])
+
+    (row,) = history.plans_for_site("単一サイト")
+    assert row["annual_k"] == pytest.approx(60.0)
+    assert row["annual_n"] == 0.0
+    assert row["soil_k"] == 5.0
+    assert row["n_06"] == 0.0
+    assert row["outputs"]["K"]["position"] == "不足補正"
+    assert row["outputs"]["gp_values"][5] == pytest.approx(0.5)
+
+
+def _set_soil_k(at, value):
+    next(n for n in at.number_input if n.label.startswith("交換性カリ")).set_value(value)
+    return at.run()
+
+
+@pytest.mark.parametrize("enabled", ["1", "0"])
+def test_app_records_computed_plan(monkeypatch, enabled):
+    monkeypatch.setenv("FERT_DESIGN_HISTORY", enabled)
+    history = get_design_history()
+    before = len(history.plans_for_site("単一サイト"))
+
+    at = AppTest.from_file(str(Path(__file__).parent.parent / "app.py"), default_timeout=60).run()
+    assert len(history.plans_for_site("単一サイト")) == before  # 土壌分析値が未入力
+    _set_soil_k(at, 5.0).run()  # 同じ入力の再実行は記録しない
+    _set_soil_k(at, 6.0)
+    assert not at.exception
+
+    recorded = len(history.plans_for_site("単一サイト")) - before
+    assert recorded == (2 if enabled == "1" else 0)
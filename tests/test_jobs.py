@@ -0,0 +1,58 @@
+import os
+import time
+
+import pytest
+
+from export import jobs
+from export.jobs import CANCELLED, DONE, ExportScheduler, _write_temp_file
+
+
+def _temp_file_job(job):
+    return _write_temp_file(job, ".txt", lambda f: f.write(b"result"))
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def scheduler(request):
+    store = ExportScheduler(workers=1, **getattr(request, "param", {}))
+    yield store
+    store.shutdown()
+
+
+def test_cancelling_finished_job_deletes_its_file(scheduler):
+    path = scheduler.run(_temp_file_job, user="u", kind="txt", timeout=10)
+    job_id = scheduler.jobs_for("u")[-1].id
+    assert os.path.exists(path)
+
+    assert scheduler.cancel(job_id)
+    assert not os.path.exists(path)
+    assert scheduler.get(job_id).status == CANCELLED
+    assert scheduler.get(job_id).result is None
+    assert not scheduler.cancel(job_id)
+
+
+@pytest.mark.parametrize("scheduler", [{"retention_sec": 0.05}], indirect=True)
+def test_get_purges_expired_jobs(scheduler):
+    path = scheduler.run(_temp_file_job, user="u", kind="txt", timeout=10)
+    job_id = scheduler.jobs_for("u")[-1].id
+    assert scheduler.get(job_id).status == DONE
+    time.sleep(0.1)
+    assert scheduler.get(job_id) is None
+    assert not os.path.exists(path)
+
+
+def test_idle_workers_purge_expired_jobs(monkeypatch):
+    monkeypatch.setattr(jobs, "PURGE_INTERVAL_SEC", 0.02)
+    scheduler = ExportScheduler(workers=1, retention_sec=0.05)
+    try:
+        path = scheduler.run(_temp_file_job, user="u", kind="txt", timeout=10)
+        assert _wait_until(lambda: not os.path.exists(path))
+        assert scheduler.queue_depth() == 0
+    finally:
+        scheduler.shutdown()
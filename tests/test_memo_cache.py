@@ -0,0 +1,79 @@
+from batch import parse_site_row
+from logic import constants
+from logic.design import build_site_design
+from logic.fertilizer import calculate_fertilizer_requirements
+from storage.memo_cache import DesignMemo, cached_fertilizer_requirements, rules_hash
+from tools import workload
+
+
+def _inputs(n=50):
+    for row in workload.iter_rows(n, seed=2):
+        site = parse_site_row(row)
+        site.pop("site_id")
+        yield site
+
+
+def test_memo_round_trip_equals_direct_computation(tmp_path):
+    memo = DesignMemo(tmp_path / "memo.sqlite3")
+    sites = list(_inputs())
+    for site in sites:
+        memo.put(memo.key(**site), calculate_fertilizer_requirements(**site))
+    memo.close()
+
+    reopened = DesignMemo(tmp_path / "memo.sqlite3")
+    for site in sites:
+        assert reopened.get(reopened.key(**site)) == calculate_fertilizer_requirements(**site)
+    assert (reopened.hits, reopened.misses) == (len(sites), 0)
+
+
+def test_cached_requirements_equal_direct_computation():
+    for site in _inputs(20):
+        direct = calculate_fertilizer_requirements(**site)
+        assert cached_fertilizer_requirements(**site) == direct
+        # 2回目はメモから返る
+        assert cached_fertilizer_requirements(**site) == direct
+
+
+def test_site_design_with_and_without_memo():
+    for row in workload.iter_rows(20, seed=3):
+        site = parse_site_row(row)
+        first = build_site_design(**site, use_memo=True)
+        again = build_site_design(**site, use_memo=True)
+        assert first == again == build_site_design(**site, use_memo=False)
+
+
+def test_equal_numbers_share_a_key(tmp_path):
+    memo = DesignMemo(tmp_path / "memo.sqlite3")
+    site = next(_inputs(1))
+    as_int = dict(site, latitude=35)
+    as_float = dict(site, latitude=35.0)
+    assert memo.key(**as_int) == memo.key(**as_float)
+    assert memo.key(**as_float) != memo.key(**dict(site, latitude=35.1))
+
+
+def test_rule_fingerprint_is_part_of_the_key(monkeypatch):
+    before = rules_hash()
+    monkeypatch.setattr(constants, "rule_fingerprint", lambda: "changed-logic")
+    assert rules_hash() != before
+
+
+def test_results_from_other_rules_are_pruned(monkeypatch, tmp_path):
+    path = tmp_path / "memo.sqlite3"
+    site = next(_inputs(1))
+    memo = DesignMemo(path)
+    key = memo.key(**site)
+    memo.put(key, calculate_fertilizer_requirements(**site))
+    memo.close()
+
+    monkeypatch.setattr(constants, "rule_fingerprint", lambda: "changed-logic")
+    changed = DesignMemo(path)
+    assert changed.key(**site) != key
+    assert changed.get(changed.key(**site)) is None
+    assert changed.stats()["entries"] == 0
+
+
+def test_disabled_memo_computes_directly(monkeypatch):
+    monkeypatch.setenv("FERT_DESIGN_MEMO", "0")
+    site = next(_inputs(1))
+    assert cached_fertilizer_requirements(**site) == calculate_fertilizer_requirements(**site)
+
@@ -0,0 +1,61 @@
+import os
+import stat
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from batch.checkpoint import atomic_write, compare_outputs
+from batch.pipeline import run_file_batch
+
+
+def test_spilled_run_matches_unbounded_run(sites_csv, tmp_path):
+    source = sites_csv(n=200, bad=2)
+
+    unbounded = run_file_batch(source, tmp_path / "unbounded", chunk_size=1000, memory_limit=1 << 30, use_memo=False)
+    bounded = run_file_batch(source, tmp_path / "bounded", chunk_size=50, memory_limit=64 * 1024, use_memo=False)
+
+    assert unbounded["parts"] == 1
+    assert bounded["parts"] > bounded["chunks"] > 1
+    assert (bounded["sites"], bounded["errors"]) == (unbounded["sites"], unbounded["errors"]) == (200, 2)
+    assert compare_outputs(tmp_path / "unbounded", tmp_path / "bounded", "parquet") == []
+
+
+def test_outputs_keep_input_order(sites_csv, tmp_path):
+    source = sites_csv(n=120, bad=1)
+    run_file_batch(source, tmp_path / "out", chunk_size=25, memory_limit=32 * 1024, use_memo=False)
+
+    summary = pq.read_table(tmp_path / "out" / "summary.parquet")
+    plans = np.load(tmp_path / "out" / "plans.npy")
+    assert summary.column("site_id").to_pylist() == [f"site-{i:05d}" for i in range(120)]
+    assert plans.shape == (120, 5, 12)
+    assert not (tmp_path / "out" / ".work").exists()
+
+
+def test_csv_summary_format(sites_csv, tmp_path):
+    source = sites_csv(n=60, bad=0)
+    run_file_batch(source, tmp_path / "a", chunk_size=1000, summary_format="csv", use_memo=False)
+    run_file_batch(source, tmp_path / "b", chunk_size=10, memory_limit=16 * 1024, summary_format="csv", use_memo=False)
+    assert compare_outputs(tmp_path / "a", tmp_path / "b", "csv") == []
+
+
+def test_atomic_write_uses_umask_mode(tmp_path):
+    umask = os.umask(0)
+    os.umask(umask)
+    path = tmp_path / "out.bin"
+    with atomic_write(path) as f:
+        f.write(b"data")
+    assert path.read_bytes() == b"data"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o666 & ~umask
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("old")
+    try:
+        with atomic_write(path, "w") as f:
+            f.write("new")
+            raise RuntimeError("interrupted")
+    except RuntimeError:
+        pass
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["out.txt"]
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+
+from batch import parse_site_row
+from logic.design import build_site_design
+from storage.plan_store import (
+    HEADER_SIZE,
+    NUTRIENTS,
+    RECORD_DTYPE,
+    PlanStore,
+    PlanStoreWriter,
+    read_header,
+    write_plan_store,
+)
+from tools import workload
+
+
+def _designs(n, seed=4):
+    return [build_site_design(**parse_site_row(row)) for row in workload.iter_rows(n, seed)]
+
+
+def _expected(design):
+    results = design["calculation_results"]
+    return (
+        np.array([results[n]["annual_value"] for n in NUTRIENTS], dtype=np.float32),
+        np.array([results[n]["monthly"] for n in NUTRIENTS], dtype=np.float32),
+    )
+
+
+def test_records_match_designs(tmp_path):
+    designs = _designs(30)
+    path = tmp_path / "plans.fplan"
+    assert write_plan_store(path, designs) == 30
+
+    store = PlanStore(path)
+    assert len(store) == 30
+    for i, design in enumerate(designs):
+        plan = store.plan(i)
+        annual, monthly = _expected(design)
+        assert plan["site_id"] == design["site_id"]
+        np.testing.assert_array_equal(plan["annual"], annual)
+        np.testing.assert_array_equal(plan["monthly"], monthly)
+    assert store.find(designs[7]["site_id"]).tolist() == [7]
+    np.testing.assert_array_equal(store.monthly("N", 4), [_expected(d)[1][0, 3] for d in designs])
+    store.close()
+
+
+def test_torn_trailing_record_is_ignored_and_truncated_on_append(tmp_path):
+    designs = _designs(12)
+    path = tmp_path / "plans.fplan"
+    write_plan_store(path, designs[:8])
+    # 追記の途中で止まった半端なレコード
+    with open(path, "ab") as f:
+        f.write(b"\x7f" * (RECORD_DTYPE.itemsize // 2))
+
+    store = PlanStore(path)
+    assert len(store) == 8
+    store.close()
+
+    with PlanStoreWriter(path, append=True, buffer_records=3) as writer:
+        assert writer.count == 8
+        writer.extend(designs[8:])
+
+    assert os.path.getsize(path) == HEADER_SIZE + 12 * RECORD_DTYPE.itemsize
+    store = PlanStore(path)
+    assert [store.plan(i)["site_id"] for i in range(len(store))] == [d["site_id"] for d in designs]
+    np.testing.assert_array_equal(store.plan(11)["annual"], _expected(designs[11])[0])
+    store.close()
+
+
+def test_reader_sees_appended_records_after_refresh(tmp_path):
+    designs = _designs(6)
+    path = tmp_path / "plans.fplan"
+    write_plan_store(path, designs[:2])
+    store = PlanStore(path)
+    with PlanStoreWriter(path, append=True) as writer:
+        writer.extend(designs[2:])
+    assert len(store) == 2
+    assert store.refresh() == 6
+    store.close()
+
+
+def test_aborted_new_file_leaves_nothing(tmp_path):
+    path = tmp_path / "plans.fplan"
+    with pytest.raises(RuntimeError):
+        with PlanStoreWriter(path) as writer:
+            writer.extend(_designs(3))
+            raise RuntimeError("interrupted")
+    assert os.listdir(tmp_path) == []
+
+
+def test_empty_store_and_bad_header(tmp_path):
+    path = tmp_path / "plans.fplan"
+    write_plan_store(path, [])
+    assert len(PlanStore(path)) == 0
+    assert read_header(path)["record_size"] == RECORD_DTYPE.itemsize
+
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"NOTAPLAN" + b"\0" * 64)
+    with pytest.raises(ValueError):
+        PlanStore(other)
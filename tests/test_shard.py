@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from batch.checkpoint import compare_outputs
+from batch.pipeline import run_file_batch
+from batch.shard import LeaseTable, init_job, job_status, load_job, merge_job, run_worker
+
+
+def _job(sites_csv, tmp_path, n=230, bad=2, shard_size=50, chunk_size=20):
+    source = sites_csv(n=n, bad=bad)
+    job_dir = tmp_path / "job"
+    job = init_job(source, job_dir, shard_size=shard_size, chunk_size=chunk_size)
+    return source, job_dir, job
+
+
+def test_init_splits_input_into_shards(sites_csv, tmp_path):
+    source, job_dir, job = _job(sites_csv, tmp_path)
+    assert (job["shards"], job["rows"]) == (5, 232)
+    # 同じ入力なら既存のジョブを返す
+    assert init_job(source, job_dir, shard_size=50, chunk_size=20) == load_job(job_dir)
+
+
+def test_merge_matches_single_machine_run(sites_csv, tmp_path):
+    source, job_dir, job = _job(sites_csv, tmp_path)
+    run_file_batch(source, tmp_path / "single", chunk_size=20, use_memo=False)
+
+    first = run_worker(job_dir, "w1", max_shards=2, use_memo=False)
+    second = run_worker(job_dir, "w2", use_memo=False)
+    assert len(first["computed"]) == 2
+    assert sorted(first["computed"] + second["computed"]) == list(range(job["shards"]))
+
+    merged = merge_job(job_dir, tmp_path / "merged")
+    assert (merged["sites"], merged["errors"]) == (230, 2)
+    assert compare_outputs(tmp_path / "single", tmp_path / "merged", "parquet") == []
+
+
+def test_concurrent_workers_compute_each_shard_once(sites_csv, tmp_path):
+    source, job_dir, job = _job(sites_csv, tmp_path, n=300, bad=0)
+    results = []
+
+    def work(name):
+        results.append(run_worker(job_dir, name, poll_seconds=0.05, use_memo=False))
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    computed = sorted(k for r in results for k in r["computed"])
+    assert computed == list(range(job["shards"]))
+    assert job_status(job_dir)["done"] == job["shards"]
+
+    run_file_batch(source, tmp_path / "single", chunk_size=20, use_memo=False)
+    merge_job(job_dir, tmp_path / "merged")
+    assert compare_outputs(tmp_path / "single", tmp_path / "merged", "parquet") == []
+
+
+def test_lease_is_taken_over_after_expiry(sites_csv, tmp_path):
+    _, job_dir, _ = _job(sites_csv, tmp_path, n=60, bad=0)
+    leases = LeaseTable(job_dir, lease_seconds=0.3)
+
+    assert leases.try_acquire(0, "dead", None) == 1
+    assert leases.try_acquire(0, "other", leases.current().get(0)) is None
+
+    time.sleep(0.4)
+    assert leases.try_acquire(0, "other", leases.current().get(0)) == 2
+    # 同じ世代は1台しか取れない
+    assert leases.try_acquire(0, "third", {"generation": 1, "expires_at": 0}) is None
+    assert leases.current()[0]["owner"] == "other"
+    # 引き継がれた前の担当は延長できない
+    assert leases.renew(0, "dead", 1) is False
+    assert leases.renew(0, "other", 2) is True
+
+
+def test_worker_takes_over_expired_shard_and_clears_stale_tmp(sites_csv, tmp_path):
+    source, job_dir, job = _job(sites_csv, tmp_path, n=100, bad=1)
+    # 止まったワーカーがシャード0を借りたまま、途中の結果を残している
+    LeaseTable(job_dir, lease_seconds=0.2).try_acquire(0, "dead", None)
+    stale = job_dir / "tmp" / "shard-000000.g0001"
+    (stale / ".work").mkdir(parents=True)
+    (stale / ".work" / "partial.npy").write_bytes(b"\0" * 16)
+
+    assert job_status(job_dir)["leased"] == [0]
+
+    time.sleep(0.3)
+    assert job_status(job_dir)["expired"] == [0]
+    result = run_worker(job_dir, "w2", lease_seconds=0.2, poll_seconds=0.05, use_memo=False)
+    assert sorted(result["computed"]) == list(range(job["shards"]))
+    assert not stale.exists()
+
+    run_file_batch(source, tmp_path / "single", chunk_size=20, use_memo=False)
+    merge_job(job_dir, tmp_path / "merged")
+    assert compare_outputs(tmp_path / "single", tmp_path / "merged", "parquet") == []
+    assert list((job_dir / "tmp").iterdir()) == []
+
+
+def test_merge_refuses_missing_shards(sites_csv, tmp_path):
+    _, job_dir, _ = _job(sites_csv, tmp_path, n=120, bad=0)
+    run_worker(job_dir, "w1", max_shards=1, use_memo=False)
+    with pytest.raises(RuntimeError):
+        merge_job(job_dir, tmp_path / "merged")
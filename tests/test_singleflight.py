@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from runtime.singleflight import SingleFlight
+
+
+def _concurrent(flight, key, fn, n):
+    results = [None] * n
+    errors = [None] * n
+    start = threading.Barrier(n)
+
+    def call(i):
+        start.wait()
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    runs = []
+
+    def compute():
+        runs.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+
+    results, errors = _concurrent(flight, "k", compute, 8)
+
+    assert len(runs) == 1
+    assert errors == [None] * 8
+    assert all(r is results[0] for r in results)
+    stats = flight.stats()
+    assert stats["calls"] == 8
+    assert stats["executed"] == 1
+    assert stats["coalesced"] == 7
+    assert stats["in_flight"] == 0
+
+
+def test_error_is_shared_and_next_call_runs_again():
+    flight = SingleFlight("test")
+    runs = []
+
+    def fail():
+        runs.append(1)
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    _, errors = _concurrent(flight, "k", fail, 4)
+
+    assert len(runs) == 1
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.stats()["errors"] == 1
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight("test")
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats()["executed"] == 2
+
+
+def test_sequential_calls_are_not_cached():
+    flight = SingleFlight("test")
+    runs = []
+    for _ in range(3):
+        flight.do("k", lambda: runs.append(1))
+    assert len(runs) == 3
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
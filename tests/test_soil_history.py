@@ -0,0 +1,79 @@
+import math
+from datetime import date, timedelta
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from storage.soil_history import (
+    SoilHistory,
+    analyze_trends,
+    fill_course,
+    normalize_table,
+    project_soil_values,
+    synthetic_history,
+)
+
+
+def _records(site_id, course, start, values, step_days=90):
+    return [
+        {"site_id": site_id, "course": course, "sampled_on": start + timedelta(days=i * step_days), "P": v}
+        for i, v in enumerate(values)
+    ]
+
+
+def test_slopes_match_per_site_least_squares():
+    table = synthetic_history(sites=25, years=4, seed=3)
+    trends = analyze_trends(table)
+    sites = trends["sites"]
+
+    course = np.asarray(table["course"].fill_null("").to_pylist(), dtype=object)
+    site_id = np.asarray(table["site_id"].to_pylist(), dtype=object)
+    years = table["sampled_on"].cast(pa.int32()).to_numpy(zero_copy_only=False) / 365.25
+    k = table["k"].to_numpy(zero_copy_only=False).astype(float)
+    for i in range(len(sites["site_id"])):
+        mask = (course == sites["course"][i]) & (site_id == sites["site_id"][i]) & ~np.isnan(k)
+        expected = np.polyfit(years[mask], k[mask], 1)[0]
+        assert sites["k_slope"][i] == pytest.approx(expected, rel=1e-6, abs=1e-9)
+        assert sites["samples"][i] == int(((course == sites["course"][i]) & (site_id == sites["site_id"][i])).sum())
+
+
+def test_years_to_floor_and_outliers():
+    # 年に 4.0 ずつ減る（90日ごと）。1件だけ外れ値
+    values = [40.0 - 4.0 * i * 90 / 365.25 for i in range(12)]
+    values[5] *= 4
+    table = normalize_table(pa.Table.from_pylist(_records("green-1", "course", date(2024, 1, 1), values)))
+    trends = analyze_trends(table, floors={"P": 10.0})
+    sites = trends["sites"]
+
+    assert sites["p_outliers"][0] == 1
+    assert trends["outliers"]["value"].tolist() == [values[5]]
+    assert sites["p_slope"][0] < 0
+    expected = (sites["p_trend"][0] - 10.0) / -sites["p_slope"][0]
+    assert sites["p_years_to_floor"][0] == pytest.approx(expected)
+    # 分析値の無い要素・下限の無い要素は NaN
+    assert math.isnan(sites["k_slope"][0])
+    assert math.isnan(sites["nh4_n_years_to_floor"][0])
+
+    projected = project_soil_values(trends, years_ahead=1.0)
+    assert projected["green-1"]["P"] == pytest.approx(max(sites["p_trend"][0] + sites["p_slope"][0], 10.0), abs=0.1)
+
+
+def test_fill_course_fills_only_blank_values():
+    table = normalize_table(pa.Table.from_pylist([
+        {"site_id": "a", "course": "east", "sampled_on": date(2025, 1, 1), "P": 1.0},
+        {"site_id": "b", "course": "", "sampled_on": date(2025, 1, 1), "P": 1.0},
+        {"site_id": "c", "course": None, "sampled_on": date(2025, 1, 1), "P": 1.0},
+    ]))
+    assert fill_course(table, "west")["course"].to_pylist() == ["east", "west", "west"]
+
+
+def test_append_and_read_by_course(tmp_path):
+    history = SoilHistory(tmp_path / "soil")
+    assert history.read().num_rows == 0
+    history.append_records(_records("g1", "east", date(2025, 1, 1), [30.0, 31.0]))
+    history.append_records(_records("g1", "west", date(2025, 1, 1), [20.0]))
+
+    assert history.read().num_rows == 3
+    assert history.read(course="west")["p"].to_pylist() == [20.0]
+    assert sorted(analyze_trends(history.read())["sites"]["course"].tolist()) == ["east", "west"]
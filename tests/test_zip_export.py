@@ -0,0 +1,23 @@
+import io
+import zipfile
+
+from batch import parse_site_row
+from export.zip_export import write_bulk_zip
+from logic.design import build_site_design
+from tools import workload
+
+
+def _folders(site_ids):
+    rows = list(workload.iter_rows(len(site_ids), 3))
+    designs = [dict(build_site_design(**parse_site_row(row)), site_id=s) for row, s in zip(rows, site_ids)]
+    buf = io.BytesIO()
+    write_bulk_zip(designs, buf)
+    with zipfile.ZipFile(buf) as zf:
+        names = zf.namelist()
+    assert len(names) == len(set(names)) == 2 * len(site_ids)
+    return [name.split("/")[0] for name in names[::2]]
+
+
+def test_duplicate_site_ids_get_unused_folder_names():
+    assert _folders(["A", "A_2", "A", "A"]) == ["A", "A_2", "A_3", "A_4"]
+    assert _folders(["A", "A", "A_2", "B"]) == ["A", "A_2", "A_2_2", "B"]
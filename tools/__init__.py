@@ -0,0 +1,3 @@
+"""
+開発・運用向けツール
+"""
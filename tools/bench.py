@@ -0,0 +1,431 @@
+"""
+計算エンジン・レポート生成のマイクロベンチマーク
+
+固定シードで作ったサイト群（tools.workload の合成データ）に対して、施肥設計のホットパスを
+1サイト・1万サイト（一括計算相当）の2つの規模で計測し、
+記録済みのベースライン（tools/bench_baselines.json）と比較する。
+ベースラインより設定したしきい値以上遅くなったベンチマークがあれば終了コード 1 を返す。
+
+対象：
+- calculate_daily_gp / monthly_gp_averages（アプリ画面のGP）
+- calculate_monthly_gp / calculate_monthly_distribution_ratios（月別配分）
+- calculate_annual_nutrient_requirements / calculate_fertilizer_requirements（施肥量）
+- template_render（generate_pdf のテンプレートのレンダリング段階）
+
+使い方：
+    python -m tools.bench                       # 計測してベースラインと比較
+    python -m tools.bench --sizes 1 --only gp   # 1サイトだけ・名前に gp を含むものだけ
+    python -m tools.bench --update-baselines    # 現在の計測値をベースラインとして保存
+    python -m tools.bench --corpus sites.parquet --sizes 1000   # 用意したサイト一覧の先頭1000行で計測
+
+ベースラインは計測したマシンに依存するため、比較は同じマシン（CIの同じランナー）で行うこと。
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from batch import iter_site_rows, parse_site_row
+from logic.annual_nutrient_model import calculate_annual_nutrient_requirements
+from logic.constants import GrassType
+from logic.daily_gp import calculate_daily_gp, monthly_gp_averages
+from logic.design import build_site_design
+from logic.fertilizer import calculate_fertilizer_requirements
+from logic.gp_model import calculate_monthly_gp, normalize_gp_ratios
+from logic.monthly_distribution import (
+    calculate_monthly_distribution_ratios,
+    get_season_factors,
+)
+from tools import workload
+
+
+DEFAULT_BASELINES = Path(__file__).resolve().parent / "bench_baselines.json"
+DEFAULT_SIZES = [1, 10000]
+DEFAULT_SEED = 0
+DEFAULT_ROUNDS = 5
+# 1回の計測の最低時間（短い処理はこの時間を超えるまで繰り返す）
+DEFAULT_MIN_TIME = 0.2
+# ベースラインからの悪化を許す割合（ファイルに threshold が無い場合）
+DEFAULT_THRESHOLD = 0.25
+
+# 芝種区分 → 日別GPの芝種（アプリ画面の選択肢）
+_TURF_BY_GRASS = {
+    GrassType.COOL_COMPETITION: "寒地型芝",
+    GrassType.COOL_GREEN: "寒地型芝",
+    GrassType.WARM_COMPETITION: "暖地型芝",
+    GrassType.WARM_GREEN: "暖地型芝",
+    GrassType.WARM_FAIRWAY: "暖地型芝",
+    GrassType.JAPANESE_FAIRWAY: "日本芝",
+    GrassType.JAPANESE_ZOYSIA: "日本芝",
+    GrassType.WOS: "ウィンターオーバーシード（WOS）",
+}
+
+
+def _to_site(row: Dict[str, Any]) -> Dict[str, Any]:
+    site = parse_site_row(row)
+    site["turf_type"] = _TURF_BY_GRASS[site["grass_type"]]
+    return site
+
+
+def make_sites(n: int, seed: int = DEFAULT_SEED) -> List[Dict[str, Any]]:
+    """
+    固定シードでベンチマーク用のサイト入力を作る（同じ n・seed なら常に同じ内容）
+    """
+    return [_to_site(row) for row in workload.iter_rows(n, seed)]
+
+
+def load_sites(path: Path, n: int) -> List[Dict[str, Any]]:
+    """
+    サイト一覧のファイル（CSV / JSONL / Parquet / Excel）の先頭 n 行をベンチマーク用のサイト入力にする
+    """
+    sites = []
+    for row in iter_site_rows(path, chunk_size=min(n, 10000)):
+        sites.append(_to_site(row))
+        if len(sites) >= n:
+            break
+    if len(sites) < n:
+        raise ValueError(f"{path} は {len(sites)} 行しかありません（{n} 行必要）")
+    return sites
+
+
+# ── ベンチマーク定義：setup(sites) が計測対象の関数（引数なし）を返す ──
+
+def _bench_daily_gp(sites):
+    args = [(s["latitude"], s["turf_type"]) for s in sites]
+
+    def run():
+        for latitude, turf_type in args:
+            calculate_daily_gp(latitude, turf_type)
+    return run
+
+
+def _bench_monthly_gp_averages(sites):
+    daily = [calculate_daily_gp(s["latitude"], s["turf_type"]) for s in sites]
+
+    def run():
+        for d in daily:
+            monthly_gp_averages(d)
+    return run
+
+
+def _bench_monthly_gp(sites):
+    args = [(s["latitude"], s["longitude"], s["grass_type"].value) for s in sites]
+
+    def run():
+        for latitude, longitude, grass_type in args:
+            calculate_monthly_gp(latitude, longitude, grass_type)
+    return run
+
+
+def _bench_distribution_ratios(sites):
+    args = []
+    for s in sites:
+        gp_values = calculate_monthly_gp(s["latitude"], s["longitude"], s["grass_type"].value)
+        stance = s["distribution_stance"]
+        base_stance = "春重点" if stance.startswith("春重点") else stance
+        season_factors = get_season_factors(
+            s["turf_type"], s["usage_type"].value, base_stance, use_heavy=True
+        )
+        args.append((normalize_gp_ratios(gp_values), season_factors, stance, gp_values))
+
+    def run():
+        for gp_ratios, season_factors, stance, gp_values in args:
+            calculate_monthly_distribution_ratios(gp_ratios, season_factors, stance, gp_values)
+    return run
+
+
+def _bench_annual_requirements(sites):
+    args = [
+        (s["grass_type"], s["usage_type"], s["management_intensity"], s["soil_values"], s["fertilizer_stance"])
+        for s in sites
+    ]
+
+    def run():
+        for a in args:
+            calculate_annual_nutrient_requirements(*a)
+    return run
+
+
+def _bench_fertilizer_requirements(sites):
+    def run():
+        for s in sites:
+            calculate_fertilizer_requirements(
+                s["grass_type"],
+                s["usage_type"],
+                s["management_intensity"],
+                s["soil_values"],
+                s["fertilizer_stance"],
+                latitude=s["latitude"],
+                longitude=s["longitude"],
+                distribution_stance=s["distribution_stance"],
+            )
+    return run
+
+
+def _bench_template_render(sites):
+    # グラフ画像・フォント埋め込みを除いた、テンプレートのレンダリング段階だけを計測する
+    from pdf.generator import build_report_context, render_template
+
+    args = []
+    for s in sites:
+        design = build_site_design(
+            s["site_id"],
+            s["grass_type"],
+            s["usage_type"],
+            s["management_intensity"],
+            s["soil_values"],
+            s["fertilizer_stance"],
+            latitude=s["latitude"],
+            longitude=s["longitude"],
+            distribution_stance=s["distribution_stance"],
+            use_memo=False,
+        )
+        context = build_report_context(
+            design["input_data"],
+            design["calculation_results"],
+            design["gp_values"],
+            design["gp_dict"],
+            design["monthly_n"],
+            render_graph=False,
+        )
+        args.append((design["input_data"], design["calculation_results"], context))
+
+    def run():
+        for input_data, calculation_results, context in args:
+            render_template(input_data, calculation_results, context, None, "HeiseiKakuGo-W5", "2025年1月1日")
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[List[Dict[str, Any]]], Callable[[], None]]] = {
+    "calculate_daily_gp": _bench_daily_gp,
+    "monthly_gp_averages": _bench_monthly_gp_averages,
+    "calculate_monthly_gp": _bench_monthly_gp,
+    "calculate_monthly_distribution_ratios": _bench_distribution_ratios,
+    "calculate_annual_nutrient_requirements": _bench_annual_requirements,
+    "calculate_fertilizer_requirements": _bench_fertilizer_requirements,
+    "template_render": _bench_template_render,
+}
+
+
+def _time_once(run: Callable[[], None], loops: int) -> float:
+    start = time.perf_counter()
+    for _ in range(loops):
+        run()
+    return time.perf_counter() - start
+
+
+def measure(run: Callable[[], None], rounds: int = DEFAULT_ROUNDS, min_time: float = DEFAULT_MIN_TIME) -> Dict[str, Any]:
+    """
+    1回あたりの実行時間を計測（timeit と同様に、計測中はGCを止める）
+
+    Returns:
+        {"median_s": float, "min_s": float, "loops": int, "rounds": int}
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        # 1回の計測が min_time を超えるまで繰り返し回数を増やす（初回はウォームアップを兼ねる）
+        loops = 1
+        while True:
+            elapsed = _time_once(run, loops)
+            if elapsed >= min_time or loops >= 1_000_000:
+                break
+            loops *= 2 if elapsed > min_time / 4 else 10
+        times = [_time_once(run, loops) / loops for _ in range(rounds)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "loops": loops,
+        "rounds": rounds,
+    }
+
+
+def load_baselines(path: Path) -> Dict[str, Any]:
+    """
+    ベースラインを読み込む（無ければ空）
+    """
+    if not path.exists():
+        return {"threshold": DEFAULT_THRESHOLD, "thresholds": {}, "results": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _machine() -> Dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baselines: Dict[str, Any], threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    計測結果をベースラインと比較
+
+    Args:
+        results: {"<名前>@<サイト数>": measure() の結果}
+        threshold: 全ベンチマーク共通のしきい値（指定時はファイルの設定より優先）
+
+    Returns:
+        ベンチマークごとの比較結果のリスト（status は "ok" / "regressed" / "new"）
+    """
+    default = baselines.get("threshold", DEFAULT_THRESHOLD)
+    per_bench = baselines.get("thresholds", {})
+    recorded = baselines.get("results", {})
+
+    rows = []
+    for key, result in results.items():
+        name = key.split("@", 1)[0]
+        limit = threshold if threshold is not None else per_bench.get(key, per_bench.get(name, default))
+        base = recorded.get(key)
+        row = {"key": key, "median_s": result["median_s"], "threshold": limit, "baseline_s": None, "ratio": None}
+        if base is None:
+            row["status"] = "new"
+        else:
+            row["baseline_s"] = base["median_s"]
+            row["ratio"] = result["median_s"] / base["median_s"] if base["median_s"] > 0 else 1.0
+            row["status"] = "regressed" if row["ratio"] > 1.0 + limit else "ok"
+        rows.append(row)
+    return rows
+
+
+def update_baselines(path: Path, baselines: Dict[str, Any], results: Dict[str, Dict[str, Any]], seed: int) -> None:
+    """
+    計測結果をベースラインとして保存（計測しなかったベンチマークの値は残す）
+    """
+    baselines.setdefault("threshold", DEFAULT_THRESHOLD)
+    baselines.setdefault("thresholds", {})
+    baselines["seed"] = seed
+    baselines["machine"] = _machine()
+    recorded = baselines.setdefault("results", {})
+    for key, result in results.items():
+        recorded[key] = {"median_s": result["median_s"], "min_s": result["min_s"]}
+    baselines["results"] = dict(sorted(recorded.items()))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def run_benchmarks(
+    sizes: List[int] = DEFAULT_SIZES,
+    only: Optional[List[str]] = None,
+    seed: int = DEFAULT_SEED,
+    rounds: int = DEFAULT_ROUNDS,
+    min_time: float = DEFAULT_MIN_TIME,
+    progress: Optional[Callable[[str], None]] = None,
+    corpus: Optional[Path] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    ベンチマークを実行
+
+    Args:
+        sizes: サイト数のリスト
+        only: 名前にいずれかを含むベンチマークだけを実行
+        progress: 1件計測するごとに "<名前>@<サイト数>" を受け取る関数
+        corpus: サイト入力に使うファイル（省略時は seed から合成する）
+
+    Returns:
+        {"<名前>@<サイト数>": measure() の結果}
+    """
+    results = {}
+    for size in sizes:
+        sites = load_sites(corpus, size) if corpus is not None else make_sites(size, seed)
+        for name, setup in BENCHMARKS.items():
+            if only and not any(o in name for o in only):
+                continue
+            key = f"{name}@{size}"
+            if progress:
+                progress(key)
+            results[key] = measure(setup(sites), rounds=rounds, min_time=min_time)
+    return results
+
+
+def _format_time(seconds: float) -> str:
+    if seconds >= 1.0:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    """
+    比較結果を表形式の文字列にする
+    """
+    lines = [f"{'benchmark':<46} {'median':>10} {'baseline':>10} {'ratio':>7}  status"]
+    for row in rows:
+        baseline = _format_time(row["baseline_s"]) if row["baseline_s"] is not None else "-"
+        ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "-"
+        status = row["status"]
+        if status == "regressed":
+            status += f" (> {1 + row['threshold']:.2f}x)"
+        lines.append(f"{row['key']:<46} {_format_time(row['median_s']):>10} {baseline:>10} {ratio:>7}  {status}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="計算エンジン・レポート生成のマイクロベンチマーク")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="サイト数（カンマ区切り）")
+    parser.add_argument("--only", action="append", default=None, help="名前にこの文字列を含むものだけ実行（複数指定可）")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="サイト入力の乱数シード")
+    parser.add_argument("--corpus", type=Path, default=None,
+                        help="サイト入力に使うファイル（python -m tools.workload で作成、省略時は合成）")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="計測の繰り返し回数")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="1回の計測の最低時間（秒）")
+    parser.add_argument("--baselines", type=Path, default=DEFAULT_BASELINES, help="ベースラインのJSON")
+    parser.add_argument("--threshold", type=float, default=None, help="許容する悪化の割合（例: 0.25）")
+    parser.add_argument("--update-baselines", action="store_true", help="計測値をベースラインとして保存")
+    parser.add_argument("--json", type=Path, default=None, help="計測結果をJSONで保存するパス")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = run_benchmarks(
+        sizes=sizes,
+        only=args.only,
+        seed=args.seed,
+        rounds=args.rounds,
+        min_time=args.min_time,
+        progress=lambda key: print(f"running {key} ...", file=sys.stderr, flush=True),
+        corpus=args.corpus,
+    )
+
+    baselines = load_baselines(args.baselines)
+    if baselines.get("results") and baselines.get("seed", args.seed) != args.seed:
+        print(f"warning: ベースラインのシード（{baselines['seed']}）と異なります", file=sys.stderr)
+    if args.corpus is not None and not args.update_baselines:
+        print("warning: ベースラインは合成したサイト入力で記録しています（--corpus の結果とは入力が異なります）",
+              file=sys.stderr)
+    rows = compare(results, baselines, args.threshold)
+    print(format_report(rows))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"machine": _machine(), "seed": args.seed,
+                       "corpus": str(args.corpus) if args.corpus else None,
+                       "results": results, "comparison": rows},
+                      f, ensure_ascii=False, indent=2)
+
+    if args.update_baselines:
+        update_baselines(args.baselines, baselines, results, args.seed)
+        print(f"ベースラインを更新しました: {args.baselines}")
+        return 0
+
+    regressed = [row["key"] for row in rows if row["status"] == "regressed"]
+    if regressed:
+        print(f"性能が悪化したベンチマーク: {', '.join(regressed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+Streamlit アプリの負荷試験（再実行レイテンシの計測）
+
+Streamlit の AppTest で app.py をヘッドレスに実行し、
+複数のセッションが操作トレース（tools/traces/*.json）どおりに
+緯度・芝種・配分方法・土壌分析値を変更したときの再実行時間を計測する。
+
+出力：
+- 再実行レイテンシの p50 / p95 / p99（全体・操作ステップ別）
+- 1回の再実行で画面に送る要素のサイズ（protobuf のバイト数）
+- プロセスのピークRSS
+
+使い方：
+    python -m tools.loadtest --sessions 8 --trace tools/traces/default.json
+    python -m tools.loadtest --sessions 32 --iterations 3 --json loadtest.json
+
+各セッションは別プロセスで動く独立した AppTest で、複数ユーザーが同時に操作して
+CPU を取り合う状況を模擬する（AppTest は実行のたびにプロセス全体の Runtime や設定を
+差し替えるため、1プロセスで複数同時に動かすことはできない）。
+そのため st.cache_data や single-flight はセッション間で共有されず、
+結果はサーバー1プロセスで共有される場合より悪め（上限寄り）の値になる。
+ピークRSSはセッション1つ分のプロセスの最大値。
+--jitter を指定すると、数値入力をセッションごとに乱数（固定シード）でずらし、
+全員が同じ入力をする状況（キャッシュが常に当たる）を避ける。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+APP_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_APP = APP_DIR / "app.py"
+DEFAULT_TRACE = Path(__file__).resolve().parent / "traces" / "default.json"
+
+
+def load_trace(path: Path) -> Dict[str, Any]:
+    """
+    操作トレースを読み込む
+
+    形式：
+        {"name": str, "steps": [{"widget": "number_input", "label": "緯度", "value": 36.2}, ...]}
+    """
+    with open(path, encoding="utf-8") as f:
+        trace = json.load(f)
+    if not trace.get("steps"):
+        raise ValueError(f"操作トレースに steps がありません: {path}")
+    return trace
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    最近順位法によるパーセンタイル
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    プロセスのピークRSS（取得できない環境では None）
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB、macOS はバイト単位
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, "peak_wset", info.rss)
+
+
+def _payload_bytes(node) -> int:
+    """
+    要素ツリーのprotobufサイズの合計（画面へ送る差分のおおよその大きさ）
+    """
+    total = 0
+    proto = getattr(node, "proto", None)
+    if proto is not None and hasattr(proto, "ByteSize"):
+        total += proto.ByteSize()
+    children = getattr(node, "children", None)
+    if children:
+        for child in children.values():
+            total += _payload_bytes(child)
+    return total
+
+
+def _find_widget(at, widget: str, label: str):
+    for w in getattr(at, widget):
+        if w.label == label:
+            return w
+    raise LookupError(f"{widget}「{label}」が見つかりません")
+
+
+def _step_value(step: Dict[str, Any], rng: random.Random, jitter: float) -> Any:
+    value = step["value"]
+    if jitter and isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = round(max(0.0, value * (1 + rng.uniform(-jitter, jitter))), 1)
+    return value
+
+
+def run_session(
+    session_no: int,
+    app_path: str,
+    trace: Dict[str, Any],
+    iterations: int,
+    jitter: float,
+    seed: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    """
+    1セッション分：初回表示のあと、トレースの各ステップを順に実行して計測する（ワーカープロセスで実行）
+
+    Returns:
+        {"samples": [...], "peak_rss_bytes": int|None, "error": str|None}
+    """
+    from streamlit.testing.v1 import AppTest
+
+    # アプリの相対パス参照（static/ など）をアプリのディレクトリ基準にする
+    os.chdir(Path(app_path).parent)
+
+    rng = random.Random(seed + session_no)
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    samples: List[Dict[str, Any]] = []
+
+    def _record(step_name: str, elapsed: float) -> None:
+        if at.exception:
+            raise RuntimeError(f"session {session_no} / {step_name}: {at.exception[0].message}")
+        samples.append({
+            "session": session_no,
+            "step": step_name,
+            "latency_ms": elapsed * 1000,
+            "payload_bytes": _payload_bytes(at._tree),
+        })
+
+    error = None
+    try:
+        start = time.perf_counter()
+        at.run()
+        _record("initial", time.perf_counter() - start)
+
+        for _ in range(iterations):
+            for i, step in enumerate(trace["steps"]):
+                w = _find_widget(at, step["widget"], step["label"])
+                w.set_value(_step_value(step, rng, jitter))
+                start = time.perf_counter()
+                at.run()
+                _record(f"{i + 1:02d} {step['label']}", time.perf_counter() - start)
+    except Exception as e:
+        error = f"session {session_no}: {e}"
+
+    return {"samples": samples, "peak_rss_bytes": peak_rss_bytes(), "error": error}
+
+
+def summarize(
+    samples: List[Dict[str, Any]],
+    wall_sec: float,
+    sessions: int,
+    peak_rss: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    計測結果を集計
+    """
+    latencies = [s["latency_ms"] for s in samples]
+    payloads = [s["payload_bytes"] for s in samples]
+
+    by_step: Dict[str, List[Dict[str, Any]]] = {}
+    for s in samples:
+        by_step.setdefault(s["step"], []).append(s)
+
+    return {
+        "sessions": sessions,
+        "reruns": len(samples),
+        "wall_sec": wall_sec,
+        "reruns_per_sec": len(samples) / wall_sec if wall_sec > 0 else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else 0.0,
+        },
+        "payload_bytes": {
+            "mean": sum(payloads) / len(payloads) if payloads else 0,
+            "max": max(payloads) if payloads else 0,
+        },
+        "peak_rss_bytes": peak_rss,
+        "steps": {
+            name: {
+                "count": len(items),
+                "p50_ms": percentile([s["latency_ms"] for s in items], 50),
+                "p95_ms": percentile([s["latency_ms"] for s in items], 95),
+                "p99_ms": percentile([s["latency_ms"] for s in items], 99),
+                "payload_bytes": max(s["payload_bytes"] for s in items),
+            }
+            for name, items in sorted(by_step.items())
+        },
+    }
+
+
+def run_loadtest(
+    sessions: int = 4,
+    trace_path: Path = DEFAULT_TRACE,
+    app_path: Path = DEFAULT_APP,
+    iterations: int = 1,
+    jitter: float = 0.0,
+    seed: int = 0,
+    timeout: float = 60.0,
+) -> Dict[str, Any]:
+    """
+    負荷試験を実行して集計結果を返す
+
+    Args:
+        sessions: 同時セッション数
+        trace_path: 操作トレースのJSON
+        app_path: 対象のStreamlitスクリプト
+        iterations: 各セッションがトレースを繰り返す回数
+        jitter: 数値入力をずらす割合（0.1 なら ±10%）
+        seed: 乱数シード
+        timeout: 1回の再実行のタイムアウト（秒）
+
+    Returns:
+        summarize() の結果に trace 名と errors を加えたもの
+    """
+    trace = load_trace(trace_path)
+    samples: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    rss_values: List[int] = []
+
+    # spawn：親プロセスの Streamlit の状態を引き継がない
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=sessions, mp_context=ctx) as pool:
+        futures = [
+            pool.submit(run_session, n, str(app_path), trace, iterations, jitter, seed, timeout)
+            for n in range(sessions)
+        ]
+        for future in futures:
+            result = future.result()
+            samples.extend(result["samples"])
+            if result["error"]:
+                errors.append(result["error"])
+            if result["peak_rss_bytes"]:
+                rss_values.append(result["peak_rss_bytes"])
+    wall_sec = time.perf_counter() - start
+
+    report = summarize(samples, wall_sec, sessions, max(rss_values) if rss_values else None)
+    report["trace"] = trace.get("name", trace_path.stem)
+    report["errors"] = errors
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    集計結果を表形式の文字列にする
+    """
+    lat = report["latency_ms"]
+    rss = report["peak_rss_bytes"]
+    lines = [
+        f"trace: {report['trace']}  sessions: {report['sessions']}  reruns: {report['reruns']}"
+        f"  wall: {report['wall_sec']:.1f}s  ({report['reruns_per_sec']:.1f} reruns/s)",
+        f"latency ms  p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}",
+        f"payload     mean {report['payload_bytes']['mean'] / 1024:.1f} KiB"
+        f"  max {report['payload_bytes']['max'] / 1024:.1f} KiB",
+        f"peak RSS    {rss / 1024 / 1024:.1f} MiB / session" if rss else "peak RSS    (unavailable)",
+        "",
+        f"{'step':<32} {'n':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'KiB':>7}",
+    ]
+    for name, s in report["steps"].items():
+        lines.append(
+            f"{name[:32]:<32} {s['count']:>4} {s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f}"
+            f" {s['p99_ms']:>8.1f} {s['payload_bytes'] / 1024:>7.1f}"
+        )
+    for err in report["errors"]:
+        lines.append(f"ERROR: {err}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Streamlit アプリの負荷試験")
+    parser.add_argument("--sessions", type=int, default=4, help="同時セッション数")
+    parser.add_argument("--trace", type=Path, default=DEFAULT_TRACE, help="操作トレースのJSON")
+    parser.add_argument("--app", type=Path, default=DEFAULT_APP, help="対象のStreamlitスクリプト")
+    parser.add_argument("--iterations", type=int, default=1, help="トレースを繰り返す回数")
+    parser.add_argument("--jitter", type=float, default=0.0, help="数値入力をずらす割合（例: 0.1）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--timeout", type=float, default=60.0, help="再実行のタイムアウト（秒）")
+    parser.add_argument("--json", type=Path, default=None, help="集計結果をJSONで保存するパス")
+    args = parser.parse_args(argv)
+
+    report = run_loadtest(
+        sessions=args.sessions,
+        trace_path=args.trace.resolve(),
+        app_path=args.app.resolve(),
+        iterations=args.iterations,
+        jitter=args.jitter,
+        seed=args.seed,
+        timeout=args.timeout,
+    )
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,425 @@
+"""
+施肥設計の入力（サイト・土壌診断値）の合成データ生成
+
+一括計算・ベンチマーク・負荷試験で使う、実際の利用に近いサイト一覧を
+1千〜1千万行の規模で作る。一括計算のサイト一覧と同じ列
+（site_id, latitude, longitude, grass_type, usage_type, management_intensity,
+fertilizer_stance, distribution_stance, P, K, Ca, Mg）を持ち、
+batch.iter_site_rows / parse_site_row でそのまま読み込める。
+
+- 地点：日本の地域（北海道〜沖縄）を重み付きで選び、地域ごとの中心から緯度・経度をばらつかせる
+- 芝種区分：地域ごとの構成比（北ほど寒地型、南ほど暖地型・日本芝が多い）。
+  利用形態は芝種区分から決まる（競技場の区分なら競技場、それ以外はゴルフ場）
+- 管理強度・施肥スタンス・配分スタンス：全体の構成比
+- 土壌診断値（P/K/Ca/Mg）：SOIL_REFERENCE_RANGES の範囲を中心とした正規分布に、
+  基準値を下回る欠乏側・上回る過剰側の裾を指定の割合で混ぜる
+
+構成比・分布は DEFAULT_SPEC を既定とし、JSON（--spec）で一部だけ上書きできる。
+データは BLOCK_SIZE 行ずつ作ってそのままファイルに書き出すため、行数によらずメモリ使用量は一定。
+各ブロックの乱数は (seed, ブロック番号) から作るので、同じ行数・シード・設定なら常に同じ内容になる。
+
+使い方：
+    python -m tools.workload -n 100000 --out sites.csv
+    python -m tools.workload -n 10000000 --out sites.parquet --seed 1
+    python -m tools.workload -n 1000 --out sites.jsonl --spec spec.json
+    python -m tools.workload --dump-spec > spec.json   # 既定の設定を書き出す
+"""
+
+import argparse
+import copy
+import csv
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from logic.constants import (
+    SOIL_REFERENCE_RANGES,
+    FertilizerStance,
+    GrassType,
+    ManagementIntensity,
+    UsageType,
+)
+
+
+BLOCK_SIZE = 8192
+DEFAULT_SEED = 0
+
+COLUMNS = [
+    "site_id", "latitude", "longitude", "grass_type", "usage_type",
+    "management_intensity", "fertilizer_stance", "distribution_stance",
+    "P", "K", "Ca", "Mg",
+]
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# 日本の範囲（地点をこの中に収める）
+LATITUDE_RANGE = (24.0, 45.5)
+LONGITUDE_RANGE = (123.0, 146.0)
+
+# 構成比のキーは列挙型の名前（GrassType.COOL_GREEN → "COOL_GREEN"）、配分スタンスは値
+DEFAULT_SPEC: Dict[str, Any] = {
+    # 地域：重み、緯度・経度の中心と標準偏差、芝種区分の構成比
+    "regions": {
+        "北海道": {
+            "weight": 0.07, "latitude": [43.0, 0.6], "longitude": [142.3, 1.0],
+            "grass_type": {"COOL_GREEN": 0.55, "COOL_COMPETITION": 0.35, "JAPANESE_FAIRWAY": 0.10},
+        },
+        "東北": {
+            "weight": 0.10, "latitude": [39.0, 1.1], "longitude": [140.8, 0.5],
+            "grass_type": {"COOL_GREEN": 0.45, "COOL_COMPETITION": 0.20, "JAPANESE_FAIRWAY": 0.25, "WOS": 0.10},
+        },
+        "関東": {
+            "weight": 0.30, "latitude": [35.9, 0.5], "longitude": [139.7, 0.5],
+            "grass_type": {
+                "COOL_GREEN": 0.35, "COOL_COMPETITION": 0.10, "JAPANESE_FAIRWAY": 0.25,
+                "JAPANESE_ZOYSIA": 0.05, "WOS": 0.12, "WARM_COMPETITION": 0.05,
+                "WARM_GREEN": 0.03, "WARM_FAIRWAY": 0.05,
+            },
+        },
+        "中部": {
+            "weight": 0.15, "latitude": [35.8, 0.8], "longitude": [137.5, 0.8],
+            "grass_type": {
+                "COOL_GREEN": 0.35, "COOL_COMPETITION": 0.10, "JAPANESE_FAIRWAY": 0.25,
+                "JAPANESE_ZOYSIA": 0.05, "WOS": 0.15, "WARM_COMPETITION": 0.05, "WARM_FAIRWAY": 0.05,
+            },
+        },
+        "近畿": {
+            "weight": 0.15, "latitude": [34.7, 0.4], "longitude": [135.5, 0.5],
+            "grass_type": {
+                "COOL_GREEN": 0.30, "COOL_COMPETITION": 0.05, "JAPANESE_FAIRWAY": 0.25,
+                "JAPANESE_ZOYSIA": 0.08, "WOS": 0.15, "WARM_COMPETITION": 0.07,
+                "WARM_GREEN": 0.05, "WARM_FAIRWAY": 0.05,
+            },
+        },
+        "中国・四国": {
+            "weight": 0.09, "latitude": [34.2, 0.6], "longitude": [133.0, 1.0],
+            "grass_type": {
+                "COOL_GREEN": 0.25, "JAPANESE_FAIRWAY": 0.30, "JAPANESE_ZOYSIA": 0.10,
+                "WOS": 0.15, "WARM_COMPETITION": 0.08, "WARM_GREEN": 0.05, "WARM_FAIRWAY": 0.07,
+            },
+        },
+        "九州": {
+            "weight": 0.12, "latitude": [32.5, 0.7], "longitude": [130.7, 0.5],
+            "grass_type": {
+                "COOL_GREEN": 0.15, "JAPANESE_FAIRWAY": 0.30, "JAPANESE_ZOYSIA": 0.15,
+                "WOS": 0.15, "WARM_COMPETITION": 0.10, "WARM_GREEN": 0.07, "WARM_FAIRWAY": 0.08,
+            },
+        },
+        "沖縄": {
+            "weight": 0.02, "latitude": [26.4, 0.3], "longitude": [127.8, 0.2],
+            "grass_type": {
+                "WARM_GREEN": 0.30, "WARM_FAIRWAY": 0.30, "WARM_COMPETITION": 0.20, "JAPANESE_ZOYSIA": 0.20,
+            },
+        },
+    },
+    "management_intensity": {"LOW": 0.25, "MEDIUM": 0.50, "HIGH": 0.25},
+    "fertilizer_stance": {"LOWER": 0.25, "CENTER": 0.50, "UPPER": 0.25},
+    "distribution_stance": {"春重点70": 0.20, "春重点50": 0.45, "春重点30": 0.15, "GP準拠": 0.20},
+    # 土壌診断値：
+    #   sd: 基準範囲内の分布の標準偏差（基準範囲の幅に対する割合）
+    #   deficient / excess: 欠乏側・過剰側の裾の割合
+    #   deficient_min: 欠乏側の下限（基準下限に対する倍率、基準下限との間で一様）
+    #   excess_max: 過剰側の上限（基準上限に対する倍率、基準上限との間で対数一様）
+    "soil": {
+        "P": {"sd": 0.30, "deficient": 0.10, "excess": 0.30, "deficient_min": 0.2, "excess_max": 5.0},
+        "K": {"sd": 0.30, "deficient": 0.25, "excess": 0.10, "deficient_min": 0.3, "excess_max": 4.0},
+        "Ca": {"sd": 0.30, "deficient": 0.15, "excess": 0.15, "deficient_min": 0.3, "excess_max": 4.0},
+        "Mg": {"sd": 0.30, "deficient": 0.20, "excess": 0.10, "deficient_min": 0.3, "excess_max": 4.0},
+    },
+}
+
+
+# ── 設定 ──
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def load_spec(path: Optional[Path] = None, override: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    DEFAULT_SPEC に JSON ファイル・辞書の設定を重ねる
+
+    Args:
+        path: 上書きする設定の JSON（一部のキーだけでよい）
+        override: 上書きする設定の辞書（path より後に適用）
+    """
+    spec = copy.deepcopy(DEFAULT_SPEC)
+    if path is not None:
+        with open(path, encoding="utf-8") as f:
+            spec = _merge(spec, json.load(f))
+    if override:
+        spec = _merge(spec, override)
+    return spec
+
+
+def _weights(mix: Dict[str, float], choices: List[str], label: str) -> np.ndarray:
+    unknown = [key for key in mix if key not in choices]
+    if unknown:
+        raise ValueError(f"{label} の不明なキー: {', '.join(unknown)}（{' / '.join(choices)}）")
+    weights = np.array([float(mix.get(key, 0.0)) for key in choices])
+    if (weights < 0).any() or weights.sum() <= 0:
+        raise ValueError(f"{label} の構成比は0以上で、合計が正の値にしてください")
+    return weights / weights.sum()
+
+
+class _Model:
+    """
+    設定を乱数生成用の配列にまとめたもの
+    """
+
+    def __init__(self, spec: Dict[str, Any]):
+        grass_names = [g.name for g in GrassType]
+        regions = spec["regions"]
+        self.region_weights = _weights(
+            {name: r.get("weight", 0.0) for name, r in regions.items()}, list(regions), "regions"
+        )
+        self.latitude = np.array([r["latitude"] for r in regions.values()], dtype=float)
+        self.longitude = np.array([r["longitude"] for r in regions.values()], dtype=float)
+        self.grass_weights = np.array([
+            _weights(r["grass_type"], grass_names, f"regions.{name}.grass_type")
+            for name, r in regions.items()
+        ])
+
+        self.grass_values = np.array([g.value for g in GrassType], dtype=object)
+        self.usage_values = np.array([
+            UsageType.COMPETITION.value if g.name.endswith("_COMPETITION") else UsageType.GOLF.value
+            for g in GrassType
+        ], dtype=object)
+
+        self.mixes = []
+        for key, enum_cls in (
+            ("management_intensity", ManagementIntensity),
+            ("fertilizer_stance", FertilizerStance),
+        ):
+            names = [m.name for m in enum_cls]
+            self.mixes.append((key, _weights(spec[key], names, key),
+                               np.array([m.value for m in enum_cls], dtype=object)))
+        stances = list(DEFAULT_SPEC["distribution_stance"])
+        self.mixes.append(("distribution_stance", _weights(spec["distribution_stance"], stances, "distribution_stance"),
+                           np.array(stances, dtype=object)))
+
+        self.soil = []
+        for key, (low, high) in SOIL_REFERENCE_RANGES.items():
+            s = spec["soil"][key]
+            if s["deficient"] + s["excess"] > 1.0:
+                raise ValueError(f"soil.{key} の deficient と excess の合計は1以下にしてください")
+            self.soil.append((key, low, high, s))
+
+
+def _soil_values(rng: np.random.Generator, size: int, low: float, high: float, s: Dict[str, Any]) -> np.ndarray:
+    """
+    基準範囲を中心とした分布に、欠乏側・過剰側の裾を混ぜた診断値
+    """
+    u = rng.random(size)
+    body = rng.normal((low + high) / 2, (high - low) * s["sd"], size)
+    # 欠乏側：基準下限の deficient_min 倍〜基準下限
+    deficient = low * rng.uniform(s["deficient_min"], 1.0, size)
+    # 過剰側：基準上限〜基準上限の excess_max 倍（対数一様で、高い値ほど少ない）
+    excess = high * np.exp(rng.uniform(0.0, np.log(s["excess_max"]), size))
+
+    values = np.where(u < s["deficient"], deficient,
+                      np.where(u < s["deficient"] + s["excess"], excess, body))
+    return np.round(np.maximum(values, 0.1), 1)
+
+
+def _block(model: _Model, rng: np.random.Generator, start: int, size: int, width: int) -> Dict[str, List[Any]]:
+    region = rng.choice(len(model.region_weights), size=size, p=model.region_weights)
+    latitude = rng.normal(model.latitude[region, 0], model.latitude[region, 1])
+    longitude = rng.normal(model.longitude[region, 0], model.longitude[region, 1])
+
+    grass = np.empty(size, dtype=np.int64)
+    for r in range(len(model.region_weights)):
+        mask = region == r
+        count = int(mask.sum())
+        if count:
+            grass[mask] = rng.choice(model.grass_weights.shape[1], size=count, p=model.grass_weights[r])
+
+    columns: Dict[str, List[Any]] = {
+        "site_id": [f"site-{i:0{width}d}" for i in range(start, start + size)],
+        "latitude": np.round(np.clip(latitude, *LATITUDE_RANGE), 2).tolist(),
+        "longitude": np.round(np.clip(longitude, *LONGITUDE_RANGE), 2).tolist(),
+        "grass_type": model.grass_values[grass].tolist(),
+        "usage_type": model.usage_values[grass].tolist(),
+    }
+    for key, weights, values in model.mixes:
+        columns[key] = values[rng.choice(len(weights), size=size, p=weights)].tolist()
+    for key, low, high, s in model.soil:
+        columns[key] = _soil_values(rng, size, low, high, s).tolist()
+    return columns
+
+
+# ── 生成 ──
+
+def iter_blocks(
+    n: int,
+    seed: int = DEFAULT_SEED,
+    spec: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, List[Any]]]:
+    """
+    サイト一覧を BLOCK_SIZE 行ずつ、列ごとのリストで作る
+
+    Args:
+        n: 行数
+        seed: 乱数シード
+        spec: 設定（省略時は DEFAULT_SPEC）
+
+    Yields:
+        {"site_id": [...], "latitude": [...], ..., "Mg": [...]}（キーは COLUMNS）
+    """
+    model = _Model(spec if spec is not None else DEFAULT_SPEC)
+    width = max(5, len(str(max(n - 1, 0))))
+    for block_no, start in enumerate(range(0, n, BLOCK_SIZE)):
+        rng = np.random.default_rng([seed, block_no])
+        yield _block(model, rng, start, min(BLOCK_SIZE, n - start), width)
+
+
+def iter_rows(
+    n: int,
+    seed: int = DEFAULT_SEED,
+    spec: Optional[Dict[str, Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    サイト一覧を1行ずつ作る（batch.parse_site_row に渡せる辞書）
+    """
+    for columns in iter_blocks(n, seed, spec):
+        for values in zip(*(columns[key] for key in COLUMNS)):
+            yield dict(zip(COLUMNS, values))
+
+
+# ── 書き出し ──
+
+def detect_format(path: Path) -> str:
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix not in FORMATS:
+        raise ValueError(f"出力形式を判定できません: {path}（{' / '.join(FORMATS)}）")
+    return suffix
+
+
+def _write_csv(f, blocks: Iterator[Dict[str, List[Any]]], on_block: Callable[[int], None]) -> None:
+    writer = csv.writer(f)
+    writer.writerow(COLUMNS)
+    for columns in blocks:
+        writer.writerows(zip(*(columns[key] for key in COLUMNS)))
+        on_block(len(columns["site_id"]))
+
+
+def _write_jsonl(f, blocks: Iterator[Dict[str, List[Any]]], on_block: Callable[[int], None]) -> None:
+    for columns in blocks:
+        f.write("".join(
+            json.dumps(dict(zip(COLUMNS, values)), ensure_ascii=False) + "\n"
+            for values in zip(*(columns[key] for key in COLUMNS))
+        ))
+        on_block(len(columns["site_id"]))
+
+
+def _write_parquet(path: Path, blocks: Iterator[Dict[str, List[Any]]], on_block: Callable[[int], None]) -> None:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet の書き出しには pyarrow が必要です（pip install pyarrow）")
+
+    schema = pa.schema(
+        [(key, pa.float64() if key in ("latitude", "longitude") or key in SOIL_REFERENCE_RANGES else pa.string())
+         for key in COLUMNS]
+    )
+    with pq.ParquetWriter(str(path), schema, compression="zstd") as writer:
+        for columns in blocks:
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            on_block(len(columns["site_id"]))
+
+
+def write_corpus(
+    path: Path,
+    n: int,
+    seed: int = DEFAULT_SEED,
+    spec: Optional[Dict[str, Any]] = None,
+    fmt: Optional[str] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    サイト一覧を作ってファイルに書き出す（BLOCK_SIZE 行ずつ書き足す）
+
+    Args:
+        path: 出力先
+        n: 行数
+        fmt: "csv" / "jsonl" / "parquet"（省略時は拡張子から判定）
+        progress: 書き出し済みの行数を受け取る関数
+
+    Returns:
+        書き出した行数
+    """
+    path = Path(path)
+    fmt = fmt or detect_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"未対応の出力形式です: {fmt}（{' / '.join(FORMATS)}）")
+
+    written = 0
+
+    def on_block(count: int) -> None:
+        nonlocal written
+        written += count
+        if progress:
+            progress(written)
+
+    blocks = iter_blocks(n, seed, spec)
+    if fmt == "parquet":
+        _write_parquet(path, blocks, on_block)
+    elif fmt == "csv":
+        # 一括計算の入力例と同じく、Excel で開けるよう BOM 付き UTF-8 にする
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            _write_csv(f, blocks, on_block)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            _write_jsonl(f, blocks, on_block)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="施肥設計の入力（サイト・土壌診断値）の合成データ生成")
+    parser.add_argument("-n", "--rows", type=int, default=10000, help="行数")
+    parser.add_argument("--out", type=Path, help="出力先（拡張子 .csv / .jsonl / .parquet で形式を判定）")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="出力形式（拡張子より優先）")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="乱数シード")
+    parser.add_argument("--spec", type=Path, default=None, help="構成比・分布の設定（JSON、一部だけでよい）")
+    parser.add_argument("--dump-spec", action="store_true", help="設定（--spec 適用後）を標準出力に書き出して終了")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    if args.dump_spec:
+        json.dump(spec, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    if args.out is None:
+        parser.error("--out を指定してください")
+
+    step = max(BLOCK_SIZE, args.rows // 20)
+    reported = [0]
+
+    def progress(count: int) -> None:
+        if count - reported[0] >= step or count == args.rows:
+            reported[0] = count
+            print(f"  {count:,} / {args.rows:,} 行", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    written = write_corpus(args.out, args.rows, seed=args.seed, spec=spec, fmt=args.format, progress=progress)
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(args.out) / (1 << 20)
+    print(f"{args.out}: {written:,} 行, {size_mb:.1f} MB, {elapsed:.1f} 秒"
+          f"（{written / elapsed if elapsed > 0 else 0:,.0f} 行/秒）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())